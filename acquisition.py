@@ -0,0 +1,301 @@
+import time
+import logging
+from PyQt5.QtCore import QObject, pyqtSignal
+from pyModbusTCP.client import ModbusClient
+import metrics
+from failover import RedundantClient
+from modbus_pipeline import PipelinedModbusClient
+from register_codec import RegisterCodec, register_count
+from scan_scheduler import ScanScheduler
+from tags import TAGS, TAG_GROUPS, SETPOINT_TAGS, tags_in_group
+
+log = logging.getLogger(__name__)
+
+MAX_READ_REGISTERS = 125
+
+# With a standby PLC a dead primary must be given up on well inside one scan period
+FAILOVER_TIMEOUT = 0.5
+
+
+def plan_reads(tags, max_registers=MAX_READ_REGISTERS, max_gap=8):
+    """(address, count) holding-register reads covering tags, merging blocks split by small gaps
+
+    Reading a few unused registers is cheaper than another request, so
+    spans closer than max_gap are read together, up to the Modbus limit of
+    125 registers per request.
+    """
+    spans = sorted((tag.address, tag.address + register_count(tag)) for tag in tags)
+    blocks = []
+    for start, end in spans:
+        if blocks and start - blocks[-1][1] <= max_gap and max(end, blocks[-1][1]) - blocks[-1][0] <= max_registers:
+            blocks[-1][1] = max(end, blocks[-1][1])
+        else:
+            blocks.append([start, end])
+    return [(start, end - start) for start, end in blocks]
+
+
+def check_registers(tags):
+    """Raise ValueError if two tags (other than bits of one register) read the same register"""
+    owners = {}
+    for tag in tags:
+        if not 0 <= tag.address <= 0xFFFF - register_count(tag) + 1:
+            raise ValueError(f"{tag.name}: register {tag.address} is out of range")
+        for address in range(tag.address, tag.address + register_count(tag)):
+            other = owners.setdefault(address, tag)
+            if other is not tag and not (tag.dtype == other.dtype == 'bit'):
+                raise ValueError(f"{other.name} and {tag.name} are both on register {address}")
+
+
+class ScanGroup:
+    """A block of registers or coils polled together for its subscribers"""
+
+    def __init__(self, name, function, address, count, codec=None, plan=None, recorded=True):
+        self.name = name
+        self.function = function
+        self.address = address
+        self.count = count
+        self.codec = codec
+        # Groups that only repeat other groups' registers faster are left out of the history
+        self.recorded = recorded
+        self.plan = [(function, a, c) for a, c in plan] if plan else [(function, address, count)]
+        self.subscribers = []
+        self.raw = None
+        self.snapshot = None
+        self.timestamp = None
+        self.job = None
+
+        self.request_latency = metrics.REGISTRY.histogram(
+            'modbus_request_seconds', 'Modbus request round trip', function=function)
+
+
+class Acquisition(QObject):
+    """One Modbus connection shared by every window
+
+    Windows subscribe to named scan groups while they are visible. A group
+    is only polled while it has subscribers, and a new subscriber is handed
+    the last snapshot straight away so a re-shown window doesn't sit blank
+    until the next poll. Groups are scan jobs on the ScanScheduler in their
+    poll class; adaptive groups speed up while their values are changing.
+
+    With pipeline_window > 1 the connection is a PipelinedModbusClient and a
+    group whose scan plan needs several requests sends them all at once;
+    pipeline_window=1 uses pyModbusTCP's synchronous client.
+
+    Given a standby (host, port) the client is a RedundantClient over both
+    PLCs, which keeps both connections warm and fails over between them.
+
+    While `source` is set (a ReplaySource) live reads are suspended and the
+    source hands recorded scans to deliver() instead, so windows can't tell
+    replayed data from live data.
+
+    Observers see every scan of every group as it is delivered, before
+    the subscribers do, without being subscribers: observing a group
+    doesn't make it polled.
+
+    reconfigure() moves tags to other registers, or rescales them, while
+    scanning carries on; reconfigured(group names) is emitted after.
+    """
+
+    reconfigured = pyqtSignal(list)
+
+    def __init__(self, host='localhost', port=5020, scheduler=None, pipeline_window=8, standby=None,
+                 parent=None):
+        super().__init__(parent)
+        self.pipeline_window = pipeline_window
+        self.failover = None
+        if standby:
+            self.failover = RedundantClient([
+                ('primary', self.make_client(host, port, FAILOVER_TIMEOUT)),
+                ('secondary', self.make_client(*standby, FAILOVER_TIMEOUT)),
+            ], parent=self)
+            self.failover.start()
+            self.client = self.failover
+        else:
+            self.client = self.make_client(host, port)
+        self.scheduler = scheduler or ScanScheduler(parent=self)
+        self.errors = metrics.REGISTRY.counter('modbus_errors_total', 'Failed Modbus requests')
+        self.groups = {}
+        self.observers = []
+        self.source = None
+
+        for name in TAG_GROUPS:
+            self.add_tag_group(name, tags_in_group(name, TAGS), 'normal', adaptive=True)
+        self.add_group('valves', 'read_coils', 0, 7, 'normal')
+        # Every process tag in one read at 10 Hz, for the overview while it's on screen
+        self.add_tag_group('overview', TAGS, 'realtime', recorded=False)
+        # Operator setpoints, read back after setpoints.py writes them and while a setpoint window is open
+        self.add_tag_group('setpoints', SETPOINT_TAGS, 'fast')
+
+    def make_client(self, host, port, timeout=2.0):
+        if self.pipeline_window > 1:
+            return PipelinedModbusClient(host=host, port=port, timeout=timeout, window=self.pipeline_window)
+        return ModbusClient(host=host, port=port, timeout=timeout, auto_open=True)
+
+    def add_group(self, name, function, address, count, poll_class='normal', adaptive=False, codec=None,
+                  plan=None, recorded=True):
+        group = ScanGroup(name, function, address, count, codec, plan, recorded)
+        group.job = self.scheduler.add(name, lambda: self.poll(name), poll_class, adaptive, start=False)
+        self.groups[name] = group
+        return group
+
+    def add_tag_group(self, name, tags, poll_class='normal', adaptive=False, recorded=True):
+        """Holding-register group whose subscribers get decoded engineering values"""
+        codec = RegisterCodec(tags)
+        return self.add_group(name, 'read_holding_registers', codec.base, codec.count,
+                              poll_class, adaptive, codec, plan_reads(tags), recorded)
+
+    def reconfigure(self, tags):
+        """Swap in new register addresses and scaling for tags (matched by name); returns the groups changed
+
+        Every tag group holding one of the tags gets a new codec and scan
+        plan. They are all built and checked, against each other and every
+        other group's registers, before any is swapped in, so a bad
+        configuration raises ValueError and changes nothing. Scans run
+        on this thread, so the swap always falls between two scans: the next
+        scan of each group reads the new registers, on the same schedule and
+        connection, and subscribers never see a gap. Tag names, their order
+        and their groups stay as they are.
+        """
+        by_name = {tag.name: tag for tag in tags}
+        changes = {}
+        for name, group in self.groups.items():
+            if not group.codec:
+                continue
+            old = group.codec.tags
+            new = [by_name.get(tag.name, tag) for tag in old]
+            if new == old:
+                continue
+            for tag, before in zip(new, old):
+                if tag.group != before.group:
+                    raise ValueError(f"{tag.name} can't move from {before.group} to {tag.group}")
+            check_registers(new)
+            changes[name] = (RegisterCodec(new), plan_reads(new))
+        if changes:
+            # A moved tag mustn't land on a register another group reads, such as a setpoint's.
+            # Groups share tags by name (the overview repeats every tag), so each name counts once.
+            configured = {}
+            for name, group in self.groups.items():
+                if group.codec:
+                    for tag in (changes[name][0] if name in changes else group.codec).tags:
+                        configured.setdefault(tag.name, tag)
+            check_registers(configured.values())
+
+        for name, (codec, plan) in changes.items():
+            group = self.groups[name]
+            group.codec = codec
+            group.address, group.count = codec.base, codec.count
+            group.plan = [(group.function, address, count) for address, count in plan]
+            group.raw = None
+        if changes:
+            log.info("Reconfigured %s", ', '.join(changes))
+            self.reconfigured.emit(list(changes))
+        return list(changes)
+
+    def subscribe(self, name, callback):
+        group = self.groups[name]
+        if callback in group.subscribers:
+            return
+        group.subscribers.append(callback)
+
+        if group.snapshot is not None:
+            callback(group.snapshot)
+
+        if len(group.subscribers) == 1:
+            log.debug("Polling %s (%s)", name, group.job.poll_class.name)
+            self.scheduler.resume(group.job)
+
+    def unsubscribe(self, name, callback):
+        group = self.groups[name]
+        if callback in group.subscribers:
+            group.subscribers.remove(callback)
+
+        if not group.subscribers:
+            log.debug("Stopped polling %s", name)
+            self.scheduler.pause(group.job)
+            # A redundant pair stays connected so the standby is warm when it's needed
+            if not self.failover and not any(g.subscribers for g in self.groups.values()):
+                self.client.close()
+
+    def observe(self, callback):
+        """Call callback(name, values, timestamp) for every delivered scan, values None on failure"""
+        if callback not in self.observers:
+            self.observers.append(callback)
+
+    def unobserve(self, callback):
+        if callback in self.observers:
+            self.observers.remove(callback)
+
+    def snapshot(self, name):
+        return self.groups[name].snapshot
+
+    @property
+    def replaying(self):
+        return self.source is not None
+
+    def execute(self, requests):
+        """Results of (function, address, arg) requests, pipelined when the client supports it"""
+        if hasattr(self.client, 'execute'):
+            return self.client.execute(requests)
+        return [getattr(self.client, function)(address, arg) for function, address, arg in requests]
+
+    def read(self, group):
+        """The group's registers/coils as one list, stitched together from its scan plan"""
+        try:
+            with group.request_latency.time():
+                results = self.execute(group.plan)
+        except Exception as e:
+            log.error("Error reading %s: %s", group.name, e)
+            results = [None]
+
+        if any(result is None for result in results):
+            self.errors.inc()
+            return None
+        if len(results) == 1:
+            return results[0]
+
+        values = [0] * group.count
+        for (_, address, count), result in zip(group.plan, results):
+            offset = address - group.address
+            values[offset:offset + count] = result
+        return values
+
+    def poll(self, name):
+        """Read a group now and hand the values (None on failure) to its subscribers
+
+        Tag groups deliver a NumPy array of engineering values in tag order;
+        other groups deliver the raw list from the client.
+
+        Returns whether the values changed since the last poll, which drives
+        the scheduler's adaptive rate.
+        """
+        group = self.groups[name]
+        if not group.subscribers or self.source is not None:
+            return None
+
+        raw = self.read(group)
+        if raw is None:
+            self.deliver(name, None)
+            return None
+
+        changed = raw != group.raw
+        group.raw = raw
+        self.deliver(name, group.codec.decode(raw) if group.codec else raw, time.time())
+        return changed
+
+    def deliver(self, name, values, timestamp=None):
+        """Hand a group's values (None on failure) to its subscribers and keep them as its snapshot"""
+        group = self.groups[name]
+        if values is not None:
+            group.snapshot = values
+            group.timestamp = timestamp
+        for callback in list(self.observers):
+            callback(name, values, timestamp)
+        for callback in list(group.subscribers):
+            callback(values)
+
+    def close(self):
+        self.observers.clear()
+        for group in self.groups.values():
+            group.subscribers.clear()
+            self.scheduler.pause(group.job)
+        self.client.close()
@@ -1,30 +1,69 @@
 import sys
 import os
+import time
+import logging
+import argparse
 from datetime import datetime
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                            QHBoxLayout, QLabel, QPushButton, QFileDialog, 
                            QMessageBox, QFrame, QSpacerItem, QSizePolicy,
                            QTableWidget, QTableWidgetItem, QHeaderView, QTabWidget)
-from PyQt5.QtCore import QTimer, Qt, pyqtSignal
-from PyQt5.QtGui import QFont, QPalette, QColor
-from PyQt5.QtSql import QSqlDatabase, QSqlTableModel, QSqlQuery
-import pandas as pd
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QFont
 import serial
-import sqlite3
+import metrics
+from db_writer import AsyncDatabase
+from cycle_db import COUNTER_SCHEMA
+from cycle_summary import rebuild_all
+from hmi_log import setup_logging
+from cycle_stats import CycleStats
+from serial_protocol import FrameDecoder, DeviceClock
+from scan_scheduler import ScanScheduler
+from stall_detector import StallDetector
+from maintenance import MaintenanceScheduler, ActivityFilter, CycleMaintenance, ARCHIVE_DIR, archive_files
 
-ser = serial.Serial(port="COM4",baudrate=9600,timeout=1);
+ser = None
+
+log = logging.getLogger('cycle_counter')
+
+# Longest count line kept while waiting for its newline
+MAX_LINE = 64
+
+SERIAL_READLINE = metrics.REGISTRY.histogram('serial_readline_seconds', 'Time spent reading the serial port per tick')
+SERIAL_ERRORS = metrics.REGISTRY.counter('serial_errors_total', 'Serial reads that failed or could not be parsed')
+CYCLE_RATE = metrics.REGISTRY.gauge('cycle_rate_per_minute', 'Cycles per minute (EWMA)')
+CYCLE_STALLS = metrics.REGISTRY.counter('cycle_stalls_total', 'Times the rig stopped cycling while counting')
+
+
+def now_text():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
 class CycleCounterGUI(QMainWindow):
-    def __init__(self):
+
+    def __init__(self, rigs=(), rig_id='COM4', protocol='text'):
         super().__init__()
         self.cycle_count = 0
         self.is_running = False
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.increment_cycle)
-        self.cycle_interval = 1000
+        self.scheduler = ScanScheduler(parent=self)
+        self.serial_job = self.scheduler.add('serial', self.increment_cycle, 'fast', start=False)
+        self.stats = CycleStats()
+        self.stats_job = self.scheduler.add('cycle_stats', self.update_stats, 'fast', start=False)
+        self.session_start = None
+        # The rig counted on the Counter tab; further rigs are counted by the rig manager
+        self.rig_id = rig_id
+        self.rig_manager = None
+        # 'framed' reads binary frames with device timestamps (serial_protocol.py) instead of count lines
+        self.protocol = protocol
+        self.decoder = None
+        self.device_clock = None
+        # Text mode: bytes of a count line still being received
+        self.line_buffer = bytearray()
         self.previous_count = 0
         self.session_id = None  
         self.offset = 0
+        # What a queued save was for, until the writer reports it committed
+        self.pending_save = None
+        self.pending_quick_save = None
         
         # Initialize database first
         self.init_database()
@@ -32,246 +71,200 @@ class CycleCounterGUI(QMainWindow):
         # Initialize UI
         self.initUI()
         
+        if rigs:
+            self.init_rigs(rigs)
+        
         # AFTER UI is initialized, restore session
         self.restore_session_after_crash()
         
-    def get_last_saved_count(self):
-        """Get the last saved count from historical data"""
-        try:
-            query = QSqlQuery("SELECT cycle_count FROM cycle_data ORDER BY id DESC LIMIT 1")
-            if query.next():
-                return query.value(0)
-            return 0
-        except Exception as e:
-            print(f"Error getting last saved count: {e}")
-            return 0
-            
     def init_database(self):
-        """Initialize SQLite database and create table if it doesn't exist"""
-        try:
-            self.db_name = 'cycle_counter.db'
-            
-            self.db = QSqlDatabase.addDatabase('QSQLITE')
-            self.db.setDatabaseName(self.db_name)
-            
-            if not self.db.open():
-                QMessageBox.critical(self, 'Database Error', 'Unable to establish database connection')
-                return
-            
-            # Create main table for historical data
-            query = QSqlQuery()
-            query.exec_('''
-                CREATE TABLE IF NOT EXISTS cycle_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    cycle_count INTEGER NOT NULL,
-                    status TEXT NOT NULL,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Create current session table (only one record)
-            query.exec_('''
-                CREATE TABLE IF NOT EXISTS current_session (
-                    id INTEGER PRIMARY KEY CHECK (id = 1),
-                    current_count INTEGER NOT NULL DEFAULT 0,
-                    last_updated DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    session_start DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    is_running BOOLEAN DEFAULT 0,
-                    was_crashed BOOLEAN DEFAULT 0
-                )
-            ''')
-            
-            print(f"Database initialized: {self.db_name}")
-            
-        except Exception as e:
-            print(f"Database initialization error: {e}")
-            QMessageBox.critical(self, 'Database Error', f'Failed to initialize database: {str(e)}')
-    
+        """Open cycle_counter.db on its own writer and reader threads; the writer creates the tables"""
+        self.db_name = 'cycle_counter.db'
+        self.database = AsyncDatabase(self.db_name, COUNTER_SCHEMA, name='counter', parent=self)
+        self.database.written.connect(self.database_written)
+        self.database.loaded.connect(self.database_loaded)
+        self.database.start()
+        log.info("Database opened: %s", self.db_name)
+
+    def database_written(self, op, ok, error):
+        """A write queued with an op name has been committed (ok) or dropped"""
+        handler = {'save': self.save_done, 'quick_save': self.quick_save_done, 'clear': self.clear_done}.get(op)
+        if handler:
+            handler(ok, error)
+        elif not ok:
+            log.warning("Database write %s failed: %s", op, error)
+
+    def database_loaded(self, op, rows, error):
+        if op == 'session':
+            self.restore_session(rows, error)
+        elif op == 'table':
+            self.show_table(rows, error)
+
     def restore_session_after_crash(self):
         """Restore session after a potential crash - called AFTER UI initialization"""
-        try:
-            query = QSqlQuery()
-            query.exec_("SELECT current_count, is_running, was_crashed FROM current_session WHERE id = 1")
-            
-            if query.next():
-                stored_count = query.value(0)
-                was_running = query.value(1)
-                was_crashed = query.value(2)
-                
-                # If the app was running when it crashed, restore the count
-                if was_running or was_crashed:
-                    self.cycle_count = stored_count
-                    self.previous_count = stored_count
-                    self.offset = 0  # Reset offset since we're restoring full count
-                    
-                    # Update UI with restored values
-                    self.cycle_display.setText(str(stored_count))
-                    self.session_count_label.setText(str(stored_count))
-                    
-                    # Show crash recovery message
-                    if was_running:
-                        self.status_label.setText(f'Recovered from crash - Count restored to {stored_count}')
-                        self.status_label.setStyleSheet("color: #f39c12; margin-top: 10px;")
-                        
-                        # Show save buttons since we have unsaved data
-                        self.save_db_button.setVisible(True)
-                        self.save_excel_button.setVisible(True)
-                        
-                        QMessageBox.information(
-                            self, 
-                            'Crash Recovery', 
-                            f'Application recovered from unexpected shutdown.\n\nRestored cycle count: {stored_count}\n\nYou can now save this data or continue counting.'
-                        )
-                    
-                    print(f"Restored session with count: {stored_count}")
-                
-                # Mark as no longer crashed and not running
-                update_query = QSqlQuery()
-                update_query.prepare("UPDATE current_session SET is_running = 0, was_crashed = 0, last_updated = ? WHERE id = 1")
-                update_query.addBindValue(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-                update_query.exec_()
-                
-            else:
-                # Create new session if none exists
-                self.create_new_session()
-                
-        except Exception as e:
-            print(f"Session restoration error: {e}")
-            # Create new session on error
+        # Counting waits until the stored session has been read back
+        self.start_button.setEnabled(False)
+        self.database.query(
+            'session', "SELECT current_count, is_running, was_crashed, session_start FROM current_session WHERE id = 1")
+
+    def restore_session(self, rows, error):
+        """Apply the stored session once restore_session_after_crash has read it"""
+        self.start_button.setEnabled(True)
+        if error or not rows:
+            if error:
+                log.error("Session restoration error: %s", error)
+            # Create new session if none exists
             self.create_new_session()
-    
+            return
+
+        stored_count, was_running, was_crashed, self.session_start = rows[0]
+
+        # If the app was running when it crashed, restore the count
+        if was_running or was_crashed:
+            self.cycle_count = stored_count
+            self.previous_count = stored_count
+            self.offset = 0  # Reset offset since we're restoring full count
+
+            # Update UI with restored values
+            self.cycle_display.setText(str(stored_count))
+            self.session_count_label.setText(str(stored_count))
+
+            # Show crash recovery message
+            if was_running:
+                self.status_label.setText(f'Recovered from crash - Count restored to {stored_count}')
+                self.status_label.setStyleSheet("color: #f39c12; margin-top: 10px;")
+
+                # Show save buttons since we have unsaved data
+                self.save_db_button.setVisible(True)
+                self.save_excel_button.setVisible(True)
+
+                QMessageBox.information(
+                    self,
+                    'Crash Recovery',
+                    f'Application recovered from unexpected shutdown.\n\nRestored cycle count: {stored_count}\n\nYou can now save this data or continue counting.'
+                )
+
+            log.info("Restored session with count: %s", stored_count)
+
+        # Mark as no longer crashed and not running
+        self.database.execute("UPDATE current_session SET is_running = 0, was_crashed = 0, last_updated = ?, rig_id = ? "
+                              "WHERE id = 1", (now_text(), self.rig_id))
+
     def create_new_session(self):
         """Create a new session record"""
-        try:
-            insert_query = QSqlQuery()
-            insert_query.prepare('''
-                INSERT OR REPLACE INTO current_session (id, current_count, last_updated, session_start, is_running, was_crashed) 
-                VALUES (1, 0, ?, ?, 0, 0)
-            ''')
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            insert_query.addBindValue(current_time)
-            insert_query.addBindValue(current_time)
-            insert_query.exec_()
-            
-            print("Created new session")
-            
-        except Exception as e:
-            print(f"Error creating new session: {e}")
-    
+        current_time = now_text()
+        self.database.execute('''
+            INSERT OR REPLACE INTO current_session
+                (id, current_count, last_updated, session_start, is_running, was_crashed, rig_id)
+            VALUES (1, 0, ?, ?, 0, 0, ?)
+        ''', (current_time, current_time, self.rig_id))
+        self.session_start = current_time
+        log.info("Created new session")
+
     def update_current_session(self, count):
-        """Update the current session with new count - called immediately when serial data arrives"""
-        try:
-            query = QSqlQuery()
-            query.prepare('''
-                UPDATE current_session 
-                SET current_count = ?, last_updated = ?, is_running = ?, was_crashed = 0
-                WHERE id = 1
-            ''')
-            query.addBindValue(count)
-            query.addBindValue(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-            query.addBindValue(self.is_running)
-            
-            if query.exec_():
-                print(f"Auto-saved count {count} to database")
-            else:
-                print(f"Failed to auto-save: {query.lastError().text()}")
-                
-        except Exception as e:
-            print(f"Auto-save error: {e}")
-    
+        """Queue the session's new count - called whenever serial data arrives
+
+        Counts queued faster than the writer commits replace each other, so
+        only the latest one is written.
+        """
+        self.database.execute('''
+            UPDATE current_session
+            SET current_count = ?, last_updated = ?, is_running = ?, was_crashed = 0
+            WHERE id = 1
+        ''', (count, now_text(), self.is_running), key='current_session')
+        log.debug("Auto-saving count %s to database", count)
+
     def save_to_database(self):
         """Save current session to historical data"""
         current_count = self.cycle_count
         if current_count == 0:
             QMessageBox.warning(self, 'Warning', 'No cycles to save!')
             return
-            
-        try:
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            query = QSqlQuery()
-            query.prepare("INSERT INTO cycle_data (timestamp, cycle_count, status) VALUES (?, ?, ?)")
-            query.addBindValue(current_time)
-            query.addBindValue(int(current_count))
-            query.addBindValue('Completed')
-            
-            if query.exec_():
-                self.refresh_table()
-                self.status_label.setText(f'Saved {current_count} cycles to historical data')
-                self.status_label.setStyleSheet("color: #27ae60; margin-top: 10px;")
-                
-                # Reset session after successful save
-                self.reset_session_after_save()
-                
-                QMessageBox.information(
-                    self, 
-                    'Success', 
-                    f'Cycle data saved to historical records!\n\nCycles: {current_count}\nTime: {current_time}'
-                )
-            else:
-                raise Exception(query.lastError().text())
-                
-        except Exception as e:
-            QMessageBox.critical(self, 'Database Error', f'Failed to save to database: {str(e)}')
-            self.status_label.setText(f'Error saving to database: {str(e)}')
+        if self.pending_save:
+            return
+
+        current_time = now_text()
+        self.pending_save = (current_count, current_time)
+        self.save_db_button.setEnabled(False)
+        self.status_label.setText(f'Saving {current_count} cycles...')
+        self.database.execute(
+            "INSERT INTO cycle_data (timestamp, cycle_count, status, rig_id, session_start) VALUES (?, ?, ?, ?, ?)",
+            (current_time, int(current_count), 'Completed', self.rig_id, self.session_start), op='save')
+
+    def save_done(self, ok, error):
+        """The writer has committed (or dropped) the row queued by save_to_database"""
+        current_count, current_time = self.pending_save
+        self.pending_save = None
+        self.save_db_button.setEnabled(True)
+        if ok:
+            self.refresh_table()
+            self.status_label.setText(f'Saved {current_count} cycles to historical data')
+            self.status_label.setStyleSheet("color: #27ae60; margin-top: 10px;")
+
+            # Reset session after successful save
+            self.reset_session_after_save()
+
+            QMessageBox.information(
+                self,
+                'Success',
+                f'Cycle data saved to historical records!\n\nCycles: {current_count}\nTime: {current_time}'
+            )
+        else:
+            QMessageBox.critical(self, 'Database Error', f'Failed to save to database: {error}')
+            self.status_label.setText(f'Error saving to database: {error}')
             self.status_label.setStyleSheet("color: #e74c3c; margin-top: 10px;")
-    
+
     def reset_session_after_save(self):
         """Reset session counts after successful save to historical data"""
-        try:
-            # Reset in-memory counts
-            self.cycle_count = 0
-            self.previous_count = 0
-            self.offset = 0
-            
-            # Update UI
-            self.cycle_display.setText('0')
-            self.session_count_label.setText('0')
-            
-            # Reset in database
-            query = QSqlQuery()
-            query.prepare('''
-                UPDATE current_session 
-                SET current_count = 0, last_updated = ?, is_running = 0, was_crashed = 0
-                WHERE id = 1
-            ''')
-            query.addBindValue(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-            query.exec_()
-            
-            # Hide save buttons
-            self.save_db_button.setVisible(False)
-            self.save_excel_button.setVisible(False)
-            
-            print("Session reset after save")
-            
-        except Exception as e:
-            print(f"Error resetting session: {e}")
+        # The saved session's statistics are final; the next count starts a new session
+        self.save_stats()
+        self.stats.reset()
+        self.show_stats()
+
+        # Reset in-memory counts
+        self.cycle_count = 0
+        self.previous_count = 0
+        self.offset = 0
+
+        # Update UI
+        self.cycle_display.setText('0')
+        self.session_count_label.setText('0')
+
+        # Reset in database
+        current_time = now_text()
+        self.database.execute('''
+            UPDATE current_session
+            SET current_count = 0, last_updated = ?, session_start = ?, is_running = 0, was_crashed = 0
+            WHERE id = 1
+        ''', (current_time, current_time))
+        self.session_start = current_time
+
+        # Hide save buttons
+        self.save_db_button.setVisible(False)
+        self.save_excel_button.setVisible(False)
+
+        log.info("Session reset after save")
+
+    def tab_changed(self, index):
+        if not self.table_loaded and self.tab_widget.widget(index) is self.table_tab:
+            self.refresh_table()
     
     def refresh_table(self):
-        """Refresh the table with latest data from database"""
-        try:
-            query = QSqlQuery("SELECT id, timestamp, cycle_count, status, created_at FROM cycle_data ORDER BY id DESC")
-            
-            self.table.setRowCount(0)
-            
-            row = 0
-            while query.next():
-                self.table.insertRow(row)
-                
-                self.table.setItem(row, 0, QTableWidgetItem(str(query.value(0))))  # ID
-                self.table.setItem(row, 1, QTableWidgetItem(str(query.value(1))))  # Timestamp
-                self.table.setItem(row, 2, QTableWidgetItem(str(query.value(2))))  # Cycle Count
-                self.table.setItem(row, 3, QTableWidgetItem(str(query.value(3))))  # Status
-                self.table.setItem(row, 4, QTableWidgetItem(str(query.value(4))))  # Created At
-                
-                row += 1
-            
-            print("Table refreshed")
-                
-        except Exception as e:
-            QMessageBox.critical(self, 'Database Error', f'Failed to refresh table: {str(e)}')
-        
+        """Reload the table from the database; the rows arrive in show_table"""
+        self.table_loaded = True
+        self.database.query('table', "SELECT id, timestamp, cycle_count, status, created_at FROM cycle_data ORDER BY id DESC")
+
+    def show_table(self, rows, error):
+        if error:
+            QMessageBox.critical(self, 'Database Error', f'Failed to refresh table: {error}')
+            return
+        self.table.setRowCount(len(rows))
+        # ID, Timestamp, Cycle Count, Status, Created At
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(str(value)))
+        log.debug("Table refreshed")
+
     def initUI(self):
         self.setWindowTitle('Cycle Counter Application')
         self.setGeometry(100, 100, 800, 600)
@@ -368,6 +361,18 @@ class CycleCounterGUI(QMainWindow):
         cycle_layout.addWidget(self.cycle_display)
         main_layout.addWidget(self.cycle_frame)
         
+        # Live throughput from the rolling statistics
+        stats_layout = QHBoxLayout()
+        self.rate_label = QLabel()
+        self.cycle_time_label = QLabel()
+        self.stall_label = QLabel()
+        for label in (self.rate_label, self.cycle_time_label, self.stall_label):
+            label.setAlignment(Qt.AlignCenter)
+            label.setFont(QFont('Arial', 12))
+            stats_layout.addWidget(label)
+        main_layout.addLayout(stats_layout)
+        self.show_stats()
+        
         main_layout.addItem(QSpacerItem(20, 20, QSizePolicy.Minimum, QSizePolicy.Expanding))
         
         button_layout = QHBoxLayout()
@@ -422,10 +427,10 @@ class CycleCounterGUI(QMainWindow):
         main_layout.addWidget(self.status_label)
         
         # Database Table Tab
-        table_tab = QWidget()
-        self.tab_widget.addTab(table_tab, "Historical Records")
+        self.table_tab = QWidget()
+        self.tab_widget.addTab(self.table_tab, "Historical Records")
         
-        table_layout = QVBoxLayout(table_tab)
+        table_layout = QVBoxLayout(self.table_tab)
         table_layout.setContentsMargins(10, 10, 10, 10)
         
         # Current Session Info
@@ -485,79 +490,105 @@ class CycleCounterGUI(QMainWindow):
         
         table_layout.addWidget(self.table)
         
-        # Load initial data
-        self.refresh_table()
+        # Diagnostics Tab
+        self.diagnostics_panel = metrics.DiagnosticsPanel()
+        self.tab_widget.addTab(self.diagnostics_panel, "Diagnostics")
+        
+        # Load historical data the first time its tab is opened, not at startup
+        self.table_loaded = False
+        self.tab_widget.currentChanged.connect(self.tab_changed)
         
         # Initialize session count display (will be updated by restore_session_after_crash)
         self.session_count_label.setText('0')
         
+    def init_rigs(self, rigs):
+        """Count further rigs, each on its own port, in this process with a Rigs dashboard tab"""
+        from rig_manager import RigManager, RigDashboard
+        
+        # Same writer thread as the Counter tab: one writer for cycle_counter.db
+        self.rig_manager = RigManager(self.database.writer, parent=self)
+        for rig_id, port, baudrate in rigs:
+            self.rig_manager.add_rig(rig_id, port, baudrate, self.protocol)
+        self.rig_dashboard = RigDashboard(self.rig_manager)
+        self.tab_widget.insertTab(1, self.rig_dashboard, "Rigs")
+        
     def to_the_db(self):
         """Quick save current count to database"""
         current_count = self.cycle_count
         if current_count == 0:
             QMessageBox.warning(self, 'Warning', 'No cycles to save!')
             return
-            
-        try:
-            query = QSqlQuery()
-            query.prepare("INSERT INTO cycle_data (timestamp, cycle_count, status) VALUES (?, ?, ?)")
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            query.addBindValue(current_time)
-            query.addBindValue(int(current_count))
-            query.addBindValue('Quick Save')
-
-            if query.exec_():
-                self.refresh_table()
-                print(f"Quick saved to DB: {current_count}")
-                QMessageBox.information(self, 'Success', f'Quick saved {current_count} cycles to database!')
-            else:
-                print("DB Error:", query.lastError().text())
-                QMessageBox.critical(self, 'Error', f'Failed to save: {query.lastError().text()}')
-                
-        except Exception as e:
-            print(f"Error in quick save: {e}")
-            QMessageBox.critical(self, 'Error', f'Error saving to database: {str(e)}')
-        
+        if self.pending_quick_save:
+            return
+
+        self.pending_quick_save = current_count
+        self.database.execute(
+            "INSERT INTO cycle_data (timestamp, cycle_count, status, rig_id, session_start) VALUES (?, ?, ?, ?, ?)",
+            (now_text(), int(current_count), 'Quick Save', self.rig_id, self.session_start), op='quick_save')
+
+    def quick_save_done(self, ok, error):
+        current_count = self.pending_quick_save
+        self.pending_quick_save = None
+        if ok:
+            self.refresh_table()
+            log.info("Quick saved to DB: %s", current_count)
+            QMessageBox.information(self, 'Success', f'Quick saved {current_count} cycles to database!')
+        else:
+            log.error("DB Error: %s", error)
+            QMessageBox.critical(self, 'Error', f'Failed to save: {error}')
+
     def crash_it(self):
         """Simulate a crash by marking as crashed and entering infinite loop"""
         # Mark as crashed in database before crashing
-        try:
-            query = QSqlQuery()
-            query.prepare("UPDATE current_session SET was_crashed = 1, last_updated = ? WHERE id = 1")
-            query.addBindValue(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-            query.exec_()
-            print("Marked as crashed in database")
-        except Exception as e:
-            print(f"Error marking crash: {e}")
-        
+        self.database.execute("UPDATE current_session SET was_crashed = 1, last_updated = ? WHERE id = 1", (now_text(),))
+        if self.database.flush(timeout=5):
+            log.warning("Marked as crashed in database")
+        else:
+            log.error("Error marking crash: the database writer did not respond")
+
         # Simulate crash with infinite loop
         while True:
             pass
-        
+
     def clear_database(self):
         """Clear all records from database"""
         reply = QMessageBox.question(
-            self, 
-            'Confirm Clear', 
+            self,
+            'Confirm Clear',
             'Are you sure you want to clear all records from the database?',
             QMessageBox.Yes | QMessageBox.No,
             QMessageBox.No
         )
-        
+
         if reply == QMessageBox.Yes:
-            try:
-                query = QSqlQuery()
-                query.exec_("DELETE FROM cycle_data")
-                self.refresh_table()
-                QMessageBox.information(self, 'Success', 'All historical records cleared from database')
-            except Exception as e:
-                QMessageBox.critical(self, 'Error', f'Failed to clear database: {str(e)}')
-        
+            # The summaries keep the archived rows' history. One writer item, so the delete and the
+            # rebuild from the archives commit or roll back together
+            archives = archive_files(ARCHIVE_DIR, self.db_name)
+            self.database.call(lambda db: (db.execute("DELETE FROM cycle_data"), rebuild_all(db, archives)),
+                               op='clear')
+
+    def clear_done(self, ok, error):
+        if ok:
+            self.refresh_table()
+            QMessageBox.information(self, 'Success', 'All historical records cleared from database')
+        else:
+            QMessageBox.critical(self, 'Error', f'Failed to clear database: {error}')
+
     def start_counting(self):
         """Start counting cycles"""
-        ser.write(b"start")
+        # The device restarts its count, so lines and frames left over from before are stale
+        ser.reset_input_buffer()
+        self.line_buffer = bytearray()
+        if self.protocol == 'framed':
+            self.decoder = FrameDecoder()
+            self.device_clock = DeviceClock()
+            ser.write(b"framed start")
+        else:
+            ser.write(b"start")
         self.is_running = True
-        self.timer.start(self.cycle_interval)
+        self.stats.rebaseline()
+        self.scheduler.resume(self.serial_job, run_now=False)
+        self.scheduler.resume(self.stats_job, run_now=False)
         
         # Update session status
         self.update_session_status(True)
@@ -573,7 +604,10 @@ class CycleCounterGUI(QMainWindow):
     def stop_counting(self):
         """Stop the cycle counting"""
         self.is_running = False
-        self.timer.stop()
+        self.scheduler.pause(self.serial_job)
+        self.scheduler.pause(self.stats_job)
+        self.save_stats()
+        self.show_stats()
         
         # Update session status
         self.update_session_status(False)
@@ -592,19 +626,13 @@ class CycleCounterGUI(QMainWindow):
         try:
             ser.write(b"stop")
         except Exception as e:
-            print(f"Error sending stop command: {e}")
+            log.error("Error sending stop command: %s", e)
     
     def update_session_status(self, is_running):
         """Update the running status in current session"""
-        try:
-            query = QSqlQuery()
-            query.prepare("UPDATE current_session SET is_running = ?, last_updated = ? WHERE id = 1")
-            query.addBindValue(is_running)
-            query.addBindValue(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-            query.exec_()
-        except Exception as e:
-            print(f"Failed to update session status: {e}")
-    
+        self.database.execute("UPDATE current_session SET is_running = ?, last_updated = ? WHERE id = 1",
+                              (is_running, now_text()))
+
     def reset_count(self):
         """Reset the cycle count"""
         if self.is_running:
@@ -616,6 +644,8 @@ class CycleCounterGUI(QMainWindow):
         self.offset = 0
         self.cycle_display.setText('0')
         self.session_count_label.setText('0')
+        self.stats.reset()
+        self.show_stats()
         
         # Reset in database
         self.update_current_session(0)
@@ -627,37 +657,106 @@ class CycleCounterGUI(QMainWindow):
         self.status_label.setStyleSheet("color: #7f8c8d; margin-top: 10px;")
         
     def increment_cycle(self):
-        """Read cycle count from Arduino and update display"""
+        """Take whatever the Arduino has sent since the last tick and update display; never blocks on the port"""
         try:
-            data = ser.readline().decode().strip()
-
-            if data:
-                try:
-                    current_count = int(data)
-
-                    # Update only if count has changed
-                    if current_count != self.previous_count:
-                        self.previous_count = current_count  # From device
-
-                        # Real count = offset + device count
-                        real_count = current_count + self.offset
-                        self.cycle_count = real_count
-                    
-                        # Update GUI
-                        self.cycle_display.setText(str(real_count))
-                        self.session_count_label.setText(str(real_count))
-                    
-                        # Save to DB
-                        self.update_current_session(real_count)
-                        print(f"Updated and auto-saved cycle count: {real_count}")
-
-                except ValueError:
-                    print(f"Invalid data received: {data}")
-
+            with SERIAL_READLINE.time():
+                data = ser.read(ser.in_waiting)
         except Exception as e:
-            print(f"Error reading serial data: {e}")
+            SERIAL_ERRORS.inc()
+            log.error("Error reading serial data: %s", e)
+            return
+        if self.decoder:
+            self.read_frames(data)
+        else:
+            self.read_lines(data)
+
+    def read_lines(self, data):
+        """Apply every complete count line in data; a partial line waits for the rest"""
+        self.line_buffer += data
+        *lines, rest = self.line_buffer.split(b'\n')
+        # A device sending garbage without newlines mustn't grow the buffer forever
+        self.line_buffer = rest if len(rest) <= MAX_LINE else bytearray()
+        for line in lines:
+            text = line.decode(errors='replace').strip()
+            if not text:
+                continue
+            try:
+                self.apply_count(int(text))
+            except ValueError:
+                SERIAL_ERRORS.inc()
+                log.warning("Invalid data received: %r", text)
+
+    def read_frames(self, data):
+        """Decode the frames in data, mapping their device timestamps onto the host clock"""
+        lost, errors = self.decoder.lost, self.decoder.errors
+        samples = self.device_clock.to_host(self.decoder.feed(data), time.monotonic())
+        if self.decoder.lost != lost or self.decoder.errors != errors:
+            log.warning("Serial frames lost: %d, corrupted: %d (session totals)", self.decoder.lost, self.decoder.errors)
+        if not samples:
+            return
+        # Every count carries the device's timestamp, so cycle times don't depend on when the port was read
+        for count, at in samples:
+            self.stats.add(count + self.offset, at)
+        self.apply_count(samples[-1][0], timed=True)
+
+    def apply_count(self, current_count, timed=False):
+        """Show and auto-save the device's cumulative count; timed means stats already have it"""
+        # Update only if count has changed
+        if current_count != self.previous_count:
+            self.previous_count = current_count  # From device
+
+            # Real count = offset + device count
+            real_count = current_count + self.offset
+            self.cycle_count = real_count
+            if not timed:
+                self.stats.add(real_count)
+
+            # Update GUI
+            self.cycle_display.setText(str(real_count))
+            self.session_count_label.setText(str(real_count))
+
+            # Save to DB
+            self.update_current_session(real_count)
+            log.debug("Updated and auto-saved cycle count: %s", real_count)
+
+    def update_stats(self):
+        """Refresh the rate display and watch for a stalled rig (once a second while counting)"""
+        if self.stats.check_stall():
+            CYCLE_STALLS.inc()
+            log.warning("No cycles for %.0f s at cycle %d - rig stalled?",
+                        time.monotonic() - self.stats.last_time, self.cycle_count)
+        self.show_stats()
+
+    def show_stats(self):
+        summary = self.stats.summary(60)
+        CYCLE_RATE.set(summary['ewma_per_min'])
+        self.rate_label.setText(f"Rate: {summary['ewma_per_min']:.1f}/min  (last min: {summary['cycles']})")
+        if summary['p50'] is None:
+            self.cycle_time_label.setText("Cycle time: -")
+        else:
+            self.cycle_time_label.setText(
+                f"Cycle time: {summary['p50']:.2f} s  (p90 {summary['p90']:.2f}, max {summary['max']:.2f})")
+        if self.stats.stalled:
+            self.stall_label.setText("STALLED")
+            self.stall_label.setStyleSheet("color: #e74c3c;")
+        else:
+            self.stall_label.setText(f"Stalls: {self.stats.stalls}")
+            self.stall_label.setStyleSheet("color: #7f8c8d;")
+
+    def save_stats(self):
+        """Store this session's cycle statistics"""
+        if not self.stats.total or not self.session_start:
+            return
+        summary = self.stats.session_summary()
+        self.database.execute('''
+            INSERT OR REPLACE INTO session_stats (session_start, updated_at, cycles, ewma_per_min, min_cycle_s,
+                                                  max_cycle_s, p50_cycle_s, p90_cycle_s, p99_cycle_s, stalls)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (self.session_start, now_text(),
+              *(summary[key] for key in ('cycles', 'ewma_per_min', 'min', 'max', 'p50', 'p90', 'p99', 'stalls'))),
+            key=('session_stats', self.session_start))
+
 
-        
     def save_to_excel(self):
         """Save current count to Excel file"""
         current_count = self.cycle_count
@@ -677,26 +776,7 @@ class CycleCounterGUI(QMainWindow):
             
         try:
             current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            new_data = {
-                'Timestamp': [current_time],
-                'Cycle Count': [current_count],
-                'Status': ['Completed']
-            }
-            new_df = pd.DataFrame(new_data)
-            
-            if os.path.exists(file_path):
-                try:
-                    existing_df = pd.read_excel(file_path)
-                    combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-                    self.status_label.setText(f'Data appended to existing file')
-                except Exception as e:
-                    combined_df = new_df
-                    self.status_label.setText(f'Created new file (could not read existing): {str(e)}')
-            else:
-                combined_df = new_df
-                self.status_label.setText('New file created')
-            
-            combined_df.to_excel(file_path, index=False)
+            self.status_label.setText(self.append_to_excel(file_path, current_count, current_time))
             
             # Reset session after successful save
             self.reset_session_after_save()
@@ -719,19 +799,81 @@ class CycleCounterGUI(QMainWindow):
             self.status_label.setText(f'Error saving file: {str(e)}')
             self.status_label.setStyleSheet("color: #e74c3c; margin-top: 10px;")
     
+    def append_to_excel(self, file_path, current_count, current_time):
+        """Append one record to the workbook at file_path and return a status message"""
+        # pandas takes longer to import than the rest of the app, so only load it when exporting
+        import pandas as pd
+
+        new_data = {
+            'Timestamp': [current_time],
+            'Cycle Count': [current_count],
+            'Status': ['Completed']
+        }
+        new_df = pd.DataFrame(new_data)
+        
+        if os.path.exists(file_path):
+            try:
+                existing_df = pd.read_excel(file_path)
+                combined_df = pd.concat([existing_df, new_df], ignore_index=True)
+                message = 'Data appended to existing file'
+            except Exception as e:
+                combined_df = new_df
+                message = f'Created new file (could not read existing): {str(e)}'
+        else:
+            combined_df = new_df
+            message = 'New file created'
+        
+        combined_df.to_excel(file_path, index=False)
+        return message
+    
     def closeEvent(self, event):
         """Handle application close event"""
-        if hasattr(self, 'db') and self.db.isOpen():
-            # Update session as not running before closing
-            self.update_session_status(False)
-            self.db.close()
+        # Update session as not running before closing; close() waits for the writer to commit
+        self.update_session_status(False)
+        self.save_stats()
+        if self.rig_manager:
+            self.rig_manager.close()
+        self.database.close()
         event.accept()
 
+def parse_rig(text):
+    """ID=PORT[@BAUD] -> (id, port, baudrate); PORT may be a pyserial URL"""
+    rig_id, _, port = text.partition('=')
+    if not port:
+        raise argparse.ArgumentTypeError(f"expected ID=PORT, got {text!r}")
+    port, _, baudrate = port.partition('@')
+    return rig_id, port, int(baudrate or 9600)
+
 def main():
-    app = QApplication(sys.argv)
+    global ser
+    parser = argparse.ArgumentParser(description="Cycle counter")
+    parser.add_argument("--port", default="COM4", help="serial port of the rig on the Counter tab")
+    parser.add_argument("--rig", dest="rigs", action="append", type=parse_rig, default=[], metavar="ID=PORT[@BAUD]",
+                        help="count another rig in this process (repeatable)")
+    parser.add_argument("--baud", type=int, default=9600, help="baud rate of the rig on the Counter tab")
+    parser.add_argument("--protocol", choices=("text", "framed"), default="text",
+                        help="text: one count per line; framed: binary frames with device timestamps and CRC")
+    args, qt_args = parser.parse_known_args()
+
+    setup_logging('cycle_counter')
+    ser = serial.Serial(port=args.port,baudrate=args.baud,timeout=1)
+
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setStyle('Fusion')
-    window = CycleCounterGUI()
+    lag_probe = metrics.EventLoopLagProbe()
+    lag_probe.start()
+    stall_detector = StallDetector(threshold=0.5)
+    stall_detector.start()
+    window = CycleCounterGUI(args.rigs, args.port, args.protocol)
     window.show()
+    # Retention and vacuum of cycle_counter.db, off the GUI thread
+    maintenance = MaintenanceScheduler()
+    CycleMaintenance(window.db_name).schedule(maintenance)
+    app.installEventFilter(ActivityFilter(maintenance, app))
+    app.aboutToQuit.connect(maintenance.stop)
+    maintenance.start()
+    # Secondary services start once the main window is up
+    metrics.start_server(9109)
     
     sys.exit(app.exec_())
 
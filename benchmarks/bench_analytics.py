@@ -0,0 +1,27 @@
+"""Analytics stage cost per scan: statistics, flags and mass balances for one group's tags"""
+import logging
+import numpy as np
+from common import measure
+
+
+def bench_analytics_scan(tags):
+    """Per-scan cost of updating a 10-tag group or the 49-tag overview scan"""
+    from tag_analytics import TagAnalytics
+    from tags import TAGS
+
+    # Random scans trip the flags and balances; their warnings aren't what is measured
+    logging.getLogger('tag_analytics').setLevel(logging.ERROR)
+    analytics = TagAnalytics()
+    slots = np.arange(tags)
+    rng = np.random.default_rng(0)
+    scans = np.round(np.array([tag.scale * 500 for tag in TAGS[:tags]]) + rng.normal(0, 1, (1000, tags)), 2)
+    clock = iter(range(10 ** 9))
+
+    def scan():
+        i = next(clock)
+        analytics.update(slots, scans[i % 1000], 1_700_000_000.0 + 2.0 * i)
+
+    return measure(scan, number=1000, repeat=5)
+
+
+bench_analytics_scan.params = [10, 49]
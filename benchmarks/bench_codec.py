@@ -0,0 +1,23 @@
+"""Register decoding cost per scan as the tag count grows"""
+import random
+from common import measure
+
+
+def bench_decode_scan(tags):
+    from tags import Tag
+    from register_codec import RegisterCodec
+
+    dtypes = ['int16', 'uint16', 'float32', 'int32', 'bit']
+    table = []
+    address = 0
+    for i in range(tags):
+        dtype = dtypes[i % len(dtypes)]
+        table.append(Tag(f"X{i:05d}", 'bench', address, dtype, 0.1, 0.0, '', 'big', 'big', i % 16))
+        address += 2 if dtype in ('float32', 'int32') else 1
+
+    codec = RegisterCodec(table)
+    regs = [random.randint(0, 65535) for _ in range(codec.count)]
+    return measure(lambda: codec.decode(regs), number=100, repeat=10)
+
+
+bench_decode_scan.params = [10, 1000, 10000]
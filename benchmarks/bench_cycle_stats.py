@@ -0,0 +1,25 @@
+"""Cost of the rolling cycle statistics on the serial read path and the 1 Hz display refresh"""
+import itertools
+from common import measure
+
+
+def bench_add_count():
+    from cycle_stats import CycleStats
+
+    stats = CycleStats()
+    counts = itertools.count(1)
+    clock = itertools.count(0, 0.5)
+    return measure(lambda: stats.add(next(counts), next(clock)), number=10000, repeat=5)
+
+
+def bench_summary(cycles):
+    """Window summary with the ring holding `cycles` cycles (capped at its capacity)"""
+    from cycle_stats import CycleStats
+
+    stats = CycleStats()
+    for count in range(cycles + 1):
+        stats.add(count, count * 0.01)
+    return measure(lambda: stats.summary(60, cycles * 0.01), number=10, repeat=5)
+
+
+bench_summary.params = [100, 4096]
@@ -0,0 +1,72 @@
+"""Cycle summaries: what the trigger adds to each save, and a week's totals from them against a full scan"""
+import itertools
+import sqlite3
+from datetime import date, timedelta
+from common import measure
+
+TODAY = date(2024, 3, 10)
+
+
+def counter_db(rows, summaries=True):
+    """In-memory cycle_counter.db with rows saves over the last 60 days, 20 per session"""
+    from cycle_db import COUNTER_SCHEMA
+    from cycle_summary import create_summaries
+
+    db = sqlite3.connect(':memory:')
+    for statement in COUNTER_SCHEMA:
+        if statement is create_summaries and not summaries:
+            continue
+        statement(db) if callable(statement) else db.execute(statement)
+    saves = []
+    for i in range(rows):
+        session = (TODAY - timedelta(days=i * 60 // rows)).isoformat() + f" {i // 20 % 24:02d}:00:00"
+        saves.append((session[:10] + " 12:00:00", i % 20 * 50, 'Completed' if i % 20 == 19 else 'Quick Save',
+                      'COM4', session))
+    db.executemany('INSERT INTO cycle_data (timestamp, cycle_count, status, rig_id, session_start) '
+                   'VALUES (?, ?, ?, ?, ?)', saves)
+    db.commit()
+    return db
+
+
+def bench_save(summaries):
+    """One save as the writer thread commits it, without (0) and with (1) the summary trigger"""
+    db = counter_db(1000, summaries)
+    counts = itertools.count()
+
+    def save():
+        db.execute('INSERT INTO cycle_data (timestamp, cycle_count, status, rig_id, session_start) '
+                   "VALUES ('2024-03-10 13:00:00', ?, 'Quick Save', 'COM4', '2024-03-10 13:00:00')", (next(counts),))
+        db.commit()
+
+    return measure(save, number=200, repeat=5)
+
+
+bench_save.params = [0, 1]
+
+
+def bench_week_totals(rows):
+    """This week's sessions and cycles from cycle_daily"""
+    from cycle_summary import week_totals
+
+    db = counter_db(rows)
+    return measure(lambda: week_totals(db, TODAY), number=100, repeat=5)
+
+
+bench_week_totals.params = [1000, 100000]
+
+
+def bench_week_totals_scan(rows):
+    """The same totals aggregated from cycle_data, as before the summaries"""
+    db = counter_db(rows, summaries=False)
+    monday = (TODAY - timedelta(days=TODAY.weekday())).isoformat()
+
+    def scan():
+        return db.execute('''SELECT COUNT(*), SUM(cycles) FROM (
+            SELECT MAX(cycle_count) AS cycles FROM cycle_data
+            WHERE substr(COALESCE(session_start, timestamp), 1, 10) BETWEEN ? AND ?
+            GROUP BY COALESCE(rig_id, ''), COALESCE(session_start, id))''', (monday, TODAY.isoformat())).fetchone()
+
+    return measure(scan, number=5, repeat=5)
+
+
+bench_week_totals_scan.params = [1000, 100000]
@@ -0,0 +1,51 @@
+"""CycleCounterGUI persistence: what auto-saves and the historical table cost the GUI thread"""
+import os
+import sqlite3
+import tempfile
+from common import qapp, quiet, measure
+
+_gui = None
+
+
+def cycle_counter():
+    """A CycleCounterGUI working on a throwaway cycle_counter.db"""
+    global _gui
+    if _gui is None:
+        qapp()
+        os.chdir(tempfile.mkdtemp(prefix="igcar-bench-"))
+        import arduino
+        with quiet():
+            _gui = arduino.CycleCounterGUI()
+    return _gui
+
+
+def fill_cycle_data(gui, rows):
+    """Replace cycle_data with rows records and return them as the table query reads them"""
+    gui.database.flush()
+    with sqlite3.connect(gui.db_name) as db:
+        db.execute("DELETE FROM cycle_data")
+        db.executemany("INSERT INTO cycle_data (timestamp, cycle_count, status) VALUES (?, ?, ?)",
+                       [("2024-01-01 00:00:00", i, "Completed" if i % 2 else "Quick Save") for i in range(rows)])
+        return db.execute("SELECT id, timestamp, cycle_count, status, created_at FROM cycle_data "
+                          "ORDER BY id DESC").fetchall()
+
+
+def bench_update_current_session():
+    """Seconds the GUI thread spends queueing an auto-save; the writer thread commits it"""
+    gui = cycle_counter()
+    count = iter(range(1, 10 ** 9))
+
+    with quiet():
+        return measure(lambda: gui.update_current_session(next(count)), number=50, repeat=10)
+
+
+def bench_show_table(rows):
+    """Seconds the GUI thread spends filling the table once the reader has loaded the rows"""
+    gui = cycle_counter()
+    loaded = fill_cycle_data(gui, rows)
+
+    with quiet():
+        return measure(lambda: gui.show_table(loaded, ''), number=1, repeat=5)
+
+
+bench_show_table.params = [100, 1000, 5000]
@@ -0,0 +1,22 @@
+"""save_to_excel cost against the size of the workbook being appended to"""
+import os
+import tempfile
+from bench_database import cycle_counter
+from common import measure
+
+
+def bench_save_to_excel(rows):
+    import pandas as pd
+
+    gui = cycle_counter()
+    file_path = os.path.join(tempfile.mkdtemp(prefix="igcar-bench-"), "cycle_data.xlsx")
+    pd.DataFrame({
+        'Timestamp': ["2024-01-01 00:00:00"] * rows,
+        'Cycle Count': list(range(rows)),
+        'Status': ['Completed'] * rows,
+    }).to_excel(file_path, index=False)
+
+    return measure(lambda: gui.append_to_excel(file_path, 1, "2024-01-01 00:00:00"), number=1, repeat=3)
+
+
+bench_save_to_excel.params = [10, 1000, 10000]
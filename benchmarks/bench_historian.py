@@ -0,0 +1,92 @@
+"""Historian recording cost on the scan path and sequential read speed for replay"""
+import os
+import tempfile
+import numpy as np
+from common import measure
+
+TAGS = 10
+SCAN_PERIOD = 2.0
+START = 1_700_000_000.0
+
+
+def historian(scans=0):
+    from historian import Historian
+
+    history = Historian(os.path.join(tempfile.mkdtemp(prefix="igcar-bench-"), "history.db"))
+    history.define_group('temperatures', [f"T{i + 1:03d}" for i in range(TAGS)])
+    values = np.linspace(20.0, 30.0, TAGS)
+    for i in range(scans):
+        history.record('temperatures', START + i * SCAN_PERIOD, values)
+    history.flush()
+    return history
+
+
+def bench_record_scan():
+    """Cost the acquisition pays per scan to hand a row to the historian"""
+    history = historian()
+    values = np.linspace(20.0, 30.0, TAGS)
+    stats = measure(lambda: history.record('temperatures', START, values), number=1000, repeat=5)
+    history.close()
+    return stats
+
+
+def bench_replay_read(scans):
+    """Per-row cost of streaming recorded scans in time order, as ReplaySource does"""
+    history = historian(scans)
+
+    def read_all():
+        for _ in history.scans(START):
+            pass
+
+    stats = measure(read_all, repeat=5, per=scans)
+    history.close()
+    return stats
+
+
+bench_replay_read.params = [1000, 10000]
+
+
+def bench_compress_chunk():
+    """Writer-thread cost of compressing one chunk of a 49-tag group, swinging-door included"""
+    from history_codec import encode_chunk
+    from register_codec import RegisterCodec
+    from tags import TAGS
+
+    rng = np.random.default_rng(0)
+    raw = 500 + np.cumsum(rng.integers(-1, 2, (1024, len(TAGS))) * (rng.random((1024, len(TAGS))) < 0.2), axis=0)
+    codec = RegisterCodec(TAGS)
+    values = np.array([codec.decode(list(row)) for row in raw])
+    times = START + np.arange(1024) * SCAN_PERIOD
+    tolerances = [(tag.scale, tag.offset, tag.tolerance) for tag in TAGS]
+    return measure(lambda: encode_chunk(times, values, tolerances), repeat=5, per=1024)
+
+
+def bench_series_read(scans):
+    """Per-row cost of reading one group's whole history into NumPy arrays"""
+    history = historian(scans)
+    stats = measure(lambda: history.series('temperatures', START), repeat=5, per=scans)
+    history.close()
+    return stats
+
+
+bench_series_read.params = [1000, 10000]
+
+
+def bench_rollup(scans):
+    """Per-scan cost of the maintenance thread rolling a group's new scans up into minutes and hours"""
+    from maintenance import HistoryMaintenance
+
+    history = historian(scans)
+    end = START + scans * SCAN_PERIOD + 3600
+
+    def rollup():
+        jobs = HistoryMaintenance(history, archive_dir=None)
+        jobs.connect().execute('DELETE FROM rollup_progress')
+        jobs.rollup(end)
+
+    stats = measure(rollup, repeat=5, per=scans)
+    history.close()
+    return stats
+
+
+bench_rollup.params = [1000, 10000]
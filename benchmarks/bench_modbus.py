@@ -0,0 +1,108 @@
+"""Modbus scan throughput and per-request latency against simulator.py"""
+import time
+from common import simulator, summarize
+
+
+def bench_scan_latency():
+    """One scan = the temperature block read plus the valve coil read"""
+    from pyModbusTCP.client import ModbusClient
+
+    with simulator() as (host, port):
+        client = ModbusClient(host=host, port=port, auto_open=True)
+        client.read_holding_registers(0, 10)
+
+        samples = []
+        for _ in range(500):
+            start = time.perf_counter()
+            client.read_holding_registers(0, 10)
+            client.read_coils(0, 7)
+            samples.append(time.perf_counter() - start)
+        client.close()
+
+    return summarize(samples)
+
+
+def bench_request_latency():
+    from pyModbusTCP.client import ModbusClient
+
+    with simulator() as (host, port):
+        client = ModbusClient(host=host, port=port, auto_open=True)
+        client.read_holding_registers(0, 10)
+
+        samples = []
+        for _ in range(1000):
+            start = time.perf_counter()
+            client.read_holding_registers(0, 10)
+            samples.append(time.perf_counter() - start)
+        client.close()
+
+    return summarize(samples)
+
+
+def bench_scan_throughput():
+    """Scans completed back to back in one second, reported as seconds per scan"""
+    from pyModbusTCP.client import ModbusClient
+
+    with simulator() as (host, port):
+        client = ModbusClient(host=host, port=port, auto_open=True)
+        client.read_holding_registers(0, 10)
+
+        samples = []
+        for _ in range(3):
+            scans = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < 1.0:
+                client.read_holding_registers(0, 10)
+                client.read_coils(0, 7)
+                scans += 1
+            samples.append((time.perf_counter() - start) / scans)
+        client.close()
+
+    return summarize(samples)
+
+
+def scan_plan(blocks):
+    return [('read_holding_registers', 0, 10)] * blocks
+
+
+def bench_plan_sequential(blocks):
+    """A scan plan of `blocks` reads, one round trip each (pyModbusTCP)"""
+    from pyModbusTCP.client import ModbusClient
+
+    with simulator() as (host, port):
+        client = ModbusClient(host=host, port=port, auto_open=True)
+        client.read_holding_registers(0, 10)
+
+        samples = []
+        for _ in range(200):
+            start = time.perf_counter()
+            for function, address, count in scan_plan(blocks):
+                getattr(client, function)(address, count)
+            samples.append(time.perf_counter() - start)
+        client.close()
+
+    return summarize(samples)
+
+
+bench_plan_sequential.params = [1, 8, 32]
+
+
+def bench_plan_pipelined(blocks):
+    """The same scan plan with up to 8 requests in flight (modbus_pipeline)"""
+    from modbus_pipeline import PipelinedModbusClient
+
+    with simulator() as (host, port):
+        client = PipelinedModbusClient(host=host, port=port, window=8)
+        client.read_holding_registers(0, 10)
+
+        samples = []
+        for _ in range(200):
+            start = time.perf_counter()
+            client.execute(scan_plan(blocks))
+            samples.append(time.perf_counter() - start)
+        client.close()
+
+    return summarize(samples)
+
+
+bench_plan_pipelined.params = [1, 8, 32]
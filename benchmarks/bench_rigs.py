@@ -0,0 +1,40 @@
+"""Multi-rig event handling: per-event cost of queueing counts and draining them on the GUI thread"""
+import os
+import time
+import tempfile
+from common import qapp, measure
+
+
+def bench_drain_events(rigs):
+    """Counts from `rigs` rigs arriving together, 100 per rig per drain"""
+    qapp()
+    from cycle_db import COUNTER_SCHEMA
+    from db_writer import DatabaseWriter
+    from rig_manager import RigManager
+
+    writer = DatabaseWriter(os.path.join(tempfile.mkdtemp(prefix="igcar-bench-"), "cycle_counter.db"),
+                            COUNTER_SCHEMA).start()
+    manager = RigManager(writer)
+    manager.timer.stop()
+    for i in range(rigs):
+        manager.add_rig(f"RIG-{i}", f"loop://{i}", connect=False)
+        manager.start(f"RIG-{i}")
+
+    counts = {'next': 0}
+
+    def drain():
+        base = counts['next']
+        now = time.monotonic()
+        for n in range(base + 1, base + 101):
+            for i in range(rigs):
+                manager.events.put((f"RIG-{i}", 'count', n, now + n * 0.01))
+        counts['next'] = base + 100
+        manager.drain()
+
+    stats = measure(drain, repeat=10, per=100 * rigs)
+    manager.close()
+    writer.close()
+    return stats
+
+
+bench_drain_events.params = [1, 12]
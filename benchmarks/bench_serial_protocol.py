@@ -0,0 +1,44 @@
+"""Host cost per count of the framed serial protocol against the text protocol's line parsing"""
+from common import measure
+
+
+def bench_text_lines(counts):
+    """Parse `counts` lines the way arduino.py --protocol text does"""
+    lines = [f"{count}\r\n".encode() for count in range(1, counts + 1)]
+
+    def parse():
+        for line in lines:
+            int(line.decode().strip())
+    return measure(parse, number=10, repeat=5)
+
+
+def bench_framed(counts):
+    """Decode `counts` samples sent as full frames of 31 samples"""
+    from serial_protocol import encode_frame, FrameDecoder
+
+    stream = b''.join(encode_frame(seq, [(count, count * 10) for count in range(start, min(start + 31, counts + 1))])
+                      for seq, start in enumerate(range(1, counts + 1, 31)))
+
+    def decode():
+        FrameDecoder().feed(stream)
+    return measure(decode, number=10, repeat=5)
+
+
+def bench_framed_chunked(counts):
+    """Same stream read 64 bytes at a time, as a busy port delivers it"""
+    from serial_protocol import encode_frame, FrameDecoder
+
+    stream = b''.join(encode_frame(seq, [(count, count * 10) for count in range(start, min(start + 31, counts + 1))])
+                      for seq, start in enumerate(range(1, counts + 1, 31)))
+    chunks = [stream[i:i + 64] for i in range(0, len(stream), 64)]
+
+    def decode():
+        decoder = FrameDecoder()
+        for chunk in chunks:
+            decoder.feed(chunk)
+    return measure(decode, number=10, repeat=5)
+
+
+bench_text_lines.params = [1000]
+bench_framed.params = [1000]
+bench_framed_chunked.params = [1000]
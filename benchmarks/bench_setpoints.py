@@ -0,0 +1,49 @@
+"""Setpoint writes: a whole recipe as merged, pipelined requests against one request per setpoint"""
+import os
+import logging
+import tempfile
+from common import qapp, simulator, measure
+
+# Every setpoint, as a recipe would set them
+RECIPE = {**{f"TSP{i:03d}": 300 + i for i in range(1, 11)}, 'FSP001': 12.5, 'FSP002': 20.0,
+          **{f"VC{i:03d}": 10.0 * i for i in range(1, 8)}}
+
+
+def bench_apply_recipe():
+    """submit() and the batch write of all 19 setpoints (one write_multiple_registers request)"""
+    qapp()
+    from acquisition import Acquisition
+    from setpoints import SetpointController
+
+    logging.getLogger('setpoints').setLevel(logging.WARNING)
+    with simulator() as (host, port):
+        acquisition = Acquisition(host, port)
+        controller = SetpointController(acquisition, audit_path=os.path.join(tempfile.mkdtemp(), 'audit.db'))
+
+        def apply():
+            controller.submit(RECIPE, source='bench')
+            controller.flush()
+
+        stats = measure(apply, number=20, repeat=5)
+        controller.close()
+        acquisition.close()
+    return stats
+
+
+def bench_write_one_by_one():
+    """The same registers written one setpoint per request, one round trip each (pyModbusTCP)"""
+    from pyModbusTCP.client import ModbusClient
+    from register_codec import encode_value
+    from tags import SETPOINT_TAGS
+
+    writes = [(tag.address, encode_value(tag, RECIPE[tag.name])) for tag in SETPOINT_TAGS]
+    with simulator() as (host, port):
+        client = ModbusClient(host=host, port=port, auto_open=True)
+
+        def write():
+            for address, registers in writes:
+                client.write_multiple_registers(address, registers)
+
+        stats = measure(write, number=20, repeat=5)
+        client.close()
+    return stats
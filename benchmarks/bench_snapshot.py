@@ -0,0 +1,48 @@
+"""Shared-memory tag snapshot: publishing cost on the scan path and what a local reader pays"""
+import os
+import numpy as np
+from common import measure
+
+_acquisition = None
+
+
+def acquisition():
+    global _acquisition
+    if _acquisition is None:
+        from acquisition import Acquisition
+        _acquisition = Acquisition()
+    return _acquisition
+
+
+def publisher():
+    from tag_snapshot import SnapshotPublisher
+
+    publisher = SnapshotPublisher(acquisition(), f"igcar_bench_{os.getpid()}")
+    for name, slots in publisher.group_slots.items():
+        publisher.publish(name, np.arange(len(slots), dtype=np.float64), 1_700_000_000.0)
+    return publisher
+
+
+def bench_publish_scan():
+    """Per-scan cost of copying the 49-tag overview scan into the snapshot"""
+    snapshot = publisher()
+    values = np.linspace(0.0, 100.0, len(snapshot.group_slots['overview']))
+    stats = measure(lambda: snapshot.publish('overview', values, 1_700_000_000.0), number=1000, repeat=5)
+    snapshot.close()
+    return stats
+
+
+def bench_read_snapshot(tags):
+    """Consistent read of some tags, or all of them (0), by a client"""
+    from tag_snapshot import SnapshotClient
+
+    snapshot = publisher()
+    client = SnapshotClient(snapshot.name)
+    slots = client.slots(client.tags[:tags]) if tags else None
+    stats = measure(lambda: client.read(slots), number=1000, repeat=5)
+    client.close()
+    snapshot.close()
+    return stats
+
+
+bench_read_snapshot.params = [0, 4]
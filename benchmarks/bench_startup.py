@@ -0,0 +1,93 @@
+"""Cold-start budget: import time (python -X importtime) and time to first window
+
+These fail (and make run.py exit non-zero) when an app imports a module
+that should be lazy or misses its time budget, so a stray eager import of
+pandas or a secondary window shows up in the suite rather than on a panel PC.
+"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+from common import ROOT, summarize
+
+IMPORT_BUDGET = 0.5
+FIRST_SHOW_BUDGET = 1.0
+
+# Modules only needed behind a button: importing them at startup is a regression
+LAZY_MODULES = {'pandas', 'openpyxl', 'trend_widget'}
+
+SHOW_SCRIPT = """
+import sys, time
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QTimer
+app = QApplication(sys.argv)
+import {module}
+window = {module}.{window}()
+window.show()
+QTimer.singleShot(0, app.quit)
+app.exec_()
+print(time.time())
+"""
+
+
+def run_python(args, cwd):
+    env = dict(os.environ, PYTHONPATH=ROOT, QT_QPA_PLATFORM='offscreen')
+    return subprocess.run([sys.executable] + args, cwd=cwd, env=env, capture_output=True, text=True, check=True)
+
+
+def import_profile(module):
+    """Cumulative import seconds of module and the set of modules it pulled in"""
+    result = run_python(['-X', 'importtime', '-c', f'import {module}'], cwd=tempfile.mkdtemp(prefix='igcar-bench-'))
+    total = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        name = name.strip()
+        imported.add(name.split('.')[0])
+        if name == module:
+            total = int(cumulative) / 1e6
+    return total, imported
+
+
+def check_import_time(module, runs=5):
+    samples = []
+    for _ in range(runs):
+        total, imported = import_profile(module)
+        eager = LAZY_MODULES & imported
+        assert not eager, f"{module} imports {sorted(eager)} at startup"
+        samples.append(total)
+    stats = summarize(samples)
+    assert stats['median'] < IMPORT_BUDGET, f"import {module} took {stats['median']:.3f}s (budget {IMPORT_BUDGET}s)"
+    return stats
+
+
+def check_first_show(module, window, runs=5):
+    samples = []
+    for _ in range(runs):
+        cwd = tempfile.mkdtemp(prefix='igcar-bench-')
+        start = time.time()
+        result = run_python(['-c', SHOW_SCRIPT.format(module=module, window=window)], cwd=cwd)
+        samples.append(float(result.stdout.strip().splitlines()[-1]) - start)
+    stats = summarize(samples)
+    assert stats['median'] < FIRST_SHOW_BUDGET, \
+        f"{module}.{window} took {stats['median']:.3f}s to show (budget {FIRST_SHOW_BUDGET}s)"
+    return stats
+
+
+def bench_import_sample():
+    return check_import_time('sample')
+
+
+def bench_import_arduino():
+    return check_import_time('arduino')
+
+
+def bench_first_show_sample():
+    return check_first_show('sample', 'MainWindow')
+
+
+def bench_first_show_arduino():
+    return check_first_show('arduino', 'CycleCounterGUI')
@@ -0,0 +1,16 @@
+"""Re-wiring a thermocouple on the running acquisition: the swap the GUI thread does between scans"""
+from common import qapp, measure
+
+
+def bench_reconfigure():
+    """Move T001 to another register and back; rebuilds the codec and scan plan of both groups holding it"""
+    qapp()
+    from acquisition import Acquisition
+    from tags import TAGS
+
+    acquisition = Acquisition()
+    moved = [TAGS[0]._replace(address=60)], [TAGS[0]]
+    turn = iter(range(10 ** 9))
+    stats = measure(lambda: acquisition.reconfigure(moved[next(turn) % 2]), number=100, repeat=5)
+    acquisition.close()
+    return stats
@@ -0,0 +1,43 @@
+"""Web view: the fixed per-scan cost of refreshing its caches and what one poll request costs"""
+import numpy as np
+from common import measure
+
+TAGS = 59
+
+
+def scans():
+    """Endless snapshots in which a third of the tags change each scan"""
+    from tag_snapshot import Snapshot, QUALITY_GOOD
+
+    values = np.linspace(0.0, 100.0, TAGS)
+    quality = np.full(TAGS, QUALITY_GOOD, dtype=np.uint8)
+    sequence = 0
+    while True:
+        sequence += 2
+        values = values.copy()
+        values[sequence % 3::3] += 0.1
+        yield Snapshot(sequence, 1_700_000_000.0 + sequence, values, np.full(TAGS, 1_700_000_000.0 + sequence), quality)
+
+
+def bench_scan_update():
+    """Per-scan cost of taking a new snapshot into the cache and serialising the full and delta bodies"""
+    from web_view import TagCache
+
+    cache = TagCache()
+    tags = [f"T{i:03d}" for i in range(TAGS)]
+    source = scans()
+    return measure(lambda: cache.update(next(source), tags), number=100, repeat=5)
+
+
+def bench_poll_request():
+    """Cost of answering one viewer's /api/tags?since= poll for the previous scan's version"""
+    from web_view import WebView
+
+    view = WebView()
+    tags = [f"T{i:03d}" for i in range(TAGS)]
+    source = scans()
+    view.tags.update(next(source), tags)
+    since = view.tags.token()
+    view.tags.update(next(source), tags)
+    query = {'since': [since]}
+    return measure(lambda: view.route('GET', '/api/tags', query), number=1000, repeat=5)
@@ -0,0 +1,127 @@
+"""Per-tag cost of the sensor/valve window updates, excluding network time"""
+import random
+from common import qapp, measure
+
+
+class FixedRegisterClient:
+    """Serves canned register values so only the widget work is timed"""
+
+    def __init__(self, registers=10, coils=7):
+        self.registers = [random.randint(0, 1000) for _ in range(registers)]
+        self.coils = [random.random() < 0.5 for _ in range(coils)]
+
+    def read_holding_registers(self, address, count):
+        self.registers = [r + 1 for r in self.registers]
+        return self.registers[address:address + count]
+
+    def read_coils(self, address, count):
+        self.coils = [not c for c in self.coils]
+        return self.coils[address:address + count]
+
+    def close(self):
+        pass
+
+
+def bench_update_temperatures_per_tag():
+    app = qapp()
+    import sample
+    from acquisition import Acquisition
+
+    acquisition = Acquisition()
+    acquisition.client = FixedRegisterClient()
+    window = sample.TemperatureWindow(acquisition)
+    window.show()
+    window.resume()
+
+    def update():
+        acquisition.poll('temperatures')
+        app.processEvents()
+
+    result = measure(update, number=20, repeat=10, per=len(window.temp_lcds))
+    window.suspend()
+    window.close()
+    return result
+
+
+def bench_refresh_valve_states_per_tag():
+    app = qapp()
+    import sample
+    from acquisition import Acquisition
+
+    acquisition = Acquisition()
+    acquisition.client = FixedRegisterClient()
+    window = sample.ValvesWindow(acquisition)
+    window.show()
+    window.resume()
+
+    def update():
+        acquisition.poll('valves')
+        app.processEvents()
+
+    result = measure(update, number=20, repeat=10, per=len(window.valve_buttons))
+    window.suspend()
+    window.close()
+    return result
+
+
+def bench_update_overview_per_tag():
+    """Every process tag and valve on the custom-painted overview, all values changing each scan"""
+    app = qapp()
+    import sample
+    from acquisition import Acquisition
+    from tags import TAGS
+
+    acquisition = Acquisition()
+    acquisition.client = FixedRegisterClient(registers=len(TAGS))
+    window = sample.OverviewWindow(acquisition, ['overview', 'valves'])
+    window.show()
+    window.resume()
+
+    def update():
+        acquisition.poll('overview')
+        acquisition.poll('valves')
+        app.processEvents()
+
+    result = measure(update, number=20, repeat=10, per=len(window.overview.cells))
+    window.suspend()
+    window.close()
+    return result
+
+
+def bench_trend_frame(mode):
+    """One 10 Hz trend frame of 12 traces with ten minutes buffered: incremental vs redrawing everything"""
+    qapp()
+    import numpy as np
+    from acquisition import Acquisition
+    from trend_widget import TrendWidget
+    from tags import TAGS
+
+    acquisition = Acquisition()
+    widget = TrendWidget(acquisition, ['overview'])
+    widget.resize(1100, 600)
+    widget.set_traces([tag.name for tag in TAGS[:12]])
+    widget.attach()
+    widget.frame_timer.stop()
+    rng = np.random.default_rng(0)
+    clock = [1.7e9]
+
+    def scan():
+        clock[0] += 0.1
+        acquisition.deliver('overview', rng.uniform(20.0, 30.0, len(TAGS)), clock[0])
+
+    for _ in range(6000):
+        scan()
+    widget.frame()
+
+    def frame():
+        scan()
+        if mode == 'full':
+            widget.redraw()
+        widget.frame()
+
+    result = measure(frame, number=20, repeat=5)
+    widget.detach()
+    return result
+
+
+bench_trend_frame.params = ['incremental', 'full']
@@ -0,0 +1,98 @@
+"""Shared fixtures for the benchmark suite: headless Qt, simulator process, timing"""
+import os
+import sys
+import time
+import socket
+import statistics
+import subprocess
+from contextlib import contextmanager
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+_app = None
+
+
+def qapp():
+    """Return the process-wide QApplication, creating it on first use"""
+    global _app
+    if _app is None:
+        from PyQt5.QtWidgets import QApplication
+        _app = QApplication.instance() or QApplication([sys.argv[0]])
+    return _app
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def simulator():
+    """Run simulator.py in its own process so it doesn't share our GIL"""
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "simulator.py"), "--host", "127.0.0.1", "--port", str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                break
+            except OSError:
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("Simulator failed to start")
+                time.sleep(0.05)
+        yield "127.0.0.1", port
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+@contextmanager
+def quiet():
+    """Send the apps' print() chatter to /dev/null while timing"""
+    with open(os.devnull, "w") as devnull:
+        old = sys.stdout
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = old
+
+
+def measure(func, number=1, repeat=5, warmup=1, per=1):
+    """Time func() and return per-call statistics in seconds
+
+    number calls are timed together per sample, repeat samples are taken and
+    per divides the result further (e.g. per-tag cost of a per-window update).
+    """
+    for _ in range(warmup):
+        func()
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number / per)
+
+    return summarize(samples)
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "max": ordered[-1],
+        "p95": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        "stdev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        "samples": len(ordered),
+    }
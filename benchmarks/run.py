@@ -0,0 +1,132 @@
+"""Run the benchmark suite and store/compare results per commit
+
+    python benchmarks/run.py                    run everything, save results/<commit>.json
+    python benchmarks/run.py -k refresh_table   only benchmarks whose name matches
+    python benchmarks/run.py --compare abc1234  also compare against a stored run
+
+Runs headless (QT_QPA_PLATFORM=offscreen). Every bench_*.py module in this
+directory is collected; each bench_* function returns timing statistics in
+seconds and may carry a .params list to run once per parameter. A benchmark
+that raises (e.g. a startup budget assertion) is reported as FAILED and the
+run exits non-zero.
+"""
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import platform
+import importlib
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(HERE, "results")
+sys.path.insert(0, HERE)
+
+import common  # noqa: E402  (sets up QT_QPA_PLATFORM and the repo path)
+
+
+def current_commit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=common.ROOT, text=True).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=common.ROOT, text=True).strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def collect(pattern=None):
+    benchmarks = []
+    for path in sorted(glob.glob(os.path.join(HERE, "bench_*.py"))):
+        module = importlib.import_module(os.path.splitext(os.path.basename(path))[0])
+        for name in sorted(dir(module)):
+            func = getattr(module, name)
+            if not name.startswith("bench_") or not callable(func):
+                continue
+            for param in getattr(func, "params", [None]):
+                full_name = f"{module.__name__}.{name}" + (f"[{param}]" if param is not None else "")
+                if pattern and pattern not in full_name:
+                    continue
+                benchmarks.append((full_name, func, param))
+    return benchmarks
+
+
+def run(benchmarks):
+    results = {}
+    failures = 0
+    for full_name, func, param in benchmarks:
+        start = time.perf_counter()
+        try:
+            stats = func(param) if param is not None else func()
+        except Exception as e:
+            print(f"{full_name:55s} FAILED: {e}")
+            failures += 1
+            continue
+        results[full_name] = stats
+        print(f"{full_name:55s} median {format_time(stats['median']):>10s}  "
+              f"p95 {format_time(stats['p95']):>10s}  ({time.perf_counter() - start:.1f}s)")
+        sys.stdout.flush()
+    return results, failures
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+def save(results, commit):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{commit}.json")
+    with open(path, "w") as f:
+        json.dump({
+            "commit": commit,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "benchmarks": results,
+        }, f, indent=2, sort_keys=True)
+    return path
+
+
+def compare(results, baseline_commit, threshold):
+    path = os.path.join(RESULTS_DIR, f"{baseline_commit}.json")
+    with open(path) as f:
+        baseline = json.load(f)["benchmarks"]
+
+    regressions = 0
+    print(f"\nCompared with {baseline_commit} (median, ratio > {threshold:.2f} flagged):")
+    for name, stats in sorted(results.items()):
+        if name not in baseline:
+            continue
+        ratio = stats["median"] / baseline[name]["median"] if baseline[name]["median"] else float("inf")
+        flag = "REGRESSION" if ratio > threshold else ("improved" if ratio < 1 / threshold else "")
+        regressions += ratio > threshold
+        print(f"{name:55s} {format_time(baseline[name]['median']):>10s} -> "
+              f"{format_time(stats['median']):>10s}  x{ratio:.2f} {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IGCAR HMI benchmark suite")
+    parser.add_argument("-k", dest="pattern", help="only run benchmarks whose name contains this")
+    parser.add_argument("--compare", metavar="COMMIT", help="stored run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression")
+    parser.add_argument("--no-save", action="store_true", help="don't write results/<commit>.json")
+    args = parser.parse_args()
+
+    results, failures = run(collect(args.pattern))
+
+    if not args.no_save:
+        print(f"\nResults written to {save(results, current_commit())}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
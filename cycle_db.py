@@ -0,0 +1,70 @@
+"""cycle_counter.db: the one schema for the Counter tab (arduino.py) and the rig manager
+
+Both write to the same file, so its tables and their migration live here
+and nowhere else. Statements are SQL or callables taking the connection, in
+the order DatabaseWriter runs them.
+"""
+from cycle_summary import create_summaries
+
+
+# Columns added to tables after they were first created
+ADDED_COLUMNS = {'cycle_data': ('rig_id', 'session_start'), 'current_session': ('rig_id',)}
+
+
+def add_session_columns(db):
+    """Rows record which rig, and which session of it, they came from"""
+    for table, added in ADDED_COLUMNS.items():
+        columns = {row[1] for row in db.execute(f'PRAGMA table_info({table})')}
+        for column in added:
+            if column not in columns:
+                db.execute(f'ALTER TABLE {table} ADD COLUMN {column} TEXT')
+
+
+COUNTER_SCHEMA = [
+    # Historical data
+    '''CREATE TABLE IF NOT EXISTS cycle_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        cycle_count INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''',
+    # Current session of the Counter tab (only one record), on rig rig_id
+    '''CREATE TABLE IF NOT EXISTS current_session (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        current_count INTEGER NOT NULL DEFAULT 0,
+        last_updated DATETIME DEFAULT CURRENT_TIMESTAMP,
+        session_start DATETIME DEFAULT CURRENT_TIMESTAMP,
+        is_running BOOLEAN DEFAULT 0,
+        was_crashed BOOLEAN DEFAULT 0
+    )''',
+    # Rolling cycle statistics, one row per session
+    '''CREATE TABLE IF NOT EXISTS session_stats (
+        session_start TEXT PRIMARY KEY,
+        updated_at DATETIME NOT NULL,
+        cycles INTEGER NOT NULL,
+        ewma_per_min REAL,
+        min_cycle_s REAL,
+        max_cycle_s REAL,
+        p50_cycle_s REAL,
+        p90_cycle_s REAL,
+        p99_cycle_s REAL,
+        stalls INTEGER NOT NULL DEFAULT 0
+    )''',
+    # Sessions of the rigs counted by the rig manager, keyed by rig and start time
+    '''CREATE TABLE IF NOT EXISTS rig_sessions (
+        rig_id TEXT NOT NULL,
+        session_start TEXT NOT NULL,
+        port TEXT,
+        current_count INTEGER NOT NULL DEFAULT 0,
+        last_updated DATETIME,
+        is_running BOOLEAN DEFAULT 0,
+        ended_at DATETIME,
+        PRIMARY KEY (rig_id, session_start)
+    )''',
+    add_session_columns,
+    # Per-session, per-day and per-status totals, kept by a trigger on cycle_data
+    create_summaries,
+    # Left by the daily rollup job the trigger replaced
+    'DROP TABLE IF EXISTS maintenance_state',
+]
@@ -0,0 +1,143 @@
+import math
+import time
+from array import array
+
+
+def percentile(ordered, fraction):
+    """Linearly interpolated percentile of an already sorted sequence"""
+    position = (len(ordered) - 1) * fraction
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def distribution(durations):
+    if not durations:
+        return {'min': None, 'max': None, 'p50': None, 'p90': None, 'p99': None}
+    ordered = sorted(durations)
+    return {'min': ordered[0], 'max': ordered[-1], 'p50': percentile(ordered, 0.5),
+            'p90': percentile(ordered, 0.9), 'p99': percentile(ordered, 0.99)}
+
+
+class CycleStats:
+    """Rolling cycle-rate statistics updated as counts arrive
+
+    add() is O(1): the cycles since the last count go into preallocated
+    ring buffers of end times and cycle times, and an exponentially
+    weighted rate (time constant ewma_seconds) and running min/max are
+    updated. Window summaries (rate and cycle-time percentiles over the last
+    N seconds) are computed over the fixed-size rings only when asked for,
+    so their cost doesn't grow with the session. The rings are plain
+    arrays rather than NumPy so the cycle counter starts without loading it.
+
+    Times are time.monotonic() seconds unless given explicitly.
+    """
+
+    def __init__(self, capacity=4096, ewma_seconds=60.0, stall_factor=5.0, min_stall_seconds=10.0):
+        self.capacity = capacity
+        self.ewma_seconds = ewma_seconds
+        self.stall_factor = stall_factor
+        self.min_stall_seconds = min_stall_seconds
+        self.ends = array('d', bytes(8 * capacity))
+        self.durations = array('d', bytes(8 * capacity))
+        self.reset()
+
+    def reset(self):
+        self.index = 0
+        self.size = 0
+        self.total = 0
+        self.last_count = None
+        self.last_time = None
+        self.ewma_sum = 0.0
+        self.ewma_weight = 0.0
+        self.min_cycle = math.inf
+        self.max_cycle = 0.0
+        self.stalls = 0
+        self.stalled = False
+
+    def add(self, count, now=None):
+        """Record the device's cumulative count; returns the number of new cycles"""
+        now = time.monotonic() if now is None else now
+        if self.last_count is None or count < self.last_count:
+            # First reading, or the device restarted its count: nothing to time yet
+            self.last_count, self.last_time = count, now
+            return 0
+
+        cycles = count - self.last_count
+        if cycles == 0:
+            return 0
+        elapsed = now - self.last_time
+        cycle_time = elapsed / cycles
+
+        # A burst of several cycles in one read is spread evenly over the interval; only its
+        # newest `capacity` cycles fit in the rings
+        for i in range(max(0, cycles - self.capacity), cycles):
+            self.ends[self.index] = now - cycle_time * (cycles - 1 - i)
+            self.durations[self.index] = cycle_time
+            self.index = (self.index + 1) % self.capacity
+        self.size = min(self.size + cycles, self.capacity)
+
+        if cycle_time > 0:
+            decay = math.exp(-elapsed / self.ewma_seconds)
+            self.ewma_sum = decay * self.ewma_sum + (1.0 - decay) * cycles / elapsed
+            self.ewma_weight = decay * self.ewma_weight + (1.0 - decay)
+            self.min_cycle = min(self.min_cycle, cycle_time)
+            self.max_cycle = max(self.max_cycle, cycle_time)
+
+        self.total += cycles
+        self.last_count, self.last_time = count, now
+        self.stalled = False
+        return cycles
+
+    @property
+    def ewma_rate(self):
+        """Cycles per second, exponentially weighted; unbiased before ewma_seconds have passed"""
+        return self.ewma_sum / self.ewma_weight if self.ewma_weight else 0.0
+
+    def window(self, seconds, now=None):
+        """Cycle times (s) of the cycles that ended in the last `seconds`"""
+        since = (time.monotonic() if now is None else now) - seconds
+        return [duration for end, duration in zip(self.ends[:self.size], self.durations[:self.size]) if end >= since]
+
+    def summary(self, seconds=60.0, now=None):
+        """Rate and cycle-time distribution over the last `seconds`"""
+        durations = self.window(seconds, now)
+        result = {
+            'cycles': len(durations),
+            'rate_per_min': 60.0 * len(durations) / seconds,
+            'ewma_per_min': 60.0 * self.ewma_rate,
+        }
+        result.update(distribution(durations))
+        return result
+
+    def session_summary(self):
+        """Totals for the whole session; percentiles cover the last `capacity` cycles"""
+        result = distribution(self.durations[:self.size])
+        result.update(cycles=self.total, ewma_per_min=60.0 * self.ewma_rate, stalls=self.stalls)
+        if self.total:
+            result.update(min=self.min_cycle, max=self.max_cycle)
+        return result
+
+    def rebaseline(self):
+        """Forget the last count so idle time before a restart isn't timed as a cycle"""
+        self.last_count = None
+        self.last_time = None
+        self.stalled = False
+
+    def stall_threshold(self):
+        """Seconds without a cycle that count as a stall: several typical cycle times"""
+        if not self.ewma_rate:
+            return None
+        return max(self.min_stall_seconds, self.stall_factor / self.ewma_rate)
+
+    def check_stall(self, now=None):
+        """Whether the rig has stopped cycling; True only once per stall"""
+        threshold = self.stall_threshold()
+        if threshold is None or self.stalled or self.last_time is None:
+            return False
+        now = time.monotonic() if now is None else now
+        if now - self.last_time > threshold:
+            self.stalled = True
+            self.stalls += 1
+            return True
+        return False
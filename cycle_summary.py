@@ -0,0 +1,226 @@
+"""Cycle totals kept up to date as cycle_data rows are inserted
+
+cycle_data holds every save: 'Quick Save' rows part way through a session
+and a 'Completed' row at its end, each with the session's count so far. A
+session's cycles are its highest saved count. Totals therefore can't just
+sum the column, and computing them means reading the whole table. Three
+summary tables are kept instead:
+
+    cycle_sessions      per rig and session: cycles, saves, first/last save, last status
+    cycle_daily         per day and rig: sessions and cycles
+    cycle_status_daily  per day, rig and status: saves, and the cycles those saves added
+
+A trigger on cycle_data updates all three inside the transaction that
+inserts the row. Every writer is covered, the GUI's saves as well as
+RigManager's, and a summary can never disagree with the row that fed it.
+A session belongs to the day it started on and to its rig ('' for rows
+saved before rigs were recorded). A row without a session stands alone.
+
+The summaries outlive the cycle_data rows that retention archives. When
+the trigger is first created on an existing file, the summaries are
+rebuilt from the rows there. `python cycle_summary.py --rebuild
+cycle_counter.db` does the same by hand. Clearing cycle_data rebuilds
+them with rebuild_all() from the archive files and whatever is left, so
+archived history stays in the totals.
+"""
+import os
+import sys
+import logging
+import sqlite3
+import argparse
+from urllib.parse import quote
+from datetime import date, timedelta
+
+log = logging.getLogger(__name__)
+
+# The session, rig and day of the row being inserted, as the trigger sees it
+RIG = "COALESCE(NEW.rig_id, '')"
+SESSION = "COALESCE(NEW.session_start, 'row ' || NEW.id)"
+DAY = "substr(COALESCE(NEW.session_start, NEW.timestamp), 1, 10)"
+THIS_SESSION = f"rig_id = {RIG} AND session = {SESSION}"
+# The cycle_data columns the summaries are computed from
+SOURCE_COLUMNS = ('id', 'timestamp', 'cycle_count', 'status', 'rig_id', 'session_start')
+# Cycles the new row adds: how far it is above the session's best count so far
+ADDED = f"(SELECT MAX(NEW.cycle_count - cycles, 0) FROM cycle_sessions WHERE {THIS_SESSION})"
+
+SUMMARY_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS cycle_sessions (
+        rig_id TEXT NOT NULL,
+        session TEXT NOT NULL,
+        day TEXT NOT NULL,
+        cycles INTEGER NOT NULL,
+        saves INTEGER NOT NULL,
+        first_saved TEXT NOT NULL,
+        last_saved TEXT NOT NULL,
+        last_status TEXT NOT NULL,
+        PRIMARY KEY (rig_id, session)
+    )''',
+    'CREATE INDEX IF NOT EXISTS cycle_sessions_day ON cycle_sessions (day)',
+    '''CREATE TABLE IF NOT EXISTS cycle_daily (
+        day TEXT NOT NULL,
+        rig_id TEXT NOT NULL,
+        sessions INTEGER NOT NULL,
+        cycles INTEGER NOT NULL,
+        PRIMARY KEY (day, rig_id)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS cycle_status_daily (
+        day TEXT NOT NULL,
+        rig_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        saves INTEGER NOT NULL,
+        cycles INTEGER NOT NULL,
+        PRIMARY KEY (day, rig_id, status)
+    )''',
+]
+
+SUMMARY_TRIGGER = f'''CREATE TRIGGER IF NOT EXISTS cycle_data_summaries AFTER INSERT ON cycle_data BEGIN
+    INSERT OR IGNORE INTO cycle_sessions (rig_id, session, day, cycles, saves, first_saved, last_saved, last_status)
+        VALUES ({RIG}, {SESSION}, {DAY}, 0, 0, NEW.timestamp, NEW.timestamp, NEW.status);
+    INSERT OR IGNORE INTO cycle_daily (day, rig_id, sessions, cycles) VALUES ({DAY}, {RIG}, 0, 0);
+    INSERT OR IGNORE INTO cycle_status_daily (day, rig_id, status, saves, cycles)
+        VALUES ({DAY}, {RIG}, NEW.status, 0, 0);
+    UPDATE cycle_daily
+        SET sessions = sessions + (SELECT saves = 0 FROM cycle_sessions WHERE {THIS_SESSION}), cycles = cycles + {ADDED}
+        WHERE day = {DAY} AND rig_id = {RIG};
+    UPDATE cycle_status_daily SET saves = saves + 1, cycles = cycles + {ADDED}
+        WHERE day = {DAY} AND rig_id = {RIG} AND status = NEW.status;
+    UPDATE cycle_sessions
+        SET cycles = MAX(cycles, NEW.cycle_count), saves = saves + 1, last_saved = NEW.timestamp,
+            last_status = NEW.status
+        WHERE {THIS_SESSION};
+END'''
+
+
+def rebuild(db, days=None, source='cycle_data'):
+    """Recompute the summaries of days (default: every day with rows in source) from source
+
+    source is cycle_data or a table with its SOURCE_COLUMNS. Days whose
+    rows have all been archived keep the summaries they have. Call inside
+    a transaction; returns the number of days rebuilt.
+    """
+    rows = "substr(COALESCE(session_start, timestamp), 1, 10)"
+    if days is None:
+        days = [day for day, in db.execute(f'SELECT DISTINCT {rows} FROM {source}')]
+    db.execute('CREATE TEMP TABLE IF NOT EXISTS rebuild_days (day TEXT PRIMARY KEY)')
+    db.execute('DELETE FROM temp.rebuild_days')
+    db.executemany('INSERT OR IGNORE INTO temp.rebuild_days VALUES (?)', [(day,) for day in days])
+    for table in ('cycle_sessions', 'cycle_daily', 'cycle_status_daily'):
+        db.execute(f'DELETE FROM {table} WHERE day IN (SELECT day FROM temp.rebuild_days)')
+
+    # Each row's cycles added over the best earlier save of its session, as the trigger counts them
+    db.execute(f'''CREATE TEMP TABLE rebuild_rows AS
+        SELECT {rows} AS day, COALESCE(rig_id, '') AS rig_id,
+               COALESCE(session_start, 'row ' || id) AS session, id, timestamp, status, cycle_count,
+               MAX(cycle_count - COALESCE(MAX(cycle_count) OVER (
+                   PARTITION BY COALESCE(rig_id, ''), COALESCE(session_start, 'row ' || id) ORDER BY id
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING), 0), 0) AS added
+        FROM {source} WHERE {rows} IN (SELECT day FROM temp.rebuild_days)''')
+    db.execute(f'''INSERT INTO cycle_sessions (rig_id, session, day, cycles, saves, first_saved, last_saved, last_status)
+        SELECT s.rig_id, s.session, s.day, s.cycles, s.saves, first.timestamp, last.timestamp, last.status
+        FROM (SELECT rig_id, session, day, MAX(cycle_count) AS cycles, COUNT(*) AS saves,
+                     MIN(id) AS first_id, MAX(id) AS last_id
+              FROM temp.rebuild_rows GROUP BY rig_id, session) AS s
+        JOIN {source} AS first ON first.id = s.first_id
+        JOIN {source} AS last ON last.id = s.last_id''')
+    db.execute('''INSERT INTO cycle_daily (day, rig_id, sessions, cycles)
+        SELECT day, rig_id, COUNT(*), SUM(cycles) FROM cycle_sessions
+        WHERE day IN (SELECT day FROM temp.rebuild_days) GROUP BY day, rig_id''')
+    db.execute('''INSERT INTO cycle_status_daily (day, rig_id, status, saves, cycles)
+        SELECT day, rig_id, status, COUNT(*), SUM(added) FROM temp.rebuild_rows GROUP BY day, rig_id, status''')
+    db.execute('DROP TABLE temp.rebuild_rows')
+    return len(days)
+
+
+def archived_rows(path):
+    """The cycle_data rows of an archive file as SOURCE_COLUMNS, NULL for columns the file predates"""
+    archive = sqlite3.connect('file:' + quote(os.path.abspath(path)) + '?mode=ro', uri=True, timeout=5.0)
+    try:
+        columns = {row[1] for row in archive.execute('PRAGMA table_info(cycle_data)')}
+        if not columns:
+            return []
+        select = ', '.join(column if column in columns else 'NULL' for column in SOURCE_COLUMNS)
+        return archive.execute(f'SELECT {select} FROM cycle_data').fetchall()
+    finally:
+        archive.close()
+
+
+def rebuild_all(db, archives=()):
+    """Recompute every summary from cycle_data and the archive files at the paths in archives
+
+    For when rows have left cycle_data other than by archiving. Days with
+    no rows in either lose their summaries. A row in both (an archive copy
+    whose delete was cut short) counts once. The archives are read over
+    their own connections, since a file can't be attached inside the
+    transaction this is called in. Returns the number of days rebuilt.
+    """
+    db.execute('DROP TABLE IF EXISTS temp.rebuild_source')
+    db.execute('''CREATE TEMP TABLE rebuild_source (id INTEGER PRIMARY KEY, timestamp TEXT, cycle_count INTEGER,
+        status TEXT, rig_id TEXT, session_start TEXT)''')
+    db.execute(f'INSERT INTO temp.rebuild_source SELECT {", ".join(SOURCE_COLUMNS)} FROM main.cycle_data')
+    for path in archives:
+        db.executemany('INSERT OR IGNORE INTO temp.rebuild_source VALUES (?, ?, ?, ?, ?, ?)', archived_rows(path))
+    for table in ('cycle_sessions', 'cycle_daily', 'cycle_status_daily'):
+        db.execute(f'DELETE FROM {table}')
+    days = rebuild(db, source='temp.rebuild_source')
+    db.execute('DROP TABLE temp.rebuild_source')
+    return days
+
+
+def create_summaries(db):
+    """Schema step: the summary tables and trigger, filled from existing rows the first time"""
+    if not db.in_transaction:
+        db.execute('BEGIN IMMEDIATE')
+    new = db.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'cycle_data_summaries'"
+                     ).fetchone() is None
+    for statement in SUMMARY_TABLES:
+        db.execute(statement)
+    db.execute(SUMMARY_TRIGGER)
+    if new:
+        log.info("Built cycle summaries for %d days of existing cycle_data", rebuild(db))
+
+
+def totals(db, first_day, last_day, rig_id=None):
+    """(sessions, cycles) from first_day to last_day inclusive ('YYYY-MM-DD'), for one rig or all"""
+    sql = 'SELECT COALESCE(SUM(sessions), 0), COALESCE(SUM(cycles), 0) FROM cycle_daily WHERE day BETWEEN ? AND ?'
+    params = (first_day, last_day)
+    if rig_id is not None:
+        sql += ' AND rig_id = ?'
+        params += (rig_id,)
+    return db.execute(sql, params).fetchone()
+
+
+def week_totals(db, today=None, rig_id=None):
+    """(sessions, cycles) since Monday"""
+    today = today or date.today()
+    return totals(db, (today - timedelta(days=today.weekday())).isoformat(), today.isoformat(), rig_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild or show the cycle summaries of a cycle counter file")
+    parser.add_argument("db", nargs='?', default='cycle_counter.db')
+    parser.add_argument("--rebuild", action="store_true", help="recompute the summaries from cycle_data")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    try:
+        db = sqlite3.connect(f'file:{args.db}?mode=rw', uri=True, timeout=30.0)
+    except sqlite3.OperationalError as e:
+        sys.exit(f"{args.db}: {e}")
+    if not db.execute("SELECT 1 FROM sqlite_master WHERE name = 'cycle_data'").fetchone():
+        sys.exit(f"{args.db} has no cycle_data table")
+    new = not db.execute("SELECT 1 FROM sqlite_master WHERE name = 'cycle_data_summaries'").fetchone()
+    create_summaries(db)
+    if args.rebuild and not new:
+        log.info("Rebuilt cycle summaries for %d days", rebuild(db))
+    db.commit()
+
+    sessions, cycles = week_totals(db)
+    log.info("This week: %d cycles in %d sessions", cycles, sessions)
+    for day, rig_id, sessions, cycles in db.execute(
+            'SELECT day, rig_id, sessions, cycles FROM cycle_daily ORDER BY day DESC, rig_id LIMIT 14'):
+        log.info("%s %-8s %6d cycles in %d sessions", day, rig_id or '-', cycles, sessions)
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+import os
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from urllib.parse import quote
+from PyQt5.QtCore import QObject, pyqtSignal
+import metrics
+
+log = logging.getLogger(__name__)
+
+
+class DatabaseWriter:
+    """The one thread that writes to an SQLite file
+
+    Statements are queued from any thread and executed on the writer's own
+    connection, batched into one transaction per flush_interval. A
+    statement queued with a key supersedes any not-yet-written statement
+    with the same key, so a counter updated many times between flushes
+    costs one UPDATE, not one per count.
+
+    Statements queued with an op name are reported to on_done(op, ok,
+    error) on the writer thread once committed or dropped; statements
+    superseded by a later one with the same key are not reported.
+    call() queues a function of the connection instead, for work that is
+    more than one statement but must commit with the rest of its batch.
+    """
+
+    def __init__(self, path, schema=(), flush_interval=0.5, name='db-writer', on_done=None):
+        self.path = path
+        self.schema = list(schema)
+        self.flush_interval = flush_interval
+        self.on_done = on_done
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.ready = threading.Event()
+
+        self.commit_seconds = metrics.REGISTRY.histogram(
+            'db_writer_commit_seconds', 'Time to execute and commit one batch', writer=name)
+        self.statements = metrics.REGISTRY.counter(
+            'db_writer_statements_total', 'Statements written', writer=name)
+        self.coalesced = metrics.REGISTRY.counter(
+            'db_writer_coalesced_total', 'Statements superseded by a later one with the same key', writer=name)
+
+    def start(self, wait=True):
+        """Start the thread; with wait, return once the schema is in place"""
+        self.thread.start()
+        if wait:
+            self.ready.wait(timeout=10)
+        return self
+
+    def execute(self, sql, params=(), key=None, op=None):
+        self.queue.put(('sql', (sql, tuple(params), key, op)))
+
+    def call(self, func, op=None):
+        """Queue func(db), run on the writer's connection in order with the statements around it"""
+        self.queue.put(('sql', (func, (), None, op)))
+
+    def flush(self, timeout=10):
+        """Wait until everything queued so far is committed"""
+        done = threading.Event()
+        self.queue.put(('flush', done))
+        return done.wait(timeout)
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(('stop', None))
+            self.thread.join(timeout=10)
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=5.0)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    def run(self):
+        db = self.connect()
+        for statement in self.schema:
+            if callable(statement):
+                statement(db)
+            else:
+                db.execute(statement)
+        db.commit()
+        self.ready.set()
+
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1][0] == 'sql':
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            statements = []
+            positions = {}
+            waiters = []
+            for kind, payload in batch:
+                if kind == 'sql':
+                    sql, params, key, op = payload
+                    if key is not None and key in positions:
+                        statements[positions[key]] = None
+                        self.coalesced.inc()
+                    if key is not None:
+                        positions[key] = len(statements)
+                    statements.append((sql, params, op))
+                elif kind == 'flush':
+                    waiters.append(payload)
+                elif kind == 'stop':
+                    running = False
+
+            self.write(db, [statement for statement in statements if statement is not None])
+            for done in waiters:
+                done.set()
+        db.close()
+
+    def write(self, db, statements):
+        if not statements:
+            return
+        try:
+            with self.commit_seconds.time():
+                for sql, params, _ in statements:
+                    self.apply(db, sql, params)
+                db.commit()
+            self.statements.inc(len(statements))
+            for _, _, op in statements:
+                self.report(op, True, '')
+        except sqlite3.Error as e:
+            db.rollback()
+            log.error("Batch of %d statements failed (%s); retrying one at a time", len(statements), e)
+            for sql, params, op in statements:
+                try:
+                    self.apply(db, sql, params)
+                    db.commit()
+                    self.statements.inc()
+                    self.report(op, True, '')
+                except sqlite3.Error as e:
+                    db.rollback()
+                    what = getattr(sql, '__name__', sql) if callable(sql) else sql.split()[0:3]
+                    log.error("Dropped statement %r: %s", what, e)
+                    self.report(op, False, str(e))
+
+    @staticmethod
+    def apply(db, sql, params):
+        if callable(sql):
+            sql(db)
+        else:
+            db.execute(sql, params)
+
+    def report(self, op, ok, error):
+        if op is not None and self.on_done is not None:
+            self.on_done(op, ok, error)
+
+
+class DatabaseReader:
+    """A thread with its own read-only connection, for queries the GUI thread mustn't wait on
+
+    query() returns at once; callback(rows, error) is called on the
+    reader thread with all the rows, or with None and the error message.
+    Queries wait for ready (typically the writer's, so that the file and
+    its tables exist) before the first one runs.
+    """
+
+    def __init__(self, path, ready=None, name='db-reader'):
+        self.path = path
+        self.ready = ready
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def query(self, sql, params=(), callback=None):
+        self.queue.put((sql, tuple(params), callback))
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=10)
+
+    def connect(self):
+        uri = 'file:' + quote(os.path.abspath(self.path)) + '?mode=ro'
+        return sqlite3.connect(uri, uri=True, timeout=5.0)
+
+    def run(self):
+        if self.ready is not None:
+            self.ready.wait(timeout=10)
+        db = None
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            sql, params, callback = item
+            try:
+                if db is None:
+                    db = self.connect()
+                rows, error = db.execute(sql, params).fetchall(), ''
+            except sqlite3.Error as e:
+                log.error("Query %r failed: %s", sql.split()[0:3], e)
+                rows, error = None, str(e)
+            if callback is not None:
+                callback(rows, error)
+        if db is not None:
+            db.close()
+
+
+class AsyncDatabase(QObject):
+    """One SQLite file for a window, without the GUI thread ever touching the disk
+
+    Writes go through a DatabaseWriter and reads through a DatabaseReader.
+    Both finish on their own threads and report back with signals, which
+    Qt delivers on the GUI thread: written(op, ok, error) for writes given
+    an op name, loaded(op, rows, error) for every query.
+    """
+
+    written = pyqtSignal(str, bool, str)
+    loaded = pyqtSignal(str, object, str)
+
+    def __init__(self, path, schema=(), flush_interval=0.25, name='db', parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.writer = DatabaseWriter(path, schema, flush_interval, name, on_done=self.written.emit)
+        self.reader = DatabaseReader(path, self.writer.ready, name=f'{name}-reader')
+
+    def start(self):
+        self.writer.start(wait=False)
+        self.reader.start()
+        return self
+
+    def execute(self, sql, params=(), key=None, op=None):
+        self.writer.execute(sql, params, key, op)
+
+    def call(self, func, op=None):
+        self.writer.call(func, op)
+
+    def query(self, op, sql, params=()):
+        histogram = metrics.REGISTRY.histogram('db_read_seconds', 'SQLite read latency', op=op)
+        started = time.perf_counter()
+
+        def done(rows, error):
+            histogram.record(time.perf_counter() - started)
+            self.loaded.emit(op, rows, error)
+
+        self.reader.query(sql, params, done)
+
+    def flush(self, timeout=10):
+        """Block until every write queued so far is committed; only for shutdown"""
+        return self.writer.flush(timeout)
+
+    def close(self):
+        self.writer.close()
+        self.reader.close()
@@ -0,0 +1,246 @@
+import time
+import logging
+import threading
+from PyQt5.QtCore import QObject, pyqtSignal
+import metrics
+
+log = logging.getLogger(__name__)
+
+READ_FOR_WRITE = {
+    'write_single_coil': 'read_coils',
+    'write_multiple_coils': 'read_coils',
+    'write_single_register': 'read_holding_registers',
+    'write_multiple_registers': 'read_holding_registers',
+}
+
+
+class PlcEndpoint:
+    """One PLC of a redundant pair: its client, a lock around it, and health state"""
+
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+        self.lock = threading.Lock()
+        self.healthy = None
+        self.failures = 0
+        self.last_ok = 0.0
+        self.last_error = None
+        self.latency = None
+
+        self.up = metrics.REGISTRY.gauge('plc_up', 'PLC answered its last request or probe', plc=name)
+        self.probe_seconds = metrics.REGISTRY.histogram(
+            'plc_probe_seconds', 'Health check round trip', plc=name)
+
+    def run(self, requests):
+        """Results of requests on this PLC, and whether the connection survived them"""
+        with self.lock:
+            if hasattr(self.client, 'execute'):
+                results = self.client.execute(requests)
+            else:
+                results = [getattr(self.client, function)(address, arg) for function, address, arg in requests]
+            connected = self.client.is_open
+        if connected:
+            self.mark_ok()
+        else:
+            self.mark_failed(getattr(self.client, 'last_error', None) or "connection lost")
+        return results, connected
+
+    def probe(self, address=0):
+        start = time.perf_counter()
+        with self.lock:
+            result = self.client.read_holding_registers(address, 1)
+        if result is None:
+            self.mark_failed(getattr(self.client, 'last_error', None) or "no response")
+            return False
+        self.latency = time.perf_counter() - start
+        self.probe_seconds.record(self.latency)
+        self.mark_ok()
+        return True
+
+    def mark_ok(self):
+        self.healthy = True
+        self.failures = 0
+        self.last_ok = time.monotonic()
+        self.up.set(1)
+
+    def mark_failed(self, error):
+        self.failures += 1
+        self.healthy = False
+        self.last_error = error
+        self.up.set(0)
+
+
+class RedundantClient(QObject):
+    """Primary/secondary PLC pair behind the ModbusClient API
+
+    Both connections are kept open: a monitor thread probes each PLC every
+    `interval` seconds (skipping the active one while real traffic proves it
+    alive), so the standby is warm and a failing standby is noticed before
+    it is needed. Probes run off the GUI thread so a black-holed PLC never
+    stalls the HMI.
+
+    A request that loses the active connection is re-run on the standby in
+    the same call, so a scan that hits the outage still returns data. Once
+    switched the pair stays on the new active until that one fails too;
+    there is no automatic switch back, which would flap on an unstable link.
+
+    Writes carry absolute values. A write interrupted by failover, alone or
+    as one request of a batch (setpoints go through execute), is only
+    replayed on the new active if reading back shows it didn't take effect,
+    so a valve command is never applied twice.
+    """
+
+    switched = pyqtSignal(str, str)
+
+    def __init__(self, endpoints, interval=1.0, parent=None):
+        super().__init__(parent)
+        self.endpoints = [PlcEndpoint(name, client) for name, client in endpoints]
+        self.active = self.endpoints[0]
+        # The monitor thread and the GUI thread's scans can both decide to switch
+        self.switch_lock = threading.Lock()
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.thread = None
+
+        self.failovers = metrics.REGISTRY.counter('plc_failovers_total', 'Switches to the standby PLC')
+
+    @property
+    def is_open(self):
+        return self.active.client.is_open
+
+    def endpoint(self, name):
+        return next(endpoint for endpoint in self.endpoints if endpoint.name == name)
+
+    def standby(self, failed=None):
+        """The best PLC to switch to from failed (the active one by default), or None"""
+        failed = failed or self.active
+        others = [endpoint for endpoint in self.endpoints if endpoint is not failed]
+        healthy = [endpoint for endpoint in others if endpoint.healthy]
+        return (healthy or others or [None])[0]
+
+    def start(self):
+        if self.thread is None:
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.monitor, name='plc-health', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def monitor(self):
+        self.check()
+        while not self.stopping.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """Probe both PLCs and switch if the active one is down and the standby isn't"""
+        for endpoint in self.endpoints:
+            recent = time.monotonic() - endpoint.last_ok < 3 * self.interval
+            if endpoint is self.active and endpoint.healthy and recent:
+                continue
+            was_healthy = endpoint.healthy
+            if endpoint.probe() != was_healthy and was_healthy is not None:
+                log.warning("PLC %s is %s", endpoint.name, "back online" if endpoint.healthy else "offline")
+
+        standby = self.standby()
+        if not self.active.healthy and standby is not None and standby.healthy:
+            self.switch(standby, f"{self.active.name} failed health check ({self.active.last_error})")
+
+    def switch(self, endpoint, reason):
+        with self.switch_lock:
+            previous = self.active
+            if endpoint is previous or endpoint is None:
+                return
+            self.active = endpoint
+        self.failovers.inc()
+        log.warning("Switched from PLC %s to %s: %s", previous.name, endpoint.name, reason)
+        self.switched.emit(endpoint.name, reason)
+
+    def execute(self, requests):
+        """Run requests on the active PLC, failing over to the standby if its connection drops"""
+        endpoint = self.active
+        standby = self.standby(endpoint)
+        if endpoint.healthy is False and standby is not None and standby.healthy:
+            # the monitor already saw it go down; don't spend this scan timing out on it
+            self.switch(standby, f"{endpoint.name} is offline ({endpoint.last_error})")
+            endpoint = self.active
+
+        results, connected = endpoint.run(requests)
+        if connected:
+            return results
+
+        standby = self.standby(endpoint)
+        if standby is None:
+            return results
+        if self.active is endpoint:
+            self.switch(standby, f"{endpoint.name} dropped the connection ({endpoint.last_error})")
+
+        retry = [i for i, request in enumerate(requests) if not self.already_applied(standby, request)]
+        retried, _ = standby.run([requests[i] for i in retry])
+        for i, result in zip(retry, retried):
+            results[i] = result
+        for i in set(range(len(requests))) - set(retry):
+            results[i] = True
+        return results
+
+    def already_applied(self, endpoint, request):
+        """Whether an interrupted write already shows on endpoint, so replaying it would repeat it"""
+        function, address, value = request
+        if function not in READ_FOR_WRITE:
+            return False
+        values = value if isinstance(value, (list, tuple)) else [value]
+        readback, _ = endpoint.run([(READ_FOR_WRITE[function], address, len(values))])
+        if readback[0] is None:
+            return False
+        if function.endswith('_coils') or function.endswith('_coil'):
+            values = [bool(v) for v in values]
+        return list(readback[0]) == list(values)
+
+    def close(self):
+        self.stop()
+        for endpoint in self.endpoints:
+            with endpoint.lock:
+                endpoint.client.close()
+
+    def status(self, name):
+        """One-line status of a PLC for the diagnostics panel"""
+        endpoint = self.endpoint(name)
+        if endpoint.healthy is None:
+            state = "Unknown (not checked yet)"
+        elif not endpoint.healthy:
+            state = f"Offline ({endpoint.last_error})"
+        else:
+            state = "Online" if endpoint is self.active else "Standby"
+            if endpoint.latency is not None:
+                state += f", {endpoint.latency * 1000:.1f} ms"
+        host = f"{endpoint.client.host}:{endpoint.client.port}"
+        return f"{state}\n{host}"
+
+    # ModbusClient-compatible requests
+
+    def read_holding_registers(self, address, count=1):
+        return self.execute([('read_holding_registers', address, count)])[0]
+
+    def read_input_registers(self, address, count=1):
+        return self.execute([('read_input_registers', address, count)])[0]
+
+    def read_coils(self, address, count=1):
+        return self.execute([('read_coils', address, count)])[0]
+
+    def read_discrete_inputs(self, address, count=1):
+        return self.execute([('read_discrete_inputs', address, count)])[0]
+
+    def write_single_coil(self, address, state):
+        return bool(self.execute([('write_single_coil', address, bool(state))])[0])
+
+    def write_single_register(self, address, value):
+        return bool(self.execute([('write_single_register', address, value)])[0])
+
+    def write_multiple_coils(self, address, states):
+        return bool(self.execute([('write_multiple_coils', address, [bool(s) for s in states])])[0])
+
+    def write_multiple_registers(self, address, values):
+        return bool(self.execute([('write_multiple_registers', address, list(values))])[0])
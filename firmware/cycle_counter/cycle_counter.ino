@@ -0,0 +1,161 @@
+// Cycle counter reference sketch for arduino.py
+//
+// Counts rising edges on COUNTER_PIN while started and reports them to the
+// host in one of two modes:
+//
+//   text    (default) the cumulative count as an ASCII line whenever it
+//           changes - what arduino.py --protocol text reads
+//   framed  binary frames of (count, millis) samples with a sequence number
+//           and CRC - what arduino.py --protocol framed reads; see
+//           serial_protocol.py for the layout
+//
+// Host commands (plain ASCII, no terminator needed): start, stop, framed, text.
+// "start" resets the count to 0.
+
+const uint8_t COUNTER_PIN = 2;
+const unsigned long DEBOUNCE_US = 2000;
+// Must match the host (arduino.py --baud / ID=PORT@BAUD); framed mode makes good use of a faster rate
+const unsigned long BAUD = 9600;
+
+// A frame goes out when it holds MAX_SAMPLES or FRAME_INTERVAL_MS after its first sample
+const uint8_t MAX_SAMPLES = 31;
+const unsigned long FRAME_INTERVAL_MS = 50;
+
+const uint8_t SYNC0 = 0xA5;
+const uint8_t SYNC1 = 0x5A;
+const uint8_t FRAME_SAMPLES = 0x01;
+
+volatile uint32_t count = 0;
+volatile unsigned long lastEdgeUs = 0;
+volatile bool running = false;
+
+// Samples captured by the interrupt, drained by loop()
+const uint8_t QUEUE_SIZE = 64;
+volatile uint32_t queueCount[QUEUE_SIZE];
+volatile uint32_t queueMs[QUEUE_SIZE];
+volatile uint8_t queueHead = 0;
+volatile uint8_t queueTail = 0;
+
+bool framed = false;
+uint16_t seq = 0;
+uint8_t frame[6 + MAX_SAMPLES * 8 + 2];
+uint8_t frameSamples = 0;
+unsigned long frameStartMs = 0;
+uint32_t lastSentCount = 0;
+
+void onEdge() {
+  unsigned long now = micros();
+  if (!running || now - lastEdgeUs < DEBOUNCE_US) {
+    return;
+  }
+  lastEdgeUs = now;
+  count++;
+
+  uint8_t next = (queueHead + 1) % QUEUE_SIZE;
+  if (next != queueTail) {  // when full the sample is dropped; the next count still carries the total
+    queueCount[queueHead] = count;
+    queueMs[queueHead] = millis();
+    queueHead = next;
+  }
+}
+
+// CRC-16/CCITT-FALSE, the same as Python's binascii.crc_hqx(data, 0xFFFF)
+uint16_t crc16(const uint8_t *data, size_t length) {
+  uint16_t crc = 0xFFFF;
+  while (length--) {
+    crc ^= (uint16_t)(*data++) << 8;
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+void putU16(uint8_t *p, uint16_t value) {
+  p[0] = value & 0xFF;
+  p[1] = value >> 8;
+}
+
+void putU32(uint8_t *p, uint32_t value) {
+  for (uint8_t i = 0; i < 4; i++) {
+    p[i] = (value >> (8 * i)) & 0xFF;
+  }
+}
+
+void sendFrame() {
+  if (frameSamples == 0) {
+    return;
+  }
+  uint8_t length = frameSamples * 8;
+  frame[0] = SYNC0;
+  frame[1] = SYNC1;
+  frame[2] = length;
+  putU16(frame + 3, seq++);
+  frame[5] = FRAME_SAMPLES;
+  putU16(frame + 6 + length, crc16(frame + 2, 4 + length));
+  Serial.write(frame, 6 + length + 2);
+  frameSamples = 0;
+}
+
+void addSample(uint32_t value, uint32_t ms) {
+  if (frameSamples == 0) {
+    frameStartMs = millis();
+  }
+  putU32(frame + 6 + frameSamples * 8, value);
+  putU32(frame + 6 + frameSamples * 8 + 4, ms);
+  if (++frameSamples == MAX_SAMPLES) {
+    sendFrame();
+  }
+}
+
+void handleCommand() {
+  String command = Serial.readString();
+  if (command.indexOf("start") >= 0) {
+    noInterrupts();
+    count = 0;
+    queueHead = queueTail = 0;
+    running = true;
+    interrupts();
+    lastSentCount = 0;
+    frameSamples = 0;
+  } else if (command.indexOf("stop") >= 0) {
+    running = false;
+  }
+  if (command.indexOf("framed") >= 0) {
+    framed = true;
+  } else if (command.indexOf("text") >= 0) {
+    framed = false;
+  }
+}
+
+void setup() {
+  Serial.begin(BAUD);
+  Serial.setTimeout(20);
+  pinMode(COUNTER_PIN, INPUT_PULLUP);
+  attachInterrupt(digitalPinToInterrupt(COUNTER_PIN), onEdge, RISING);
+}
+
+void loop() {
+  if (Serial.available()) {
+    handleCommand();
+  }
+
+  while (queueTail != queueHead) {
+    noInterrupts();
+    uint32_t value = queueCount[queueTail];
+    uint32_t ms = queueMs[queueTail];
+    queueTail = (queueTail + 1) % QUEUE_SIZE;
+    interrupts();
+
+    if (framed) {
+      addSample(value, ms);
+    } else if (value != lastSentCount) {
+      Serial.println(value);
+    }
+    lastSentCount = value;
+  }
+
+  if (framed && frameSamples > 0 && millis() - frameStartMs >= FRAME_INTERVAL_MS) {
+    sendFrame();
+  }
+}
@@ -0,0 +1,406 @@
+import json
+import heapq
+import queue
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from operator import itemgetter
+import numpy as np
+import metrics
+from history_codec import encode_chunk, decode_chunk
+
+log = logging.getLogger(__name__)
+
+HISTORY_DB = 'sfct_history.db'
+
+# Raw scans of a group are compressed into a chunk once this many have accumulated
+CHUNK_ROWS = 1024
+
+
+def add_codec_column(db):
+    """scan_groups records each tag's (scale, offset, tolerance) for the chunk encoder"""
+    columns = {row[1] for row in db.execute('PRAGMA table_info(scan_groups)')}
+    if 'codec' not in columns:
+        db.execute('ALTER TABLE scan_groups ADD COLUMN codec TEXT')
+
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS scan_groups (
+        name TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        tags TEXT NOT NULL
+    )''',
+    add_codec_column,
+    '''CREATE TABLE IF NOT EXISTS scans (
+        ts REAL NOT NULL,
+        grp TEXT NOT NULL,
+        vals BLOB NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS scans_ts ON scans (ts)',
+    'CREATE INDEX IF NOT EXISTS scans_grp_ts ON scans (grp, ts)',
+    '''CREATE TABLE IF NOT EXISTS chunks (
+        grp TEXT NOT NULL,
+        start_ts REAL NOT NULL,
+        end_ts REAL NOT NULL,
+        rows INTEGER NOT NULL,
+        data BLOB NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS chunks_grp_start ON chunks (grp, start_ts)',
+    'CREATE INDEX IF NOT EXISTS chunks_grp_end ON chunks (grp, end_ts)',
+    # Per-bucket min/max/mean of each tag, filled in by maintenance.py
+    '''CREATE TABLE IF NOT EXISTS rollups (
+        grp TEXT NOT NULL,
+        period INTEGER NOT NULL,
+        start_ts REAL NOT NULL,
+        samples INTEGER NOT NULL,
+        low BLOB NOT NULL,
+        high BLOB NOT NULL,
+        mean BLOB NOT NULL,
+        PRIMARY KEY (grp, period, start_ts)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS rollup_progress (
+        grp TEXT NOT NULL,
+        period INTEGER NOT NULL,
+        done_until REAL NOT NULL,
+        PRIMARY KEY (grp, period)
+    )''',
+]
+
+
+class Historian:
+    """Scan history in SQLite: recent scans as raw rows, older ones as compressed chunks
+
+    Each raw row holds a group's values in tag order as a float64 blob, the
+    same array the acquisition hands to windows. Coil groups ('bits') are
+    stored the same way and come back as lists of bools. Once a group has
+    CHUNK_ROWS raw rows, the writer encodes them into one columnar chunk
+    (history_codec.py) and deletes them in the same transaction. Tags
+    defined with their register scaling are stored losslessly in a few bits
+    per sample, or thinned by swinging-door compression to the tag's
+    tolerance. Readers see one time-ordered history either way.
+
+    Recording never touches the database on the caller's thread: rows go on
+    a queue and a writer thread inserts them in batches, committing at most
+    every flush_interval seconds. Reads use a separate connection per
+    reading thread (the file is in WAL mode, so they don't block the writer),
+    stream raw rows with fetchmany and decode chunks one at a time.
+    """
+
+    def __init__(self, path=HISTORY_DB, flush_interval=1.0, max_queue=10000, chunk_rows=CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = None
+        self.readers = threading.local()
+        self.group_info = None
+
+        self.rows_written = metrics.REGISTRY.counter('historian_rows_total', 'Scan rows written to the historian')
+        self.dropped = metrics.REGISTRY.counter(
+            'historian_dropped_total', 'Scan rows dropped because the historian queue was full')
+        self.commit_seconds = metrics.REGISTRY.histogram(
+            'historian_commit_seconds', 'Time to insert and commit one batch of scan rows')
+        self.chunks_written = metrics.REGISTRY.counter('historian_chunks_total', 'Compressed chunks written')
+        self.compact_seconds = metrics.REGISTRY.histogram(
+            'historian_compact_seconds', 'Time to compress one chunk of raw scans and replace them')
+
+    # Writing
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.writer, name='historian', daemon=True)
+            self.thread.start()
+
+    def define_group(self, name, tags, kind='values', codec=None):
+        """Declare a group's tag names; codec gives each tag's (scale, offset, tolerance) for compression"""
+        self.start()
+        self.queue.put(('group', (name, kind, json.dumps(list(tags)), json.dumps(codec) if codec else None)))
+
+    def record(self, name, timestamp, values):
+        if values is None:
+            return
+        self.start()
+        blob = np.asarray(values, dtype=np.float64).tobytes()
+        try:
+            self.queue.put_nowait(('scan', (timestamp, name, blob)))
+        except queue.Full:
+            self.dropped.inc()
+
+    def attach(self, acquisition):
+        """Record every scan of every recorded acquisition group from now on"""
+        for name, group in acquisition.groups.items():
+            if not group.recorded:
+                continue
+            self.define_acquisition_group(name, group)
+            acquisition.subscribe(name, lambda values, name=name: self.record(
+                name, acquisition.groups[name].timestamp, values))
+        # Rescaled tags are compressed with their new scaling from the next chunk on
+        acquisition.reconfigured.connect(lambda names: [
+            self.define_acquisition_group(name, acquisition.groups[name])
+            for name in names if acquisition.groups[name].recorded])
+
+    def define_acquisition_group(self, name, group):
+        if group.codec:
+            self.define_group(name, [tag.name for tag in group.codec.tags], 'values',
+                              [(tag.scale, tag.offset, tag.tolerance) for tag in group.codec.tags])
+        else:
+            self.define_group(name, [f"{name}.{i}" for i in range(group.count)], 'bits',
+                              [(1.0, 0.0, 0.0)] * group.count)
+
+    def writer(self):
+        db = self.connect()
+        for statement in SCHEMA:
+            if callable(statement):
+                statement(db)
+            else:
+                db.execute(statement)
+        db.commit()
+        codecs = {name: json.loads(codec) for name, codec in db.execute('SELECT name, codec FROM scan_groups')
+                  if codec}
+        raw_rows = dict(db.execute('SELECT grp, COUNT(*) FROM scans GROUP BY grp'))
+
+        running = True
+        while running:
+            item = self.queue.get()
+            batch = [item]
+            # Everything queued during the last flush interval goes in one transaction
+            while True:
+                try:
+                    batch.append(self.queue.get(timeout=self.flush_interval if len(batch) == 1 else 0))
+                except queue.Empty:
+                    break
+                if len(batch) >= 1000:
+                    break
+
+            scans = [args for kind, args in batch if kind == 'scan']
+            groups = [args for kind, args in batch if kind == 'group']
+            running = not any(kind == 'stop' for kind, _ in batch)
+            try:
+                with self.commit_seconds.time():
+                    db.executemany('INSERT OR REPLACE INTO scan_groups (name, kind, tags, codec) VALUES (?, ?, ?, ?)',
+                                   groups)
+                    db.executemany('INSERT INTO scans (ts, grp, vals) VALUES (?, ?, ?)', scans)
+                    db.commit()
+                self.rows_written.inc(len(scans))
+                for name, _, _, codec in groups:
+                    codecs[name] = json.loads(codec) if codec else None
+                for _, name, _ in scans:
+                    raw_rows[name] = raw_rows.get(name, 0) + 1
+            except sqlite3.Error as e:
+                log.error("Historian write failed, %d rows lost: %s", len(scans), e)
+                db.rollback()
+
+            for name in list(raw_rows):
+                while raw_rows[name] >= self.chunk_rows:
+                    compacted = self.compact(db, name, codecs.get(name))
+                    if not compacted:
+                        # Retention may have deleted raw rows from under the count
+                        raw_rows[name] = db.execute('SELECT COUNT(*) FROM scans WHERE grp = ?', (name,)).fetchone()[0]
+                        break
+                    raw_rows[name] -= compacted
+            for _ in batch:
+                self.queue.task_done()
+        db.close()
+
+    def compact(self, db, name, codec):
+        """Replace the oldest chunk_rows raw scans of a group with one chunk; returns how many"""
+        try:
+            with self.compact_seconds.time():
+                # Read and replace under one write lock, so retention can't move the rows in between
+                db.execute('BEGIN IMMEDIATE')
+                rows = db.execute('SELECT rowid, ts, vals FROM scans WHERE grp = ? ORDER BY ts, rowid LIMIT ?',
+                                  (name, self.chunk_rows)).fetchall()
+                if not rows:
+                    db.rollback()
+                    return 0
+                # A group redefined with more or fewer tags starts a new chunk
+                width = len(rows[0][2])
+                rows = rows[:next((i for i, row in enumerate(rows) if len(row[2]) != width), len(rows))]
+                times = np.array([ts for _, ts, _ in rows])
+                values = np.frombuffer(b''.join(vals for _, _, vals in rows), dtype=np.float64).reshape(len(rows), -1)
+                if codec and len(codec) != values.shape[1]:
+                    codec = None
+                data = encode_chunk(times, values, codec)
+                start, end = round(times[0], 3), round(times[-1], 3)
+                db.execute('INSERT INTO chunks (grp, start_ts, end_ts, rows, data) VALUES (?, ?, ?, ?, ?)',
+                           (name, start, end, len(rows), data))
+                db.executemany('DELETE FROM scans WHERE rowid = ?', [(rowid,) for rowid, _, _ in rows])
+                db.commit()
+        except (sqlite3.Error, ValueError) as e:
+            log.error("Historian could not compress %s: %s", name, e)
+            db.rollback()
+            return 0
+        self.chunks_written.inc()
+        log.debug("Compressed %d %s scans into %d bytes", len(rows), name, len(data))
+        return len(rows)
+
+    def flush(self):
+        """Wait until everything recorded so far is committed"""
+        if self.thread is not None:
+            self.queue.join()
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(('stop', None))
+            self.thread.join(timeout=10)
+            self.thread = None
+
+    # Reading
+
+    def connect(self):
+        db = sqlite3.connect(self.path)
+        # Only takes effect on a new file; lets maintenance hand freed pages back a few at a time
+        db.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    def reader(self):
+        """This thread's read connection"""
+        db = getattr(self.readers, 'db', None)
+        if db is None:
+            db = self.readers.db = sqlite3.connect(self.path)
+        return db
+
+    @contextmanager
+    def snapshot(self):
+        """One consistent view of chunks and raw rows while the writer moves scans between them"""
+        db = self.reader()
+        if db.in_transaction:
+            yield db
+            return
+        db.execute('BEGIN')
+        try:
+            yield db
+        finally:
+            db.commit()
+
+    def groups(self):
+        """{group: (kind, tag names)} for every recorded group"""
+        if self.group_info is None:
+            try:
+                rows = self.reader().execute('SELECT name, kind, tags FROM scan_groups').fetchall()
+            except sqlite3.OperationalError:
+                rows = []
+            self.group_info = {name: (kind, json.loads(tags)) for name, kind, tags in rows}
+        return self.group_info
+
+    def decode(self, name, blob):
+        return self.group_values(name, np.frombuffer(blob, dtype=np.float64))
+
+    def group_values(self, name, values):
+        if self.groups().get(name, ('values',))[0] == 'bits':
+            return [bool(v) for v in values]
+        return values
+
+    def time_range(self):
+        """(first, last) recorded timestamp, or None when there is no history"""
+        try:
+            with self.snapshot() as db:
+                spans = [db.execute('SELECT MIN(ts), MAX(ts) FROM scans').fetchone(),
+                         db.execute('SELECT MIN(start_ts), MAX(end_ts) FROM chunks').fetchone()]
+        except sqlite3.OperationalError:
+            return None
+        firsts = [first for first, _ in spans if first is not None]
+        lasts = [last for _, last in spans if last is not None]
+        return (min(firsts), max(lasts)) if firsts else None
+
+    def chunks(self, name, start, end):
+        """(times, values) arrays of each of a group's chunks overlapping start..end, cut to it, in order"""
+        cursor = self.reader().execute(
+            'SELECT start_ts, data FROM chunks WHERE grp = ? AND end_ts >= ? ORDER BY end_ts', (name, start))
+        for chunk_start, data in cursor:
+            if chunk_start > end:
+                return
+            times, values = decode_chunk(data)
+            first, last = np.searchsorted(times, start, 'left'), np.searchsorted(times, end, 'right')
+            if last > first:
+                yield times[first:last], values[first:last]
+
+    def raw_scans(self, name, start, end, batch):
+        cursor = self.reader().execute(
+            'SELECT ts, vals FROM scans WHERE grp = ? AND ts >= ? AND ts <= ? ORDER BY ts', (name, start, end))
+        while True:
+            rows = cursor.fetchmany(batch)
+            if not rows:
+                return
+            for ts, blob in rows:
+                yield ts, name, self.decode(name, blob)
+
+    def group_scans(self, name, start, end, batch):
+        chunked = ((ts, name, self.group_values(name, row))
+                   for times, values in self.chunks(name, start, end)
+                   for ts, row in zip(times.tolist(), values))
+        return heapq.merge(chunked, self.raw_scans(name, start, end, batch), key=itemgetter(0))
+
+    def scans(self, start, end=None, batch=500):
+        """(timestamp, group, values) rows from start on in time order, read batch rows at a time"""
+        if end is None:
+            end = float('inf')
+        with self.snapshot():
+            streams = [self.group_scans(name, start, end, batch) for name in self.groups()]
+            yield from heapq.merge(*streams, key=itemgetter(0))
+
+    def series(self, name, start, end=None):
+        """(times, values) of one group between start and end as NumPy arrays of shape (n,) and (n, tags)"""
+        if end is None:
+            end = float('inf')
+        with self.snapshot() as db:
+            parts = list(self.chunks(name, start, end))
+            rows = db.execute('SELECT ts, vals FROM scans WHERE grp = ? AND ts >= ? AND ts <= ? ORDER BY ts',
+                              (name, start, end)).fetchall()
+        if rows:
+            parts.append((np.array([ts for ts, _ in rows]),
+                          np.frombuffer(b''.join(blob for _, blob in rows), dtype=np.float64).reshape(len(rows), -1)))
+        if not parts:
+            return np.zeros(0), np.zeros((0, len(self.groups().get(name, ('values', []))[1])))
+        times = np.concatenate([times for times, _ in parts])
+        values = np.concatenate([values for _, values in parts])
+        if np.any(np.diff(times) < 0):
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+        return times, values
+
+    def rollups(self, name, period, start, end=None):
+        """(start times, samples, low, high, mean) of a group's period-second rollup buckets from start to end
+
+        low, high and mean have shape (buckets, tags). Buckets are only
+        there once maintenance has rolled them up, and outlive the scans.
+        """
+        if end is None:
+            end = float('inf')
+        try:
+            rows = self.reader().execute(
+                'SELECT start_ts, samples, low, high, mean FROM rollups '
+                'WHERE grp = ? AND period = ? AND start_ts >= ? AND start_ts <= ? ORDER BY start_ts',
+                (name, period, start, end)).fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+        width = len(self.groups().get(name, ('values', []))[1])
+        columns = [np.frombuffer(b''.join(row[i] for row in rows), dtype=np.float64).reshape(len(rows), -1)
+                   if rows else np.zeros((0, width)) for i in (2, 3, 4)]
+        return (np.array([row[0] for row in rows]), np.array([row[1] for row in rows], dtype=np.int64),
+                *columns)
+
+    def state_at(self, timestamp):
+        """{group: (timestamp, values)} of each group's last scan at or before timestamp"""
+        state = {}
+        with self.snapshot() as db:
+            for name in self.groups():
+                latest = db.execute(
+                    'SELECT ts, vals FROM scans WHERE grp = ? AND ts <= ? ORDER BY ts DESC LIMIT 1',
+                    (name, timestamp)).fetchone()
+                if latest:
+                    latest = (latest[0], self.decode(name, latest[1]))
+                chunk = db.execute(
+                    'SELECT data FROM chunks WHERE grp = ? AND start_ts <= ? ORDER BY start_ts DESC LIMIT 1',
+                    (name, timestamp)).fetchone()
+                if chunk:
+                    times, values = decode_chunk(chunk[0])
+                    i = np.searchsorted(times, timestamp, 'right') - 1
+                    if latest is None or times[i] > latest[0]:
+                        latest = (float(times[i]), self.group_values(name, values[i]))
+                if latest:
+                    state[name] = latest
+        return state
@@ -0,0 +1,168 @@
+"""Columnar compression of historian chunks
+
+A chunk is one group's scans over a stretch of time: n timestamps and an
+n x m block of values. The layout (zlib-compressed as a whole) is
+
+    header      version u8, rows u32, columns u16
+    times       first timestamp in ms (i64), then the delta-of-deltas
+    columns     per tag: encoding u8, keep mask, values
+
+Timestamps are kept to the millisecond. Regular scans make the
+delta-of-deltas almost all zero, which zlib all but removes.
+
+Values use QUANTISED when they are whole multiples of the tag's register
+scaling, as everything read off the PLC is. The register counts are then
+stored as deltas, losslessly, in the narrowest integer type that fits.
+Anything else, such as scans recorded before the tag was rescaled, uses XOR: each float64's bits XORed with the previous one's,
+which zeroes the common sign, exponent and high mantissa bits of slowly
+moving values.
+
+A tag with a tolerance (engineering units) is thinned by swinging-door
+compression before encoding. Only the points needed to keep the line
+between stored points within tolerance of every sample are stored, with a
+bitmask of which rows they were. Decoding interpolates the rest. NaN and
+inf samples and the samples either side of them are always stored, and a
+column holding them is XOR-encoded. With a tolerance of 0 every value is
+stored exactly.
+
+Integer arrays are written with a one-byte dtype code and decoded with
+np.frombuffer and cumsum, so decoding a chunk is a handful of NumPy calls
+per column.
+"""
+import zlib
+import struct
+import numpy as np
+
+VERSION = 1
+HEADER = struct.Struct('<BIH')
+QUANTISED = 0
+XOR = 1
+
+INT_TYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+def pack_ints(values):
+    """Integers in the narrowest of int8..int64 that holds them, prefixed with the type's index"""
+    values = np.asarray(values, dtype=np.int64)
+    low, high = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+    for code, dtype in enumerate(INT_TYPES):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return bytes([code]) + struct.pack('<I', len(values)) + values.astype(dtype).tobytes()
+
+
+def unpack_ints(buffer, offset):
+    code = buffer[offset]
+    count, = struct.unpack_from('<I', buffer, offset + 1)
+    dtype = np.dtype(INT_TYPES[code])
+    start = offset + 5
+    values = np.frombuffer(buffer, dtype=dtype, count=count, offset=start).astype(np.int64)
+    return values, start + count * dtype.itemsize
+
+
+def swinging_door(times, values, tolerance):
+    """Mask of the samples to store so linear interpolation between them stays within tolerance"""
+    n = len(values)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    if tolerance <= 0 or n < 3:
+        keep[:] = True
+        return keep
+
+    finite = np.isfinite(values)
+    finite = None if finite.all() else finite.tolist()
+    times = times.tolist()
+    values = values.tolist()
+    anchor = 0
+    # Slopes from the anchor that keep every sample since it within tolerance
+    upper, lower = float('inf'), float('-inf')
+    for i in range(1, n):
+        elapsed = times[i] - times[anchor]
+        if elapsed <= 0 or (finite is not None and not (finite[i] and finite[anchor])):
+            # Nothing can be interpolated across a repeated time or a NaN/inf: store both sides of it
+            keep[i - 1] = keep[i] = True
+            anchor, upper, lower = i, float('inf'), float('-inf')
+            continue
+        if not lower <= (values[i] - values[anchor]) / elapsed <= upper:
+            # A line to this sample would leave the doors: end the segment at the previous one
+            anchor = i - 1
+            keep[anchor] = True
+            upper, lower = float('inf'), float('-inf')
+            elapsed = times[i] - times[anchor]
+        upper = min(upper, (values[i] + tolerance - values[anchor]) / elapsed)
+        lower = max(lower, (values[i] - tolerance - values[anchor]) / elapsed)
+    return keep
+
+
+def encode_chunk(times, values, codec=None):
+    """Compress (n,) timestamps and (n, m) values; codec is per column (scale, offset, tolerance) or None"""
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values.reshape(-1, 1)
+    rows, columns = values.shape
+    codec = codec or [(None, 0.0, 0.0)] * columns
+
+    ms = np.round(times * 1000.0).astype(np.int64)
+    deltas = np.diff(ms)
+    parts = [HEADER.pack(VERSION, rows, columns), struct.pack('<q', ms[0] if rows else 0),
+             pack_ints(np.diff(deltas, prepend=0) if rows > 1 else [])]
+
+    for column, (scale, offset, tolerance) in zip(values.T, codec):
+        keep = swinging_door(ms / 1000.0, column, tolerance or 0.0) if rows else np.ones(0, dtype=bool)
+        thinned = not keep.all()
+        kept = column[keep]
+
+        encoding = XOR
+        if scale and np.isfinite(kept).all():
+            counts = np.round((kept - offset) / scale)
+            if np.array_equal(counts * scale + offset, kept):
+                encoding = QUANTISED
+        parts.append(bytes([encoding, thinned]))
+        if thinned:
+            parts.append(np.packbits(keep).tobytes())
+        if encoding == QUANTISED:
+            parts.append(struct.pack('<dd', scale, offset))
+            parts.append(pack_ints(np.diff(counts.astype(np.int64), prepend=0)))
+        else:
+            bits = kept.view(np.uint64)
+            previous = np.zeros_like(bits)
+            previous[1:] = bits[:-1]
+            parts.append((bits ^ previous).tobytes())
+    return zlib.compress(b''.join(parts), 6)
+
+
+def decode_chunk(blob):
+    """(times, values) of a chunk as float64 arrays of shape (n,) and (n, m)"""
+    buffer = zlib.decompress(blob)
+    version, rows, columns = HEADER.unpack_from(buffer, 0)
+    if version != VERSION:
+        raise ValueError(f"unsupported chunk version {version}")
+    offset = HEADER.size
+    first, = struct.unpack_from('<q', buffer, offset)
+    dods, offset = unpack_ints(buffer, offset + 8)
+    ms = first + np.concatenate(([0], np.cumsum(np.cumsum(dods)))) if rows else np.zeros(0, dtype=np.int64)
+    times = ms / 1000.0
+
+    values = np.empty((rows, columns))
+    for column in range(columns):
+        encoding, thinned = buffer[offset], buffer[offset + 1]
+        offset += 2
+        keep = None
+        if thinned:
+            mask_bytes = (rows + 7) // 8
+            keep = np.unpackbits(np.frombuffer(buffer, np.uint8, mask_bytes, offset))[:rows].astype(bool)
+            offset += mask_bytes
+        kept_rows = int(keep.sum()) if thinned else rows
+
+        if encoding == QUANTISED:
+            scale, value_offset = struct.unpack_from('<dd', buffer, offset)
+            deltas, offset = unpack_ints(buffer, offset + 16)
+            kept = np.cumsum(deltas) * scale + value_offset
+        else:
+            bits = np.frombuffer(buffer, np.uint64, kept_rows, offset)
+            offset += kept_rows * 8
+            kept = np.bitwise_xor.accumulate(bits).view(np.float64)
+
+        values[:, column] = np.interp(times, times[keep], kept) if thinned else kept
+    return times, values
@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(threadName)s %(name)s: %(message)s'
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per call site so a repeating message can't flood the log
+
+    Messages are keyed by logger, level and the unformatted message template,
+    so "Invalid data received: %s" is one key whatever the data was. Each key
+    may burst `burst` records and then `rate` records per second; the next
+    record let through carries the number suppressed in between.
+    """
+
+    def __init__(self, rate=0.2, burst=5):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [float(self.burst), now, 0]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                return False
+
+            bucket[0] -= 1.0
+            record.suppressed = bucket[2]
+            bucket[2] = 0
+            return True
+
+
+class HmiFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            text += f" [{suppressed} similar messages suppressed]"
+        return text
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread without formatting them here
+
+    The stock QueueHandler formats in the calling thread; deferring that to
+    the listener keeps the cost on the GUI thread to a filter check and a
+    non-blocking put. When the queue is full the record is dropped and
+    counted rather than blocking the caller.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+
+
+def setup_logging(app_name, level=None, log_dir=LOG_DIR, console=True,
+                  max_bytes=5 * 1024 * 1024, backup_count=5, queue_size=10000):
+    """Route all logging through a background thread to a rotating file and the console
+
+    The level defaults to $HMI_LOG_LEVEL or INFO; per-tick hot-path messages
+    are logged at DEBUG so they cost only a level check unless enabled.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    if level is None:
+        level = os.environ.get('HMI_LOG_LEVEL', 'INFO').upper()
+
+    formatter = HmiFormatter(LOG_FORMAT)
+    handlers = []
+
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(log_dir, f'{app_name}.log'), maxBytes=max_bytes,
+            backupCount=backup_count, encoding='utf-8')
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    except OSError as e:
+        sys.stderr.write(f"File logging disabled: {e}\n")
+
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    log_queue = queue.Queue(queue_size)
+    queue_handler = BackgroundQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,617 @@
+"""Background housekeeping for the SQLite files: rollups, retention and vacuum
+
+A MaintenanceScheduler runs jobs on its own thread, so none of this ever
+touches the GUI thread. Jobs marked idle wait until the operator has left
+the HMI alone for a while (an ActivityFilter on the QApplication tells the
+scheduler about input), or until they are max_delay overdue.
+
+HistoryMaintenance keeps the historian bounded:
+
+    rollup   per-minute and per-hour min/max/mean of every tag, computed
+             incrementally from a watermark per group and period; hours are
+             built from the minutes, not the scans
+    expire   scans older than the group's retention (the longest of its
+             tags') move into archive/<file>-YYYY-MM.db, one file per
+             month, readable by Historian and --replay like the live file.
+             Scans are never expired before they are rolled up, and minute
+             rollups are dropped after ROLLUP_RETENTION
+    vacuum   WAL checkpoint and incremental vacuum while idle
+
+CycleMaintenance does the same for cycle_counter.db: old cycle_data and
+session rows into archive files. Its daily totals are kept by
+cycle_summary.py as rows are inserted.
+"""
+import os
+import glob
+import math
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from PyQt5.QtCore import QObject, QEvent
+import metrics
+from cycle_summary import create_summaries
+# NumPy and the historian are imported by the historian jobs, so the cycle counter starts without them
+from tags import TAGS, TAG_GROUPS
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_DIR = 'archive'
+
+# Rollup periods in seconds, finest first; each must divide the next
+ROLLUP_PERIODS = (60, 3600)
+# Days to keep each rollup period; None keeps it for good
+ROLLUP_RETENTION = {60: 90, 3600: None}
+# Scans read into memory per rollup step
+ROLLUP_SLICE = 86400
+
+CYCLE_RETENTION_DAYS = 730
+
+# Free pages handed back to the file system per idle vacuum step (4 KiB pages)
+VACUUM_PAGES = 2048
+# Files up to this size are switched to incremental vacuum with one VACUUM while idle
+CONVERT_LIMIT = 64 * 1024 * 1024
+
+INPUT_EVENTS = {QEvent.MouseButtonPress, QEvent.MouseButtonRelease, QEvent.MouseMove, QEvent.KeyPress,
+                QEvent.Wheel, QEvent.TouchBegin}
+
+
+class Job:
+    def __init__(self, name, func, interval, idle, first_run):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.idle = idle
+        self.next_run = first_run
+        self.seconds = metrics.REGISTRY.histogram('maintenance_job_seconds', 'Time taken by one maintenance job run',
+                                                  job=name)
+        self.failures = metrics.REGISTRY.counter('maintenance_job_failures_total', 'Maintenance job runs that raised',
+                                                 job=name)
+
+
+class MaintenanceScheduler:
+    """Runs housekeeping jobs every so often on one background thread
+
+    A job's callable gets no arguments. Jobs added with idle=True only run
+    once there has been no operator input for idle_after seconds, or when
+    they are max_delay seconds overdue so a busy control room can't put
+    them off for good. Long jobs should check interrupted() between steps
+    and return early; they are simply run again next time.
+    """
+
+    def __init__(self, idle_after=120.0, max_delay=6 * 3600.0, tick=1.0):
+        self.idle_after = idle_after
+        self.max_delay = max_delay
+        self.tick = tick
+        self.jobs = []
+        self.last_input = time.monotonic()
+        self.stopping = threading.Event()
+        self.overdue = False
+        self.thread = None
+
+    def add(self, name, func, interval, idle=False, delay=None):
+        """Run func every interval seconds, the first time after delay (default: interval)"""
+        job = Job(name, func, interval, idle, time.monotonic() + (interval if delay is None else delay))
+        self.jobs.append(job)
+        return job
+
+    def touch(self):
+        """Note operator input; called from the GUI thread"""
+        self.last_input = time.monotonic()
+
+    def is_idle(self):
+        return time.monotonic() - self.last_input >= self.idle_after
+
+    def interrupted(self):
+        """Whether a running job should stop at its next convenient point"""
+        return self.stopping.is_set() or not (self.overdue or self.is_idle())
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.loop, name='maintenance', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout=10)
+            self.thread = None
+
+    def loop(self):
+        while not self.stopping.wait(self.tick):
+            self.run_pending()
+
+    def run_pending(self, force=False):
+        """Run every job that is due (every job with force); returns how many ran"""
+        ran = 0
+        for job in self.jobs:
+            now = time.monotonic()
+            if self.stopping.is_set():
+                break
+            if not force:
+                if now < job.next_run:
+                    continue
+                if job.idle and not self.is_idle() and now - job.next_run < self.max_delay:
+                    continue
+            # An overdue job runs to the end even though the operator is busy
+            self.overdue = force or (job.idle and not self.is_idle())
+            try:
+                with job.seconds.time():
+                    job.func()
+            except Exception:
+                job.failures.inc()
+                log.exception("Maintenance job %s failed", job.name)
+            job.next_run = time.monotonic() + job.interval
+            ran += 1
+        return ran
+
+
+class ActivityFilter(QObject):
+    """Application event filter that tells a MaintenanceScheduler whenever the operator does something"""
+
+    def __init__(self, scheduler, parent=None):
+        super().__init__(parent)
+        self.scheduler = scheduler
+
+    def eventFilter(self, watched, event):
+        if event.type() in INPUT_EVENTS:
+            self.scheduler.touch()
+        return False
+
+
+# Shared steps
+
+def connect(path):
+    db = sqlite3.connect(path, timeout=5.0)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    return db
+
+
+def archive_path(archive_dir, path, start):
+    """archive/<name>-YYYY-MM.db for the month (local time) starting at start"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(archive_dir, f"{stem}-{datetime.fromtimestamp(start):%Y-%m}.db")
+
+
+def archive_files(archive_dir, path):
+    """Every monthly archive file of the file at path, oldest first"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    month = '[0-9]' * 4 + '-' + '[0-9]' * 2
+    return sorted(glob.glob(os.path.join(glob.escape(archive_dir), f"{glob.escape(stem)}-{month}.db")))
+
+
+def month_bounds(first, last):
+    """(start, end) timestamps of each local calendar month from first's to last's"""
+    month = datetime.fromtimestamp(first).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while month.timestamp() <= last:
+        following = month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(
+            month=month.month + 1)
+        yield month.timestamp(), following.timestamp()
+        month = following
+
+
+def create_schema(path, schema):
+    """Create the file at path if need be and run the schema's statements (or migrations) on it"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    db = sqlite3.connect(path, timeout=5.0)
+    try:
+        for statement in schema:
+            if callable(statement):
+                statement(db)
+            else:
+                db.execute(statement)
+        db.commit()
+    finally:
+        db.close()
+
+
+def copy_rows(db, table, where, params, keys, path):
+    """Copy the rows of table matching where into the same table of the archive file at path
+
+    Rows the archive already has (by keys) are skipped, so a copy that is
+    repeated after being cut short leaves no duplicates.
+    """
+    db.execute('ATTACH DATABASE ? AS archive', (path,))
+    try:
+        db.execute(f'CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0')
+        db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS archive.{table}_archive_key ON {table} ({", ".join(keys)})')
+        db.execute(f'INSERT OR IGNORE INTO archive.{table} SELECT * FROM main.{table} WHERE {where}', params)
+        db.commit()
+    except sqlite3.Error:
+        db.rollback()
+        raise
+    finally:
+        db.execute('DETACH DATABASE archive')
+
+
+def move_rows(db, table, where, params, keys, path=None, schema=()):
+    """Move the rows of table matching where into the archive at path (None: just delete them)
+
+    The rows are pinned by rowid first, so rows the writer adds meanwhile
+    are left alone. The archive is created with schema when there is
+    anything to move, and the copy is committed before the rows are
+    deleted: a crash (or a chunk compacted from them) in between leaves
+    them in both files, never in neither. Returns the number of rows removed from db.
+    """
+    db.execute('DROP TABLE IF EXISTS temp.moving')
+    db.execute(f'CREATE TEMP TABLE moving AS SELECT rowid AS id FROM main.{table} WHERE {where}', params)
+    try:
+        if db.execute('SELECT 1 FROM temp.moving LIMIT 1').fetchone() is None:
+            return 0
+        pinned = 'rowid IN (SELECT id FROM temp.moving)'
+        if path is not None:
+            create_schema(path, schema)
+            copy_rows(db, table, pinned, (), keys, path)
+        removed = db.execute(f'DELETE FROM main.{table} WHERE {pinned}').rowcount
+        db.commit()
+        return removed
+    finally:
+        db.execute('DROP TABLE temp.moving')
+        db.commit()
+
+
+def enable_incremental_vacuum(db, path, limit=CONVERT_LIMIT):
+    """Switch an older file to incremental vacuum; needs a full VACUUM, so only files up to limit bytes"""
+    if db.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return True
+    size = db.execute('PRAGMA page_count').fetchone()[0] * db.execute('PRAGMA page_size').fetchone()[0]
+    if size > limit:
+        log.info("%s is %.0f MB; run 'python maintenance.py --vacuum %s' while it is not in use to enable "
+                 "incremental vacuum", path, size / 1e6, path)
+        return False
+    db.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    db.execute('VACUUM')
+    log.info("Enabled incremental vacuum on %s", path)
+    return True
+
+
+class Housekeeping:
+    """Idle-time WAL checkpoint and incremental vacuum of one SQLite file"""
+
+    def __init__(self, path, pages=VACUUM_PAGES):
+        self.path = path
+        self.pages = pages
+        self.db = None
+        self.incremental = None
+        self.freed = metrics.REGISTRY.counter('maintenance_pages_freed_total', 'Free pages handed back by incremental '
+                                              'vacuum', file=os.path.basename(path))
+
+    def __call__(self):
+        if self.db is None:
+            self.db = connect(self.path)
+        db = self.db
+        db.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchall()
+        if self.incremental is None:
+            self.incremental = enable_incremental_vacuum(db, self.path)
+        if self.incremental:
+            free = db.execute('PRAGMA freelist_count').fetchone()[0]
+            if free:
+                # executescript steps the pragma to completion; execute() would free a single page
+                db.executescript(f'PRAGMA incremental_vacuum({min(free, self.pages)});')
+                self.freed.inc(free - db.execute('PRAGMA freelist_count').fetchone()[0])
+
+
+# Historian
+
+def group_retention(acquisition, default=None):
+    """{group: retention in days or None} for the recorded acquisition groups
+
+    A group's scans are stored together, so they are kept for the longest
+    retention of its tags (None if any tag keeps its history for good).
+    Coil groups have no tags and get default.
+    """
+    retention = {}
+    for name, group in acquisition.groups.items():
+        if not group.recorded:
+            continue
+        if group.codec:
+            days = [tag.retention for tag in group.codec.tags]
+            retention[name] = None if None in days else max(days)
+        else:
+            retention[name] = default
+    return retention
+
+
+def rollup_buckets(times, samples, low, high, mean, period):
+    """Combine rows into period-second buckets: (bucket starts, samples, low, high, mean)
+
+    Rows are raw scans (samples 1, low = high = mean = the values) or the
+    buckets of a finer period; times must be in order.
+    """
+    import numpy as np
+
+    buckets = np.floor(times / period) * period
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.add.reduceat(samples, starts)
+    weighted = np.add.reduceat(mean * samples[:, None], starts, axis=0) / counts[:, None]
+    return (buckets[starts], counts, np.fmin.reduceat(low, starts, axis=0), np.fmax.reduceat(high, starts, axis=0),
+            weighted)
+
+
+class HistoryMaintenance:
+    """Rollups, retention and vacuum for a Historian's file
+
+    retention maps group to days (see group_retention); groups not in it,
+    or mapped to None, are kept for good. With archive_dir None expired
+    scans are deleted rather than archived.
+    """
+
+    def __init__(self, history, retention=None, archive_dir=ARCHIVE_DIR, periods=ROLLUP_PERIODS,
+                 rollup_retention=ROLLUP_RETENTION):
+        self.history = history
+        self.retention = retention or {}
+        self.archive_dir = archive_dir
+        self.periods = periods
+        self.rollup_retention = rollup_retention
+        from historian import SCHEMA
+        self.schema = SCHEMA
+        self.scheduler = None
+        self.db = None
+        self.buckets = metrics.REGISTRY.counter('historian_rollups_total', 'Rollup buckets written')
+        self.archived = metrics.REGISTRY.counter('historian_archived_rows_total',
+                                                 'Chunks and raw scans moved out of the historian by retention')
+
+    def schedule(self, scheduler, rollup_interval=60, expire_interval=3600, vacuum_interval=300):
+        self.scheduler = scheduler
+        scheduler.add('history-rollup', self.rollup, rollup_interval)
+        scheduler.add('history-expire', self.expire, expire_interval, idle=True)
+        scheduler.add('history-vacuum', Housekeeping(self.history.path), vacuum_interval, idle=True)
+
+    def connect(self):
+        if self.db is None:
+            self.db = connect(self.history.path)
+            # Migrations are the writer's job; CREATE ... IF NOT EXISTS is safe to race it
+            create_schema(self.history.path, [statement for statement in self.schema if not callable(statement)])
+        return self.db
+
+    def stopping(self):
+        return self.scheduler is not None and self.scheduler.stopping.is_set()
+
+    def groups(self):
+        return [name for name, in self.connect().execute('SELECT name FROM scan_groups ORDER BY name')]
+
+    def progress(self, name, period):
+        row = self.connect().execute('SELECT done_until FROM rollup_progress WHERE grp = ? AND period = ?',
+                                     (name, period)).fetchone()
+        return row[0] if row else None
+
+    # Rollups
+
+    def rollup(self, now=None):
+        """Bring every group's rollups up to date; returns the number of buckets written"""
+        now = time.time() if now is None else now
+        written = 0
+        for name in self.groups():
+            for i, period in enumerate(self.periods):
+                if self.stopping():
+                    return written
+                written += self.rollup_group(name, period, self.periods[i - 1] if i else None, now)
+        return written
+
+    def rollup_group(self, name, period, source, now):
+        """Roll one group up to whole period buckets, from its scans or from the source period's buckets"""
+        import numpy as np
+
+        db = self.connect()
+        if source is None:
+            first, last = self.data_span(name)
+        else:
+            first = db.execute('SELECT MIN(start_ts) FROM rollups WHERE grp = ? AND period = ?',
+                               (name, source)).fetchone()[0]
+            last = self.progress(name, source)
+        if first is None or last is None:
+            return 0
+        done = self.progress(name, period)
+        start = done if done is not None else math.floor(first / period) * period
+        # Buckets are complete once data after them has arrived, or recording stopped a period ago
+        limit = last if source is not None else (last if now - last < period else now)
+        end = math.floor(limit / period) * period
+        written = 0
+        while start < end and not self.stopping():
+            stop = min(end, start + max(period, ROLLUP_SLICE // period * period))
+            if source is None:
+                times, values = self.history.series(name, start, stop)
+                keep = times < stop
+                times, values = times[keep], values[keep]
+                rows = (times, np.ones(len(times), dtype=np.int64), values, values, values)
+            else:
+                rows = self.history.rollups(name, source, start, stop)
+                keep = rows[0] < stop
+                rows = tuple(column[keep] for column in rows)
+            buckets = rollup_buckets(*rows, period) if len(rows[0]) else ((),) * 5
+            db.executemany('INSERT OR REPLACE INTO rollups (grp, period, start_ts, samples, low, high, mean) '
+                           'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           [(name, period, float(bucket), int(count), low.tobytes(), high.tobytes(), mean.tobytes())
+                            for bucket, count, low, high, mean in zip(*buckets)])
+            db.execute('INSERT OR REPLACE INTO rollup_progress (grp, period, done_until) VALUES (?, ?, ?)',
+                       (name, period, float(stop)))
+            db.commit()
+            written += len(buckets[0])
+            start = stop
+        self.buckets.inc(written)
+        return written
+
+    def data_span(self, name):
+        """(first, last) timestamp of a group's scans, chunked or raw"""
+        db = self.connect()
+        spans = [db.execute('SELECT MIN(ts), MAX(ts) FROM scans WHERE grp = ?', (name,)).fetchone(),
+                 db.execute('SELECT MIN(start_ts), MAX(end_ts) FROM chunks WHERE grp = ?', (name,)).fetchone()]
+        firsts = [first for first, _ in spans if first is not None]
+        lasts = [last for _, last in spans if last is not None]
+        return (min(firsts), max(lasts)) if firsts else (None, None)
+
+    # Retention
+
+    def expire(self, now=None):
+        """Archive scans past their group's retention and drop old rollups; returns rows removed"""
+        now = time.time() if now is None else now
+        db = self.connect()
+        removed = 0
+        for name in self.groups():
+            days = self.retention.get(name)
+            if days is None:
+                continue
+            cutoff = now - days * 86400
+            if self.periods:
+                # Never drop scans the rollups haven't seen
+                cutoff = min(cutoff, self.progress(name, self.periods[0]) or 0.0)
+            first = db.execute('SELECT MIN(start_ts) FROM chunks WHERE grp = ? AND end_ts < ?',
+                               (name, cutoff)).fetchone()[0]
+            raw_first = db.execute('SELECT MIN(ts) FROM scans WHERE grp = ? AND ts < ?', (name, cutoff)).fetchone()[0]
+            firsts = [ts for ts in (first, raw_first) if ts is not None]
+            if not firsts:
+                continue
+            for month_start, month_end in month_bounds(min(firsts), cutoff):
+                if self.scheduler is not None and self.scheduler.interrupted():
+                    return removed
+                path = archive_path(self.archive_dir, self.history.path, month_start) if self.archive_dir else None
+                count = move_rows(db, 'chunks', 'grp = ? AND end_ts < ? AND start_ts >= ? AND start_ts < ?',
+                                  (name, cutoff, month_start, month_end), ('grp', 'start_ts'), path, self.schema)
+                count += move_rows(db, 'scans', 'grp = ? AND ts < ? AND ts >= ? AND ts < ?',
+                                   (name, cutoff, month_start, month_end), ('grp', 'ts'), path, self.schema)
+                if count and path:
+                    # The archive is a historian file in its own right, so it gets the group's definition
+                    copy_rows(db, 'scan_groups', 'name = ?', (name,), ('name',), path)
+                if count:
+                    log.info("Moved %d %s chunks/scans from %s to %s", count, name,
+                             datetime.fromtimestamp(month_start).strftime('%Y-%m'), path or 'the bin')
+                removed += count
+        self.archived.inc(removed)
+
+        for period, days in self.rollup_retention.items():
+            if days is not None:
+                removed += db.execute('DELETE FROM rollups WHERE period = ? AND start_ts < ?',
+                                      (period, now - days * 86400)).rowcount
+        db.commit()
+        return removed
+
+
+# Cycle counter
+
+# table -> (time column, extra condition, archive key); time columns are 'YYYY-MM-DD HH:MM:SS' text
+CYCLE_TABLES = {
+    'cycle_data': ('timestamp', '1', ('id',)),
+    'session_stats': ('session_start', '1', ('session_start',)),
+    'rig_sessions': ('session_start', 'is_running = 0', ('rig_id', 'session_start')),
+}
+
+
+def as_text(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class CycleMaintenance:
+    """Retention and vacuum for cycle_counter.db
+
+    cycle_data, session_stats and finished rig_sessions rows older than
+    retention_days move into archive/cycle_counter-YYYY-MM.db. The cycle
+    summaries (cycle_summary.py) outlive them. A file that predates the
+    summaries gets them before any of its rows are archived.
+    """
+
+    def __init__(self, path, retention_days=CYCLE_RETENTION_DAYS, archive_dir=ARCHIVE_DIR):
+        self.path = path
+        self.retention_days = retention_days
+        self.archive_dir = archive_dir
+        self.scheduler = None
+        self.db = None
+        self.archived = metrics.REGISTRY.counter('cycle_archived_rows_total',
+                                                 'Cycle counter rows moved out of the database by retention')
+
+    def schedule(self, scheduler, expire_interval=3600, vacuum_interval=300):
+        self.scheduler = scheduler
+        scheduler.add('cycle-expire', self.expire, expire_interval, idle=True)
+        scheduler.add('cycle-vacuum', Housekeeping(self.path), vacuum_interval, idle=True)
+
+    def connect(self):
+        if self.db is None:
+            self.db = connect(self.path)
+        return self.db
+
+    def tables(self):
+        return {name for name, in self.connect().execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    def summarise(self):
+        """Make sure rows are summarised before any are archived"""
+        db = self.connect()
+        if db.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'cycle_data_summaries'"
+                      ).fetchone() is None:
+            create_summaries(db)
+            db.commit()
+
+    def expire(self, now=None):
+        """Archive rows past the retention; returns how many were removed"""
+        now = time.time() if now is None else now
+        cutoff = now - self.retention_days * 86400
+        tables = self.tables()
+        if 'cycle_data' in tables:
+            self.summarise()
+        db = self.db
+        removed = 0
+        for table, (column, condition, keys) in CYCLE_TABLES.items():
+            if table not in tables:
+                continue
+            params = {'cutoff': as_text(cutoff)}
+            first = db.execute(f'SELECT MIN({column}) FROM {table} WHERE {column} < :cutoff AND {condition}',
+                               params).fetchone()[0]
+            if first is None:
+                continue
+            first = datetime.strptime(first[:19], '%Y-%m-%d %H:%M:%S').timestamp()
+            for month_start, month_end in month_bounds(first, cutoff):
+                if self.scheduler is not None and self.scheduler.interrupted():
+                    return removed
+                path = archive_path(self.archive_dir, self.path, month_start) if self.archive_dir else None
+                where = f'{column} < :cutoff AND {column} >= :start AND {column} < :end AND {condition}'
+                count = move_rows(db, table, where, dict(params, start=as_text(month_start), end=as_text(month_end)),
+                                  keys, path)
+                if count:
+                    log.info("Moved %d %s rows from %s to %s", count, table,
+                             datetime.fromtimestamp(month_start).strftime('%Y-%m'), path or 'the bin')
+                removed += count
+        self.archived.inc(removed)
+        return removed
+
+
+def tag_retention(tags=TAGS, default=None):
+    """group_retention() for the standard tag groups, for use without an acquisition"""
+    retention = {}
+    for name in TAG_GROUPS:
+        days = [tag.retention for tag in tags if tag.group == name]
+        retention[name] = None if None in days else max(days)
+    retention['valves'] = default
+    return retention
+
+
+def main():
+    import argparse
+    from hmi_log import setup_logging
+    from historian import Historian
+    parser = argparse.ArgumentParser(description="Run SFCT database maintenance now")
+    parser.add_argument("--history", metavar="HISTORY_DB", help="roll up, expire and vacuum a historian file")
+    parser.add_argument("--cycles", metavar="CYCLE_DB", help="expire and vacuum a cycle counter file")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="where expired rows go (default: %(default)s)")
+    parser.add_argument("--delete", action="store_true", help="delete expired rows instead of archiving them")
+    parser.add_argument("--vacuum", metavar="DB", action="append", default=[],
+                        help="switch a file that is not in use to incremental vacuum with a full VACUUM")
+    args = parser.parse_args()
+    setup_logging('maintenance')
+
+    for path in args.vacuum:
+        db = sqlite3.connect(path)
+        enable_incremental_vacuum(db, path, limit=float('inf'))
+        db.close()
+    archive_dir = None if args.delete else args.archive_dir
+    if args.history:
+        jobs = HistoryMaintenance(Historian(args.history), tag_retention(default=730), archive_dir)
+        log.info("Rolled up %d buckets, removed %d rows", jobs.rollup(), jobs.expire())
+        Housekeeping(args.history)()
+    if args.cycles:
+        jobs = CycleMaintenance(args.cycles, archive_dir=archive_dir)
+        log.info("Removed %d rows", jobs.expire())
+        Housekeeping(args.cycles)()
+
+
+if __name__ == '__main__':
+    main()
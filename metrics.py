@@ -0,0 +1,321 @@
+import math
+import time
+import logging
+import threading
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QPlainTextEdit
+from PyQt5.QtCore import QObject, QTimer, Qt
+from PyQt5.QtGui import QFont
+
+log = logging.getLogger(__name__)
+
+
+class Histogram:
+    """HDR-style histogram: log-spaced buckets with bounded relative error
+
+    Recording is O(1) and the memory footprint is fixed, so it can sit on a
+    hot path. Values are in seconds unless the metric name says otherwise.
+    """
+
+    def __init__(self, name, help='', labels=None, lowest=1e-6, highest=3600.0, precision=0.01):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.lowest = lowest
+        self.highest = highest
+        self.log_base = math.log1p(precision)
+        self.buckets = [0] * (self.bucket_index(highest) + 1)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def bucket_index(self, value):
+        if value <= self.lowest:
+            return 0
+        return int(math.log(value / self.lowest) / self.log_base) + 1
+
+    def bucket_value(self, index):
+        """Upper edge of a bucket, i.e. the value reported for percentiles"""
+        return self.lowest * math.exp(index * self.log_base)
+
+    def record(self, value):
+        index = min(self.bucket_index(value), len(self.buckets) - 1)
+        with self.lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+            if value < self.min:
+                self.min = value
+
+    def time(self):
+        """Context manager recording the duration of its block"""
+        return _Timer(self)
+
+    def percentile(self, p):
+        with self.lock:
+            if not self.count:
+                return 0.0
+            target = max(1, math.ceil(self.count * p / 100.0))
+            seen = 0
+            for index, n in enumerate(self.buckets):
+                seen += n
+                if seen >= target:
+                    return min(self.bucket_value(index), self.max)
+        return self.max
+
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def reset(self):
+        with self.lock:
+            self.buckets = [0] * len(self.buckets)
+            self.count = 0
+            self.sum = 0.0
+            self.max = 0.0
+            self.min = math.inf
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter() - self.start)
+        return False
+
+
+class Counter:
+    def __init__(self, name, help='', labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def reset(self):
+        with self.lock:
+            self.value = 0
+
+
+class Gauge:
+    def __init__(self, name, help='', labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def reset(self):
+        pass
+
+
+class MetricsRegistry:
+    """Named metrics, created on first use and shared process-wide"""
+
+    QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            metric = self.metrics.get(key)
+            if metric is None:
+                metric = self.metrics[key] = cls(name, help, labels)
+            return metric
+
+    def histogram(self, name, help='', **labels):
+        return self._get(Histogram, name, help, labels)
+
+    def counter(self, name, help='', **labels):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help='', **labels):
+        return self._get(Gauge, name, help, labels)
+
+    def reset(self):
+        for metric in list(self.metrics.values()):
+            metric.reset()
+
+    def render_prometheus(self):
+        """Prometheus text exposition format; histograms are exported as summaries"""
+        lines = []
+        seen = set()
+        for (name, _), metric in sorted(self.metrics.items(), key=lambda item: item[0]):
+            if name not in seen:
+                seen.add(name)
+                kind = {Histogram: 'summary', Counter: 'counter', Gauge: 'gauge'}[type(metric)]
+                if metric.help:
+                    lines.append(f"# HELP {name} {metric.help}")
+                lines.append(f"# TYPE {name} {kind}")
+
+            if isinstance(metric, Histogram):
+                for q in self.QUANTILES:
+                    labels = format_labels(dict(metric.labels, quantile=str(q)))
+                    lines.append(f"{name}{labels} {metric.percentile(q * 100):.9g}")
+                labels = format_labels(metric.labels)
+                lines.append(f"{name}_sum{labels} {metric.sum:.9g}")
+                lines.append(f"{name}_count{labels} {metric.count}")
+            else:
+                lines.append(f"{name}{format_labels(metric.labels)} {metric.value:.9g}")
+        return "\n".join(lines) + "\n"
+
+    def render_text(self):
+        """Fixed-width summary for the diagnostics panel"""
+        lines = [f"{'histogram':60s} {'count':>8s} {'p50':>9s} {'p90':>9s} {'p99':>9s} {'max':>9s}"]
+        others = []
+        for (name, _), metric in sorted(self.metrics.items(), key=lambda item: item[0]):
+            label = name + format_labels(metric.labels)
+            if isinstance(metric, Histogram):
+                lines.append(f"{label:60s} {metric.count:8d} "
+                             f"{format_seconds(metric.percentile(50)):>9s} "
+                             f"{format_seconds(metric.percentile(90)):>9s} "
+                             f"{format_seconds(metric.percentile(99)):>9s} "
+                             f"{format_seconds(metric.max):>9s}")
+            else:
+                others.append(f"{label:60s} {metric.value:>8g}")
+        if others:
+            lines += ["", f"{'counter / gauge':60s} {'value':>8s}"] + others
+        return "\n".join(lines)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+def format_seconds(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.1f}ms"
+    return f"{seconds * 1e6:.0f}us"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def start_server(port, host='127.0.0.1', registry=REGISTRY):
+    """Serve /metrics (Prometheus) and / (plain text) from a daemon thread"""
+    # http.server pulls in email/html parsing; keep it off the import path
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith('/metrics'):
+                body = registry.render_prometheus().encode()
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            elif self.path in ('/', '/text'):
+                body = registry.render_text().encode()
+                content_type = 'text/plain; charset=utf-8'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        log.warning("Metrics endpoint not started on %s:%s: %s", host, port, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    log.info("Metrics available at http://%s:%s/metrics", host, port)
+    return server
+
+
+class EventLoopLagProbe(QObject):
+    """Measures how late a precise timer fires, i.e. Qt event-loop lag"""
+
+    def __init__(self, interval_ms=100, registry=REGISTRY, parent=None):
+        super().__init__(parent)
+        self.interval = interval_ms / 1000.0
+        self.lag = registry.histogram('qt_event_loop_lag_seconds', 'Lateness of a 100 ms precise timer')
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+        self.expected = None
+        self.interval_ms = interval_ms
+
+    def start(self):
+        self.expected = time.monotonic() + self.interval
+        self.timer.start(self.interval_ms)
+
+    def tick(self):
+        now = time.monotonic()
+        self.lag.record(max(0.0, now - self.expected))
+        self.expected = now + self.interval
+
+
+class DiagnosticsPanel(QWidget):
+    """Live view of the metrics registry, refreshed while visible"""
+
+    def __init__(self, registry=REGISTRY, parent=None):
+        super().__init__(parent)
+        self.registry = registry
+        self.setWindowTitle("Performance Diagnostics")
+        self.resize(820, 480)
+
+        layout = QVBoxLayout()
+
+        title = QLabel("Latency histograms and counters")
+        title.setAlignment(Qt.AlignCenter)
+        title.setStyleSheet("font-size: 16px; font-weight: bold; margin: 10px;")
+        layout.addWidget(title)
+
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setFont(QFont('Courier New', 10))
+        layout.addWidget(self.text)
+
+        button_layout = QHBoxLayout()
+        reset_btn = QPushButton("Reset")
+        reset_btn.clicked.connect(self.reset)
+        button_layout.addWidget(reset_btn)
+        button_layout.addStretch()
+        layout.addLayout(button_layout)
+
+        self.setLayout(layout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    def refresh(self):
+        scroll = self.text.verticalScrollBar().value()
+        self.text.setPlainText(self.registry.render_text())
+        self.text.verticalScrollBar().setValue(scroll)
+
+    def reset(self):
+        self.registry.reset()
+        self.refresh()
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start(1000)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
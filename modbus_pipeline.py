@@ -0,0 +1,235 @@
+import socket
+import struct
+import logging
+import metrics
+
+log = logging.getLogger(__name__)
+
+FUNCTION_CODES = {
+    'read_coils': 0x01,
+    'read_discrete_inputs': 0x02,
+    'read_holding_registers': 0x03,
+    'read_input_registers': 0x04,
+    'write_single_coil': 0x05,
+    'write_single_register': 0x06,
+    'write_multiple_coils': 0x0F,
+    'write_multiple_registers': 0x10,
+}
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class TransactionError(ProtocolError):
+    """The server answered with a transaction ID that was not outstanding"""
+
+
+def encode_pdu(function, address, arg):
+    """PDU for one request; arg is a count for reads, a value or list of values for writes"""
+    code = FUNCTION_CODES[function]
+    if function.startswith('read_'):
+        return struct.pack('>BHH', code, address, arg)
+    if function == 'write_single_coil':
+        return struct.pack('>BHH', code, address, 0xFF00 if arg else 0x0000)
+    if function == 'write_single_register':
+        return struct.pack('>BHH', code, address, arg)
+    if function == 'write_multiple_registers':
+        return struct.pack(f'>BHHB{len(arg)}H', code, address, len(arg), 2 * len(arg), *arg)
+    if function == 'write_multiple_coils':
+        packed = bytearray((len(arg) + 7) // 8)
+        for i, bit in enumerate(arg):
+            if bit:
+                packed[i // 8] |= 1 << (i % 8)
+        return struct.pack('>BHHB', code, address, len(arg), len(packed)) + bytes(packed)
+    raise ValueError(f"unsupported function {function}")
+
+
+def decode_pdu(function, arg, pdu):
+    """Result of one response PDU in pyModbusTCP's conventions (list, True, or None on exception)
+
+    A response too short or too long for its request raises ProtocolError.
+    """
+    code = pdu[0]
+    if code & 0x80:
+        if len(pdu) != 2:
+            raise ProtocolError(f"{function} exception response of {len(pdu)} bytes")
+        log.debug("%s exception code %d", function, pdu[1])
+        return None
+    if code != FUNCTION_CODES[function]:
+        raise ProtocolError(f"response function {code} does not match {function}")
+
+    if function.startswith('read_'):
+        size = 2 * arg if function in ('read_holding_registers', 'read_input_registers') else (arg + 7) // 8
+        if len(pdu) < 2 or pdu[1] != size or len(pdu) != 2 + size:
+            raise ProtocolError(f"{function} of {arg} answered with {len(pdu) - 2} data bytes, expected {size}")
+        if function in ('read_holding_registers', 'read_input_registers'):
+            return list(struct.unpack_from(f'>{arg}H', pdu, 2))
+        return [bool(pdu[2 + i // 8] >> (i % 8) & 1) for i in range(arg)]
+    if len(pdu) != 5:
+        raise ProtocolError(f"{function} response of {len(pdu)} bytes, expected 5")
+    return True
+
+
+class PipelinedModbusClient:
+    """Modbus TCP client that keeps several requests in flight on one connection
+
+    Requests are tagged with MBAP transaction IDs and up to `window` of them
+    are sent before waiting, so a batch of N requests costs about one round
+    trip plus transfer time rather than N round trips. Responses are matched
+    back by transaction ID and returned in request order.
+
+    Servers that can't pipeline (they answer out of step or echo a fixed
+    transaction ID) are detected on the first batch: the client reconnects,
+    drops to one request at a time for the rest of the session and retries
+    what was outstanding. A timeout or a malformed response only fails the
+    call, like any connection error: outstanding requests yield None and the
+    next call reconnects with the window unchanged, so a network stall or a
+    failover doesn't turn pipelining off.
+
+    Single-request methods mirror pyModbusTCP.client.ModbusClient, so this
+    can stand in for it.
+    """
+
+    def __init__(self, host='localhost', port=502, unit_id=1, timeout=2.0, window=8, auto_open=True):
+        self.host = host
+        self.port = port
+        self.unit_id = unit_id
+        self.timeout = timeout
+        self.window = max(1, window)
+        self.auto_open = auto_open
+        self.sock = None
+        self.tx_id = 0
+        self.last_error = None
+        self.fallbacks = metrics.REGISTRY.counter(
+            'modbus_pipeline_fallbacks_total', 'Times the server could not pipeline and the client fell back')
+
+    @property
+    def is_open(self):
+        return self.sock is not None
+
+    def open(self):
+        if self.sock is None:
+            try:
+                self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError as e:
+                self.last_error = e
+                self.sock = None
+                return False
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def next_tx_id(self):
+        self.tx_id = (self.tx_id + 1) & 0xFFFF
+        return self.tx_id
+
+    def recv_exact(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("connection closed by server")
+            data += chunk
+        return bytes(data)
+
+    def send_request(self, pdu):
+        tx_id = self.next_tx_id()
+        self.sock.sendall(struct.pack('>HHHB', tx_id, 0, len(pdu) + 1, self.unit_id) + pdu)
+        return tx_id
+
+    def recv_response(self):
+        tx_id, protocol, length, _ = struct.unpack('>HHHB', self.recv_exact(7))
+        if protocol != 0 or length < 2:
+            raise ProtocolError(f"bad MBAP header (protocol {protocol}, length {length})")
+        return tx_id, self.recv_exact(length - 1)
+
+    def execute(self, requests):
+        """Run (function, address, arg) requests, pipelined, and return their results in order
+
+        A failed request yields None in its slot; a connection failure yields
+        None for everything still outstanding.
+        """
+        results = [None] * len(requests)
+        if not requests:
+            return results
+        if not self.sock and not (self.auto_open and self.open()):
+            return results
+
+        done = set()
+        while True:
+            try:
+                self._run(requests, [i for i in range(len(requests)) if i not in done], results, done)
+                return results
+            except TransactionError as e:
+                self.close()
+                if self.window == 1:
+                    self.last_error = e
+                    return results
+                log.warning("Server at %s:%s can't pipeline requests (%s); falling back to one at a time",
+                            self.host, self.port, e)
+                self.fallbacks.inc()
+                self.window = 1
+                if not self.open():
+                    return results
+            except (ProtocolError, OSError) as e:
+                # the stream can't be trusted past this point; the next call reconnects
+                log.debug("Modbus %s:%s: %s", self.host, self.port, e)
+                self.last_error = e
+                self.close()
+                return results
+
+    def _run(self, requests, pending, results, done):
+        """Keep up to `window` of the pending requests in flight until all are answered"""
+        in_flight = {}
+        queue = list(pending)
+
+        while queue or in_flight:
+            while queue and len(in_flight) < self.window:
+                index = queue.pop(0)
+                function, address, arg = requests[index]
+                in_flight[self.send_request(encode_pdu(function, address, arg))] = index
+
+            tx_id, pdu = self.recv_response()
+            if self.window == 1:
+                # one request in flight: the answer is its own, whatever ID the server echoed
+                tx_id = next(iter(in_flight))
+            index = in_flight.pop(tx_id, None)
+            if index is None:
+                raise TransactionError(f"unexpected transaction id {tx_id}")
+            function, _, arg = requests[index]
+            results[index] = decode_pdu(function, arg, pdu)
+            done.add(index)
+
+    # pyModbusTCP-compatible single requests
+
+    def read_holding_registers(self, address, count=1):
+        return self.execute([('read_holding_registers', address, count)])[0]
+
+    def read_input_registers(self, address, count=1):
+        return self.execute([('read_input_registers', address, count)])[0]
+
+    def read_coils(self, address, count=1):
+        return self.execute([('read_coils', address, count)])[0]
+
+    def read_discrete_inputs(self, address, count=1):
+        return self.execute([('read_discrete_inputs', address, count)])[0]
+
+    def write_single_coil(self, address, state):
+        return bool(self.execute([('write_single_coil', address, state)])[0])
+
+    def write_single_register(self, address, value):
+        return bool(self.execute([('write_single_register', address, value)])[0])
+
+    def write_multiple_coils(self, address, states):
+        return bool(self.execute([('write_multiple_coils', address, list(states))])[0])
+
+    def write_multiple_registers(self, address, values):
+        return bool(self.execute([('write_multiple_registers', address, list(values))])[0])
@@ -0,0 +1,273 @@
+import math
+import time
+from collections import deque
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import Qt, QRect, QPointF
+from PyQt5.QtGui import QPainter, QPixmap, QColor, QFont, QPen, QPolygonF, QStaticText, QTransform
+import metrics
+
+CELL_WIDTH = 150
+CELL_HEIGHT = 64
+HEADER_HEIGHT = 24
+MARGIN = 6
+
+# One sparkline point per SPARK_INTERVAL seconds, however fast the tags are scanned
+SPARK_POINTS = 60
+SPARK_INTERVAL = 1.0
+
+SECTION_TITLES = {
+    'temperatures': 'Temperature', 'pressures': 'Pressure', 'levels': 'Level',
+    'flows': 'Flow', 'leaks': 'Leak', 'valves': 'Valves',
+}
+
+# state -> (value box background, value text)
+STATE_COLOURS = {
+    'normal': ('#000000', '#00e676'),
+    'low': ('#1565c0', '#ffffff'),
+    'high': ('#c62828', '#ffffff'),
+    'stale': ('#424242', '#9e9e9e'),
+    'open': ('#4CAF50', '#ffffff'),
+    'closed': ('#D9534F', '#ffffff'),
+}
+
+PAINT_SECONDS = metrics.REGISTRY.histogram('overview_paint_seconds', 'Time to paint the dirty part of the overview')
+CELLS_REPAINTED = metrics.REGISTRY.counter('overview_cells_repainted_total', 'Overview cells repainted')
+
+
+class Cell:
+    """One tag on the overview: what it shows now and where"""
+
+    def __init__(self, name, font, unit='', decimals=0, low=None, high=None, valve=False):
+        self.name = name
+        self.font = font
+        self.unit = unit
+        self.format = f"%.{decimals}f"
+        self.low = low
+        self.high = high
+        self.valve = valve
+        self.value = None
+        self.state = 'stale'
+        self.set_text('--')
+        self.history = deque(maxlen=SPARK_POINTS)
+        self.polygon = None
+        self.rect = QRect()
+        self.value_rect = QRect()
+        self.spark_rect = QRect()
+
+    def set(self, value, add_point):
+        """Take a new reading; returns whether the cell looks any different"""
+        if self.valve:
+            state = 'open' if value else 'closed'
+            text = 'OPEN' if value else 'CLOSED'
+        else:
+            if self.high is not None and value > self.high:
+                state = 'high'
+            elif self.low is not None and value < self.low:
+                state = 'low'
+            else:
+                state = 'normal'
+            text = self.format % value
+
+        changed = state != self.state or text != self.label
+        if text != self.label:
+            self.set_text(text)
+        self.value = value
+        self.state = state
+        if add_point and not self.valve:
+            self.history.append(value)
+            self.update_polygon()
+            changed = True
+        return changed
+
+    def set_text(self, text):
+        self.label = text
+        # Laid out once here rather than on every paint
+        self.text = QStaticText(text)
+        self.text.prepare(QTransform(), self.font)
+
+    def set_stale(self):
+        changed = self.state != 'stale'
+        self.state = 'stale'
+        return changed
+
+    def update_polygon(self):
+        """Sparkline points in widget coordinates, rebuilt when a point is added or the cell moves"""
+        if len(self.history) < 2 or self.spark_rect.isEmpty():
+            self.polygon = None
+            return
+        low, high = min(self.history), max(self.history)
+        span = (high - low) or 1.0
+        rect = self.spark_rect
+        step = rect.width() / (SPARK_POINTS - 1)
+        x0 = rect.right() - step * (len(self.history) - 1)
+        self.polygon = QPolygonF([
+            QPointF(x0 + step * i, rect.bottom() - (value - low) / span * rect.height())
+            for i, value in enumerate(self.history)
+        ])
+
+
+class OverviewWidget(QWidget):
+    """Every tag of the given scan groups in one custom-painted widget
+
+    Each cell shows a tag's value in a box coloured by its alarm state, its
+    name and unit, and a sparkline of the last minute. Everything that
+    doesn't change with the values (background, section headings, frames,
+    names, units) is drawn once per resize into a cached pixmap; fonts and
+    text layouts are cached too. A scan only schedules a repaint of the
+    cells whose text, state or sparkline changed, and paintEvent redraws
+    just the cells inside the dirty region on top of the cached pixmap, so
+    a 10 Hz scan of a steady plant costs almost no painting.
+
+    Groups are acquisition scan groups: tag groups give one cell per tag,
+    sectioned by each tag's own group, and coil groups one valve cell per
+    coil. Call attach()/detach() to start and stop receiving scans.
+    """
+
+    def __init__(self, acquisition, groups, parent=None):
+        super().__init__(parent)
+        self.acquisition = acquisition
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.background = None
+        self.background_colour = QColor('#1e1e1e')
+        self.frame_pen = QPen(QColor('#3a3a3a'))
+        self.spark_pen = QPen(QColor('#80cbc4'))
+        self.state_colours = {state: (QColor(box), QColor(text)) for state, (box, text) in STATE_COLOURS.items()}
+
+        self.name_font = QFont()
+        self.name_font.setPointSize(8)
+        self.name_font.setBold(True)
+        self.value_font = QFont('Monospace')
+        self.value_font.setStyleHint(QFont.TypeWriter)
+        self.value_font.setPointSize(13)
+        self.value_font.setBold(True)
+        self.header_font = QFont()
+        self.header_font.setPointSize(10)
+        self.header_font.setBold(True)
+
+        self.sections = {}
+        self.callbacks = {}
+        self.last_point = {}
+        for name in groups:
+            cells = self.make_cells(name, acquisition.groups[name])
+            self.callbacks[name] = lambda values, name=name, cells=cells: self.update_cells(name, cells, values)
+            self.last_point[name] = 0.0
+        self.cells = [cell for cells in self.sections.values() for cell in cells]
+        self.headers = []
+        self.layout_cells(CELL_WIDTH * 6 + MARGIN * 7)
+
+    def make_cells(self, name, group):
+        cells = []
+        if group.codec:
+            for tag in group.codec.tags:
+                decimals = max(0, round(-math.log10(tag.scale))) if 0 < tag.scale < 1 else 0
+                cell = Cell(tag.name, self.value_font, tag.unit, decimals, tag.low, tag.high)
+                self.sections.setdefault(tag.group, []).append(cell)
+                cells.append(cell)
+        else:
+            for i in range(group.count):
+                cell = Cell(f"VAL{i + 1:03d}", self.value_font, valve=True)
+                self.sections.setdefault(name, []).append(cell)
+                cells.append(cell)
+        return cells
+
+    def attach(self):
+        for name, callback in self.callbacks.items():
+            self.acquisition.subscribe(name, callback)
+
+    def detach(self):
+        for name, callback in self.callbacks.items():
+            self.acquisition.unsubscribe(name, callback)
+
+    def update_cells(self, name, cells, values):
+        if values is None:
+            dirty = [cell for cell in cells if cell.set_stale()]
+        else:
+            # Scan time rather than the wall clock, so a replayed sparkline spans a recorded minute
+            now = self.acquisition.groups[name].timestamp or time.time()
+            add_point = not 0 <= now - self.last_point[name] < SPARK_INTERVAL
+            if add_point:
+                self.last_point[name] = now
+            values = values.tolist() if hasattr(values, 'tolist') else values
+            dirty = [cell for cell, value in zip(cells, values) if cell.set(value, add_point)]
+        # Qt merges these into one dirty region and one paint
+        for cell in dirty:
+            self.update(cell.rect)
+
+    # Layout and painting
+
+    def layout_cells(self, width):
+        columns = max(1, (width - MARGIN) // (CELL_WIDTH + MARGIN))
+        cell_width = (width - MARGIN * (columns + 1)) // columns
+        self.headers = []
+        y = MARGIN
+        for section, cells in self.sections.items():
+            self.headers.append((QRect(MARGIN, y, width - 2 * MARGIN, HEADER_HEIGHT),
+                                 SECTION_TITLES.get(section, section.capitalize())))
+            y += HEADER_HEIGHT
+            for i, cell in enumerate(cells):
+                row, column = divmod(i, columns)
+                cell.rect = QRect(MARGIN + column * (cell_width + MARGIN), y + row * (CELL_HEIGHT + MARGIN),
+                                  cell_width, CELL_HEIGHT)
+                cell.value_rect = QRect(cell.rect.left() + 4, cell.rect.top() + 18, cell.rect.width() - 8, 24)
+                cell.spark_rect = QRect(cell.rect.left() + 4, cell.rect.top() + 46, cell.rect.width() - 8, 14)
+                cell.update_polygon()
+            y += math.ceil(len(cells) / columns) * (CELL_HEIGHT + MARGIN)
+        self.setMinimumHeight(y)
+        self.background = None
+
+    def render_background(self):
+        ratio = self.devicePixelRatioF()
+        pixmap = QPixmap(self.size() * ratio)
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(self.background_colour)
+        painter = QPainter(pixmap)
+
+        painter.setFont(self.header_font)
+        painter.setPen(QColor('#eceff1'))
+        for rect, title in self.headers:
+            painter.drawText(rect, Qt.AlignLeft | Qt.AlignVCenter, title)
+
+        painter.setFont(self.name_font)
+        for cell in self.cells:
+            painter.fillRect(cell.rect, QColor('#263238'))
+            painter.setPen(self.frame_pen)
+            painter.drawRect(cell.rect.adjusted(0, 0, -1, -1))
+            painter.setPen(QColor('#b0bec5'))
+            text_rect = cell.rect.adjusted(5, 2, -5, 0)
+            text_rect.setHeight(16)
+            painter.drawText(text_rect, Qt.AlignLeft | Qt.AlignVCenter, cell.name)
+            painter.drawText(text_rect, Qt.AlignRight | Qt.AlignVCenter, cell.unit)
+        painter.end()
+        self.background = pixmap
+
+    def resizeEvent(self, event):
+        self.layout_cells(self.width())
+        super().resizeEvent(event)
+
+    def paintEvent(self, event):
+        with PAINT_SECONDS.time():
+            if self.background is None or self.background.size() != self.size() * self.devicePixelRatioF():
+                self.render_background()
+            painter = QPainter(self)
+            # Qt clips to the dirty region, so this only copies the exposed part of the pixmap
+            painter.drawPixmap(0, 0, self.background)
+
+            region = event.region()
+            painter.setFont(self.value_font)
+            repainted = 0
+            for cell in self.cells:
+                if not region.intersects(cell.rect):
+                    continue
+                repainted += 1
+                box, text = self.state_colours[cell.state]
+                painter.fillRect(cell.value_rect, box)
+                painter.setPen(text)
+                size = cell.text.size()
+                painter.drawStaticText(
+                    int(cell.value_rect.right() - 4 - size.width()),
+                    int(cell.value_rect.center().y() - size.height() / 2), cell.text)
+                if cell.polygon is not None:
+                    painter.setPen(self.spark_pen)
+                    painter.drawPolyline(cell.polygon)
+            painter.end()
+            CELLS_REPAINTED.inc(repainted)
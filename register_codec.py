@@ -0,0 +1,103 @@
+import struct
+import numpy as np
+
+WORDS = {'uint16': 1, 'int16': 1, 'bit': 1, 'uint32': 2, 'int32': 2, 'float32': 2}
+WIDE_DTYPES = {'uint32': '>u4', 'int32': '>i4', 'float32': '>f4'}
+PACK_FORMATS = {'uint16': '>H', 'int16': '>h', 'uint32': '>I', 'int32': '>i', 'float32': '>f'}
+
+
+def register_count(tag):
+    return WORDS[tag.dtype]
+
+
+def encode_value(tag, value):
+    """Registers that RegisterCodec.decode reads back as value (to the tag's resolution)
+
+    Raises ValueError for a value the tag's dtype can't hold, and for bit
+    tags, which share their register with other bits.
+    """
+    if tag.dtype == 'bit':
+        raise ValueError(f"{tag.name}: bit tags can't be written on their own")
+    raw = (value - tag.offset) / tag.scale
+    if tag.dtype != 'float32':
+        raw = round(raw)
+    try:
+        data = struct.pack(PACK_FORMATS[tag.dtype], raw)
+    except (struct.error, OverflowError):
+        raise ValueError(f"{tag.name}: {value} {tag.unit} doesn't fit in {tag.dtype}") from None
+    words = list(struct.unpack(f'>{len(data) // 2}H', data))
+    if tag.word_order == 'little':
+        words.reverse()
+    if tag.byte_order == 'little':
+        words = [(word & 0xFF) << 8 | word >> 8 for word in words]
+    return words
+
+
+class RegisterCodec:
+    """Turns a scan's raw uint16 register block into scaled engineering values
+
+    Tags are grouped by dtype and word/byte order when the codec is built, so
+    decode() is one gather and one NumPy view per group plus a single
+    multiply-add for scale and offset, however many tags there are.
+    Registers are treated as big-endian words as they arrive off the wire.
+    """
+
+    def __init__(self, tags):
+        self.tags = list(tags)
+        self.base = min(tag.address for tag in self.tags)
+        self.count = max(tag.address + register_count(tag) for tag in self.tags) - self.base
+        self.scale = np.array([tag.scale for tag in self.tags], dtype=np.float64)
+        self.offset = np.array([tag.offset for tag in self.tags], dtype=np.float64)
+
+        groups = {}
+        for position, tag in enumerate(self.tags):
+            if tag.dtype not in WORDS:
+                raise ValueError(f"{tag.name}: unsupported dtype {tag.dtype!r}")
+            key = (tag.dtype, tag.word_order, tag.byte_order)
+            groups.setdefault(key, ([], [], []))
+            groups[key][0].append(position)
+            groups[key][1].append(tag.address - self.base)
+            groups[key][2].append(tag.bit)
+
+        self.groups = [(key, np.array(positions), np.array(indexes), np.array(bits, dtype=np.uint16))
+                       for key, (positions, indexes, bits) in groups.items()]
+
+    def raw_array(self, regs):
+        """Registers as a native uint16 array; accepts a list or the raw big-endian payload bytes"""
+        if isinstance(regs, (bytes, bytearray, memoryview)):
+            return np.frombuffer(regs, dtype='>u2').astype(np.uint16)
+        return np.asarray(regs, dtype=np.uint16)
+
+    def decode(self, regs):
+        raw = self.raw_array(regs)
+        if len(raw) < self.count:
+            raise ValueError(f"expected {self.count} registers, got {len(raw)}")
+
+        swapped = None
+        values = np.empty(len(self.tags), dtype=np.float64)
+
+        for (dtype, word_order, byte_order), positions, indexes, bits in self.groups:
+            words = raw
+            if byte_order == 'little':
+                if swapped is None:
+                    swapped = raw.byteswap()
+                words = swapped
+
+            if dtype == 'uint16':
+                values[positions] = words[indexes]
+            elif dtype == 'int16':
+                values[positions] = words[indexes].view(np.int16)
+            elif dtype == 'bit':
+                values[positions] = (words[indexes] >> bits) & 1
+            else:
+                pairs = np.empty((len(indexes), 2), dtype='>u2')
+                high, low = (0, 1) if word_order == 'big' else (1, 0)
+                pairs[:, high] = words[indexes]
+                pairs[:, low] = words[indexes + 1]
+                # NaN bit patterns from the PLC are passed through, not warned about
+                with np.errstate(invalid='ignore'):
+                    values[positions] = pairs.view(WIDE_DTYPES[dtype]).ravel()
+
+        values *= self.scale
+        values += self.offset
+        return values
@@ -0,0 +1,178 @@
+import time
+import logging
+from collections import deque
+from datetime import datetime
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QPushButton, QComboBox, QSlider, QLabel
+from PyQt5.QtCore import QObject, QTimer, Qt, pyqtSignal
+
+log = logging.getLogger(__name__)
+
+SPEEDS = (1, 2, 5, 10, 50, 100)
+
+
+def clamp_speed(speed):
+    return max(SPEEDS[0], min(SPEEDS[-1], speed))
+
+
+class ReplaySource(QObject):
+    """Plays recorded scans from a Historian back through an Acquisition
+
+    While running, the acquisition's live reads are suspended and each
+    recorded scan is handed to Acquisition.deliver() when the replay clock
+    reaches its timestamp, so every subscribed window updates exactly as it
+    did live. The clock runs at 1x to 100x and can be paused or moved; a
+    seek first delivers each group's state at the new position so windows
+    don't sit blank until that group's next scan.
+
+    Rows are read sequentially in batches from a cursor positioned at the
+    replay clock, and the buffer is topped up as it drains.
+    """
+
+    position_changed = pyqtSignal(float)
+    finished = pyqtSignal()
+
+    def __init__(self, acquisition, historian, speed=1, batch=500, tick_ms=20, parent=None):
+        super().__init__(parent)
+        self.acquisition = acquisition
+        self.historian = historian
+        self.speed = clamp_speed(speed)
+        self.batch = batch
+        self.rows = iter(())
+        self.buffer = deque()
+        self.exhausted = True
+        self.base_ts = 0.0
+        self.base_mono = time.monotonic()
+        self.playing = False
+
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setInterval(tick_ms)
+        self.timer.timeout.connect(self.tick)
+
+    @property
+    def position(self):
+        if not self.playing:
+            return self.base_ts
+        return self.base_ts + (time.monotonic() - self.base_mono) * self.speed
+
+    def start(self, at=None):
+        """Take over the acquisition and start playing from at (default: the start of history)"""
+        span = self.historian.time_range()
+        if span is None:
+            log.warning("No history in %s to replay", self.historian.path)
+            return False
+        self.acquisition.source = self
+        log.info("Replaying %s from %s at %gx", self.historian.path,
+                 datetime.fromtimestamp(at or span[0]), self.speed)
+        self.seek(at or span[0])
+        self.play()
+        return True
+
+    def stop(self):
+        """Stop replaying and hand the acquisition back to live reads"""
+        self.pause()
+        if self.acquisition.source is self:
+            self.acquisition.source = None
+
+    def play(self):
+        self.base_mono = time.monotonic()
+        self.playing = True
+        self.timer.start()
+
+    def pause(self):
+        self.base_ts = self.position
+        self.playing = False
+        self.timer.stop()
+
+    def set_speed(self, speed):
+        self.base_ts = self.position
+        self.base_mono = time.monotonic()
+        self.speed = clamp_speed(speed)
+
+    def seek(self, timestamp):
+        self.base_ts = timestamp
+        self.base_mono = time.monotonic()
+        for name, (ts, values) in self.historian.state_at(timestamp).items():
+            if name in self.acquisition.groups:
+                self.acquisition.deliver(name, values, ts)
+
+        # Rows at exactly the seek time were just delivered as the state
+        self.rows = self.historian.scans(timestamp + 1e-6, batch=self.batch)
+        self.buffer.clear()
+        self.exhausted = False
+        self.fill()
+        self.position_changed.emit(timestamp)
+
+    def fill(self):
+        while not self.exhausted and len(self.buffer) < self.batch:
+            try:
+                self.buffer.append(next(self.rows))
+            except StopIteration:
+                self.exhausted = True
+
+    def tick(self):
+        now = self.position
+        while self.buffer and self.buffer[0][0] <= now:
+            ts, name, values = self.buffer.popleft()
+            if name in self.acquisition.groups:
+                self.acquisition.deliver(name, values, ts)
+            if len(self.buffer) < self.batch // 2:
+                self.fill()
+
+        self.position_changed.emit(now)
+        if not self.buffer and self.exhausted:
+            self.pause()
+            log.info("Replay reached the end of history")
+            self.finished.emit()
+
+
+class ReplayBar(QWidget):
+    """Play/pause, speed and position controls for a ReplaySource"""
+
+    def __init__(self, source, parent=None):
+        super().__init__(parent)
+        self.source = source
+        self.span = source.historian.time_range() or (0.0, 0.0)
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.play_button = QPushButton("Pause")
+        self.play_button.clicked.connect(self.toggle)
+        layout.addWidget(self.play_button)
+
+        self.speed_box = QComboBox()
+        self.speed_box.addItems([f"{speed}x" for speed in SPEEDS])
+        self.speed_box.setCurrentIndex(SPEEDS.index(source.speed) if source.speed in SPEEDS else 0)
+        self.speed_box.currentIndexChanged.connect(lambda index: source.set_speed(SPEEDS[index]))
+        layout.addWidget(self.speed_box)
+
+        self.slider = QSlider(Qt.Horizontal)
+        self.slider.setRange(0, 1000)
+        self.slider.sliderReleased.connect(self.slider_released)
+        layout.addWidget(self.slider, 1)
+
+        self.time_label = QLabel()
+        layout.addWidget(self.time_label)
+        self.setLayout(layout)
+
+        source.position_changed.connect(self.show_position)
+        source.finished.connect(lambda: self.play_button.setText("Play"))
+
+    def toggle(self):
+        if self.source.playing:
+            self.source.pause()
+            self.play_button.setText("Play")
+        else:
+            self.source.play()
+            self.play_button.setText("Pause")
+
+    def slider_released(self):
+        first, last = self.span
+        self.source.seek(first + (last - first) * self.slider.value() / 1000)
+
+    def show_position(self, timestamp):
+        self.time_label.setText(datetime.fromtimestamp(timestamp).strftime("Replay %Y-%m-%d %H:%M:%S"))
+        first, last = self.span
+        if not self.slider.isSliderDown() and last > first:
+            self.slider.setValue(int(1000 * (timestamp - first) / (last - first)))
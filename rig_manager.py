@@ -0,0 +1,376 @@
+import time
+import queue
+import logging
+import threading
+from datetime import datetime
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QTableWidget, QTableWidgetItem, QHeaderView
+from PyQt5.QtCore import QObject, QTimer, Qt, pyqtSignal
+import serial
+import metrics
+from cycle_stats import CycleStats
+from serial_protocol import FrameDecoder, DeviceClock
+
+log = logging.getLogger('cycle_counter.rigs')
+
+RIG_EVENTS = metrics.REGISTRY.counter('rig_events_total', 'Counts and status changes received from rigs')
+
+
+def now_text():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def session_key():
+    """Session start time, to the millisecond so a quick stop/start can't collide"""
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+class SerialRig(threading.Thread):
+    """Reads one rig's serial port and puts what it hears on the shared event queue
+
+    The port is opened with serial_for_url, so besides COM/tty names it can
+    be a pyserial URL such as socket://host:port or loop:// for testing. If
+    the port can't be opened or drops out the thread keeps retrying with
+    backoff and reports the rig as disconnected meanwhile.
+
+    With protocol='framed' the device is switched to binary frames and
+    each count is reported with its device timestamp, mapped onto the host
+    clock; frames missing from the sequence are reported as 'lost'.
+    """
+
+    def __init__(self, rig_id, port, baudrate, events, protocol='text'):
+        super().__init__(name=f'rig-{rig_id}', daemon=True)
+        self.rig_id = rig_id
+        self.port = port
+        self.baudrate = baudrate
+        self.events = events
+        self.protocol = protocol
+        self.decoder = None
+        self.clock = None
+        self.serial = None
+        self.write_lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def open(self):
+        backoff = 1.0
+        while not self.stopping.is_set():
+            try:
+                self.serial = serial.serial_for_url(self.port, baudrate=self.baudrate, timeout=1)
+                if self.protocol == 'framed':
+                    self.decoder = FrameDecoder()
+                    self.clock = DeviceClock()
+                    self.send(b"framed")
+                self.events.put((self.rig_id, 'connected', None, time.monotonic()))
+                return True
+            except (serial.SerialException, OSError) as e:
+                self.events.put((self.rig_id, 'disconnected', str(e), time.monotonic()))
+                self.stopping.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+        return False
+
+    def run(self):
+        while not self.stopping.is_set():
+            if self.serial is None and not self.open():
+                return
+            try:
+                if self.decoder:
+                    self.read_frames()
+                else:
+                    self.parse(self.serial.readline())
+            except (serial.SerialException, OSError) as e:
+                self.events.put((self.rig_id, 'disconnected', str(e), time.monotonic()))
+                self.close_port()
+        self.close_port()
+
+    def read_frames(self):
+        data = self.serial.read(self.serial.in_waiting or 1)
+        now = time.monotonic()
+        lost = self.decoder.lost
+        for count, at in self.clock.to_host(self.decoder.feed(data), now):
+            self.events.put((self.rig_id, 'count', count, at))
+        if self.decoder.lost != lost:
+            self.events.put((self.rig_id, 'lost', self.decoder.lost - lost, now))
+
+    def parse(self, line):
+        data = line.decode(errors='replace').strip()
+        if not data:
+            return
+        try:
+            self.events.put((self.rig_id, 'count', int(data), time.monotonic()))
+        except ValueError:
+            self.events.put((self.rig_id, 'error', data, time.monotonic()))
+
+    def send(self, command):
+        with self.write_lock:
+            if self.serial is None:
+                return False
+            try:
+                self.serial.write(command)
+                return True
+            except (serial.SerialException, OSError) as e:
+                log.error("Rig %s: failed to send %r: %s", self.rig_id, command, e)
+                return False
+
+    def close_port(self):
+        with self.write_lock:
+            if self.serial is not None:
+                try:
+                    self.serial.close()
+                except (serial.SerialException, OSError):
+                    pass
+                self.serial = None
+
+    def stop(self):
+        self.stopping.set()
+
+
+class Rig:
+    """What the GUI knows about one rig"""
+
+    def __init__(self, rig_id, port, baudrate=9600):
+        self.rig_id = rig_id
+        self.port = port
+        self.baudrate = baudrate
+        self.connected = False
+        self.running = False
+        self.count = 0
+        self.session_start = None
+        self.last_error = None
+        self.errors = 0
+        self.lost_frames = 0
+        self.stats = CycleStats()
+        self.reader = None
+        self.stall_counter = metrics.REGISTRY.counter(
+            'rig_stalls_total', 'Times the rig stopped cycling while counting', rig=rig_id)
+
+
+class RigManager(QObject):
+    """Counts cycles on any number of rigs from one process
+
+    Each rig's port has its own reader thread; all of them feed one event
+    queue of (rig_id, kind, value, monotonic time read), which the GUI
+    thread drains every drain_ms in a single pass.
+    Every rig has its own sessions (rig_sessions, keyed by rig and start
+    time). Database writes go through the DatabaseWriter of cycle_counter.db
+    the manager is given (the Counter tab's, so the file has one writer
+    thread), which collapses a rig's count updates into one UPDATE per
+    flush. The writer belongs to the caller and is left open by close().
+    """
+
+    rig_updated = pyqtSignal(str)
+
+    def __init__(self, writer, drain_ms=100, parent=None):
+        super().__init__(parent)
+        self.rigs = {}
+        self.events = queue.Queue()
+        self.writer = writer
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.drain)
+        self.timer.start(drain_ms)
+        self.last_stall_check = time.monotonic()
+
+    def add_rig(self, rig_id, port, baudrate=9600, protocol='text', connect=True):
+        rig = Rig(rig_id, port, baudrate)
+        self.rigs[rig_id] = rig
+        if connect:
+            rig.reader = SerialRig(rig_id, port, baudrate, self.events, protocol)
+            rig.reader.start()
+        return rig
+
+    def drain(self, limit=10000):
+        """Apply everything the readers have queued since the last drain"""
+        changed = set()
+        for _ in range(limit):
+            try:
+                rig_id, kind, value, timestamp = self.events.get_nowait()
+            except queue.Empty:
+                break
+            rig = self.rigs.get(rig_id)
+            if rig is None:
+                continue
+            RIG_EVENTS.inc()
+            changed.add(rig_id)
+            if kind == 'count':
+                self.count(rig, value, timestamp)
+            elif kind == 'connected':
+                rig.connected = True
+                log.info("Rig %s connected on %s", rig_id, rig.port)
+            elif kind == 'disconnected':
+                if rig.connected or rig.last_error != value:
+                    log.warning("Rig %s on %s unavailable: %s", rig_id, rig.port, value)
+                rig.connected = False
+                rig.last_error = value
+            elif kind == 'error':
+                rig.errors += 1
+                log.warning("Rig %s: invalid data received: %r", rig_id, value)
+            elif kind == 'lost':
+                rig.lost_frames += value
+                log.warning("Rig %s: %d frame(s) lost", rig_id, value)
+
+        if time.monotonic() - self.last_stall_check >= 1.0:
+            self.last_stall_check = time.monotonic()
+            changed.update(self.check_stalls())
+
+        for rig_id in changed:
+            self.rig_updated.emit(rig_id)
+        return len(changed)
+
+    def check_stalls(self):
+        stalled = []
+        for rig in self.rigs.values():
+            if rig.running and rig.stats.check_stall():
+                rig.stall_counter.inc()
+                log.warning("Rig %s: no cycles for %.0f s at cycle %d - stalled?",
+                            rig.rig_id, time.monotonic() - rig.stats.last_time, rig.count)
+                stalled.append(rig.rig_id)
+        return stalled
+
+    def count(self, rig, device_count, timestamp):
+        if not rig.running or device_count == rig.count:
+            return
+        rig.count = device_count
+        rig.stats.add(device_count, timestamp)
+        self.writer.execute(
+            'UPDATE rig_sessions SET current_count = ?, last_updated = ? WHERE rig_id = ? AND session_start = ?',
+            (device_count, now_text(), rig.rig_id, rig.session_start), key=('count', rig.rig_id, rig.session_start))
+
+    def start(self, rig_id):
+        rig = self.rigs[rig_id]
+        if rig.running:
+            return
+        rig.running = True
+        rig.count = 0
+        rig.stats.reset()
+        rig.stats.add(0, time.monotonic())
+        rig.session_start = session_key()
+        if rig.reader:
+            rig.reader.send(b"start")
+        self.writer.execute(
+            'INSERT OR REPLACE INTO rig_sessions (rig_id, session_start, port, current_count, last_updated, is_running) '
+            'VALUES (?, ?, ?, 0, ?, 1)', (rig_id, rig.session_start, rig.port, now_text()))
+        log.info("Rig %s: session started", rig_id)
+        self.rig_updated.emit(rig_id)
+
+    def stop(self, rig_id):
+        """End the rig's session and record its count in cycle_data"""
+        rig = self.rigs[rig_id]
+        if not rig.running:
+            return
+        if rig.reader:
+            rig.reader.send(b"stop")
+        rig.running = False
+        ended = now_text()
+        self.writer.execute(
+            'UPDATE rig_sessions SET current_count = ?, last_updated = ?, is_running = 0, ended_at = ? '
+            'WHERE rig_id = ? AND session_start = ?', (rig.count, ended, ended, rig_id, rig.session_start),
+            key=('count', rig_id, rig.session_start))
+        if rig.count:
+            self.writer.execute(
+                'INSERT INTO cycle_data (timestamp, cycle_count, status, rig_id, session_start) VALUES (?, ?, ?, ?, ?)',
+                (ended, rig.count, 'Completed', rig_id, rig.session_start))
+        log.info("Rig %s: session ended at %d cycles", rig_id, rig.count)
+        self.rig_updated.emit(rig_id)
+
+    def close(self):
+        self.timer.stop()
+        self.drain()
+        for rig_id, rig in self.rigs.items():
+            self.stop(rig_id)
+            if rig.reader:
+                rig.reader.stop()
+        for rig in self.rigs.values():
+            if rig.reader:
+                rig.reader.join(timeout=2)
+
+
+class RigDashboard(QWidget):
+    """One row per rig: connection, session, count, rate and a start/stop button
+
+    Rows are updated individually as their rig reports; rates and stall
+    checks refresh once a second while the dashboard is visible.
+    """
+
+    COLUMNS = ['Rig', 'Port', 'Connection', 'Session Start', 'Count', 'Rate /min', 'Cycle Time', 'Status', '']
+
+    def __init__(self, manager, parent=None):
+        super().__init__(parent)
+        self.manager = manager
+        self.rows = {}
+
+        layout = QVBoxLayout(self)
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.table)
+
+        for rig_id in manager.rigs:
+            self.add_row(rig_id)
+        manager.rig_updated.connect(self.update_row)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    def add_row(self, rig_id):
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        self.rows[rig_id] = row
+        for column in range(len(self.COLUMNS) - 1):
+            self.table.setItem(row, column, QTableWidgetItem())
+        button = QPushButton('Start')
+        button.clicked.connect(lambda checked, rig_id=rig_id: self.toggle(rig_id))
+        self.table.setCellWidget(row, len(self.COLUMNS) - 1, button)
+        self.update_row(rig_id)
+
+    def toggle(self, rig_id):
+        if self.manager.rigs[rig_id].running:
+            self.manager.stop(rig_id)
+        else:
+            self.manager.start(rig_id)
+
+    def update_row(self, rig_id):
+        if rig_id not in self.rows:
+            self.add_row(rig_id)
+            return
+        rig = self.manager.rigs[rig_id]
+        summary = rig.stats.summary(60)
+
+        if rig.stats.stalled:
+            status = 'STALLED'
+        elif rig.running:
+            status = 'Counting'
+        else:
+            status = 'Idle'
+        cycle_time = '-' if summary['p50'] is None else f"{summary['p50']:.2f} s"
+        values = [rig_id, rig.port, 'Connected' if rig.connected else 'Offline',
+                  rig.session_start or '-', str(rig.count), f"{summary['ewma_per_min']:.1f}", cycle_time, status]
+
+        row = self.rows[rig_id]
+        for column, value in enumerate(values):
+            item = self.table.item(row, column)
+            if item.text() != value:
+                item.setText(value)
+        self.table.item(row, 2).setToolTip('' if rig.connected else rig.last_error or '')
+        self.table.item(row, 7).setForeground(Qt.red if rig.stats.stalled else Qt.black)
+        self.table.cellWidget(row, len(self.COLUMNS) - 1).setText('Stop' if rig.running else 'Start')
+
+    def refresh(self):
+        for rig_id in self.rows:
+            self.update_row(rig_id)
+        rigs = self.manager.rigs.values()
+        self.summary_label.setText(
+            f"{sum(rig.running for rig in rigs)} of {len(self.rows)} rigs counting, "
+            f"{sum(rig.count for rig in rigs if rig.running)} cycles in open sessions")
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start(1000)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
@@ -1,28 +1,50 @@
 import sys
+import math
+import logging
 import random
+import argparse
 from datetime import datetime
-from PyQt5.QtWidgets import *
-from PyQt5.QtCore import *
-from PyQt5.QtGui import *
-from Graph import MainWindow as GraphWindow
-from pyModbusTCP.client import ModbusClient
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QDialog, QWidget, QVBoxLayout, QHBoxLayout,
+                             QGridLayout, QGroupBox, QLabel, QLCDNumber, QPushButton, QMessageBox,
+                             QInputDialog, QScrollArea)
+from PyQt5.QtCore import Qt
+import metrics
+from acquisition import Acquisition
+from historian import Historian, HISTORY_DB
+from maintenance import MaintenanceScheduler, ActivityFilter, HistoryMaintenance, group_retention
+from overview_widget import OverviewWidget
+from scan_scheduler import ScanScheduler
+from hmi_log import setup_logging
+from window_manager import WindowRegistry
+from stall_detector import StallDetector
+from tag_snapshot import SnapshotPublisher
+from tag_analytics import TagAnalytics, FLAG_NAMES
+import tag_config
+from tags import TAG_GROUPS, SETPOINT_TAGS, tags_in_group
+
+log = logging.getLogger('sfct')
+
+# Quantum hot-standby pair; simulator.py --standby-port 5021 stands in for both
+PLC_PRIMARY = ('localhost', 5020)
+PLC_SECONDARY = ('localhost', 5021)
 
 
 class TemperatureWindow(QDialog):
-    def __init__(self):
+    def __init__(self, acquisition):
         super().__init__()
         self.setWindowTitle("Temperature Monitoring")
         self.setGeometry(200, 200, 600, 400)
 
-        # Modbus client setup
-        self.client = ModbusClient(host='localhost', port=5020, auto_open=True)
+        # Readings arrive from the shared acquisition while the window is visible
+        self.acquisition = acquisition
 
         self.init_ui()
 
-        # Timer to update readings every 2 seconds
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_temperatures)
-        self.timer.start(2000)  # 2000 ms = 2 seconds
+    def resume(self):
+        self.acquisition.subscribe('temperatures', self.update_temperatures)
+
+    def suspend(self):
+        self.acquisition.unsubscribe('temperatures', self.update_temperatures)
 
     def init_ui(self):
         layout = QVBoxLayout()
@@ -63,27 +85,14 @@ class TemperatureWindow(QDialog):
 
         self.setLayout(layout)
 
-    def update_temperatures(self):
-        try:
-            # Attempt to read 10 registers
-            regs = self.client.read_holding_registers(0, 10)
-            if regs:
-                for i in range(10):
-                    temp_value = regs[i] / 10.0  # Convert to float (e.g., 235 -> 23.5°C)
-                    self.temp_lcds[i].display(temp_value)
-                print(f"Temperatures updated: {[r / 10 for r in regs]}")
-            else:
-                print("Failed to read Modbus registers")
-        except Exception as e:
-            print(f"Error reading Modbus: {e}")
-
-    def closeEvent(self, event):
-        self.timer.stop()
-        try:
-            self.client.close()
-        except:
-            pass
-        event.accept()
+    def update_temperatures(self, values):
+        if values is not None:
+            # Already scaled to °C by the acquisition's register codec
+            for lcd, temp_value in zip(self.temp_lcds, values.tolist()):
+                lcd.display(temp_value)
+            log.debug("Temperatures updated: %s", values)
+        else:
+            log.warning("Failed to read Modbus registers")
 
 
 class PressureWindow(QDialog):
@@ -222,36 +231,39 @@ class FlowWindow(QDialog):
 
 
 class ValvesWindow(QDialog):
-    def __init__(self):
+    def __init__(self, acquisition):
         super().__init__()
         self.setWindowTitle("Valve Control")
         self.setGeometry(200, 200, 500, 400)
 
-        # Initialize Modbus client
-        self.client = ModbusClient(host='localhost', port=5020, auto_open=True)
+        # Coil states arrive from the shared acquisition while the window is visible
+        self.acquisition = acquisition
+        self.client = acquisition.client
 
         # Test connection
         self.test_connection()
 
         self.init_ui()
-        self.refresh_valve_states()
 
-        # Auto-refresh timer
-        self.refresh_timer = QTimer()
-        self.refresh_timer.timeout.connect(self.refresh_valve_states)
-        self.refresh_timer.start(2000)  # Refresh every 2 seconds
+    def resume(self):
+        self.acquisition.subscribe('valves', self.update_valve_states)
+
+    def suspend(self):
+        self.acquisition.unsubscribe('valves', self.update_valve_states)
 
     def test_connection(self):
         """Test the Modbus connection"""
+        if self.acquisition.replaying:
+            return
         try:
             # Try to read a coil to test connection
             result = self.client.read_coils(0, 1)
             if result is not None:
-                print(f"✓ Modbus connection successful! Read coil 0: {result}")
+                log.info("Modbus connection successful! Read coil 0: %s", result)
             else:
-                print("✗ Modbus connection failed - read_coils returned None")
+                log.warning("Modbus connection failed - read_coils returned None")
         except Exception as e:
-            print(f"✗ Modbus connection error: {e}")
+            log.error("Modbus connection error: %s", e)
 
     def init_ui(self):
         layout = QVBoxLayout()
@@ -299,42 +311,41 @@ class ValvesWindow(QDialog):
         self.setLayout(layout)
 
     def refresh_valve_states(self):
-        """Read coils from Modbus and update button colors accordingly"""
-        try:
-            print("Refreshing valve states...")
-            # Read 7 coils starting at address 0
-            coil_states = self.client.read_coils(0, 7)
-
-            if coil_states is not None:
-                print(f"Read coil states: {coil_states}")
-                self.status_label.setText("Status: Connected")
-                self.status_label.setStyleSheet("color: green; margin: 5px;")
-
-                for i, state in enumerate(coil_states):
-                    btn = self.valve_buttons[i]
-                    if state:
-                        btn.setStyleSheet(self.open_style())
-                        btn.setText(f"VAL{i + 1:03d}\n(OPEN)")
-                    else:
-                        btn.setStyleSheet(self.closed_style())
-                        btn.setText(f"VAL{i + 1:03d}\n(CLOSED)")
-            else:
-                print("Failed to read coils from Modbus server - returned None")
-                self.status_label.setText("Status: Read Failed")
-                self.status_label.setStyleSheet("color: red; margin: 5px;")
-
-        except Exception as e:
-            print(f"Error reading coils: {e}")
-            self.status_label.setText(f"Status: Error - {e}")
+        """Poll the valve coils now instead of waiting for the next scan"""
+        log.debug("Refreshing valve states...")
+        self.acquisition.poll('valves')
+
+    def update_valve_states(self, coil_states):
+        """Update button colors from the latest coil states"""
+        if coil_states is not None:
+            log.debug("Read coil states: %s", coil_states)
+            self.status_label.setText("Status: Connected")
+            self.status_label.setStyleSheet("color: green; margin: 5px;")
+
+            for i, state in enumerate(coil_states):
+                btn = self.valve_buttons[i]
+                if state:
+                    btn.setStyleSheet(self.open_style())
+                    btn.setText(f"VAL{i + 1:03d}\n(OPEN)")
+                else:
+                    btn.setStyleSheet(self.closed_style())
+                    btn.setText(f"VAL{i + 1:03d}\n(CLOSED)")
+        else:
+            log.warning("Failed to read coils from Modbus server - returned None")
+            self.status_label.setText("Status: Read Failed")
             self.status_label.setStyleSheet("color: red; margin: 5px;")
 
     def valve_clicked(self, valve_id):
         """Handle valve button clicks"""
-        print(f"Valve {valve_id} clicked")
+        log.info("Valve %d clicked", valve_id)
+
+        if self.acquisition.replaying:
+            QMessageBox.information(self, "Valve Control", "Valve control is disabled while replaying history.")
+            return
 
         # Read current valve coil state
         try:
-            print(f"Reading coil {valve_id - 1} state...")
+            log.debug("Reading coil %d state...", valve_id - 1)
             state = self.client.read_coils(valve_id - 1, 1)
 
             if state is None:
@@ -342,11 +353,11 @@ class ValvesWindow(QDialog):
                 return
 
             current_state = state[0]  # True or False
-            print(f"Current state of valve {valve_id}: {current_state}")
+            log.info("Current state of valve %d: %s", valve_id, current_state)
 
         except Exception as e:
             QMessageBox.warning(self, "Error", f"Modbus read error: {e}")
-            print(f"Error reading valve {valve_id}: {e}")
+            log.error("Error reading valve %d: %s", valve_id, e)
             return
 
         # Ask user confirmation
@@ -363,24 +374,24 @@ class ValvesWindow(QDialog):
         if reply == QMessageBox.Yes:
             # Write the new coil state
             try:
-                print(f"Writing coil {valve_id - 1} = {new_state}")
+                log.info("Writing coil %d = %s", valve_id - 1, new_state)
                 success = self.client.write_single_coil(valve_id - 1, new_state)
 
                 if success:
                     action = "opened" if new_state else "closed"
                     QMessageBox.information(self, 'Valve Status',
                                             f'VAL{valve_id:03d} has been {action}!')
-                    print(f"Successfully {action} valve {valve_id}")
+                    log.info("Successfully %s valve %d", action, valve_id)
 
                     # Refresh button states after change
                     self.refresh_valve_states()
                 else:
                     QMessageBox.warning(self, 'Valve Status', 'Failed to write valve state to Modbus.')
-                    print(f"Failed to write valve {valve_id} state")
+                    log.warning("Failed to write valve %d state", valve_id)
 
             except Exception as e:
                 QMessageBox.warning(self, 'Valve Status', f'Error writing to Modbus: {e}')
-                print(f"Error writing valve {valve_id}: {e}")
+                log.error("Error writing valve %d: %s", valve_id, e)
         else:
             QMessageBox.information(self, 'Valve Status', f'VAL{valve_id:03d} operation cancelled.')
 
@@ -414,24 +425,26 @@ class ValvesWindow(QDialog):
             }
         """
 
-    def closeEvent(self, event):
-        """Clean up when closing"""
-        print("Closing valve window...")
-        self.refresh_timer.stop()
-        try:
-            self.client.close()
-        except:
-            pass
-        event.accept()
-
 
 class LeakWindow(QDialog):
-    def __init__(self):
+    """Leak detector readings and the mass-balance checks, both live from the analytics stage"""
+
+    def __init__(self, acquisition, analytics):
         super().__init__()
         self.setWindowTitle("Leak Detection")
         self.setGeometry(200, 200, 600, 350)
+
+        # Readings arrive from the shared acquisition while the window is visible
+        self.acquisition = acquisition
+        self.analytics = analytics
         self.init_ui()
 
+    def resume(self):
+        self.acquisition.subscribe('leaks', self.update_leaks)
+
+    def suspend(self):
+        self.acquisition.unsubscribe('leaks', self.update_leaks)
+
     def init_ui(self):
         layout = QVBoxLayout()
 
@@ -441,16 +454,19 @@ class LeakWindow(QDialog):
         layout.addWidget(title)
 
         grid_layout = QGridLayout()
+        self.leak_labels = []
+        self.leak_lcds = []
 
-        for i in range(9):
-            label = QLabel(f"LEAK{i + 1:03d}")
+        for i, tag in enumerate(tags_in_group('leaks')):
+            label = QLabel(tag.name)
             label.setStyleSheet("font-weight: bold; margin: 5px;")
 
             lcd = QLCDNumber()
             lcd.setDigitCount(4)
             lcd.setStyleSheet("background-color: black; color: red;")
-            leak_value = round(random.uniform(0.0, 10.0), 2)
-            lcd.display(leak_value)
+
+            self.leak_labels.append(label)
+            self.leak_lcds.append(lcd)
 
             row = i // 3
             col = (i % 3) * 2
@@ -459,25 +475,130 @@ class LeakWindow(QDialog):
 
         layout.addLayout(grid_layout)
 
+        # Flow unaccounted for around each configured part of the loop
+        balance_layout = QGridLayout()
+        self.balance_labels = []
+        for row, check in enumerate(self.analytics.balances):
+            balance_layout.addWidget(QLabel(check.name), row, 0)
+            label = QLabel("waiting for flows and levels")
+            balance_layout.addWidget(label, row, 1)
+            self.balance_labels.append(label)
+        layout.addLayout(balance_layout)
+
         close_btn = QPushButton("Close")
         close_btn.clicked.connect(self.close)
         layout.addWidget(close_btn)
 
         self.setLayout(layout)
 
+    def update_leaks(self, values):
+        if values is None:
+            log.warning("Failed to read leak detectors")
+            return
+        for label, lcd, value in zip(self.leak_labels, self.leak_lcds, values.tolist()):
+            lcd.display(value)
+            *_, flags = self.analytics.state(label.text())
+            kinds = [kind for flag, kind in FLAG_NAMES.items() if flags & flag]
+            label.setToolTip(', '.join(kinds))
+            label.setStyleSheet(f"font-weight: bold; margin: 5px; color: {'#f39c12' if kinds else 'black'};")
+
+        analytics = self.analytics
+        for row, label in enumerate(self.balance_labels):
+            check = analytics.balances[row]
+            if math.isnan(analytics.balance_since[row]):
+                continue
+            label.setText(f"{analytics.imbalance[row]:+.2f} m³/h unaccounted for (tolerance {check.tolerance:.2f})")
+            label.setStyleSheet("color: #e74c3c; font-weight: bold;" if analytics.leaking[row] else "")
+
+
+class OverviewWindow(QDialog):
+    def __init__(self, acquisition, groups):
+        super().__init__()
+        self.setWindowTitle("Plant Overview")
+        self.setGeometry(150, 150, 980, 640)
+
+        # One custom-painted widget for every tag instead of a label and LCD per tag
+        self.overview = OverviewWidget(acquisition, groups)
+
+        layout = QVBoxLayout()
+        scroll = QScrollArea()
+        scroll.setWidgetResizable(True)
+        scroll.setWidget(self.overview)
+        layout.addWidget(scroll)
+
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.close)
+        layout.addWidget(close_btn)
+
+        self.setLayout(layout)
+
+    def resume(self):
+        self.overview.attach()
+
+    def suspend(self):
+        self.overview.detach()
+
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, replay=None, speed=1, start=None):
         super().__init__()
         self.setWindowTitle("Industrial Control System")
         self.setGeometry(100, 100, 1000, 700)
         self.init_ui()
-        self.client = ModbusClient(host='localhost', port=5020, auto_open=True)
+        self.scheduler = ScanScheduler(parent=self)
+        # A replay never talks to the PLCs, so it doesn't keep the standby pair connected either
+        self.acquisition = Acquisition(*PLC_PRIMARY, scheduler=self.scheduler,
+                                       standby=None if replay else PLC_SECONDARY)
+        if self.acquisition.failover:
+            self.acquisition.failover.switched.connect(self.plc_switched)
+        # Channels re-wired on site, from tag_config.db
+        try:
+            self.acquisition.reconfigure(tag_config.load())
+        except ValueError as e:
+            log.error("Saved tag assignments not used: %s", e)
+        self.windows = WindowRegistry(self)
+
+        # Live sessions are recorded; --replay plays a recording back through the same windows instead
+        self.replay = None
+        if replay:
+            from replay import ReplaySource, ReplayBar
+            self.historian = Historian(replay)
+            self.replay = ReplaySource(self.acquisition, self.historian, speed, parent=self)
+            self.statusBar().addPermanentWidget(ReplayBar(self.replay), 1)
+            self.setWindowTitle(f"Industrial Control System - Replay of {replay}")
+            self.replay.start(start)
+        else:
+            self.historian = Historian(HISTORY_DB)
+            self.historian.attach(self.acquisition)
+
+        # Drift, stuck sensors, spikes and mass balance, live or replayed
+        self.analytics = TagAnalytics(parent=self)
+        self.analytics.attach(self.acquisition)
+        self.analytics.anomaly.connect(self.tag_anomaly)
+        self.analytics.balance.connect(self.balance_changed)
+
+        # Other processes on this PC read live values from shared memory instead of polling the PLC too
+        self.snapshot = None
+        if not replay:
+            try:
+                self.snapshot = SnapshotPublisher(self.acquisition)
+            except OSError as e:
+                log.warning("Shared tag snapshot not available: %s", e)
+
+        # Rollups, retention and vacuum of the live history, the heavy parts while nobody is using the HMI
+        self.maintenance = None
+        if not replay:
+            self.maintenance = MaintenanceScheduler()
+            retention = group_retention(self.acquisition, default=730)
+            HistoryMaintenance(self.historian, retention).schedule(self.maintenance)
+            QApplication.instance().installEventFilter(ActivityFilter(self.maintenance, self))
+            self.maintenance.start()
 
-        # Setup timer for updating system time
-        self.time_timer = QTimer()
-        self.time_timer.timeout.connect(self.update_system_time)
-        self.time_timer.start(1000)  # Update every second
+        # Created on first use, with its audit database
+        self.setpoints = None
+
+        # Update system time every second on the drift-free scheduler
+        self.time_job = self.scheduler.add('clock', self.update_system_time, 'fast')
 
     def init_ui(self):
         central_widget = QWidget()
@@ -709,7 +830,8 @@ class MainWindow(QMainWindow):
             ("RIO-5", lambda: self.rio_clicked(5)),
             ("RIO-6", lambda: self.rio_clicked(6)),
             ("RIO-7", lambda: self.rio_clicked(7)),
-            ("Ethernet Connection", self.ethernet_clicked)
+            ("Ethernet Connection", self.ethernet_clicked),
+            ("Performance", self.performance_clicked)
         ]
 
         for btn_text, btn_function in buttons:
@@ -727,6 +849,7 @@ class MainWindow(QMainWindow):
         layout = QVBoxLayout()
 
         buttons = [
+            ("Overview", self.overview_clicked),
             ("Temperature", self.temperature_clicked),
             ("Pressure", self.pressure_clicked),
             ("Level", self.level_clicked),
@@ -808,10 +931,28 @@ class MainWindow(QMainWindow):
 
     # Diagnostics button functions
     def quantum_primary_clicked(self):
-        QMessageBox.information(self, "Diagnostics", "Quantum Primary System Status: Online")
+        QMessageBox.information(self, "Diagnostics", f"Quantum Primary System Status: {self.plc_status('primary')}")
 
     def quantum_secondary_clicked(self):
-        QMessageBox.information(self, "Diagnostics", "Quantum Secondary System Status: Standby")
+        QMessageBox.information(self, "Diagnostics", f"Quantum Secondary System Status: {self.plc_status('secondary')}")
+
+    def plc_status(self, name):
+        if self.acquisition.failover is None:
+            return "Not connected (replaying history)"
+        return self.acquisition.failover.status(name)
+
+    def plc_switched(self, name, reason):
+        self.statusBar().showMessage(f"Switched to Quantum {name.capitalize()} PLC: {reason}", 30000)
+
+    def tag_anomaly(self, tag, kind, active):
+        if active:
+            self.statusBar().showMessage(f"{tag}: {'stuck' if kind == 'stuck' else kind + ' detected'}", 10000)
+
+    def balance_changed(self, name, leaking):
+        if leaking:
+            self.statusBar().showMessage(f"{name}: possible leak, flows don't balance", 30000)
+        else:
+            self.statusBar().showMessage(f"{name}: flows balance again", 10000)
 
     def rio_clicked(self, rio_number):
         status = "Connected" if random.choice([True, False]) else "Disconnected"
@@ -820,77 +961,132 @@ class MainWindow(QMainWindow):
     def ethernet_clicked(self):
         QMessageBox.information(self, "Diagnostics", "Ethernet Connection Status: Active")
 
+    def performance_clicked(self):
+        self.windows.show('performance', metrics.DiagnosticsPanel)
+
     # Process Parameters button functions
+    def overview_clicked(self):
+        # Live, every tag comes from the 10 Hz overview scan; a recording only has the per-area groups
+        groups = TAG_GROUPS + ['valves'] if self.replay else ['overview', 'valves']
+        self.windows.show('overview', lambda: OverviewWindow(self.acquisition, groups))
+
     def temperature_clicked(self):
-        self.temp_window = TemperatureWindow()
-        self.temp_window.show()
+        self.windows.show('temperature', lambda: TemperatureWindow(self.acquisition))
 
     def pressure_clicked(self):
-        self.pressure_window = PressureWindow()
-        self.pressure_window.show()
+        self.windows.show('pressure', PressureWindow)
 
     def level_clicked(self):
-        self.level_window = LevelWindow()
-        self.level_window.show()
+        self.windows.show('level', LevelWindow)
 
     def flow_clicked(self):
-        self.flow_window = FlowWindow()
-        self.flow_window.show()
+        self.windows.show('flow', FlowWindow)
 
     def valves_clicked(self):
-        self.valves_window = ValvesWindow()
-        self.valves_window.show()
+        self.windows.show('valves', lambda: ValvesWindow(self.acquisition))
 
     def leak_clicked(self):
-        self.leak_window = LeakWindow()
-        self.leak_window.show()
+        self.windows.show('leak', lambda: LeakWindow(self.acquisition, self.analytics))
 
     # Process Control button functions
+    def setpoint_controller(self):
+        if self.setpoints is None:
+            from setpoints import SetpointController
+            self.setpoints = SetpointController(self.acquisition, parent=self)
+            self.setpoints.result.connect(self.setpoint_result)
+        return self.setpoints
+
+    def setpoint_result(self, tag, outcome, detail):
+        if outcome == 'verified':
+            self.statusBar().showMessage(f"{tag} set", 10000)
+        elif outcome != 'superseded':
+            self.statusBar().showMessage(f"{tag} {outcome}: {detail}", 30000)
+
     def set_pointer_clicked(self):
-        QMessageBox.information(self, "Process Control", "Set Pointer function activated")
+        from setpoints import SetpointWindow
+        self.windows.show('setpoints', lambda: SetpointWindow(self.setpoint_controller(), title="Set Points"))
 
     def tc_assignment_clicked(self):
-        QMessageBox.information(self, "Process Control", "TC Assignment window would open here")
+        self.windows.show('tc_assignment', lambda: tag_config.TcAssignmentWindow(self.acquisition))
 
     def value_control_clicked(self):
-        QMessageBox.information(self, "Process Control", "Value Control panel activated")
+        from setpoints import SetpointWindow
+        valves = [tag for tag in SETPOINT_TAGS if tag.name.startswith('VC')]
+        self.windows.show('value_control', lambda: SetpointWindow(self.setpoint_controller(), valves, "Value Control"))
 
     def enter_tc_clicked(self):
-        text, ok = QInputDialog.getText(self, 'Enter TC', 'Enter TC Value:')
-        if ok and text:
-            QMessageBox.information(self, "Process Control", f"TC Value entered: {text}")
+        """One heater zone's temperature setpoint"""
+        zones = [tag for tag in SETPOINT_TAGS if tag.name.startswith('TSP')]
+        name, ok = QInputDialog.getItem(self, 'Enter TC', 'Heater zone:', [tag.name for tag in zones], 0, False)
+        if not ok:
+            return
+        tag = next(tag for tag in zones if tag.name == name)
+        snapshot = self.acquisition.snapshot('setpoints')
+        current = snapshot[SETPOINT_TAGS.index(tag)] if snapshot is not None else tag.low
+        value, ok = QInputDialog.getDouble(self, 'Enter TC', f"{name} setpoint ({tag.unit}):", current,
+                                           tag.low, tag.high, 1)
+        if not ok:
+            return
+        try:
+            self.setpoint_controller().submit({name: value}, source='Enter TC')
+        except ValueError as e:
+            QMessageBox.warning(self, "Process Control", str(e))
 
     # Alarms, Trends, Reports button functions
     def alarms_clicked(self):
         QMessageBox.information(self, "Alarms", "Alarms panel would open here")
 
     def trends_clicked(self):
-        self.trends_window = GraphWindow()
-        self.trends_window.show()
+        from trend_widget import TrendWindow
+        groups = TAG_GROUPS if self.replay else ['overview']
+        self.windows.show('trends', lambda: TrendWindow(self.acquisition, groups))
 
     def reports_clicked(self):
         QMessageBox.information(self, "Reports", "Reports generation window would open here")
 
     def closeEvent(self, event):
         """Clean up when closing the main window"""
-        self.time_timer.stop()
-        try:
-            self.client.close()
-        except:
-            pass
+        self.scheduler.pause(self.time_job)
+        self.windows.close_all()
+        if self.replay:
+            self.replay.stop()
+        if self.snapshot:
+            self.snapshot.close()
+        if self.setpoints:
+            self.setpoints.close()
+        self.acquisition.close()
+        if self.maintenance:
+            self.maintenance.stop()
+        self.historian.close()
         event.accept()
 
 
 def main():
-    app = QApplication(sys.argv)
+    from replay import SPEEDS
+    parser = argparse.ArgumentParser(description="SFCT HMI")
+    parser.add_argument("--replay", metavar="HISTORY_DB", help="play back a recorded historian file instead of the PLC")
+    parser.add_argument("--speed", type=int, default=1, choices=SPEEDS, help="replay speed (default: 1x)")
+    parser.add_argument("--start", help="replay start time, YYYY-MM-DD HH:MM:SS (default: start of the recording)")
+    args, qt_args = parser.parse_known_args()
+    start = datetime.strptime(args.start, "%Y-%m-%d %H:%M:%S").timestamp() if args.start else None
+
+    setup_logging('sfct')
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setStyle('Fusion')  # Modern look
 
     # Set application icon and properties
     app.setApplicationName("Sodium Facility for Component Testing (SFCT)")
     app.setApplicationVersion("1.0")
 
-    window = MainWindow()
+    lag_probe = metrics.EventLoopLagProbe()
+    lag_probe.start()
+    stall_detector = StallDetector(threshold=0.5)
+    stall_detector.start()
+
+    window = MainWindow(args.replay, args.speed, start)
     window.show()
+    # Secondary services start once the main window is up
+    metrics.start_server(9108)
 
     sys.exit(app.exec_())
 
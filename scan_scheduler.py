@@ -0,0 +1,147 @@
+import math
+import time
+import logging
+from PyQt5.QtCore import QObject, QTimer, Qt
+import metrics
+
+log = logging.getLogger(__name__)
+
+
+class PollClass:
+    """Nominal scan interval and the range adaptive jobs may move within (ms)"""
+
+    def __init__(self, name, interval_ms, min_ms, max_ms):
+        self.name = name
+        self.interval_ms = interval_ms
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+
+
+POLL_CLASSES = {
+    'realtime': PollClass('realtime', 100, 100, 500),
+    'fast': PollClass('fast', 1000, 250, 1000),
+    'normal': PollClass('normal', 2000, 500, 5000),
+    'slow': PollClass('slow', 10000, 5000, 30000),
+}
+
+
+class ScanJob:
+    def __init__(self, name, callback, poll_class, adaptive):
+        self.name = name
+        self.callback = callback
+        self.poll_class = poll_class
+        self.adaptive = adaptive
+        self.interval = poll_class.interval_ms / 1000.0
+        self.next_deadline = None
+        self.paused = True
+
+        self.duration = metrics.REGISTRY.histogram(
+            'scan_duration_seconds', 'Time spent in one scan callback', job=name)
+        self.jitter = metrics.REGISTRY.histogram(
+            'scan_jitter_seconds', 'How late a scan started relative to its deadline', job=name)
+        self.overruns = metrics.REGISTRY.counter(
+            'scan_overruns_total', 'Scans that ran past their next deadline', job=name)
+        self.skipped = metrics.REGISTRY.counter(
+            'scan_skipped_total', 'Deadlines skipped to catch up after an overrun', job=name)
+        self.interval_gauge = metrics.REGISTRY.gauge(
+            'scan_interval_seconds', 'Current scan interval', job=name)
+        self.interval_gauge.set(self.interval)
+
+
+class ScanScheduler(QObject):
+    """Fixed-rate scan scheduling on the monotonic clock
+
+    Each job's next deadline is its previous deadline plus its interval, not
+    "now plus interval", so periods don't drift with callback time. A job
+    that overruns skips the deadlines it missed instead of firing a burst to
+    catch up. Adaptive jobs return True from their callback when values
+    changed and False when they were steady; the interval halves on change
+    and backs off by half again when steady, within the poll class range.
+
+    All jobs share one precise single-shot timer armed for the earliest
+    deadline, and run on the thread that owns the scheduler.
+    """
+
+    def __init__(self, poll_classes=None, parent=None):
+        super().__init__(parent)
+        self.poll_classes = poll_classes or POLL_CLASSES
+        self.jobs = {}
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.run_due)
+
+    def add(self, name, callback, poll_class='normal', adaptive=False, start=True):
+        job = ScanJob(name, callback, self.poll_classes[poll_class], adaptive)
+        self.jobs[name] = job
+        if start:
+            self.resume(job)
+        return job
+
+    def remove(self, job):
+        self.jobs.pop(job.name, None)
+        job.paused = True
+        self.arm()
+
+    def pause(self, job):
+        job.paused = True
+        self.arm()
+
+    def resume(self, job, run_now=True):
+        """Restart a job; its first scan is due immediately unless run_now is False"""
+        if not job.paused:
+            return
+        job.paused = False
+        now = time.monotonic()
+        job.next_deadline = now if run_now else now + job.interval
+        self.arm()
+
+    def arm(self):
+        deadlines = [job.next_deadline for job in self.jobs.values() if not job.paused]
+        if not deadlines:
+            self.timer.stop()
+            return
+        delay = max(0.0, min(deadlines) - time.monotonic())
+        self.timer.start(int(math.ceil(delay * 1000)))
+
+    def run_due(self):
+        now = time.monotonic()
+        due = sorted((job for job in self.jobs.values() if not job.paused and job.next_deadline <= now + 0.001),
+                     key=lambda job: job.next_deadline)
+
+        for job in due:
+            if job.paused:
+                continue
+            deadline = job.next_deadline
+            job.jitter.record(max(0.0, time.monotonic() - deadline))
+
+            with job.duration.time():
+                try:
+                    changed = job.callback()
+                except Exception:
+                    log.exception("Scan job %s failed", job.name)
+                    changed = None
+
+            if job.adaptive and changed is not None:
+                self.adapt(job, changed)
+
+            next_deadline = deadline + job.interval
+            end = time.monotonic()
+            if next_deadline <= end:
+                missed = int((end - next_deadline) // job.interval) + 1
+                job.overruns.inc()
+                job.skipped.inc(missed)
+                next_deadline += missed * job.interval
+            job.next_deadline = next_deadline
+
+        self.arm()
+
+    def adapt(self, job, changed):
+        poll_class = job.poll_class
+        if changed:
+            interval = max(poll_class.min_ms / 1000.0, job.interval / 2)
+        else:
+            interval = min(poll_class.max_ms / 1000.0, job.interval * 1.5)
+        if interval != job.interval:
+            job.interval = interval
+            job.interval_gauge.set(interval)
@@ -0,0 +1,139 @@
+"""Framed binary protocol between the cycle counter and its Arduino
+
+Frame, little-endian (firmware/cycle_counter/cycle_counter.ino sends these):
+
+    A5 5A       sync
+    len   u8    payload bytes
+    seq   u16   frame number, wraps at 65536
+    type  u8    FRAME_SAMPLES
+    payload     len / 8 samples of (count u32, device millis u32)
+    crc   u16   CRC-16/CCITT-FALSE of len..payload
+
+One frame carries every count that happened since the last one, each with
+the device's own timestamp, so counts are not limited to one line per
+round trip and the host times cycles to the millisecond regardless of when
+it reads the port. Sequence gaps show lost frames and the CRC rejects
+corrupted ones.
+"""
+import struct
+import binascii
+import metrics
+
+SYNC = b'\xa5\x5a'
+HEADER = struct.Struct('<2sBHB')
+SAMPLE = struct.Struct('<II')
+CRC = struct.Struct('<H')
+FRAME_SAMPLES = 0x01
+MAX_PAYLOAD = 255 - 255 % SAMPLE.size
+
+FRAMES = metrics.REGISTRY.counter('serial_frames_total', 'Framed-protocol frames decoded')
+FRAME_ERRORS = metrics.REGISTRY.counter('serial_frame_errors_total', 'Frames rejected for a bad CRC or header')
+FRAMES_LOST = metrics.REGISTRY.counter('serial_frames_lost_total', 'Frames missing from the sequence')
+
+
+def crc16(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def encode_frame(seq, samples):
+    """Frame for (count, device_ms) samples; used by tests and the bench, the firmware does the same"""
+    payload = b''.join(SAMPLE.pack(count, ms & 0xFFFFFFFF) for count, ms in samples)
+    body = HEADER.pack(SYNC, len(payload), seq & 0xFFFF, FRAME_SAMPLES)[2:] + payload
+    return SYNC + body + CRC.pack(crc16(body))
+
+
+class FrameDecoder:
+    """Splits a byte stream into frames and unwraps their samples
+
+    feed() takes whatever bytes the port had and returns the samples of
+    every complete, valid frame in them as (count, device seconds). Partial
+    frames wait in the buffer for the next feed; garbage and frames with a
+    bad CRC are skipped by resynchronising on the next sync pattern. Device
+    millis are unwrapped across the 49-day rollover.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.expected_seq = None
+        self.last_ms = None
+        self.ms_base = 0
+        self.lost = 0
+        self.errors = 0
+
+    def feed(self, data):
+        self.buffer += data
+        samples = []
+        buffer = self.buffer
+        start = 0
+        while True:
+            start = buffer.find(SYNC, start)
+            if start < 0:
+                # Keep a trailing A5 that may be the first half of the next sync
+                start = len(buffer) - 1 if buffer.endswith(SYNC[:1]) else len(buffer)
+                break
+            if len(buffer) - start < HEADER.size:
+                break
+            _, length, seq, kind = HEADER.unpack_from(buffer, start)
+            end = start + HEADER.size + length + CRC.size
+            if kind != FRAME_SAMPLES or length % SAMPLE.size or length > MAX_PAYLOAD:
+                self.reject()
+                start += 1
+                continue
+            if len(buffer) < end:
+                break
+            body = bytes(buffer[start + 2:end - CRC.size])
+            if CRC.unpack_from(buffer, end - CRC.size)[0] != crc16(body):
+                self.reject()
+                start += 1
+                continue
+
+            self.check_sequence(seq)
+            samples.extend(self.unwrap(SAMPLE.iter_unpack(body[HEADER.size - 2:])))
+            FRAMES.inc()
+            start = end
+
+        del buffer[:start]
+        return samples
+
+    def reject(self):
+        self.errors += 1
+        FRAME_ERRORS.inc()
+
+    def check_sequence(self, seq):
+        if self.expected_seq is not None and seq != self.expected_seq:
+            missing = (seq - self.expected_seq) & 0xFFFF
+            self.lost += missing
+            FRAMES_LOST.inc(missing)
+        self.expected_seq = (seq + 1) & 0xFFFF
+
+    def unwrap(self, samples):
+        unwrapped = []
+        for count, ms in samples:
+            if self.last_ms is not None and ms < self.last_ms and self.last_ms - ms > 0x80000000:
+                self.ms_base += 0x100000000
+            self.last_ms = ms
+            unwrapped.append((count, (self.ms_base + ms) / 1000.0))
+        return unwrapped
+
+
+class DeviceClock:
+    """Maps device seconds onto time.monotonic(), keeping the device's spacing between samples
+
+    The offset is fixed at the first sample and only moved when a sample
+    would land in the host's future (the device clock runs fast) or more
+    than max_lag behind the read (the device restarted, or ran slow for
+    hours).
+    """
+
+    def __init__(self, max_lag=5.0):
+        self.offset = None
+        self.max_lag = max_lag
+
+    def to_host(self, samples, now):
+        """(count, device seconds) samples read at `now` -> (count, host monotonic seconds)"""
+        if not samples:
+            return []
+        newest = samples[-1][1]
+        if self.offset is None or not now - self.max_lag <= newest + self.offset <= now:
+            self.offset = now - newest
+        return [(count, seconds + self.offset) for count, seconds in samples]
@@ -0,0 +1,435 @@
+"""Operator setpoints: validated, merged into few writes, verified by the next scan, audited
+
+submit() checks every entry against its tag's low/high range and dtype
+before anything is sent. A batch with a bad entry is rejected whole, so
+half a recipe is never applied. Accepted values are queued, and whatever is
+queued by the time control returns to the event loop is written as one
+batch:
+
+    encode      each value into its registers (register_codec.encode_value)
+    plan        runs of adjacent registers into write_multiple_registers requests of up to
+                123 registers; unlike plan_reads, a gap always splits, since writing across it
+                would overwrite whatever lies between
+    write       every request of the batch in one Acquisition.execute call, which pipelines
+                them, so a recipe of a few dozen values costs a round trip or two
+
+Nothing is read back specially. While writes are unverified the controller
+subscribes to the 'setpoints' scan group, and the scans that follow a write
+compare the registers read with those written. A write is 'verified' when
+they match, 'mismatch' when they still differ after verify_scans scans (the
+PLC clamped or overrode it), and 'failed' when the PLC refused the request.
+
+Every entry, including rejected ones, is a row of setpoint_audit in
+AUDIT_DB: who entered what from where, the value it replaced, the outcome,
+the readback and how long the PLC took to show it.
+"""
+import math
+import time
+import getpass
+import logging
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTableWidget,
+                             QTableWidgetItem, QHeaderView, QMessageBox, QFileDialog)
+from PyQt5.QtCore import QObject, QTimer, Qt, pyqtSignal
+import metrics
+from db_writer import DatabaseWriter
+from register_codec import encode_value
+
+log = logging.getLogger(__name__)
+
+AUDIT_DB = 'setpoint_audit.db'
+
+# Modbus limit for one write_multiple_registers request
+MAX_WRITE_REGISTERS = 123
+
+OUTCOMES = ('verified', 'mismatch', 'failed', 'superseded', 'rejected')
+
+AUDIT_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS setpoint_audit (
+        batch INTEGER NOT NULL,
+        tag TEXT NOT NULL,
+        requested_at TEXT NOT NULL,
+        user TEXT NOT NULL,
+        source TEXT NOT NULL,
+        previous REAL,
+        value REAL,
+        status TEXT NOT NULL,
+        readback REAL,
+        latency_ms REAL,
+        detail TEXT,
+        PRIMARY KEY (batch, tag)
+    )''',
+    'CREATE INDEX IF NOT EXISTS setpoint_audit_tag ON setpoint_audit (tag, batch)',
+]
+
+
+def now_text():
+    return time.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def limits(tag):
+    """The range an operator may enter, as text"""
+    low = '' if tag.low is None else f"{tag.low:g}"
+    high = '' if tag.high is None else f"{tag.high:g}"
+    return f"{low} .. {high} {tag.unit}".strip()
+
+
+def plan_writes(writes, max_registers=MAX_WRITE_REGISTERS):
+    """[(address, registers, items)] requests for writes [(address, registers, item)]
+
+    Writes to adjacent registers share a request, up to max_registers; a
+    gap always starts a new one.
+    """
+    requests = []
+    for address, registers, item in sorted(writes, key=lambda write: write[0]):
+        if requests:
+            start, merged, items = requests[-1]
+            if address == start + len(merged) and len(merged) + len(registers) <= max_registers:
+                merged.extend(registers)
+                items.append(item)
+                continue
+        requests.append((address, list(registers), [item]))
+    return requests
+
+
+def read_recipe(path):
+    """{tag: value text} from a recipe file of 'tag,value' lines; blank lines and # comments are skipped"""
+    values = {}
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            fields = [field.strip() for field in line.split(',')]
+            if len(fields) != 2 or not fields[0]:
+                raise ValueError(f"{path} line {number}: expected 'tag,value', got {line!r}")
+            values[fields[0]] = fields[1]
+    return values
+
+
+class SetpointWrite:
+    """One tag's new value on its way to the PLC"""
+
+    def __init__(self, tag, value, registers, previous, batch, source):
+        self.tag = tag
+        self.value = value
+        self.registers = registers
+        self.previous = previous
+        self.batch = batch
+        self.source = source
+        self.requested = time.time()
+        self.sent = None
+        self.scans = 0
+
+
+class SetpointController(QObject):
+    """Writes operator setpoints through the shared acquisition
+
+        controller.submit({'TSP001': 420, 'VC003': 35.5}, source='recipe')
+
+    result(tag, outcome, detail) is emitted once per submitted entry when
+    its outcome is known: verified, mismatch, failed, superseded (a later
+    write to the same tag was submitted before this one was sent, or sent
+    before it was verified) or rejected.
+    """
+
+    result = pyqtSignal(str, str, str)
+
+    def __init__(self, acquisition, group='setpoints', audit_path=AUDIT_DB, verify_scans=3,
+                 max_registers=MAX_WRITE_REGISTERS, parent=None):
+        super().__init__(parent)
+        self.acquisition = acquisition
+        self.group = acquisition.groups[group]
+        self.tags = {tag.name: tag for tag in self.group.codec.tags}
+        self.positions = {tag.name: i for i, tag in enumerate(self.group.codec.tags)}
+        self.verify_scans = verify_scans
+        self.max_registers = max_registers
+        self.user = getpass.getuser()
+        self.queued = {}
+        self.pending = {}
+        self.last_batch = 0
+
+        # Everything submitted before control returns to the event loop goes out together
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(0)
+        self.flush_timer.timeout.connect(self.flush)
+
+        self.audit = DatabaseWriter(audit_path, AUDIT_SCHEMA, name='setpoint-audit').start(wait=False)
+
+        self.write_seconds = metrics.REGISTRY.histogram(
+            'setpoint_write_seconds', 'Time to send one batch of setpoint writes')
+        self.verify_seconds = metrics.REGISTRY.histogram(
+            'setpoint_verify_seconds', 'From a setpoint being submitted to a scan reading it back')
+        self.requests = metrics.REGISTRY.counter(
+            'setpoint_requests_total', 'write_multiple_registers requests sent for setpoints')
+        self.outcomes = {outcome: metrics.REGISTRY.counter('setpoints_total', 'Setpoint entries by outcome',
+                                                           outcome=outcome)
+                         for outcome in OUTCOMES}
+
+    def check(self, values):
+        """({tag: (value, registers)}, [(tag, problem)]) for entries {tag: value or text}"""
+        checked, problems = {}, []
+        for name, entry in values.items():
+            tag = self.tags.get(name)
+            if tag is None:
+                problems.append((name, f"{name}: not a setpoint"))
+                continue
+            try:
+                value = float(entry)
+            except (TypeError, ValueError):
+                problems.append((name, f"{name}: {entry!r} is not a number"))
+                continue
+            if not math.isfinite(value):
+                problems.append((name, f"{name}: {entry!r} is not a number"))
+            elif (tag.low is not None and value < tag.low) or (tag.high is not None and value > tag.high):
+                problems.append((name, f"{name}: {value:g} is outside {limits(tag)}"))
+            else:
+                try:
+                    checked[name] = (value, encode_value(tag, value))
+                except ValueError as e:
+                    problems.append((name, str(e)))
+        return checked, problems
+
+    def submit(self, values, source='operator'):
+        """Queue {tag: value} to be written together
+
+        Raises ValueError, and queues none of them, if any entry can't be
+        written.
+        """
+        if self.acquisition.replaying:
+            raise ValueError("Setpoints can't be changed while replaying history")
+        checked, problems = self.check(values)
+        if problems:
+            batch = self.next_batch()
+            for name, problem in problems:
+                self.unsent(batch, name, source, None, str(values[name]), 'rejected', problem)
+            # The valid entries of the batch weren't sent either
+            for name, (value, _) in checked.items():
+                self.unsent(batch, name, source, None, value, 'rejected', "not sent: the batch had a bad entry")
+            log.warning("Rejected setpoints from %s: %s", source, '; '.join(problem for _, problem in problems))
+            raise ValueError('\n'.join(problem for _, problem in problems))
+
+        snapshot = self.acquisition.snapshot(self.group.name)
+        batch = None
+        for name, (value, registers) in checked.items():
+            previous = float(snapshot[self.positions[name]]) if snapshot is not None else None
+            earlier = self.queued.get(name)
+            if earlier is not None:
+                batch = batch or self.next_batch()
+                value_was, _, previous_was, source_was = earlier
+                self.unsent(batch, name, source_was, previous_was, value_was, 'superseded',
+                            f"replaced by {value:g} from {source} before it was sent")
+            self.queued[name] = (value, registers, previous, source)
+        self.flush_timer.start()
+
+    def unsent(self, batch, name, source, previous, value, outcome, detail):
+        """Audit an entry that never reached the PLC"""
+        self.audit.execute('INSERT INTO setpoint_audit (batch, tag, requested_at, user, source, previous, value, '
+                           'status, detail) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                           (batch, name, now_text(), self.user, source, previous, value, outcome, detail))
+        self.outcomes[outcome].inc()
+        self.result.emit(name, outcome, detail)
+
+    def next_batch(self):
+        """Batch number: the submit time in ms, kept unique"""
+        self.last_batch = max(self.last_batch + 1, int(time.time() * 1000))
+        return self.last_batch
+
+    def flush(self):
+        """Write everything queued now; returns the batch number, None if nothing was queued"""
+        self.flush_timer.stop()
+        if not self.queued:
+            return None
+        queued, self.queued = self.queued, {}
+        batch = self.next_batch()
+        requested_at = now_text()
+        writes = []
+        for name, (value, registers, previous, source) in queued.items():
+            write = SetpointWrite(self.tags[name], value, registers, previous, batch, source)
+            writes.append((write.tag.address, registers, write))
+            self.audit.execute('INSERT INTO setpoint_audit (batch, tag, requested_at, user, source, previous, value, '
+                               'status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (batch, name, requested_at, self.user, source, previous, value, 'sent'))
+
+        requests = plan_writes(writes, self.max_registers)
+        start = time.perf_counter()
+        try:
+            results = self.acquisition.execute([('write_multiple_registers', address, registers)
+                                                for address, registers, _ in requests])
+        except Exception as e:
+            log.error("Error writing setpoints: %s", e)
+            results = [None] * len(requests)
+        elapsed = time.perf_counter() - start
+        self.write_seconds.record(elapsed)
+        self.requests.inc(len(requests))
+        log.info("Wrote %d setpoints in %d requests (%.1f ms)", len(writes), len(requests), elapsed * 1000)
+
+        sent = time.time()
+        for (_, _, items), ok in zip(requests, results):
+            for write in items:
+                if not ok:
+                    self.finish(write, 'failed', "the PLC refused the write")
+                    continue
+                write.sent = sent
+                earlier = self.pending.pop(write.tag.name, None)
+                if earlier is not None:
+                    self.finish(earlier, 'superseded', f"replaced by batch {batch}")
+                self.pending[write.tag.name] = write
+        if self.pending:
+            self.acquisition.subscribe(self.group.name, self.scanned)
+        return batch
+
+    def scanned(self, values):
+        """Check the unverified writes against a scan of the setpoints group"""
+        group = self.group
+        if values is None or group.raw is None:
+            return
+        for name, write in list(self.pending.items()):
+            # The last snapshot, handed over on subscribing, predates the write
+            if group.timestamp is None or group.timestamp < write.sent:
+                continue
+            offset = write.tag.address - group.address
+            readback = float(values[self.positions[name]])
+            if list(group.raw[offset:offset + len(write.registers)]) == write.registers:
+                del self.pending[name]
+                latency = group.timestamp - write.requested
+                self.verify_seconds.record(latency)
+                self.finish(write, 'verified', '', readback, latency)
+            else:
+                write.scans += 1
+                if write.scans >= self.verify_scans:
+                    del self.pending[name]
+                    self.finish(write, 'mismatch', f"the PLC shows {readback:g} {write.tag.unit}", readback)
+        if not self.pending:
+            self.acquisition.unsubscribe(group.name, self.scanned)
+
+    def finish(self, write, outcome, detail='', readback=None, latency=None):
+        self.audit.execute('UPDATE setpoint_audit SET status = ?, readback = ?, latency_ms = ?, detail = ? '
+                           'WHERE batch = ? AND tag = ?',
+                           (outcome, readback, None if latency is None else round(latency * 1000, 1), detail,
+                            write.batch, write.tag.name))
+        self.outcomes[outcome].inc()
+        if outcome in ('mismatch', 'failed'):
+            log.warning("%s = %g %s from %s %s: %s", write.tag.name, write.value, write.tag.unit, write.source,
+                        outcome, detail)
+        self.result.emit(write.tag.name, outcome, detail)
+
+    def close(self):
+        self.flush()
+        self.acquisition.unsubscribe(self.group.name, self.scanned)
+        self.pending.clear()
+        self.audit.close()
+
+
+class SetpointWindow(QDialog):
+    """Current and new values of some setpoints, applied together as one batch"""
+
+    COLUMNS = ['Setpoint', 'Range', 'Current', 'New value', 'Status']
+
+    def __init__(self, controller, tags=None, title="Setpoints"):
+        super().__init__()
+        self.setWindowTitle(title)
+        self.setGeometry(200, 200, 640, 520)
+        self.controller = controller
+        self.acquisition = controller.acquisition
+        self.tags = list(tags or controller.tags.values())
+        self.rows = {tag.name: row for row, tag in enumerate(self.tags)}
+        controller.result.connect(self.show_result)
+        self.init_ui()
+
+    def resume(self):
+        self.acquisition.subscribe(self.controller.group.name, self.update_current)
+
+    def suspend(self):
+        self.acquisition.unsubscribe(self.controller.group.name, self.update_current)
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+
+        title = QLabel(self.windowTitle())
+        title.setAlignment(Qt.AlignCenter)
+        title.setStyleSheet("font-size: 16px; font-weight: bold; margin: 10px;")
+        layout.addWidget(title)
+
+        self.table = QTableWidget(len(self.tags), len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        for row, tag in enumerate(self.tags):
+            for column, text in enumerate([tag.name, limits(tag), '', '', '']):
+                item = QTableWidgetItem(text)
+                if column != 3:
+                    item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+                self.table.setItem(row, column, item)
+        layout.addWidget(self.table)
+
+        button_layout = QHBoxLayout()
+        recipe_btn = QPushButton("Load Recipe...")
+        recipe_btn.clicked.connect(self.load_recipe)
+        button_layout.addWidget(recipe_btn)
+
+        apply_btn = QPushButton("Apply")
+        apply_btn.clicked.connect(self.apply)
+        button_layout.addWidget(apply_btn)
+
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.close)
+        button_layout.addWidget(close_btn)
+
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+    def update_current(self, values):
+        if values is None:
+            return
+        positions = self.controller.positions
+        for row, tag in enumerate(self.tags):
+            self.table.item(row, 2).setText(f"{values[positions[tag.name]]:g}")
+
+    def entries(self):
+        """{tag: text} of the rows with a new value"""
+        entries = {}
+        for row, tag in enumerate(self.tags):
+            text = self.table.item(row, 3).text().strip()
+            if text:
+                entries[tag.name] = text
+        return entries
+
+    def apply(self):
+        entries = self.entries()
+        if not entries:
+            QMessageBox.information(self, self.windowTitle(), "Enter a new value for at least one setpoint.")
+            return
+        try:
+            self.controller.submit(entries, source=self.windowTitle())
+        except ValueError as e:
+            QMessageBox.warning(self, self.windowTitle(), f"Nothing was written:\n\n{e}")
+            return
+        for name in entries:
+            self.table.item(self.rows[name], 4).setText("writing")
+
+    def show_result(self, name, outcome, detail):
+        row = self.rows.get(name)
+        if row is None:
+            return
+        self.table.item(row, 4).setText(f"{outcome}: {detail}" if detail else outcome)
+        self.table.item(row, 4).setForeground(Qt.darkGreen if outcome == 'verified' else Qt.red)
+        if outcome == 'verified':
+            self.table.item(row, 3).setText('')
+
+    def load_recipe(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load Recipe", "", "Recipes (*.csv *.txt);;All files (*)")
+        if not path:
+            return
+        try:
+            recipe = read_recipe(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Load Recipe", str(e))
+            return
+        unknown = [name for name in recipe if name not in self.rows]
+        if unknown:
+            QMessageBox.warning(self, "Load Recipe", f"Not in this window: {', '.join(unknown)}")
+            return
+        for name, text in recipe.items():
+            self.table.item(self.rows[name], 3).setText(text)
+            self.table.item(self.rows[name], 4).setText("from recipe")
@@ -0,0 +1,72 @@
+import sys
+import time
+import random
+import argparse
+import threading
+from pyModbusTCP.server import ModbusServer
+
+
+# Raw register ranges the process values drift within: pressures (0.01 bar), levels (0.1 %),
+# flows (0.01 m³/h) and leak detectors (0.01 mV), at holding registers 10-48
+PROCESS_RANGES = [(100, 1000)] * 10 + [(0, 1000)] * 10 + [(0, 5000)] * 10 + [(0, 1000)] * 9
+
+
+def simulate(server, period=1.0):
+    """Drift temperature and process registers and toggle a valve now and then"""
+    temps = [random.randint(200, 300) for _ in range(10)]
+    process = [random.randint(low, high) for low, high in PROCESS_RANGES]
+    server.data_bank.set_coils(0, [False] * 7)
+    # Setpoints (holding registers 100-120) start at 250.0 °C, 0 m³/h and 0 %; after that only the HMI writes them
+    server.data_bank.set_holding_registers(100, [2500] * 10 + [0] * 11)
+
+    while True:
+        temps = [max(0, t + random.randint(-3, 3)) for t in temps]
+        server.data_bank.set_holding_registers(0, temps)
+        process = [min(high, max(low, value + random.randint(-(high - low) // 50, (high - low) // 50)))
+                   for value, (low, high) in zip(process, PROCESS_RANGES)]
+        server.data_bank.set_holding_registers(10, process)
+
+        if random.random() < 0.1:
+            valve = random.randrange(7)
+            state = server.data_bank.get_coils(valve, 1)[0]
+            server.data_bank.set_coils(valve, [not state])
+
+        time.sleep(period)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Modbus TCP simulator for the SFCT HMI")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--period", type=float, default=1.0, help="seconds between value changes")
+    parser.add_argument("--standby-port", type=int,
+                        help="also serve the same registers here, as the secondary of a redundant PLC pair")
+    args = parser.parse_args()
+
+    server = ModbusServer(host=args.host, port=args.port, no_block=True)
+    server.start()
+    print(f"Simulator listening on {args.host}:{args.port}")
+
+    standby = None
+    if args.standby_port:
+        standby = ModbusServer(host=args.host, port=args.standby_port, no_block=True, data_bank=server.data_bank)
+        standby.start()
+        print(f"Standby listening on {args.host}:{args.standby_port}")
+    sys.stdout.flush()
+
+    updater = threading.Thread(target=simulate, args=(server, args.period), daemon=True)
+    updater.start()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        if standby:
+            standby.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import sys
+import time
+import logging
+import threading
+import traceback
+from collections import Counter
+from PyQt5.QtCore import QObject, QTimer, Qt
+import metrics
+
+log = logging.getLogger(__name__)
+
+
+class StallDetector(QObject):
+    """Watchdog for the Qt main loop
+
+    A precise heartbeat timer on the GUI thread stamps time.monotonic(); a
+    background thread checks the stamp and, once it is older than threshold
+    seconds, samples the GUI thread's Python stack via sys._current_frames()
+    until the heartbeat resumes. The report names the call site that was on
+    the stack most often, i.e. the code that blocked the event loop.
+    """
+
+    def __init__(self, threshold=0.5, heartbeat_ms=50, sample_interval=0.05, max_frames=12, parent=None):
+        super().__init__(parent)
+        self.threshold = threshold
+        self.sample_interval = sample_interval
+        self.max_frames = max_frames
+        self.main_ident = threading.get_ident()
+        self.last_beat = time.monotonic()
+
+        self.stall_duration = metrics.REGISTRY.histogram('gui_stall_seconds', 'Duration of detected GUI thread stalls')
+        self.stall_count = metrics.REGISTRY.counter('gui_stalls_total', 'GUI thread stalls above the threshold')
+
+        self.heartbeat = QTimer(self)
+        self.heartbeat.setTimerType(Qt.PreciseTimer)
+        self.heartbeat.timeout.connect(self.beat)
+        self.heartbeat_ms = heartbeat_ms
+
+        self.running = False
+        self.thread = None
+
+    def beat(self):
+        self.last_beat = time.monotonic()
+
+    def start(self):
+        self.last_beat = time.monotonic()
+        self.heartbeat.start(self.heartbeat_ms)
+        self.running = True
+        self.thread = threading.Thread(target=self.watch, name='stall-detector', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.heartbeat.stop()
+
+    def sample_stack(self):
+        frame = sys._current_frames().get(self.main_ident)
+        if frame is None:
+            return None
+        return tuple((f.filename, f.lineno, f.name) for f in traceback.extract_stack(frame)[-self.max_frames:])
+
+    def watch(self):
+        stall_start = None
+        samples = Counter()
+        first = None
+
+        while self.running:
+            time.sleep(self.sample_interval)
+            last_beat = self.last_beat
+            now = time.monotonic()
+
+            if now - last_beat > self.threshold:
+                if stall_start is None:
+                    stall_start = last_beat
+                    samples.clear()
+                    first = None
+                stack = self.sample_stack()
+                if stack:
+                    samples[stack] += 1
+                    if first is None:
+                        first = stack
+                        log.warning("GUI thread stalled for %.2fs, blocked in:\n%s",
+                                    now - stall_start, format_stack(stack))
+
+            elif stall_start is not None:
+                self.report(last_beat - stall_start, samples, first)
+                stall_start = None
+
+    def report(self, duration, samples, first):
+        self.stall_duration.record(duration)
+        self.stall_count.inc()
+
+        total = sum(samples.values())
+        if not total:
+            log.warning("GUI thread stall of %.2fs ended (no stack captured)", duration)
+            return
+
+        stack, hits = samples.most_common(1)[0]
+        filename, lineno, name = stack[-1]
+        log.warning("GUI thread stall of %.2fs ended; %d/%d samples in %s (%s:%d)",
+                    duration, hits, total, name, filename, lineno)
+        if stack != first:
+            log.warning("Most sampled stack:\n%s", format_stack(stack))
+
+
+def format_stack(stack):
+    return "\n".join(f'  File "{filename}", line {lineno}, in {name}' for filename, lineno, name in stack)
@@ -0,0 +1,213 @@
+"""Running statistics and anomaly flags for every tag, updated scan by scan
+
+Each tag keeps, in arrays indexed by its slot:
+
+    mean, var   exponentially weighted mean and variance over slow_seconds, the tag's baseline
+    fast        exponentially weighted mean over fast_seconds, what the tag is doing now
+    noise       exponentially weighted variance (over slow_seconds) of samples about fast, the
+                sensor's own scatter, which a slow drift doesn't inflate the way it does var
+    changed_at  when the value last changed at all
+
+Weights come from the time since the tag's previous sample
+(alpha = 1 - exp(-dt / tau)), so irregular scans and the overview's extra
+reads don't skew them. Until a tag has enough samples for that weight,
+alpha is 1 / samples instead, so the first samples give a plain running
+mean and variance rather than one that starts from zero. A scan updates its group's slots with a few NumPy
+expressions, whatever the history length, and nothing is rescanned.
+
+Flags, recomputed on every scan of the tag:
+
+    STUCK   the value hasn't changed for STUCK_SECONDS of its group
+    SPIKE   this sample is more than spike_sigma noise deviations from fast
+    DRIFT   fast has moved more than drift_sigma noise deviations from the baseline mean
+
+The noise deviation is never taken as less than two register counts (2 x
+the tag's scale), so a quiet, quantised signal doesn't alarm on one count.
+SPIKE and DRIFT wait for `warmup` samples.
+
+MASS_BALANCES are checked after every scan from the latest flows and
+levels. The imbalance is flow in - flow out - rise in inventory (m³/h),
+averaged over the balance's window.
+"""
+import logging
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+import metrics
+from tags import TAGS, STUCK_SECONDS, MASS_BALANCES
+
+log = logging.getLogger(__name__)
+
+STUCK = 1
+SPIKE = 2
+DRIFT = 4
+FLAG_NAMES = {STUCK: 'stuck', SPIKE: 'spike', DRIFT: 'drift'}
+
+
+class TagAnalytics(QObject):
+    """Statistics, flags and mass balances over TAGS, fed by Acquisition.observe
+
+    anomaly(tag, kind, active) is emitted when a flag is raised or
+    cleared, and balance(name, leaking) when a mass balance goes out of or
+    back into tolerance.
+    """
+
+    anomaly = pyqtSignal(str, str, bool)
+    balance = pyqtSignal(str, bool)
+
+    def __init__(self, tags=TAGS, balances=MASS_BALANCES, fast_seconds=60.0, slow_seconds=3600.0,
+                 spike_sigma=6.0, drift_sigma=4.0, warmup=30, parent=None):
+        super().__init__(parent)
+        self.tags = list(tags)
+        self.index = {tag.name: i for i, tag in enumerate(self.tags)}
+        self.fast_seconds = fast_seconds
+        self.slow_seconds = slow_seconds
+        self.spike_sigma = spike_sigma
+        self.drift_sigma = drift_sigma
+        self.warmup = warmup
+        self.floor = np.array([2 * tag.scale for tag in self.tags])
+        self.stuck_seconds = np.array([STUCK_SECONDS.get(tag.group, np.inf) for tag in self.tags], dtype=float)
+        self.group_slots = {}
+
+        count = len(self.tags)
+        self.value = np.full(count, np.nan)
+        self.time = np.full(count, np.nan)
+        self.mean = np.zeros(count)
+        self.var = np.zeros(count)
+        self.fast = np.zeros(count)
+        self.noise = np.zeros(count)
+        self.samples = np.zeros(count, dtype=np.int64)
+        self.changed_at = np.full(count, np.nan)
+        self.flags = np.zeros(count, dtype=np.uint8)
+
+        self.balances = list(balances)
+        self.inflow = np.zeros((len(self.balances), count))
+        self.inventory = np.zeros((len(self.balances), count))
+        for row, check in enumerate(self.balances):
+            for name in check.inflows:
+                self.inflow[row, self.index[name]] += 1.0
+            for name in check.outflows:
+                self.inflow[row, self.index[name]] -= 1.0
+            for name, volume in check.levels:
+                self.inventory[row, self.index[name]] = volume
+        self.involved = (self.inflow != 0) | (self.inventory != 0)
+        self.balance_window = np.array([check.window for check in self.balances], dtype=float)
+        self.balance_tolerance = np.array([check.tolerance for check in self.balances], dtype=float)
+        self.imbalance = np.zeros(len(self.balances))
+        self.balance_since = np.full(len(self.balances), np.nan)
+        self.balance_time = np.full(len(self.balances), np.nan)
+        self.balance_inventory = np.zeros(len(self.balances))
+        self.leaking = np.zeros(len(self.balances), dtype=bool)
+
+        self.update_seconds = metrics.REGISTRY.histogram('analytics_update_seconds', 'Analytics time per scan')
+        self.raised = {kind: metrics.REGISTRY.counter('tag_anomalies_total', 'Anomaly flags raised', kind=kind)
+                       for kind in FLAG_NAMES.values()}
+
+    def attach(self, acquisition):
+        """Analyse every scan of acquisition's tag groups (those made of our tags) from now on"""
+        for name, group in acquisition.groups.items():
+            if group.codec and all(tag.name in self.index for tag in group.codec.tags):
+                self.group_slots[name] = np.array([self.index[tag.name] for tag in group.codec.tags])
+        acquisition.observe(self.observe)
+
+    def detach(self, acquisition):
+        acquisition.unobserve(self.observe)
+
+    def observe(self, group, values, timestamp):
+        slots = self.group_slots.get(group)
+        if slots is None or values is None or timestamp is None:
+            return
+        with self.update_seconds.time():
+            self.update(slots, values, timestamp)
+
+    def update(self, slots, values, timestamp):
+        """Take one scan of the tags at slots; emits anomaly and balance for what changed"""
+        values = np.asarray(values, dtype=float)
+        elapsed = timestamp - self.time[slots]
+        # First sample, or replay has seeked backwards: start the tag afresh
+        fresh = ~(elapsed >= 0)
+        elapsed = np.where(fresh, 0.0, elapsed)
+
+        deviation = np.maximum(np.sqrt(self.noise[slots]), self.floor[slots])
+        ready = ~fresh & (self.samples[slots] >= self.warmup)
+        residual = values - self.fast[slots]
+        spike = ready & (np.abs(residual) > self.spike_sigma * deviation)
+
+        running = 1.0 / (self.samples[slots] + 1)
+        slow = np.maximum(1.0 - np.exp(-elapsed / self.slow_seconds), running)
+        difference = values - self.mean[slots]
+        increment = slow * difference
+        mean = np.where(fresh, values, self.mean[slots] + increment)
+        var = np.where(fresh, 0.0, (1.0 - slow) * (self.var[slots] + difference * increment))
+        fast_alpha = np.maximum(1.0 - np.exp(-elapsed / self.fast_seconds), running)
+        fast = np.where(fresh, values, self.fast[slots] + fast_alpha * residual)
+        noise = np.where(fresh, 0.0, self.noise[slots] + slow * (residual * residual - self.noise[slots]))
+        moved = fresh | (values != self.value[slots])
+        changed_at = np.where(moved, timestamp, self.changed_at[slots])
+        samples = np.where(fresh, 1, self.samples[slots] + 1)
+
+        self.mean[slots], self.var[slots], self.fast[slots], self.noise[slots] = mean, var, fast, noise
+        self.value[slots], self.time[slots], self.changed_at[slots], self.samples[slots] = (
+            values, timestamp, changed_at, samples)
+
+        drift = ready & (np.abs(fast - mean) > self.drift_sigma * deviation)
+        stuck = timestamp - changed_at > self.stuck_seconds[slots]
+        flags = (stuck * STUCK | spike * SPIKE | drift * DRIFT).astype(np.uint8)
+        previous = self.flags[slots]
+        self.flags[slots] = flags
+        if (flags != previous).any():
+            self.report(slots, previous, flags)
+
+        if len(self.balances):
+            self.update_balances(timestamp)
+
+    def report(self, slots, previous, flags):
+        for position in np.flatnonzero(flags != previous).tolist():
+            tag = self.tags[slots[position]]
+            slot = slots[position]
+            for flag, kind in FLAG_NAMES.items():
+                was, now = previous[position] & flag, flags[position] & flag
+                if now and not was:
+                    self.raised[kind].inc()
+                    if flag == STUCK:
+                        log.warning("%s stuck at %g %s for %.0f s", tag.name, self.value[slot], tag.unit,
+                                    self.time[slot] - self.changed_at[slot])
+                    else:
+                        log.warning("%s %s: %g %s against a baseline of %g (noise ± %g)", tag.name,
+                                    'spike' if flag == SPIKE else 'drifting', self.value[slot] if flag == SPIKE
+                                    else self.fast[slot], tag.unit, self.mean[slot], np.sqrt(self.noise[slot]))
+                    self.anomaly.emit(tag.name, kind, True)
+                elif was and not now:
+                    self.anomaly.emit(tag.name, kind, False)
+
+    def update_balances(self, timestamp):
+        have = ~(self.involved & np.isnan(self.value)).any(axis=1)
+        values = np.nan_to_num(self.value)
+        inventory = self.inventory @ values
+        elapsed = timestamp - self.balance_time
+        started = have & (elapsed > 0)
+        if started.any():
+            # m³/h in - out - rise of the stored volume
+            rise = (inventory - self.balance_inventory) / np.where(started, elapsed, 1.0) * 3600.0
+            instant = self.inflow @ values - rise
+            alpha = 1.0 - np.exp(-np.where(started, elapsed, 0.0) / self.balance_window)
+            self.imbalance = np.where(started, self.imbalance + alpha * (instant - self.imbalance), self.imbalance)
+        fresh = have & ~(elapsed >= 0)
+        self.imbalance[fresh] = 0.0
+        self.balance_since[fresh] = timestamp
+        self.balance_time = np.where(have, timestamp, self.balance_time)
+        self.balance_inventory = np.where(have, inventory, self.balance_inventory)
+
+        settled = timestamp - self.balance_since >= self.balance_window
+        leaking = settled & (self.imbalance > self.balance_tolerance)
+        for row in np.flatnonzero(leaking != self.leaking).tolist():
+            check = self.balances[row]
+            if leaking[row]:
+                log.warning("%s: %.2f m³/h unaccounted for over %.0f s (tolerance %.2f)", check.name,
+                            self.imbalance[row], check.window, check.tolerance)
+            self.balance.emit(check.name, bool(leaking[row]))
+        self.leaking = leaking
+
+    def state(self, name):
+        """(value, mean, standard deviation, fast mean, flags) of one tag"""
+        i = self.index[name]
+        return self.value[i], self.mean[i], np.sqrt(self.var[i]), self.fast[i], int(self.flags[i])
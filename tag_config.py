@@ -0,0 +1,209 @@
+"""Site tag assignments: which register each tag reads, kept in a table and applied while scanning
+
+tags.py holds the tag table as designed. Re-wiring on site (a
+thermocouple moved to another input channel, a calibration offset) goes
+into tag_assignments in CONFIG_DB instead, one row per tag that differs
+from tags.py:
+
+    name        tag name
+    address     holding register it is read from
+    offset      engineering value = raw * scale + offset
+    changed_at  when, and changed_by who, last changed it
+
+load() gives TAGS with those rows applied, and the HMI hands that to
+Acquisition.reconfigure() at startup. The TC Assignment window edits the
+thermocouples, applies the change to the running acquisition (between two
+scans, on the same connection) and saves it, so re-wiring needs neither a
+code change nor a restart.
+"""
+import time
+import getpass
+import logging
+import sqlite3
+from decimal import Decimal
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTableWidget,
+                             QTableWidgetItem, QHeaderView, QSpinBox, QDoubleSpinBox, QMessageBox)
+from PyQt5.QtCore import Qt
+from tags import TAGS
+
+log = logging.getLogger(__name__)
+
+CONFIG_DB = 'tag_config.db'
+
+CONFIG_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS tag_assignments (
+        name TEXT PRIMARY KEY,
+        address INTEGER NOT NULL,
+        offset REAL NOT NULL,
+        changed_at TEXT NOT NULL,
+        changed_by TEXT NOT NULL
+    )''',
+]
+
+DEFAULTS = {tag.name: tag for tag in TAGS}
+
+
+def load(path=CONFIG_DB):
+    """TAGS with the saved assignments applied; just TAGS if nothing has been saved"""
+    try:
+        db = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        rows = db.execute('SELECT name, address, offset FROM tag_assignments').fetchall()
+        db.close()
+    except sqlite3.Error:
+        return list(TAGS)
+    saved = {}
+    for name, address, offset in rows:
+        if name in DEFAULTS:
+            saved[name] = DEFAULTS[name]._replace(address=address, offset=offset)
+        else:
+            log.warning("%s: ignoring the saved assignment of a tag that no longer exists", name)
+    if saved:
+        log.info("Loaded site assignments for %s", ', '.join(saved))
+    return [saved.get(tag.name, tag) for tag in TAGS]
+
+
+def offset_decimals(tag):
+    """Decimal places that show tag's offset as it is: its register scaling's, or more if its offsets have them"""
+    return max(0, *(-Decimal(repr(value)).normalize().as_tuple().exponent
+                    for value in (tag.scale, tag.offset, DEFAULTS[tag.name].offset)))
+
+
+def save(tags, path=CONFIG_DB):
+    """Store the assignments of tags, dropping the rows of tags back at their tags.py defaults"""
+    db = sqlite3.connect(path, timeout=5.0)
+    try:
+        for statement in CONFIG_SCHEMA:
+            db.execute(statement)
+        changed_at, changed_by = time.strftime('%Y-%m-%d %H:%M:%S'), getpass.getuser()
+        for tag in tags:
+            default = DEFAULTS[tag.name]
+            if (tag.address, tag.offset) == (default.address, default.offset):
+                db.execute('DELETE FROM tag_assignments WHERE name = ?', (tag.name,))
+            else:
+                db.execute('INSERT INTO tag_assignments (name, address, offset, changed_at, changed_by) '
+                           'VALUES (?, ?, ?, ?, ?) ON CONFLICT (name) DO UPDATE SET address = excluded.address, '
+                           'offset = excluded.offset, changed_at = excluded.changed_at, '
+                           'changed_by = excluded.changed_by '
+                           'WHERE (address, offset) != (excluded.address, excluded.offset)',
+                           (tag.name, tag.address, tag.offset, changed_at, changed_by))
+        db.commit()
+    finally:
+        db.close()
+
+
+class TcAssignmentWindow(QDialog):
+    """Input channel (holding register) and calibration offset of each thermocouple"""
+
+    COLUMNS = ['TC', 'Register', 'Offset', 'Reading']
+
+    def __init__(self, acquisition, group='temperatures', path=CONFIG_DB):
+        super().__init__()
+        self.setWindowTitle("TC Assignment")
+        self.setGeometry(200, 200, 560, 480)
+        self.acquisition = acquisition
+        self.group = group
+        self.path = path
+        self.init_ui()
+        self.show_tags(acquisition.groups[group].codec.tags)
+
+    def resume(self):
+        self.acquisition.subscribe(self.group, self.update_readings)
+
+    def suspend(self):
+        self.acquisition.unsubscribe(self.group, self.update_readings)
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+
+        title = QLabel("Thermocouple Assignment")
+        title.setAlignment(Qt.AlignCenter)
+        title.setStyleSheet("font-size: 16px; font-weight: bold; margin: 10px;")
+        layout.addWidget(title)
+
+        tags = self.acquisition.groups[self.group].codec.tags
+        self.table = QTableWidget(len(tags), len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.registers = []
+        self.offsets = []
+        for row, tag in enumerate(tags):
+            for column in (0, 3):
+                item = QTableWidgetItem(tag.name if column == 0 else '')
+                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+                self.table.setItem(row, column, item)
+            register = QSpinBox()
+            register.setRange(0, 0xFFFF)
+            self.table.setCellWidget(row, 1, register)
+            self.registers.append(register)
+            # Wide and fine enough for the tags.py offset, so Apply never changes one nobody edited
+            offset = QDoubleSpinBox()
+            offset.setDecimals(offset_decimals(tag))
+            limit = max([100.0] + [abs(t.offset) for t in (tag, DEFAULTS[tag.name])])
+            offset.setRange(-limit, limit)
+            offset.setSingleStep(tag.scale if 0 < tag.scale < 1 else 1.0)
+            offset.setSuffix(f" {tag.unit}")
+            self.table.setCellWidget(row, 2, offset)
+            self.offsets.append(offset)
+        layout.addWidget(self.table)
+
+        button_layout = QHBoxLayout()
+        defaults_btn = QPushButton("Defaults")
+        defaults_btn.clicked.connect(lambda: self.show_tags(
+            [DEFAULTS[tag.name] for tag in self.acquisition.groups[self.group].codec.tags]))
+        button_layout.addWidget(defaults_btn)
+
+        revert_btn = QPushButton("Revert")
+        revert_btn.clicked.connect(lambda: self.show_tags(self.acquisition.groups[self.group].codec.tags))
+        button_layout.addWidget(revert_btn)
+
+        apply_btn = QPushButton("Apply")
+        apply_btn.clicked.connect(self.apply)
+        button_layout.addWidget(apply_btn)
+
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.close)
+        button_layout.addWidget(close_btn)
+
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+    def show_tags(self, tags):
+        for register, offset, tag in zip(self.registers, self.offsets, tags):
+            register.setValue(tag.address)
+            offset.setValue(tag.offset)
+
+    def edited_tags(self):
+        return [tag._replace(address=register.value(), offset=round(offset.value(), offset.decimals()))
+                for register, offset, tag in zip(self.registers, self.offsets,
+                                                 self.acquisition.groups[self.group].codec.tags)]
+
+    def apply(self):
+        if self.acquisition.replaying:
+            QMessageBox.information(self, "TC Assignment", "TC assignment is disabled while replaying history.")
+            return
+        tags = self.edited_tags()
+        previous = self.acquisition.groups[self.group].codec.tags
+        try:
+            changed = self.acquisition.reconfigure(tags)
+        except ValueError as e:
+            QMessageBox.warning(self, "TC Assignment", f"Nothing was changed:\n\n{e}")
+            return
+        if not changed:
+            return
+        try:
+            save(tags, self.path)
+        except sqlite3.Error as e:
+            log.error("TC assignment applied but not saved to %s: %s", self.path, e)
+            QMessageBox.warning(self, "TC Assignment",
+                                f"The new assignment is in use but could not be saved, and will be lost on restart:\n\n{e}")
+            return
+        log.info("TC assignment changed by %s: %s", getpass.getuser(), ', '.join(
+            f"{tag.name} on register {tag.address}, offset {tag.offset:+g}"
+            for tag, before in zip(tags, previous) if tag != before))
+
+    def update_readings(self, values):
+        if values is None:
+            return
+        for row, value in enumerate(values.tolist()):
+            self.table.item(row, 3).setText(f"{value:.1f}")
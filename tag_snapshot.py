@@ -0,0 +1,319 @@
+"""The latest value of every tag in shared memory, for other processes on this machine
+
+The acquisition process publishes each scan into one fixed-layout
+multiprocessing.shared_memory segment. Local readers (a logger, a report
+job, a second HMI) attach with SnapshotClient and copy the current values
+out in microseconds, without a Modbus connection of their own and
+without any serialisation. The layout, all little-endian, is
+
+    header      magic b'IGTS', version u16, state u16 (1 live, 0 closed),
+                tags u32, name width u32, sequence u64, published f64,
+                publisher pid u32, padded to 64 bytes
+    names       tags x name width bytes, NUL-padded ASCII
+    values      tags x f64, engineering units
+    timestamps  tags x f64, scan time (epoch seconds) of each value
+    quality     tags x u8, QUALITY_NONE, QUALITY_GOOD or QUALITY_BAD
+
+Consistency is a seqlock. There is one writer, and it makes the sequence
+odd before it changes anything and even again after. A reader copies what
+it needs between two reads of the sequence and retries if the sequence was
+odd or moved in between. Readers never block the writer. Each sequence
+store is one aligned 8-byte write, and both x86 and the Python
+interpreter's own locking keep the stores in program order.
+"""
+import os
+import sys
+import time
+import struct
+import logging
+import argparse
+from collections import namedtuple
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+import metrics
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_NAME = 'igcar_sfct_tags'
+
+MAGIC = b'IGTS'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII')
+SEQUENCE_OFFSET = 16
+PUBLISHED_OFFSET = 24
+PID_OFFSET = 32
+HEADER_SIZE = 64
+NAME_WIDTH = 32
+
+# How often a client whose segment is still marked live checks that its publisher is
+PUBLISHER_CHECK_INTERVAL = 1.0
+
+STATE_CLOSED = 0
+STATE_LIVE = 1
+
+QUALITY_NONE = 0
+QUALITY_GOOD = 1
+QUALITY_BAD = 2
+
+Snapshot = namedtuple('Snapshot', 'sequence published values timestamps quality')
+
+
+def pid_alive(pid):
+    """Whether process pid is still running"""
+    if sys.platform == 'win32':
+        # os.kill(pid, 0) would terminate it on Windows
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def segment_size(count, name_width=NAME_WIDTH):
+    names = (count * name_width + 7) // 8 * 8
+    return HEADER_SIZE + names + count * 17
+
+
+class Layout:
+    """numpy views of a segment's fields, which a publisher and its clients share"""
+
+    def __init__(self, buffer, count, name_width=NAME_WIDTH):
+        self.count = count
+        self.header = buffer[:HEADER_SIZE]
+        self.sequence = np.ndarray((1,), np.uint64, buffer, SEQUENCE_OFFSET)
+        self.published = np.ndarray((1,), np.float64, buffer, PUBLISHED_OFFSET)
+        offset = HEADER_SIZE
+        self.names = np.ndarray((count,), f'S{name_width}', buffer, offset)
+        offset += (count * name_width + 7) // 8 * 8
+        self.values = np.ndarray((count,), np.float64, buffer, offset)
+        offset += count * 8
+        self.timestamps = np.ndarray((count,), np.float64, buffer, offset)
+        offset += count * 8
+        self.quality = np.ndarray((count,), np.uint8, buffer, offset)
+
+    def set_state(self, state):
+        self.header[6:8] = struct.pack('<H', state)
+
+    def state(self):
+        return struct.unpack('<H', self.header[6:8])[0]
+
+
+class SnapshotPublisher:
+    """Writes every scan the acquisition delivers into the shared snapshot
+
+    Every tag of every group gets a slot. Tag groups use their tag names and
+    coil groups use group.N, as the historian does. A tag read by more than
+    one group, such as the overview's fast scan of every tag, shares one slot,
+    so it holds whichever read is newest. Publishing only observes
+    deliveries. It never makes the acquisition poll a group that nobody is
+    subscribed to.
+
+    A failed read marks that group's tags QUALITY_BAD and keeps the last
+    values and their timestamps.
+    """
+
+    def __init__(self, acquisition, name=SNAPSHOT_NAME):
+        self.acquisition = acquisition
+        self.name = name
+        slots = {}
+        self.group_slots = {}
+        for group_name, group in acquisition.groups.items():
+            if group.codec:
+                names = [tag.name for tag in group.codec.tags]
+            else:
+                names = [f"{group_name}.{i}" for i in range(group.count)]
+            self.group_slots[group_name] = np.array([slots.setdefault(n, len(slots)) for n in names])
+        self.tags = list(slots)
+
+        self.shm = self.create(name, segment_size(len(self.tags)))
+        buffer = self.shm.buf
+        buffer[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        HEADER.pack_into(buffer, 0, MAGIC, VERSION, STATE_CLOSED, len(self.tags), NAME_WIDTH)
+        struct.pack_into('<I', buffer, PID_OFFSET, os.getpid())
+        self.layout = Layout(buffer, len(self.tags))
+        self.layout.names[:] = [n.encode('ascii') for n in self.tags]
+        self.layout.values[:] = np.nan
+        self.layout.timestamps[:] = np.nan
+        self.layout.quality[:] = QUALITY_NONE
+        self.layout.set_state(STATE_LIVE)
+
+        self.publish_seconds = metrics.REGISTRY.histogram(
+            'snapshot_publish_seconds', 'Time to publish one scan to the shared snapshot')
+        acquisition.observe(self.publish)
+        log.info("Publishing %d tags to shared memory %s", len(self.tags), name)
+
+    @staticmethod
+    def create(name, size):
+        try:
+            return shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a publisher that died without closing. Mark it closed so that
+            # clients still mapped to it move to the new segment
+            log.warning("Replacing stale shared snapshot %s", name)
+            stale = shared_memory.SharedMemory(name)
+            if bytes(stale.buf[:4]) == MAGIC:
+                struct.pack_into('<H', stale.buf, 6, STATE_CLOSED)
+            stale.close()
+            stale.unlink()
+            return shared_memory.SharedMemory(name, create=True, size=size)
+
+    def publish(self, group, values, timestamp):
+        slots = self.group_slots.get(group)
+        if slots is None:
+            return
+        layout = self.layout
+        with self.publish_seconds.time():
+            layout.sequence[0] += 1
+            if values is None:
+                layout.quality[slots] = QUALITY_BAD
+            else:
+                layout.values[slots] = values
+                layout.timestamps[slots] = timestamp if timestamp is not None else time.time()
+                layout.quality[slots] = QUALITY_GOOD
+            layout.published[0] = time.time()
+            layout.sequence[0] += 1
+
+    def close(self):
+        """Tell clients the segment is gone, then remove it"""
+        if self.shm is None:
+            return
+        self.acquisition.unobserve(self.publish)
+        self.layout.set_state(STATE_CLOSED)
+        # The numpy views must go before the mapping can be closed
+        self.layout = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+
+class SnapshotClient:
+    """Read-only view of a publisher's snapshot
+
+        client = SnapshotClient()
+        snapshot = client.read(['T001', 'P003'])
+        snapshot.values, snapshot.timestamps, snapshot.quality
+
+    read() returns copies that are consistent with one another. If the
+    publisher restarts, the client attaches to the new segment on the next
+    read. Reads raise FileNotFoundError while no publisher is running,
+    including after one has died without closing its segment, which the
+    client notices within check_interval seconds.
+    """
+
+    def __init__(self, name=SNAPSHOT_NAME, timeout=0.1, check_interval=PUBLISHER_CHECK_INTERVAL):
+        self.name = name
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.next_check = 0.0
+        self.shm = None
+        self.layout = None
+        self.pid = None
+        self.retries = metrics.REGISTRY.counter(
+            'snapshot_read_retries_total', 'Snapshot reads repeated because the publisher was mid-update')
+        self.attach()
+
+    def attach(self):
+        self.detach()
+        shm = shared_memory.SharedMemory(self.name)
+        pid = struct.unpack_from('<I', shm.buf, PID_OFFSET)[0]
+        # Python < 3.13 tracks attached segments too and would unlink the publisher's at our exit
+        if pid != os.getpid():
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        magic, version, _, count, name_width = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            shm.close()
+            raise ValueError(f"{self.name} is not a version {VERSION} tag snapshot")
+        if not pid_alive(pid):
+            shm.close()
+            raise FileNotFoundError(f"{self.name} was left by publisher {pid}, which is no longer running")
+        self.shm = shm
+        self.pid = pid
+        self.next_check = time.monotonic() + self.check_interval
+        self.layout = Layout(shm.buf, count, name_width)
+        self.tags = [n.decode('ascii') for n in self.layout.names]
+        self.index = {n: i for i, n in enumerate(self.tags)}
+
+    def detach(self):
+        if self.shm is not None:
+            self.layout = None
+            self.shm.close()
+            self.shm = None
+
+    def slots(self, tags):
+        """Slot indexes of tag names, for reading the same tags over and over"""
+        return np.array([self.index[tag] for tag in tags])
+
+    def publisher_gone(self):
+        """Whether the publisher has died without closing; checked every check_interval"""
+        now = time.monotonic()
+        if now < self.next_check:
+            return False
+        self.next_check = now + self.check_interval
+        return not pid_alive(self.pid)
+
+    def read(self, tags=None):
+        """Snapshot of every tag, or of tags (names or slots()) in that order"""
+        if self.layout is None or self.layout.state() != STATE_LIVE or self.publisher_gone():
+            self.attach()
+        if tags is not None and not isinstance(tags, np.ndarray):
+            tags = self.slots(tags)
+
+        layout = self.layout
+        sequence = layout.sequence
+        deadline = None
+        while True:
+            start = int(sequence[0])
+            if not start & 1:
+                if tags is None:
+                    values, timestamps, quality = layout.values.copy(), layout.timestamps.copy(), layout.quality.copy()
+                else:
+                    values, timestamps, quality = layout.values[tags], layout.timestamps[tags], layout.quality[tags]
+                published = float(layout.published[0])
+                if int(sequence[0]) == start:
+                    return Snapshot(start // 2, published, values, timestamps, quality)
+            self.retries.inc()
+            if deadline is None:
+                deadline = time.monotonic() + self.timeout
+            elif time.monotonic() > deadline:
+                raise TimeoutError(f"{self.name} stayed mid-update for {self.timeout}s; is the publisher hung?")
+
+    def close(self):
+        self.detach()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the current tag values from the HMI's shared snapshot")
+    parser.add_argument("tags", nargs='*', help="tag names (default: every tag)")
+    parser.add_argument("--name", default=SNAPSHOT_NAME, help="shared memory segment name")
+    args = parser.parse_args()
+
+    try:
+        client = SnapshotClient(args.name)
+    except FileNotFoundError:
+        sys.exit(f"No snapshot {args.name}: is sample.py running?")
+    tags = args.tags or client.tags
+    unknown = [tag for tag in tags if tag not in client.index]
+    if unknown:
+        sys.exit(f"Unknown tags: {', '.join(unknown)}")
+    snapshot = client.read(tags)
+    quality = {QUALITY_NONE: 'not read', QUALITY_GOOD: 'good', QUALITY_BAD: 'bad'}
+    now = time.time()
+    for tag, value, timestamp, q in zip(tags, snapshot.values, snapshot.timestamps, snapshot.quality):
+        age = f"{now - timestamp:7.1f}s ago" if q != QUALITY_NONE else ''
+        print(f"{tag:12} {value:12.3f}  {quality[q]:8} {age}")
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+from collections import namedtuple
+
+# One process tag mapped onto Modbus holding registers.
+#   dtype       uint16, int16, uint32, int32, float32 or bit
+#   scale/offset  engineering value = raw * scale + offset
+#   word_order  'big' when the high word comes first (ABCD), 'little' for CDAB
+#   byte_order  'big' for Modbus-standard registers, 'little' when each register's bytes are swapped
+#   bit         bit index within the register for dtype 'bit'
+#   low/high    alarm limits in engineering units, None for no limit
+#   tolerance   how far the historian's compressed history may stray from the samples (engineering
+#               units); 0 keeps every sample exactly
+#   retention   days of scans the historian keeps before archiving them, None to keep them for good
+Tag = namedtuple('Tag', 'name group address dtype scale offset unit word_order byte_order bit low high tolerance '
+                        'retention', defaults=('uint16', 1.0, 0.0, '', 'big', 'big', 0, None, None, 0.0, None))
+
+TEMPERATURE_TAGS = [
+    Tag(f"T{i + 1:03d}", 'temperatures', i, 'int16', 0.1, 0.0, '°C', tolerance=0.2, retention=730)
+    for i in range(10)
+]
+
+PRESSURE_TAGS = [
+    Tag(f"P{i + 1:03d}", 'pressures', 10 + i, 'uint16', 0.01, 0.0, 'bar', low=1.5, high=9.0, tolerance=0.02,
+        retention=730)
+    for i in range(10)
+]
+
+LEVEL_TAGS = [
+    Tag(f"L{i + 1:03d}", 'levels', 20 + i, 'uint16', 0.1, 0.0, '%', low=10.0, high=90.0, tolerance=0.2, retention=730)
+    for i in range(10)
+]
+
+FLOW_TAGS = [
+    Tag(f"F{i + 1:03d}", 'flows', 30 + i, 'uint16', 0.01, 0.0, 'm³/h', low=5.0, tolerance=0.05, retention=730)
+    for i in range(10)
+]
+
+LEAK_TAGS = [
+    # Leak detector history is kept exactly, and for ten years
+    Tag(f"LEAK{i + 1:03d}", 'leaks', 40 + i, 'uint16', 0.01, 0.0, 'mV', high=8.0, retention=3650)
+    for i in range(9)
+]
+
+TAGS = TEMPERATURE_TAGS + PRESSURE_TAGS + LEVEL_TAGS + FLOW_TAGS + LEAK_TAGS
+
+# Operator setpoints, written by setpoints.py and read back with the 'setpoints' scan. low/high are the
+# range an operator may enter, not alarm limits.
+SETPOINT_TAGS = [
+    # Heater zone temperatures; sodium must stay well clear of its 98 °C freezing point
+    Tag(f"TSP{i + 1:03d}", 'setpoints', 100 + i, 'int16', 0.1, 0.0, '°C', low=150.0, high=550.0)
+    for i in range(10)
+] + [
+    # EM pump flow demands
+    Tag(f"FSP{i + 1:03d}", 'setpoints', 110 + 2 * i, 'float32', 1.0, 0.0, 'm³/h', low=0.0, high=50.0)
+    for i in range(2)
+] + [
+    # Control valve openings
+    Tag(f"VC{i + 1:03d}", 'setpoints', 114 + i, 'uint16', 0.1, 0.0, '%', low=0.0, high=100.0)
+    for i in range(7)
+]
+
+# Seconds a tag's value may stay exactly the same before it is reported stuck, per group; a live
+# transmitter's last digit moves within minutes. Leak detectors legitimately sit at one reading.
+STUCK_SECONDS = {'temperatures': 900, 'pressures': 900, 'levels': 1800, 'flows': 900}
+
+# Mass balance over part of the loop. Flow in that neither leaves nor shows up as a rising level is
+# unaccounted for.
+#   inflows/outflows  flow tags (m³/h) into and out of it
+#   levels            (level tag, m³ per % of level) of the tanks in between
+#   tolerance         m³/h unaccounted for, averaged over `window` seconds, that is reported as a possible leak
+MassBalance = namedtuple('MassBalance', 'name inflows outflows levels tolerance window', defaults=(0.5, 600.0))
+
+# Example only: F001 into the tank measured by L001, F002 out of it. Replace with the plant's flow paths and
+# tank volumes before trusting the leak indication.
+MASS_BALANCES = [
+    MassBalance('Loop 1 storage', ['F001'], ['F002'], [('L001', 0.05)]),
+]
+
+# Scan groups of process tags, in the order the overview shows them
+TAG_GROUPS = ['temperatures', 'pressures', 'levels', 'flows', 'leaks']
+
+
+def tags_in_group(group, tags=TAGS):
+    return [tag for tag in tags if tag.group == group]
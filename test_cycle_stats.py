@@ -0,0 +1,83 @@
+import pytest
+from cycle_stats import CycleStats, percentile, distribution
+
+
+def steady(stats, cycles, period, start=0.0, first_count=0):
+    """One count every period seconds; returns the time of the last"""
+    for i in range(cycles + 1):
+        stats.add(first_count + i, start + i * period)
+    return start + cycles * period
+
+
+def test_percentile_interpolates():
+    assert percentile([1.0, 2.0, 3.0, 4.0], 0.5) == 2.5
+    assert percentile([5.0], 0.99) == 5.0
+    assert distribution([]) == {'min': None, 'max': None, 'p50': None, 'p90': None, 'p99': None}
+
+
+def test_steady_rate():
+    stats = CycleStats()
+    assert stats.add(10, 0.0) == 0
+    now = steady(stats, 120, 2.0, first_count=10)
+    summary = stats.summary(60.0, now + 1.0)
+    assert summary['cycles'] == 30
+    assert summary['rate_per_min'] == pytest.approx(30.0)
+    assert summary['ewma_per_min'] == pytest.approx(30.0)
+    assert summary['min'] == summary['p50'] == summary['max'] == pytest.approx(2.0)
+    session = stats.session_summary()
+    assert session['cycles'] == 120
+    assert session['min'] == session['max'] == pytest.approx(2.0)
+
+
+def test_burst_is_spread_over_the_interval():
+    stats = CycleStats()
+    stats.add(0, 0.0)
+    assert stats.add(4, 8.0) == 4
+    assert list(stats.ends[:stats.size]) == [2.0, 4.0, 6.0, 8.0]
+    assert list(stats.durations[:stats.size]) == [2.0] * 4
+
+
+def test_burst_larger_than_the_ring_keeps_its_newest_cycles():
+    stats = CycleStats(capacity=8)
+    stats.add(0, 0.0)
+    assert stats.add(100, 100.0) == 100
+    assert stats.size == 8
+    assert sorted(stats.ends) == [93.0, 94.0, 95.0, 96.0, 97.0, 98.0, 99.0, 100.0]
+    assert stats.summary(5.0, 100.0)['cycles'] == 6
+    assert stats.session_summary()['cycles'] == 100
+
+
+def test_ring_wraps_and_window_covers_recent_cycles():
+    stats = CycleStats(capacity=16)
+    steady(stats, 40, 1.0)
+    stats.add(42, 42.0)
+    assert stats.size == 16
+    assert max(stats.ends) == 42.0
+    assert stats.window(3.0, 42.5) == [1.0, 1.0, 1.0]
+
+
+def test_restart_and_rebaseline_are_not_timed():
+    stats = CycleStats()
+    steady(stats, 10, 1.0)
+    # the device restarted its count
+    assert stats.add(2, 11.0) == 0
+    assert stats.add(3, 12.0) == 1
+    # an hour idle before counting again
+    stats.rebaseline()
+    assert stats.add(3, 3612.0) == 0
+    assert stats.add(4, 3613.0) == 1
+    assert stats.session_summary()['max'] == pytest.approx(1.0)
+    assert stats.total == 12
+
+
+def test_stall_reported_once_per_stall():
+    stats = CycleStats(stall_factor=5.0, min_stall_seconds=10.0)
+    assert not stats.check_stall(0.0)
+    now = steady(stats, 60, 1.0)
+    assert stats.stall_threshold() == pytest.approx(10.0)
+    assert not stats.check_stall(now + 9.0)
+    assert stats.check_stall(now + 11.0)
+    assert not stats.check_stall(now + 30.0)
+    stats.add(61, now + 31.0)
+    assert stats.check_stall(now + 60.0)
+    assert stats.stalls == 2
@@ -0,0 +1,178 @@
+import random
+import sqlite3
+from collections import defaultdict
+from datetime import datetime, timedelta
+import pytest
+from cycle_db import COUNTER_SCHEMA
+from cycle_summary import rebuild, rebuild_all, totals
+from db_writer import DatabaseWriter
+from maintenance import CycleMaintenance, create_schema, archive_files
+
+START = datetime(2024, 1, 1, 6, 0, 0)
+INSERT = 'INSERT INTO cycle_data (timestamp, cycle_count, status, rig_id, session_start) VALUES (?, ?, ?, ?, ?)'
+
+
+def random_saves(seed, sessions=60):
+    """Saves as the Counter tab and the rig manager make them, in the order they would be inserted"""
+    rng = random.Random(seed)
+    open_sessions = []
+    saves = []
+    clock = START
+    for _ in range(sessions):
+        clock += timedelta(minutes=rng.randint(1, 1800))
+        # no rig or session for rows saved before they were recorded
+        rig = rng.choice(['COM4', 'R1', 'R2', None])
+        start = clock.strftime('%Y-%m-%d %H:%M:%S') if rng.random() > 0.1 else None
+        open_sessions.append([rig, start, 0, rng.randint(1, 6)])
+        while open_sessions and rng.random() < 0.7:
+            session = rng.choice(open_sessions)
+            rig, start, count, left = session
+            clock += timedelta(minutes=rng.randint(1, 300))
+            # counts mostly rise, but a restored or restarted session can save a lower one
+            count = max(0, count + rng.randint(-20, 200))
+            status = 'Completed' if left == 1 else rng.choice(['Quick Save', 'Quick Save', 'Auto Save'])
+            saves.append((clock.strftime('%Y-%m-%d %H:%M:%S'), count, status, rig, start))
+            session[2:] = [count, left - 1]
+            if left == 1:
+                open_sessions.remove(session)
+    return saves
+
+
+def counter_db(path=':memory:'):
+    db = sqlite3.connect(path)
+    for statement in COUNTER_SCHEMA:
+        statement(db) if callable(statement) else db.execute(statement)
+    db.commit()
+    return db
+
+
+def summaries(db):
+    return {table: db.execute(f'SELECT * FROM {table} ORDER BY 1, 2, 3').fetchall()
+            for table in ('cycle_sessions', 'cycle_daily', 'cycle_status_daily')}
+
+
+def brute_force(rows):
+    """The daily summaries straight from (id, timestamp, cycle_count, status, rig_id, session_start) rows"""
+    sessions = {}
+    status_daily = defaultdict(lambda: [0, 0])
+    for id_, timestamp, count, status, rig, start in sorted(rows):
+        key = (rig or '', start or f'row {id_}')
+        day = (start or timestamp)[:10]
+        best = sessions.get(key, (day, 0))[1]
+        sessions[key] = (day, max(best, count))
+        status_daily[day, rig or '', status][0] += 1
+        status_daily[day, rig or '', status][1] += max(count - best, 0)
+    daily = defaultdict(lambda: [0, 0])
+    for (rig, _), (day, cycles) in sessions.items():
+        daily[day, rig][0] += 1
+        daily[day, rig][1] += cycles
+    return ([(day, rig, *daily[day, rig]) for day, rig in sorted(daily)],
+            [(*key, *status_daily[key]) for key in sorted(status_daily)])
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_trigger_matches_rebuild_and_brute_force(seed):
+    db = counter_db()
+    db.executemany(INSERT, random_saves(seed))
+    db.commit()
+    by_trigger = summaries(db)
+
+    daily, status_daily = brute_force(db.execute('SELECT id, timestamp, cycle_count, status, rig_id, session_start '
+                                                 'FROM cycle_data').fetchall())
+    assert by_trigger['cycle_daily'] == daily
+    assert by_trigger['cycle_status_daily'] == status_daily
+
+    assert rebuild(db) == len({row[0] for row in daily})
+    assert summaries(db) == by_trigger
+
+
+def test_rebuild_of_some_days_leaves_the_rest():
+    db = counter_db()
+    db.executemany(INSERT, random_saves(7))
+    db.commit()
+    expected = summaries(db)
+    days = [day for day, in db.execute('SELECT DISTINCT day FROM cycle_daily ORDER BY day')]
+    db.execute('UPDATE cycle_daily SET cycles = -1')
+    rebuild(db, days[:3])
+    assert [row for row in summaries(db)['cycle_daily'] if row[3] != -1] == \
+        [row for row in expected['cycle_daily'] if row[0] in days[:3]]
+
+
+def test_clear_keeps_archived_history(tmp_path):
+    path = str(tmp_path / 'cycle_counter.db')
+    archive_dir = str(tmp_path / 'archive')
+    create_schema(path, COUNTER_SCHEMA)
+    db = sqlite3.connect(path)
+    saves = random_saves(3, sessions=120)
+    db.executemany(INSERT, saves)
+    # a new file's old table, from the rollup job the trigger replaced
+    db.execute('CREATE TABLE maintenance_state (name TEXT PRIMARY KEY, value REAL NOT NULL)')
+    db.commit()
+    before = summaries(db)
+    db.close()
+
+    cutoff = datetime.strptime(saves[len(saves) // 2][0], '%Y-%m-%d %H:%M:%S')
+    maintenance = CycleMaintenance(path, retention_days=0, archive_dir=archive_dir)
+    assert maintenance.expire(now=cutoff.timestamp()) > 0
+    maintenance.db.close()
+    archives = archive_files(archive_dir, path)
+    assert len(archives) > 1
+    archived_rows = [row for archive in archives for row in sqlite3.connect(archive).execute(
+        'SELECT id, timestamp, cycle_count, status, rig_id, session_start FROM cycle_data')]
+
+    # a row copied to an archive but not yet deleted from cycle_data counts once
+    db = sqlite3.connect(path)
+    archived = sqlite3.connect(archives[-1]).execute('SELECT * FROM cycle_data ORDER BY id DESC LIMIT 1').fetchone()
+    db.execute('INSERT INTO cycle_data SELECT ' + ', '.join('?' * len(archived)), archived)
+    rebuild_all(db, archives)
+    db.commit()
+    live = db.execute('SELECT id, timestamp, cycle_count, status, rig_id, session_start FROM cycle_data').fetchall()
+    daily, status_daily = brute_force(set(live + archived_rows))
+    assert summaries(db)['cycle_daily'] == daily
+    assert summaries(db)['cycle_status_daily'] == status_daily
+    db.close()
+
+    writer = DatabaseWriter(path, COUNTER_SCHEMA, flush_interval=0.0).start()
+    done = []
+    writer.on_done = lambda op, ok, error: done.append((op, ok, error))
+    writer.call(lambda db: (db.execute('DELETE FROM cycle_data'), rebuild_all(db, archives)), op='clear')
+    assert writer.flush()
+    writer.close()
+    assert done == [('clear', True, '')]
+
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT 1 FROM sqlite_master WHERE name = 'maintenance_state'").fetchone() is None
+    assert db.execute('SELECT COUNT(*) FROM cycle_data').fetchone()[0] == 0
+    daily, status_daily = brute_force(archived_rows)
+    after = summaries(db)
+    assert after['cycle_daily'] == daily
+    assert after['cycle_status_daily'] == status_daily
+    # sessions wholly archived keep exactly the totals they had
+    kept = [row for row in before['cycle_sessions'] if row[6] < cutoff.strftime('%Y-%m-%d %H:%M:%S')]
+    assert kept and set(kept) <= set(after['cycle_sessions'])
+    assert totals(db, '2024-01-01', '2099-12-31')[1] == sum(row[3] for row in daily)
+    db.close()
+
+
+def test_failed_clear_changes_nothing(tmp_path):
+    path = str(tmp_path / 'cycle_counter.db')
+    create_schema(path, COUNTER_SCHEMA)
+    db = sqlite3.connect(path)
+    db.executemany(INSERT, random_saves(4))
+    db.commit()
+    before = db.execute('SELECT COUNT(*) FROM cycle_data').fetchone()[0], summaries(db)
+    db.close()
+    broken = tmp_path / 'cycle_counter-2023-12.db'
+    broken.write_bytes(b'not a database' * 100)
+
+    writer = DatabaseWriter(path, COUNTER_SCHEMA, flush_interval=0.0).start()
+    done = []
+    writer.on_done = lambda op, ok, error: done.append((op, ok))
+    writer.call(lambda db: (db.execute('DELETE FROM cycle_data'), rebuild_all(db, [str(broken)])), op='clear')
+    assert writer.flush()
+    writer.close()
+    assert done == [('clear', False)]
+
+    db = sqlite3.connect(path)
+    assert (db.execute('SELECT COUNT(*) FROM cycle_data').fetchone()[0], summaries(db)) == before
+    db.close()
@@ -0,0 +1,96 @@
+import time
+import threading
+from PyQt5.QtCore import Qt
+from failover import RedundantClient
+
+
+class FakePlc:
+    """Holding registers in a dict; drop_after cuts the connection after that many requests of a call"""
+
+    def __init__(self, host):
+        self.host = host
+        self.port = 502
+        self.registers = {}
+        self.is_open = True
+        self.drop_after = None
+        self.writes = 0
+
+    def execute(self, requests):
+        results = []
+        for function, address, arg in requests:
+            if self.drop_after is not None and len(results) >= self.drop_after:
+                self.is_open = False
+            if not self.is_open:
+                results.append(None)
+            elif function == 'read_holding_registers':
+                results.append([self.registers.get(a, 0) for a in range(address, address + arg)])
+            else:
+                self.writes += 1
+                for i, value in enumerate(arg):
+                    self.registers[address + i] = value
+                results.append(True)
+        return results
+
+
+def pair():
+    primary, secondary = FakePlc('primary'), FakePlc('secondary')
+    return RedundantClient([('primary', primary), ('secondary', secondary)]), primary, secondary
+
+
+def test_batch_write_interrupted_by_failover_is_not_repeated():
+    client, primary, secondary = pair()
+    # the hot standby mirrors the first write before the primary drops
+    secondary.registers.update({100: 1, 101: 2})
+    primary.drop_after = 1
+    batch = [('write_multiple_registers', 100, [1, 2]), ('write_multiple_registers', 200, [3])]
+
+    assert client.execute(batch) == [True, True]
+    assert client.active.name == 'secondary'
+    assert secondary.writes == 1
+    assert secondary.registers[200] == 3
+
+
+def test_reads_are_rerun_on_the_standby():
+    client, primary, secondary = pair()
+    secondary.registers[5] = 42
+    primary.drop_after = 0
+
+    assert client.read_holding_registers(5) == [42]
+    assert client.active.name == 'secondary'
+
+
+
+class SlowReads(RedundantClient):
+    """Reading the active PLC yields the thread, so a check-then-set race shows every time"""
+
+    @property
+    def active(self):
+        endpoint = self._active
+        time.sleep(0.001)
+        return endpoint
+
+    @active.setter
+    def active(self, endpoint):
+        self._active = endpoint
+
+
+def test_concurrent_switches_count_once():
+    for _ in range(20):
+        client = SlowReads([('primary', FakePlc('primary')), ('secondary', FakePlc('secondary'))])
+        switched = []
+        client.switched.connect(lambda name, reason: switched.append(name), Qt.DirectConnection)
+        before = client.failovers.value
+        barrier = threading.Barrier(4)
+
+        def switch():
+            barrier.wait()
+            client.switch(client.endpoint('secondary'), 'test')
+
+        threads = [threading.Thread(target=switch) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert client.active.name == 'secondary'
+        assert switched == ['secondary']
+        assert client.failovers.value == before + 1
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+from history_codec import encode_chunk, decode_chunk, swinging_door
+
+RNG = np.random.default_rng(42)
+N = 500
+# Scans every 250 ms with some jitter, as the scheduler delivers them
+TIMES = 1.7e9 + np.cumsum(np.full(N, 0.25) + RNG.integers(-3, 4, N) / 1000.0)
+
+SERIES = {
+    'random': RNG.normal(0.0, 1e3, N),
+    'constant': np.full(N, 451.5),
+    'increasing': np.linspace(-40.0, 900.0, N),
+    'decreasing': np.linspace(900.0, -40.0, N),
+    'random walk': 400.0 + np.cumsum(RNG.normal(0.0, 0.3, N)),
+    'tiny and huge': RNG.choice([1e-300, -5e-324, 1e300, 0.0, -0.0], N),
+}
+
+
+def with_non_finite(values):
+    values = values.copy()
+    values[[0, 17, 18, 250, N - 1]] = [np.nan, np.inf, -np.inf, np.nan, np.inf]
+    return values
+
+
+def same(a, b):
+    """Bit-for-bit equal, so NaN matches NaN and -0.0 doesn't match 0.0"""
+    return np.array_equal(np.asarray(a, dtype=np.float64).view(np.uint64),
+                          np.asarray(b, dtype=np.float64).view(np.uint64))
+
+
+@pytest.mark.parametrize('name', SERIES)
+@pytest.mark.parametrize('non_finite', [False, True])
+def test_lossless_round_trip(name, non_finite):
+    values = SERIES[name]
+    if non_finite:
+        values = with_non_finite(values)
+    times, decoded = decode_chunk(encode_chunk(TIMES, values))
+    assert same(decoded[:, 0], values)
+    assert np.array_equal(np.round(times * 1000.0), np.round(TIMES * 1000.0))
+
+
+def test_timestamps_keep_milliseconds():
+    times = np.array([0.0, 0.001, 0.001, 5.0, 4.999, 1e6 + 0.123])
+    decoded, _ = decode_chunk(encode_chunk(times, np.zeros(len(times))))
+    assert np.array_equal(np.round(decoded * 1000.0), np.round(times * 1000.0))
+
+
+@pytest.mark.parametrize('rows', [0, 1, 2])
+def test_short_chunks(rows):
+    values = np.arange(rows * 3, dtype=float).reshape(rows, 3)
+    times, decoded = decode_chunk(encode_chunk(TIMES[:rows], values, [(0.5, 0.0, 1.0)] * 3))
+    assert decoded.shape == (rows, 3)
+    assert same(decoded, values)
+
+
+def test_quantised_round_trip():
+    scale, offset = 0.1, -50.0
+    counts = np.concatenate((RNG.integers(-32768, 32767, N // 2), np.cumsum(RNG.integers(-3, 4, N - N // 2))))
+    values = counts * scale + offset
+    _, decoded = decode_chunk(encode_chunk(TIMES, values, [(scale, offset, 0.0)]))
+    assert same(decoded[:, 0], values)
+
+
+def test_quantised_column_with_non_finite_values():
+    values = with_non_finite(np.round(SERIES['random walk'], 1))
+    _, decoded = decode_chunk(encode_chunk(TIMES, values, [(0.1, 0.0, 0.0)]))
+    assert same(decoded[:, 0], values)
+
+
+@pytest.mark.parametrize('name', ['random', 'increasing', 'random walk', 'constant'])
+@pytest.mark.parametrize('tolerance', [0.05, 0.5, 5.0])
+def test_swinging_door_within_tolerance(name, tolerance):
+    values = SERIES[name]
+    _, decoded = decode_chunk(encode_chunk(TIMES, values, [(None, 0.0, tolerance)]))
+    assert np.max(np.abs(decoded[:, 0] - values)) <= tolerance * (1 + 1e-9)
+
+
+@pytest.mark.parametrize('tolerance', [0.1, 1.0])
+def test_swinging_door_on_plc_values(tolerance):
+    # register counts in 0.1 steps, stored quantised after thinning
+    values = np.round(SERIES['random walk'] * 10) / 10
+    _, decoded = decode_chunk(encode_chunk(TIMES, values, [(0.1, 0.0, tolerance)]))
+    assert np.max(np.abs(decoded[:, 0] - values)) <= tolerance * (1 + 1e-9)
+
+
+@pytest.mark.parametrize('tolerance', [0.0, 0.01, 0.5])
+def test_values_off_the_scale_grid_are_not_rounded_to_it(tolerance):
+    # scans recorded before the tag's offset was changed from 0.03 to 0.0
+    values = np.round(SERIES['random walk'], 1) + 0.03
+    _, decoded = decode_chunk(encode_chunk(TIMES, values, [(0.1, 0.0, tolerance)]))
+    assert np.max(np.abs(decoded[:, 0] - values)) <= tolerance * (1 + 1e-9)
+
+
+def test_swinging_door_thins_smooth_series():
+    ramp = 20.0 + 3.0 * (TIMES - TIMES[0])
+    keep = swinging_door(TIMES, ramp, 0.01)
+    assert keep[0] and keep[-1]
+    assert keep.sum() <= 4
+    assert swinging_door(TIMES, SERIES['constant'], 0.01).sum() == 2
+
+
+def test_swinging_door_keeps_non_finite_samples():
+    values = with_non_finite(SERIES['random walk'])
+    keep = swinging_door(TIMES, values, 1.0)
+    for row in np.flatnonzero(~np.isfinite(values)):
+        assert keep[max(row - 1, 0):row + 2].all()
+
+    _, decoded = decode_chunk(encode_chunk(TIMES, values, [(None, 0.0, 1.0)]))
+    finite = np.isfinite(values)
+    assert same(decoded[~finite, 0], values[~finite])
+    assert np.max(np.abs(decoded[finite, 0] - values[finite])) <= 1.0 * (1 + 1e-9)
+
+
+def test_mixed_columns():
+    values = np.column_stack([SERIES['random'], np.round(SERIES['random walk'], 1), SERIES['constant']])
+    codec = [(None, 0.0, 0.0), (0.1, 0.0, 0.0), (None, 0.0, 0.1)]
+    _, decoded = decode_chunk(encode_chunk(TIMES, values, codec))
+    assert same(decoded[:, :2], values[:, :2])
+    assert np.allclose(decoded[:, 2], values[:, 2], rtol=0, atol=0.1)
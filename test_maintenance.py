@@ -0,0 +1,185 @@
+import os
+import sqlite3
+from datetime import datetime
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QEvent, QObject
+from PyQt5.QtWidgets import QApplication
+import maintenance
+from cycle_db import COUNTER_SCHEMA
+from historian import Historian
+from maintenance import (MaintenanceScheduler, ActivityFilter, HistoryMaintenance, CycleMaintenance, archive_files,
+                         create_schema)
+
+app = QApplication.instance() or QApplication([])
+
+NOW = datetime(2024, 3, 15, 12, 0).timestamp()
+OLD = datetime(2024, 3, 12, 6, 0).timestamp()
+
+
+def scans(start, hours, period=10.0):
+    times = start + period * np.arange(int(hours * 3600 / period))
+    values = np.column_stack([np.round(np.sin(times / 500.0) * 100.0, 1), np.floor(times / 7.0) % 13])
+    return times, values
+
+
+@pytest.fixture
+def history(tmp_path):
+    # the old scans fill whole chunks, since a chunk is only archived once all of it has expired
+    history = Historian(str(tmp_path / 'sfct_history.db'), flush_interval=0.0, chunk_rows=120)
+    history.define_group('process', ['A', 'B'])
+    for times, values in (scans(OLD, 3), scans(NOW - 3600, 1)):
+        for ts, row in zip(times, values):
+            history.record('process', float(ts), row)
+    history.flush()
+    yield history
+    history.close()
+
+
+def expected_buckets(times, values, period):
+    buckets = np.floor(times / period) * period
+    rows = []
+    for bucket in np.unique(buckets):
+        inside = values[buckets == bucket]
+        rows.append((bucket, len(inside), inside.min(axis=0), inside.max(axis=0), inside.mean(axis=0)))
+    return rows
+
+
+def assert_rollups(history, period, times, values):
+    starts, samples, low, high, mean = history.rollups('process', period, 0)
+    expected = expected_buckets(times, values, period)
+    assert list(starts) == [row[0] for row in expected]
+    assert list(samples) == [row[1] for row in expected]
+    assert np.array_equal(low, [row[2] for row in expected])
+    assert np.array_equal(high, [row[3] for row in expected])
+    assert np.allclose(mean, [row[4] for row in expected])
+
+
+def test_rollups_match_the_scans_and_only_add_new_buckets(history):
+    jobs = HistoryMaintenance(history, archive_dir=None)
+    times, values = history.series('process', 0)
+    assert jobs.rollup(now=NOW) > 0
+    # the last, partial minute and hour wait for later data
+    complete = times < np.floor(times[-1] / 60) * 60
+    assert_rollups(history, 60, times[complete], values[complete])
+    complete = times < np.floor(times[-1] / 3600) * 3600
+    assert_rollups(history, 3600, times[complete], values[complete])
+
+    assert jobs.rollup(now=NOW) == 0
+    # recording stopped more than an hour ago: every bucket is complete
+    assert jobs.rollup(now=NOW + 7200) > 0
+    assert_rollups(history, 60, times, values)
+    assert_rollups(history, 3600, times, values)
+    assert jobs.progress('process', 60) == np.floor((NOW + 7200) / 60) * 60
+
+
+def test_retention_moves_old_scans_to_the_archive(history, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    jobs = HistoryMaintenance(history, {'process': 1}, archive_dir, rollup_retention={60: 2, 3600: None})
+    before = history.series('process', 0)
+    # nothing is expired before it is rolled up
+    assert jobs.expire(now=NOW) == 0
+    assert jobs.rollup(now=NOW) > 0
+    assert jobs.expire(now=NOW) > 0
+    jobs.db.close()
+
+    old = before[0] < NOW - 86400
+    live = history.series('process', 0)
+    assert np.array_equal(live[0], before[0][~old]) and np.array_equal(live[1], before[1][~old])
+    archives = archive_files(archive_dir, history.path)
+    assert [os.path.basename(path) for path in archives] == ['sfct_history-2024-03.db']
+    archived = Historian(archives[0])
+    times, values = archived.series('process', 0)
+    assert np.array_equal(times, before[0][old]) and np.array_equal(values, before[1][old])
+    assert archived.groups() == {'process': ('values', ['A', 'B'])}
+
+    # minute buckets past their two days are dropped, hours are kept
+    assert history.rollups('process', 60, 0)[0].min() >= NOW - 2 * 86400
+    assert history.rollups('process', 3600, 0)[0].min() == np.floor(OLD / 3600) * 3600
+
+
+def test_cycle_retention_keeps_running_sessions(tmp_path):
+    path = str(tmp_path / 'cycle_counter.db')
+    create_schema(path, COUNTER_SCHEMA)
+    db = sqlite3.connect(path)
+    db.executemany('INSERT INTO cycle_data (timestamp, cycle_count, status, rig_id, session_start) '
+                   'VALUES (?, ?, ?, ?, ?)', [('2022-01-05 10:00:00', 40, 'Completed', 'R1', '2022-01-05 09:00:00'),
+                                              ('2024-03-14 10:00:00', 12, 'Completed', 'R1', '2024-03-14 09:00:00')])
+    db.executemany('INSERT INTO rig_sessions (rig_id, session_start, port, current_count, is_running) '
+                   'VALUES (?, ?, ?, ?, ?)', [('R1', '2022-01-05 09:00:00', 'COM5', 40, 0),
+                                              ('R2', '2022-01-06 09:00:00', 'COM6', 3, 1)])
+    db.commit()
+    db.close()
+
+    jobs = CycleMaintenance(path, retention_days=365, archive_dir=str(tmp_path / 'archive'))
+    assert jobs.expire(now=NOW) == 2
+    jobs.db.close()
+    db = sqlite3.connect(path)
+    assert db.execute('SELECT timestamp FROM cycle_data').fetchall() == [('2024-03-14 10:00:00',)]
+    assert db.execute('SELECT rig_id FROM rig_sessions').fetchall() == [('R2',)]
+    archive = sqlite3.connect(str(tmp_path / 'archive' / 'cycle_counter-2022-01.db'))
+    assert archive.execute('SELECT cycle_count FROM cycle_data').fetchall() == [(40,)]
+    assert archive.execute('SELECT rig_id FROM rig_sessions').fetchall() == [('R1',)]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(maintenance, 'time', SimpleNamespace(monotonic=clock.monotonic, time=lambda: NOW))
+    return clock
+
+
+def test_idle_jobs_wait_for_the_operator_to_stop(clock):
+    scheduler = MaintenanceScheduler(idle_after=120.0, max_delay=3600.0)
+    runs = []
+    scheduler.add('rollup', lambda: runs.append('rollup'), 60)
+    scheduler.add('expire', lambda: runs.append(('expire', scheduler.interrupted())), 60, idle=True)
+    watcher = ActivityFilter(scheduler)
+    app.installEventFilter(watcher)
+    target = QObject()
+    try:
+        clock.now += 60
+        QApplication.sendEvent(target, QEvent(QEvent.KeyPress))
+        assert scheduler.run_pending() == 1
+        assert runs == ['rollup']
+
+        # events other than input don't count as the operator being there
+        clock.now += 120
+        QApplication.sendEvent(target, QEvent(QEvent.Timer))
+        assert scheduler.run_pending() == 2
+        assert runs[-1] == ('expire', False)
+
+        # a busy operator holds the job off until it is max_delay overdue, then it runs to the end
+        clock.now += 60
+        assert not watcher.eventFilter(target, QEvent(QEvent.MouseButtonPress))
+        assert scheduler.run_pending() == 1
+        clock.now += 3600
+        scheduler.touch()
+        assert scheduler.run_pending() == 2
+        assert runs[-1] == ('expire', False)
+    finally:
+        app.removeEventFilter(watcher)
+
+
+def test_failing_job_is_counted_and_rescheduled(clock):
+    scheduler = MaintenanceScheduler()
+
+    def broken():
+        raise sqlite3.OperationalError('database is locked')
+
+    job = scheduler.add('broken', broken, 60, delay=0)
+    assert scheduler.run_pending() == 1
+    assert job.failures.value == 1
+    assert job.next_run == clock.now + 60
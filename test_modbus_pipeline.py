@@ -0,0 +1,106 @@
+import socket
+import contextlib
+import struct
+import threading
+import pytest
+from modbus_pipeline import PipelinedModbusClient, ProtocolError, decode_pdu
+
+
+class FakeServer:
+    """Modbus TCP server answering read_holding_registers with the register addresses
+
+    stall: read requests but answer none of them
+    echo:  answer every request with this fixed transaction ID
+    """
+
+    def __init__(self):
+        self.stall = False
+        self.echo = None
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        with conn, contextlib.suppress(OSError):
+            while True:
+                header = conn.recv(7, socket.MSG_WAITALL)
+                if len(header) < 7:
+                    return
+                tx_id, _, length, unit = struct.unpack('>HHHB', header)
+                pdu = conn.recv(length - 1, socket.MSG_WAITALL)
+                if self.stall:
+                    continue
+                _, address, count = struct.unpack('>BHH', pdu)
+                reply = struct.pack(f'>BB{count}H', 0x03, 2 * count, *range(address, address + count))
+                tx_id = tx_id if self.echo is None else self.echo
+                conn.sendall(struct.pack('>HHHB', tx_id, 0, len(reply) + 1, unit) + reply)
+
+    def close(self):
+        self.listener.close()
+
+
+@pytest.fixture
+def server():
+    server = FakeServer()
+    yield server
+    server.close()
+
+
+def requests(n):
+    return [('read_holding_registers', 10 * i, 2) for i in range(n)]
+
+
+def test_pipelined_results_in_request_order(server):
+    client = PipelinedModbusClient('127.0.0.1', server.port)
+    assert client.execute(requests(5)) == [[10 * i, 10 * i + 1] for i in range(5)]
+    assert client.window == 8
+    client.close()
+
+
+def test_timeout_keeps_pipelining(server):
+    client = PipelinedModbusClient('127.0.0.1', server.port, timeout=0.2)
+    server.stall = True
+    assert client.execute(requests(4)) == [None] * 4
+    assert isinstance(client.last_error, OSError)
+    assert client.window == 8
+
+    server.stall = False
+    assert client.execute(requests(4)) == [[10 * i, 10 * i + 1] for i in range(4)]
+    assert client.window == 8
+    client.close()
+
+
+def test_fixed_transaction_id_falls_back(server):
+    server.echo = 0
+    client = PipelinedModbusClient('127.0.0.1', server.port)
+    assert client.execute(requests(4)) == [[10 * i, 10 * i + 1] for i in range(4)]
+    assert client.window == 1
+    client.close()
+
+
+@pytest.mark.parametrize('pdu', [
+    bytes([0x03, 4, 0, 1]),               # byte count says 4, 2 bytes follow
+    bytes([0x03, 2, 0, 1]),               # complete, but one register short of the request
+    bytes([0x03, 4, 0, 1, 0, 2, 0, 3]),  # trailing bytes
+    bytes([0x83]),                        # exception without its code
+])
+def test_decode_rejects_wrong_length(pdu):
+    with pytest.raises(ProtocolError):
+        decode_pdu('read_holding_registers', 2, pdu)
+
+
+def test_decode():
+    assert decode_pdu('read_holding_registers', 2, bytes([0x03, 4, 0, 1, 0, 2])) == [1, 2]
+    assert decode_pdu('read_coils', 10, bytes([0x01, 2, 0b101, 0b10])) == [True, False, True] + [False] * 6 + [True]
+    assert decode_pdu('read_holding_registers', 2, bytes([0x83, 2])) is None
+    assert decode_pdu('write_multiple_registers', [1, 2], bytes([0x10, 0, 100, 0, 2])) is True
+    with pytest.raises(ProtocolError):
+        decode_pdu('write_multiple_registers', [1, 2], bytes([0x10, 0, 100]))
@@ -0,0 +1,71 @@
+import struct
+import numpy as np
+import pytest
+from tags import Tag, TAGS, SETPOINT_TAGS
+from register_codec import RegisterCodec, encode_value, register_count
+
+
+def words(fmt, value):
+    return list(struct.unpack('>2H', struct.pack(fmt, value)))
+
+
+@pytest.mark.parametrize('dtype, fmt, value', [('float32', '>f', -12.5), ('int32', '>i', -70000),
+                                               ('uint32', '>I', 3000000000)])
+@pytest.mark.parametrize('word_order', ['big', 'little'])
+@pytest.mark.parametrize('byte_order', ['big', 'little'])
+def test_wide_values_in_every_word_and_byte_order(dtype, fmt, value, word_order, byte_order):
+    high, low = words(fmt, value)
+    regs = [high, low] if word_order == 'big' else [low, high]
+    if byte_order == 'little':
+        regs = [(word & 0xFF) << 8 | word >> 8 for word in regs]
+    tag = Tag('X', 'test', 10, dtype, word_order=word_order, byte_order=byte_order)
+    # the codec's block starts at the lowest address
+    assert RegisterCodec([tag]).decode(regs)[0] == value
+    assert encode_value(tag, value) == regs
+
+
+def test_int16_is_signed_and_uint16_is_not():
+    codec = RegisterCodec([Tag('A', 'test', 0, 'int16', 0.1), Tag('B', 'test', 1, 'uint16', 0.1),
+                           Tag('C', 'test', 2, 'int16', 0.1, byte_order='little')])
+    values = codec.decode([0xFFF6, 0xFFF6, 0xF6FF])
+    assert values == pytest.approx([-1.0, 6552.6, -1.0])
+
+
+def test_bits_share_a_register():
+    tags = [Tag(f"B{bit}", 'test', 5, 'bit', bit=bit) for bit in (0, 3, 15)] + [Tag('W', 'test', 6)]
+    codec = RegisterCodec(tags)
+    assert codec.count == 2
+    assert list(codec.decode([0b1000_0000_0000_1000, 7])) == [0.0, 1.0, 1.0, 7.0]
+    with pytest.raises(ValueError, match="bit tags can't be written"):
+        encode_value(tags[0], 1)
+
+
+def test_scale_offset_and_payload_bytes():
+    codec = RegisterCodec([Tag('T', 'test', 0, 'int16', 0.1, -50.0), Tag('F', 'test', 1, 'float32', 2.0, 1.0)])
+    regs = [250] + words('>f', 3.5)
+    expected = [-25.0, 8.0]
+    assert list(codec.decode(regs)) == pytest.approx(expected)
+    assert list(codec.decode(struct.pack('>3H', *regs))) == pytest.approx(expected)
+    with pytest.raises(ValueError, match='expected 3 registers'):
+        codec.decode(regs[:2])
+
+
+@pytest.mark.parametrize('tag', TAGS + SETPOINT_TAGS, ids=lambda tag: tag.name)
+def test_encode_value_round_trips_through_decode(tag):
+    if tag.dtype == 'bit':
+        return
+    codec = RegisterCodec([tag])
+    low = tag.low if tag.low is not None else tag.offset
+    high = tag.high if tag.high is not None else low + 100 * tag.scale
+    for value in np.linspace(low, high, 7):
+        regs = encode_value(tag, value)
+        assert len(regs) == register_count(tag)
+        # to the tag's resolution
+        assert codec.decode(regs)[0] == pytest.approx(value, abs=tag.scale / 2 + 1e-9, rel=1e-6)
+
+
+def test_encode_value_refuses_what_the_dtype_cannot_hold():
+    with pytest.raises(ValueError, match="doesn't fit in int16"):
+        encode_value(Tag('T', 'test', 0, 'int16', 0.1), 4000.0)
+    with pytest.raises(ValueError, match="doesn't fit in uint16"):
+        encode_value(Tag('V', 'test', 0, 'uint16', 0.1), -1.0)
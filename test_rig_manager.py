@@ -0,0 +1,165 @@
+import os
+import queue
+import sqlite3
+import time
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+from cycle_db import COUNTER_SCHEMA
+from db_writer import DatabaseWriter
+from rig_manager import RigManager, SerialRig
+from serial_protocol import encode_frame
+
+app = QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def counter_db(tmp_path):
+    path = str(tmp_path / 'cycle_counter.db')
+    writer = DatabaseWriter(path, COUNTER_SCHEMA, flush_interval=0.0).start()
+    yield path, writer
+    writer.close()
+
+
+@pytest.fixture
+def manager(counter_db):
+    manager = RigManager(counter_db[1], drain_ms=60000)
+    manager.updated = []
+    manager.rig_updated.connect(manager.updated.append)
+    yield manager
+    manager.close()
+
+
+def query(path, sql):
+    db = sqlite3.connect(path)
+    rows = db.execute(sql).fetchall()
+    db.close()
+    return rows
+
+
+def test_session_is_recorded_per_rig(manager, counter_db):
+    path, writer = counter_db
+    for rig_id, port in (('R1', 'COM5'), ('R2', 'COM6')):
+        manager.add_rig(rig_id, port, connect=False)
+    manager.start('R1')
+    manager.start('R2')
+    started = manager.rigs['R1'].session_start
+    now = time.monotonic()
+    for count in range(1, 6):
+        manager.events.put(('R1', 'count', count, now + count))
+    manager.events.put(('R2', 'count', 3, now + 1))
+    manager.drain()
+    assert writer.flush()
+    assert query(path, 'SELECT rig_id, port, current_count, is_running FROM rig_sessions ORDER BY rig_id') == [
+        ('R1', 'COM5', 5, 1), ('R2', 'COM6', 3, 1)]
+
+    manager.stop('R1')
+    assert writer.flush()
+    assert query(path, "SELECT current_count, is_running, ended_at IS NOT NULL FROM rig_sessions "
+                       "WHERE rig_id = 'R1'") == [(5, 0, 1)]
+    assert query(path, 'SELECT cycle_count, status, rig_id, session_start FROM cycle_data') == [
+        (5, 'Completed', 'R1', started)]
+    assert manager.rigs['R1'].stats.session_summary()['cycles'] == 5
+
+
+def test_counts_outside_a_session_are_ignored(manager, counter_db):
+    path, writer = counter_db
+    rig = manager.add_rig('R1', 'COM5', connect=False)
+    manager.events.put(('R1', 'count', 7, time.monotonic()))
+    manager.drain()
+    assert rig.count == 0
+
+    manager.start('R1')
+    manager.stop('R1')
+    assert writer.flush()
+    # an empty session isn't a cycle_data row
+    assert query(path, 'SELECT COUNT(*) FROM cycle_data') == [(0,)]
+    assert query(path, 'SELECT current_count, is_running FROM rig_sessions') == [(0, 0)]
+
+
+def test_drain_keeps_connection_and_error_state(manager):
+    manager.add_rig('R1', 'COM5', connect=False)
+    manager.add_rig('R2', 'COM6', connect=False)
+    now = time.monotonic()
+    for event in [('R1', 'disconnected', 'could not open port', now), ('R1', 'connected', None, now),
+                  ('R2', 'error', 'garbage', now), ('R2', 'error', 'more garbage', now), ('R2', 'lost', 3, now),
+                  ('R9', 'count', 1, now)]:
+        manager.events.put(event)
+    manager.updated.clear()
+    assert manager.drain() == 2
+    # one signal per rig however many of its events were drained; unknown rigs are skipped
+    assert sorted(manager.updated) == ['R1', 'R2']
+    r1, r2 = manager.rigs['R1'], manager.rigs['R2']
+    assert r1.connected and r1.last_error == 'could not open port'
+    assert (r2.errors, r2.lost_frames) == (2, 3)
+    assert manager.events.empty()
+
+
+def test_drain_is_bounded(manager):
+    manager.add_rig('R1', 'COM5', connect=False)
+    for _ in range(5):
+        manager.events.put(('R1', 'error', 'x', time.monotonic()))
+    manager.drain(limit=3)
+    assert manager.rigs['R1'].errors == 3
+    assert manager.events.qsize() == 2
+
+
+def events_until(events, kind, timeout=5.0):
+    """Events off the queue up to and including the first of kind"""
+    seen = []
+    deadline = time.monotonic() + timeout
+    while not seen or seen[-1][1] != kind:
+        seen.append(events.get(timeout=max(0.0, deadline - time.monotonic())))
+    return seen
+
+
+def test_text_rig_over_a_loopback_port():
+    events = queue.Queue()
+    reader = SerialRig('R1', 'loop://', 9600, events)
+    reader.start()
+    try:
+        assert events_until(events, 'connected')[-1][:3] == ('R1', 'connected', None)
+        assert reader.send(b"41\n")
+        assert events_until(events, 'count')[-1][:3] == ('R1', 'count', 41)
+        reader.send(b"oops\n")
+        assert events_until(events, 'error')[-1][:3] == ('R1', 'error', 'oops')
+    finally:
+        reader.stop()
+        reader.join(timeout=5)
+    assert not reader.is_alive()
+    assert reader.serial is None
+
+
+def test_framed_rig_reports_counts_and_lost_frames():
+    events = queue.Queue()
+    reader = SerialRig('R1', 'loop://', 9600, events, protocol='framed')
+    reader.start()
+    try:
+        events_until(events, 'connected')
+        # the b"framed" command comes back on the loopback too; the decoder skips it
+        reader.send(encode_frame(0, [(1, 1000), (2, 2000)]))
+        counts = [event[2] for event in events_until(events, 'count')]
+        counts += [event[2] for event in events_until(events, 'count')]
+        assert counts == [1, 2]
+        reader.send(encode_frame(3, [(7, 7000)]))
+        seen = events_until(events, 'lost')
+        assert ('R1', 'count', 7) in [event[:3] for event in seen]
+        assert seen[-1][2] == 2
+    finally:
+        reader.stop()
+        reader.join(timeout=5)
+
+
+def test_unopenable_port_is_reported_and_retried():
+    events = queue.Queue()
+    reader = SerialRig('R1', 'socket://127.0.0.1:1', 9600, events)
+    reader.start()
+    try:
+        rig_id, kind, error, _ = events.get(timeout=5)
+        assert (rig_id, kind) == ('R1', 'disconnected') and error
+    finally:
+        reader.stop()
+        reader.join(timeout=5)
+    assert not reader.is_alive()
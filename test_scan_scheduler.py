@@ -0,0 +1,121 @@
+import os
+from types import SimpleNamespace
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+import scan_scheduler
+from scan_scheduler import ScanScheduler, POLL_CLASSES
+
+app = QApplication.instance() or QApplication([])
+
+
+class Clock:
+    """A monotonic clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scan_scheduler, 'time', SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+@pytest.fixture
+def scheduler(clock):
+    scheduler = ScanScheduler()
+    yield scheduler
+    scheduler.timer.stop()
+
+
+def job_taking(clock, seconds, starts, result=None):
+    """A scan callback that records its start time and takes seconds[i] on its i-th run"""
+    def callback():
+        starts.append(clock.now)
+        clock.now += seconds[min(len(starts), len(seconds)) - 1]
+        return result
+    return callback
+
+
+def run_until(scheduler, clock, end):
+    """Step the clock from deadline to deadline, as the timer would"""
+    while True:
+        deadline = min(job.next_deadline for job in scheduler.jobs.values() if not job.paused)
+        if deadline > end:
+            return
+        clock.now = max(clock.now, deadline)
+        scheduler.run_due()
+
+
+def test_deadlines_do_not_drift_with_callback_time(scheduler, clock):
+    starts = []
+    scheduler.add('fixed rate', job_taking(clock, [0.3], starts), 'normal')
+    run_until(scheduler, clock, 1008.0)
+    assert starts == pytest.approx([1000.0, 1002.0, 1004.0, 1006.0, 1008.0])
+
+
+def test_overrun_skips_the_missed_deadlines(scheduler, clock):
+    starts = []
+    job = scheduler.add('overrun', job_taking(clock, [0.1, 5.0, 0.1], starts), 'normal')
+    run_until(scheduler, clock, 1010.0)
+    # the 1004 and 1006 scans are dropped, not run late in a burst
+    assert starts == pytest.approx([1000.0, 1002.0, 1008.0, 1010.0])
+    assert job.overruns.value == 1
+    assert job.skipped.value == 2
+
+
+def test_adaptive_interval_halves_on_change_and_backs_off_when_steady(scheduler, clock):
+    changed = [True] * 4 + [False] * 8
+    normal = POLL_CLASSES['normal']
+
+    def callback():
+        return changed.pop(0)
+
+    job = scheduler.add('adaptive', callback, 'normal', adaptive=True)
+    intervals = []
+    while changed:
+        clock.now = job.next_deadline
+        scheduler.run_due()
+        intervals.append(job.interval)
+    assert intervals == pytest.approx([1.0, 0.5, 0.5, 0.5, 0.75, 1.125, 1.6875, 2.53125, 3.796875, 5.0, 5.0, 5.0])
+    assert min(intervals) == normal.min_ms / 1000.0 and max(intervals) == normal.max_ms / 1000.0
+    assert job.interval_gauge.value == 5.0
+
+
+def test_failed_or_fixed_jobs_keep_their_interval(scheduler, clock):
+    def fails():
+        raise RuntimeError('no reply')
+
+    failing = scheduler.add('failing', fails, 'fast', adaptive=True)
+    fixed = scheduler.add('fixed', lambda: True, 'fast')
+    scheduler.run_due()
+    assert failing.interval == fixed.interval == 1.0
+    assert failing.next_deadline == fixed.next_deadline == 1001.0
+
+
+def test_paused_job_is_not_run_until_resumed(scheduler, clock):
+    starts = []
+    job = scheduler.add('paused', job_taking(clock, [0.0], starts), 'slow', start=False)
+    other = scheduler.add('other', lambda: None, 'slow')
+    scheduler.run_due()
+    assert starts == []
+    clock.now += 3.0
+    scheduler.resume(job, run_now=False)
+    assert job.next_deadline == 1013.0
+    clock.now = other.next_deadline
+    scheduler.run_due()
+    assert starts == []
+    clock.now = job.next_deadline
+    scheduler.run_due()
+    assert starts == [1013.0]
+    scheduler.pause(job)
+    clock.now += 60.0
+    scheduler.run_due()
+    assert starts == [1013.0]
@@ -0,0 +1,83 @@
+import pytest
+from serial_protocol import FrameDecoder, DeviceClock, encode_frame, SYNC
+
+
+def frames(first_seq, count, per_frame=2):
+    """Consecutive frames and the samples they carry"""
+    data, samples = b'', []
+    for seq in range(first_seq, first_seq + count):
+        batch = [(seq * per_frame + i, 1000 * (seq * per_frame + i)) for i in range(per_frame)]
+        data += encode_frame(seq, batch)
+        samples += [(n, ms / 1000.0) for n, ms in batch]
+    return data, samples
+
+
+def test_decodes_frames():
+    data, samples = frames(0, 3)
+    decoder = FrameDecoder()
+    assert decoder.feed(data) == samples
+    assert (decoder.lost, decoder.errors) == (0, 0)
+    assert decoder.buffer == b''
+
+
+@pytest.mark.parametrize('chunk', [1, 2, 5, 13])
+def test_split_frames_wait_for_the_rest(chunk):
+    data, samples = frames(0, 4)
+    decoder = FrameDecoder()
+    decoded = []
+    for i in range(0, len(data), chunk):
+        decoded += decoder.feed(data[i:i + chunk])
+    assert decoded == samples
+    assert decoder.errors == 0
+
+
+def test_resyncs_after_garbage():
+    # stray sync bytes and a header-sized run of junk in front, junk between frames
+    garbage = b'\x00\xff' + SYNC + b'\x07\x01' + SYNC[:1] + b'junk'
+    first = encode_frame(0, [(1, 1000)])
+    decoder = FrameDecoder()
+    assert decoder.feed(garbage + first + b'\xa5\xa5\x5a' + encode_frame(1, [(2, 2000)])) == [(1, 1.0), (2, 2.0)]
+    assert decoder.lost == 0
+
+
+def test_bad_crc_is_rejected_and_the_next_frame_kept():
+    good, samples = frames(0, 1)
+    corrupted = bytearray(encode_frame(1, [(5, 5000)]))
+    corrupted[8] ^= 0x01
+    decoder = FrameDecoder()
+    assert decoder.feed(good + bytes(corrupted) + encode_frame(2, [(6, 6000)])) == samples + [(6, 6.0)]
+    assert decoder.errors >= 1
+    # the corrupted frame shows as a gap in the sequence
+    assert decoder.lost == 1
+
+
+def test_text_lines_before_framing_are_skipped():
+    # the device may still send count lines until it has switched to frames
+    data, samples = frames(0, 2)
+    decoder = FrameDecoder()
+    assert decoder.feed(b'41\r\n42\r\n' + data[:10]) == []
+    assert decoder.feed(data[10:] + b'43\r\n') == samples
+    assert decoder.buffer == b''
+    assert decoder.errors == 0
+
+
+def test_sequence_gap_and_wrap():
+    decoder = FrameDecoder()
+    decoder.feed(encode_frame(0xFFFE, [(1, 1)]) + encode_frame(0xFFFF, [(2, 2)]) + encode_frame(0, [(3, 3)]))
+    assert decoder.lost == 0
+    decoder.feed(encode_frame(3, [(4, 4)]))
+    assert decoder.lost == 2
+
+
+def test_device_millis_unwrap_across_rollover():
+    decoder = FrameDecoder()
+    samples = decoder.feed(encode_frame(0, [(1, 0xFFFFFC18), (2, 0x000003E8)]))
+    assert samples[1][1] - samples[0][1] == pytest.approx(2.0)
+
+
+def test_clock_keeps_device_spacing():
+    clock = DeviceClock(max_lag=5.0)
+    mapped = clock.to_host([(1, 10.0), (2, 10.25), (3, 11.0)], now=100.0)
+    assert [at for _, at in mapped] == [99.0, 99.25, 100.0]
+    # a device clock running fast is pulled back so no sample lands in the future
+    assert clock.to_host([(4, 20.0)], now=101.0) == [(4, 101.0)]
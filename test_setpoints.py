@@ -0,0 +1,232 @@
+import os
+import math
+import time
+import sqlite3
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+from acquisition import ScanGroup
+from register_codec import RegisterCodec, encode_value
+from setpoints import SetpointController, plan_writes
+from tags import SETPOINT_TAGS
+
+app = QApplication.instance() or QApplication([])
+
+TAGS = {tag.name: tag for tag in SETPOINT_TAGS}
+
+
+class FakeAcquisition:
+    """The setpoints scan group over a register map that write_multiple_registers changes
+
+    held {address: register} are registers the PLC keeps whatever is written;
+    writes starting at a refused address fail.
+    """
+
+    def __init__(self, held=None, refused=()):
+        codec = RegisterCodec(SETPOINT_TAGS)
+        self.groups = {'setpoints': ScanGroup('setpoints', 'read_holding_registers', codec.base, codec.count, codec)}
+        self.registers = [0] * codec.count
+        self.held = held or {}
+        self.refused = set(refused)
+        self.replaying = False
+        self.sent = []
+
+    def subscribe(self, name, callback):
+        group = self.groups[name]
+        if callback not in group.subscribers:
+            group.subscribers.append(callback)
+            if group.snapshot is not None:
+                callback(group.snapshot)
+
+    def unsubscribe(self, name, callback):
+        if callback in self.groups[name].subscribers:
+            self.groups[name].subscribers.remove(callback)
+
+    def snapshot(self, name):
+        return self.groups[name].snapshot
+
+    def execute(self, requests):
+        self.sent.append(requests)
+        base = self.groups['setpoints'].address
+        results = []
+        for function, address, registers in requests:
+            assert function == 'write_multiple_registers'
+            if address in self.refused:
+                results.append(None)
+                continue
+            self.registers[address - base:address - base + len(registers)] = registers
+            results.append(True)
+        return results
+
+    def scan(self, timestamp=None):
+        group = self.groups['setpoints']
+        for address, register in self.held.items():
+            self.registers[address - group.address] = register
+        group.raw = list(self.registers)
+        group.timestamp = time.time() if timestamp is None else timestamp
+        group.snapshot = group.codec.decode(group.raw)
+        for callback in list(group.subscribers):
+            callback(group.snapshot)
+
+
+@pytest.fixture
+def plc():
+    return FakeAcquisition()
+
+
+@pytest.fixture
+def audit_path(tmp_path):
+    return str(tmp_path / 'setpoint_audit.db')
+
+
+@pytest.fixture
+def controller(plc, audit_path):
+    controller = SetpointController(plc, audit_path=audit_path)
+    controller.results = []
+    controller.result.connect(lambda *result: controller.results.append(result))
+    yield controller
+    controller.close()
+
+
+def audit(controller, path):
+    assert controller.audit.flush()
+    db = sqlite3.connect(path)
+    rows = db.execute('SELECT batch, tag, source, previous, value, status, readback, latency_ms, detail '
+                      'FROM setpoint_audit ORDER BY batch, tag').fetchall()
+    db.close()
+    return rows
+
+
+def test_plan_writes_splits_at_gaps():
+    requests = plan_writes([(5, [4], 'c'), (0, [1], 'a'), (1, [2, 3], 'b'), (3, [9], 'd')])
+    assert requests == [(0, [1, 2, 3, 9], ['a', 'b', 'd']), (5, [4], ['c'])]
+
+
+def test_plan_writes_stops_at_the_register_limit():
+    requests = plan_writes([(address, [address], address) for address in range(130)])
+    assert [(address, len(registers)) for address, registers, _ in requests] == [(0, 123), (123, 7)]
+    # a two-register value that would cross the limit starts the next request whole
+    requests = plan_writes([(address, [0], address) for address in range(122)] + [(122, [1, 2], 'float')])
+    assert [(address, len(registers)) for address, registers, _ in requests] == [(0, 122), (122, 2)]
+
+
+def test_check_reports_every_bad_entry(controller):
+    checked, problems = controller.check({'TSP001': '420', 'TSP002': 100, 'TSP003': math.nan, 'VC001': 'open',
+                                          'XYZ001': 1, 'FSP001': 50})
+    assert checked == {'TSP001': (420.0, encode_value(TAGS['TSP001'], 420.0)),
+                       'FSP001': (50.0, encode_value(TAGS['FSP001'], 50.0))}
+    assert [name for name, _ in problems] == ['TSP002', 'TSP003', 'VC001', 'XYZ001']
+    assert 'outside 150 .. 550 °C' in problems[0][1]
+    assert 'not a number' in problems[1][1] and 'not a number' in problems[2][1]
+    assert 'not a setpoint' in problems[3][1]
+
+
+def test_rejected_batch_writes_nothing_and_audits_every_entry(controller, plc, audit_path):
+    with pytest.raises(ValueError, match='TSP002'):
+        controller.submit({'TSP001': 420, 'TSP002': 9999, 'XYZ001': 1}, source='recipe')
+    assert controller.flush() is None
+    assert plc.sent == []
+    assert sorted(controller.results) == [('TSP001', 'rejected', 'not sent: the batch had a bad entry'),
+                                          ('TSP002', 'rejected', 'TSP002: 9999 is outside 150 .. 550 °C'),
+                                          ('XYZ001', 'rejected', 'XYZ001: not a setpoint')]
+    rows = audit(controller, audit_path)
+    assert len({row[0] for row in rows}) == 1
+    assert [(tag, source, value, status) for _, tag, source, _, value, status, *_ in rows] == [
+        ('TSP001', 'recipe', 420.0, 'rejected'), ('TSP002', 'recipe', 9999.0, 'rejected'),
+        ('XYZ001', 'recipe', 1.0, 'rejected')]
+
+
+def test_batch_is_written_together_and_verified_by_the_next_scan(controller, plc, audit_path):
+    plc.scan()
+    controller.submit({'TSP001': 420, 'VC003': 35.5, 'FSP001': 12.5})
+    batch = controller.flush()
+    # one pipelined call; the registers between the three aren't overwritten
+    assert [[(address, len(registers)) for _, address, registers in requests] for requests in plc.sent] == \
+        [[(100, 1), (110, 2), (116, 1)]]
+    assert controller.results == []
+
+    plc.scan()
+    assert sorted(controller.results) == [('FSP001', 'verified', ''), ('TSP001', 'verified', ''),
+                                          ('VC003', 'verified', '')]
+    assert not controller.pending and controller.scanned not in plc.groups['setpoints'].subscribers
+    rows = audit(controller, audit_path)
+    assert [(b, tag, previous, value, status, readback) for b, tag, _, previous, value, status, readback, *_ in rows] \
+        == [(batch, 'FSP001', 0.0, 12.5, 'verified', 12.5), (batch, 'TSP001', 0.0, 420.0, 'verified', 420.0),
+            (batch, 'VC003', 0.0, 35.5, 'verified', 35.5)]
+    assert all(row[7] is not None and row[7] >= 0 for row in rows)
+
+
+def test_snapshot_handed_over_on_subscribing_is_ignored(plc, audit_path):
+    controller = SetpointController(plc, audit_path=audit_path, verify_scans=1)
+    results = []
+    controller.result.connect(lambda *result: results.append(result))
+    # the last scan, from before the write, doesn't show the new value
+    plc.scan(timestamp=time.time() - 10)
+    controller.submit({'TSP001': 420})
+    controller.flush()
+    assert results == [] and 'TSP001' in controller.pending
+
+    plc.scan()
+    assert results == [('TSP001', 'verified', '')]
+    controller.close()
+
+
+def test_value_the_plc_overrides_is_a_mismatch_after_verify_scans(controller, plc, audit_path):
+    # the PLC clamps TSP001 to 500.0 °C
+    plc.held = {100: encode_value(TAGS['TSP001'], 500.0)[0]}
+    controller.submit({'TSP001': 540, 'TSP002': 300})
+    batch = controller.flush()
+    plc.scan()
+    assert controller.results == [('TSP002', 'verified', '')]
+    plc.scan()
+    assert 'TSP001' in controller.pending
+    plc.scan()
+    assert controller.results[-1] == ('TSP001', 'mismatch', 'the PLC shows 500 °C')
+    assert not controller.pending
+    rows = audit(controller, audit_path)
+    assert rows[0][:2] == (batch, 'TSP001') and rows[0][5:7] == ('mismatch', 500.0)
+
+
+def test_refused_write_fails(plc, audit_path):
+    plc.refused = {100}
+    controller = SetpointController(plc, audit_path=audit_path)
+    results = []
+    controller.result.connect(lambda *result: results.append(result))
+    controller.submit({'TSP001': 420})
+    controller.flush()
+    assert results == [('TSP001', 'failed', 'the PLC refused the write')]
+    assert not controller.pending
+    assert audit(controller, audit_path)[0][5] == 'failed'
+    controller.close()
+
+
+def test_later_write_supersedes_an_unverified_one(controller, plc, audit_path):
+    controller.submit({'TSP001': 420})
+    first = controller.flush()
+    controller.submit({'TSP001': 430})
+    second = controller.flush()
+    assert controller.results == [('TSP001', 'superseded', f"replaced by batch {second}")]
+    plc.scan()
+    assert controller.results[-1] == ('TSP001', 'verified', '')
+    rows = audit(controller, audit_path)
+    assert [(batch, value, status) for batch, _, _, _, value, status, *_ in rows] == [
+        (first, 420.0, 'superseded'), (second, 430.0, 'verified')]
+
+
+def test_entry_replaced_before_it_was_sent_is_audited(controller, plc, audit_path):
+    plc.scan()
+    controller.submit({'TSP001': 420, 'TSP002': 300}, source='Set Points')
+    assert controller.results == []
+    controller.submit({'TSP001': 430}, source='recipe')
+    assert controller.results == [('TSP001', 'superseded', 'replaced by 430 from recipe before it was sent')]
+    sent = controller.flush()
+    assert [registers for _, _, registers in plc.sent[0]] == [encode_value(TAGS['TSP001'], 430.0)
+                                                              + encode_value(TAGS['TSP002'], 300.0)]
+    plc.scan()
+    rows = audit(controller, audit_path)
+    assert [(tag, source, value, status) for _, tag, source, _, value, status, *_ in rows] == [
+        ('TSP001', 'Set Points', 420.0, 'superseded'), ('TSP001', 'recipe', 430.0, 'verified'),
+        ('TSP002', 'Set Points', 300.0, 'verified')]
+    assert rows[0][0] < sent == rows[1][0]
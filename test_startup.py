@@ -0,0 +1,20 @@
+import os
+import sys
+import statistics
+import pytest
+
+# The budget and the lazy modules are the startup benchmark's, so the two can't disagree
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+from bench_startup import IMPORT_BUDGET, LAZY_MODULES, import_profile
+
+
+@pytest.mark.parametrize('module', ['sample', 'arduino'])
+def test_app_imports_within_budget_without_lazy_modules(module):
+    samples = []
+    for _ in range(3):
+        total, imported = import_profile(module)
+        eager = LAZY_MODULES & imported
+        assert not eager, f"{module} imports {sorted(eager)} at startup"
+        samples.append(total)
+    median = statistics.median(samples)
+    assert median < IMPORT_BUDGET, f"import {module} took {median:.3f}s (budget {IMPORT_BUDGET}s)"
@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+from tags import Tag, MassBalance, STUCK_SECONDS
+from tag_analytics import TagAnalytics, STUCK, SPIKE, DRIFT
+
+T001 = Tag('T001', 'temperatures', 0, 'int16', 0.1, 0.0, '°C')
+FLOWS = [Tag('F001', 'flows', 0, 'uint16', 0.01, 0.0, 'm³/h'), Tag('F002', 'flows', 1, 'uint16', 0.01, 0.0, 'm³/h'),
+         Tag('L001', 'levels', 2, 'uint16', 0.1, 0.0, 'cm')]
+
+
+def analytics(tags=(T001,), balances=(), **kwargs):
+    analytics = TagAnalytics(tags, balances, **kwargs)
+    analytics.events, analytics.leaks = [], []
+    analytics.anomaly.connect(lambda *event: analytics.events.append(event))
+    analytics.balance.connect(lambda *event: analytics.leaks.append(event))
+    return analytics
+
+
+def feed(analytics, values, start=0.0, period=1.0):
+    """One scan of the first tag per value; returns the time of the next"""
+    slots = np.array([0])
+    for i, value in enumerate(values):
+        analytics.update(slots, [value], start + i * period)
+    return start + len(values) * period
+
+
+def test_warmup_gives_the_plain_running_mean_and_variance():
+    rng = np.random.default_rng(1)
+    values = 400.0 + rng.normal(0.0, 3.0, 30)
+    tracker = analytics()
+    for n in range(1, len(values) + 1):
+        feed(tracker, values[n - 1:n], start=n - 1.0)
+        value, mean, deviation, _, _ = tracker.state('T001')
+        assert mean == pytest.approx(np.mean(values[:n]), rel=1e-12)
+        assert deviation ** 2 == pytest.approx(np.var(values[:n]), rel=1e-9, abs=1e-12)
+
+
+def test_spike_is_raised_and_cleared():
+    rng = np.random.default_rng(2)
+    tracker = analytics()
+    now = feed(tracker, 300.0 + rng.normal(0.0, 0.5, 300))
+    assert tracker.events == []
+    now = feed(tracker, [310.0], start=now)
+    assert tracker.events == [('T001', 'spike', True)]
+    assert tracker.state('T001')[4] == SPIKE
+    feed(tracker, [300.0], start=now)
+    assert tracker.events[-1] == ('T001', 'spike', False)
+    assert tracker.state('T001')[4] == 0
+
+
+def test_stuck_after_its_groups_seconds():
+    limit = STUCK_SECONDS['temperatures']
+    tracker = analytics()
+    now = feed(tracker, [300.0] * (limit // 10 + 1), period=10.0)
+    assert tracker.events == []
+    now = feed(tracker, [300.0], start=now)
+    assert tracker.events == [('T001', 'stuck', True)]
+    assert tracker.state('T001')[4] == STUCK
+    feed(tracker, [300.1], start=now)
+    assert tracker.events[-1] == ('T001', 'stuck', False)
+
+
+def test_slow_ramp_drifts():
+    tracker = analytics()
+    now = feed(tracker, [300.0] * 600)
+    # 0.6 °C a minute: too slow for a spike
+    feed(tracker, np.round(300.0 + 0.01 * np.arange(1, 1201), 1), start=now)
+    assert [event for event in tracker.events if event[1] == 'spike'] == []
+    assert ('T001', 'drift', True) in tracker.events
+    assert tracker.state('T001')[4] & DRIFT
+
+
+def test_quantised_noise_stays_under_the_two_count_floor():
+    rng = np.random.default_rng(3)
+    tracker = analytics()
+    # a steady reading, then one count of dither, then a step of one count: each would alarm
+    # against the noise measured just before it without the floor
+    now = feed(tracker, [300.0] * 600)
+    now = feed(tracker, 300.0 + 0.1 * rng.integers(0, 2, 1800), start=now)
+    feed(tracker, [300.2] * 600, start=now)
+    assert tracker.events == []
+
+    unfloored = analytics()
+    unfloored.floor[:] = 0.0
+    now = feed(unfloored, [300.0] * 600)
+    feed(unfloored, [300.1], start=now)
+    assert ('T001', 'spike', True) in unfloored.events
+
+
+def scan_flows(tracker, rows, start=0.0):
+    slots = np.arange(3)
+    for i, row in enumerate(rows):
+        tracker.update(slots, row, start + i)
+    return start + len(rows)
+
+
+def test_mass_balance_leak_after_its_window_and_cleared():
+    loop = MassBalance('loop', ['F001'], ['F002'], [('L001', 0.05)], tolerance=0.5, window=600.0)
+    tracker = analytics(FLOWS, [loop])
+    # 2 m³/h more in than out, going into a level rising 40 cm an hour
+    now = scan_flows(tracker, [(10.0, 8.0, 100.0 + 40.0 * t / 3600.0) for t in range(1200)])
+    assert tracker.leaks == []
+    assert abs(tracker.imbalance[0]) < 0.05
+
+    # the level stops rising: 2 m³/h unaccounted for
+    level = 100.0 + 40.0 * 1200 / 3600.0
+    leak = scan_flows(tracker, [(10.0, 8.0, level)] * 150, start=now)
+    assert tracker.leaks == []
+    now = scan_flows(tracker, [(10.0, 8.0, level)] * 450, start=leak)
+    assert tracker.leaks == [('loop', True)]
+    assert tracker.imbalance[0] == pytest.approx(2.0 * (1.0 - np.exp(-600.0 / 600.0)), rel=0.01)
+
+    # in and out match again
+    scan_flows(tracker, [(10.0, 10.0, level)] * 1200, start=now)
+    assert tracker.leaks == [('loop', True), ('loop', False)]
+    assert not tracker.leaking[0]
+
+
+def test_mass_balance_waits_for_its_window():
+    loop = MassBalance('loop', ['F001'], ['F002'], [('L001', 0.05)], tolerance=0.5, window=600.0)
+    tracker = analytics(FLOWS, [loop])
+    # leaking from the first scan: only raised once the average covers the window
+    now = scan_flows(tracker, [(10.0, 8.0, 100.0)] * 599)
+    assert tracker.leaks == [] and tracker.imbalance[0] > 0.5
+    scan_flows(tracker, [(10.0, 8.0, 100.0)] * 2, start=now)
+    assert tracker.leaks == [('loop', True)]
@@ -0,0 +1,53 @@
+import os
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+import tag_config
+from acquisition import Acquisition
+from tag_config import TcAssignmentWindow, offset_decimals
+from tags import SETPOINT_TAGS
+
+app = QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def acquisition():
+    # Nothing is subscribed, so nothing is polled and no PLC is needed
+    return Acquisition(pipeline_window=1)
+
+
+def temperatures(acquisition):
+    return acquisition.groups['temperatures'].codec.tags
+
+
+def test_move_onto_another_groups_register_is_refused(acquisition):
+    tags = temperatures(acquisition)
+    moved = tags[0]._replace(address=SETPOINT_TAGS[0].address)
+    with pytest.raises(ValueError, match=SETPOINT_TAGS[0].name):
+        acquisition.reconfigure([moved])
+    assert temperatures(acquisition) == tags
+    assert acquisition.groups['overview'].codec.tags[0] == tags[0]
+
+
+def test_swap_within_a_group_is_accepted(acquisition):
+    first, second = temperatures(acquisition)[:2]
+    swapped = [first._replace(address=second.address), second._replace(address=first.address)]
+    assert acquisition.reconfigure(swapped) == ['temperatures', 'overview']
+    assert temperatures(acquisition)[:2] == swapped
+
+
+def test_apply_keeps_offsets_finer_than_a_tenth(acquisition, monkeypatch, tmp_path):
+    tag = temperatures(acquisition)[0]
+    fine = tag._replace(offset=-273.15)
+    monkeypatch.setitem(tag_config.DEFAULTS, tag.name, fine)
+    acquisition.reconfigure([fine])
+    assert offset_decimals(fine) == 2
+
+    window = TcAssignmentWindow(acquisition, path=str(tmp_path / 'tag_config.db'))
+    assert window.edited_tags() == temperatures(acquisition)
+    window.apply()
+    assert temperatures(acquisition)[0].offset == -273.15
+    assert not (tmp_path / 'tag_config.db').exists()
+    window.close()
@@ -0,0 +1,177 @@
+import os
+import time
+import signal
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from tag_snapshot import SnapshotPublisher, SnapshotClient, QUALITY_NONE, QUALITY_GOOD, QUALITY_BAD
+
+names = (f"igcar_test_{os.getpid()}_{i}" for i in itertools.count())
+
+
+class FakeAcquisition:
+    """The groups and observer hooks SnapshotPublisher uses"""
+
+    def __init__(self, groups):
+        self.groups = {}
+        for name, tags in groups.items():
+            if isinstance(tags, int):
+                self.groups[name] = SimpleNamespace(codec=None, count=tags)
+            else:
+                self.groups[name] = SimpleNamespace(codec=SimpleNamespace(tags=[SimpleNamespace(name=t) for t in tags]))
+        self.observers = []
+
+    def observe(self, callback):
+        self.observers.append(callback)
+
+    def unobserve(self, callback):
+        self.observers.remove(callback)
+
+
+GROUPS = {'temperatures': ['T001', 'T002', 'T003'], 'overview': ['T001', 'T003', 'P001'], 'valves': 2}
+
+
+@pytest.fixture
+def publisher():
+    publisher = SnapshotPublisher(FakeAcquisition(GROUPS), next(names))
+    yield publisher
+    publisher.close()
+
+
+def test_tags_share_slots(publisher):
+    client = SnapshotClient(publisher.name)
+    assert client.tags == ['T001', 'T002', 'T003', 'P001', 'valves.0', 'valves.1']
+    snapshot = client.read()
+    assert snapshot.sequence == 0
+    assert np.isnan(snapshot.values).all()
+    assert (snapshot.quality == QUALITY_NONE).all()
+    client.close()
+
+
+def test_publish_and_read(publisher):
+    client = SnapshotClient(publisher.name)
+    publisher.publish('temperatures', np.array([400.0, 410.0, 420.0]), 1000.0)
+    publisher.publish('overview', np.array([401.0, 421.0, 2.5]), 1001.0)
+
+    snapshot = client.read(['T003', 'T002', 'P001'])
+    assert snapshot.sequence == 2
+    assert snapshot.values.tolist() == [421.0, 410.0, 2.5]
+    assert snapshot.timestamps.tolist() == [1001.0, 1000.0, 1001.0]
+    assert (snapshot.quality == QUALITY_GOOD).all()
+
+    # a failed read keeps the last values but marks them bad
+    publisher.publish('temperatures', None, None)
+    snapshot = client.read(client.slots(['T001', 'P001']))
+    assert snapshot.values.tolist() == [401.0, 2.5]
+    assert snapshot.quality.tolist() == [QUALITY_BAD, QUALITY_GOOD]
+    client.close()
+
+
+def test_reader_times_out_on_a_writer_stuck_mid_update(publisher):
+    client = SnapshotClient(publisher.name, timeout=0.05)
+    publisher.layout.sequence[0] += 1
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        client.read()
+    assert time.monotonic() - start < 1.0
+    publisher.layout.sequence[0] += 1
+    assert client.read().sequence == 1
+    client.close()
+
+
+def publish_frames(publisher, frames):
+    """Child process: scan n writes n into every value and timestamp of the group"""
+    for frame in range(1, frames + 1):
+        publisher.publish('temperatures', np.full(3, float(frame)), float(frame))
+    os._exit(0)
+
+
+def test_reads_are_consistent_while_another_process_publishes(publisher):
+    client = SnapshotClient(publisher.name)
+    writer = multiprocessing.get_context('fork').Process(target=publish_frames, args=(publisher, 200000))
+    writer.start()
+    reads, last = 0, 0
+    while writer.is_alive() or reads == 0:
+        snapshot = client.read(['T001', 'T002', 'T003'])
+        reads += 1
+        if snapshot.sequence:
+            # every slot from the same scan, and that scan is the one the sequence says
+            assert len(set(snapshot.values.tolist() + snapshot.timestamps.tolist())) == 1
+            assert snapshot.values[0] == snapshot.sequence
+        assert snapshot.sequence >= last
+        last = snapshot.sequence
+    writer.join()
+    assert writer.exitcode == 0
+    assert reads > 1
+    assert client.read().sequence == 200000
+    client.close()
+
+
+def test_client_follows_a_restarted_publisher():
+    name = next(names)
+    publisher = SnapshotPublisher(FakeAcquisition(GROUPS), name)
+    client = SnapshotClient(name)
+    publisher.publish('temperatures', np.array([1.0, 2.0, 3.0]), 10.0)
+    publisher.close()
+
+    with pytest.raises(FileNotFoundError):
+        client.read()
+
+    publisher = SnapshotPublisher(FakeAcquisition({'temperatures': ['T001', 'T002', 'T003']}), name)
+    publisher.publish('temperatures', np.array([7.0, 8.0, 9.0]), 20.0)
+    assert client.read(['T002']).values.tolist() == [8.0]
+    client.close()
+    publisher.close()
+
+
+def publish_and_crash(name, ready):
+    """Child process: publish one scan, then die without closing the segment"""
+    publisher = SnapshotPublisher(FakeAcquisition({'temperatures': ['T001', 'T002', 'T003']}), name)
+    publisher.publish('temperatures', np.array([1.0, 2.0, 3.0]), 10.0)
+    ready.set()
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def crashed_publisher(name):
+    context = multiprocessing.get_context('fork')
+    ready = context.Event()
+    child = context.Process(target=publish_and_crash, args=(name, ready))
+    child.start()
+    assert ready.wait(10)
+    return child
+
+
+def test_client_follows_a_publisher_restarted_after_a_crash():
+    name = next(names)
+    child = crashed_publisher(name)
+    client = SnapshotClient(name)
+    assert client.read(['T002']).values.tolist() == [2.0]
+    child.join()
+    assert child.exitcode == -signal.SIGKILL
+
+    # the new publisher marks the crashed one's segment closed before replacing it
+    publisher = SnapshotPublisher(FakeAcquisition({'temperatures': ['T001', 'T002', 'T003']}), name)
+    publisher.publish('temperatures', np.array([7.0, 8.0, 9.0]), 20.0)
+    snapshot = client.read(['T002'])
+    assert snapshot.values.tolist() == [8.0]
+    assert snapshot.quality.tolist() == [QUALITY_GOOD]
+    client.close()
+    publisher.close()
+
+
+def test_client_notices_a_crashed_publisher():
+    name = next(names)
+    child = crashed_publisher(name)
+    client = SnapshotClient(name, check_interval=0.0)
+    assert client.read(['T002']).values.tolist() == [2.0]
+    child.join()
+
+    with pytest.raises(FileNotFoundError):
+        client.read()
+    with pytest.raises(FileNotFoundError):
+        SnapshotClient(name)
+    client.close()
+    shared_memory.SharedMemory(name).unlink()
@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import base64
+import asyncio
+import itertools
+from datetime import datetime
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from db_writer import DatabaseWriter
+from cycle_db import COUNTER_SCHEMA
+from tag_snapshot import Snapshot, SnapshotPublisher, QUALITY_GOOD, QUALITY_BAD
+from web_view import CycleCache, TagCache, WebView, STALE_AFTER
+
+names = (f"igcar_web_{os.getpid()}_{i}" for i in itertools.count())
+TAGS = ['T001', 'T002', 'P001']
+
+
+@pytest.fixture
+def counter_db(tmp_path):
+    path = str(tmp_path / 'cycle_counter.db')
+    writer = DatabaseWriter(path, COUNTER_SCHEMA, flush_interval=0.0).start()
+    yield path, writer
+    writer.close()
+
+
+def test_counter_tab_session_on_a_port(counter_db):
+    path, writer = counter_db
+    start = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    # As the Counter tab saves a session on COM4: a quick save part way through, then the completed count
+    writer.execute('INSERT OR REPLACE INTO current_session (id, current_count, last_updated, session_start, '
+                   'is_running, was_crashed, rig_id) VALUES (1, 120, ?, ?, 1, 0, ?)', (start, start, 'COM4'))
+    for count, status in ((50, 'Quick Save'), (120, 'Completed')):
+        writer.execute('INSERT INTO cycle_data (timestamp, cycle_count, status, rig_id, session_start) '
+                       'VALUES (?, ?, ?, ?, ?)', (start, count, status, 'COM4', start))
+    # and a rig manager session the same day
+    writer.execute('INSERT INTO rig_sessions (rig_id, session_start, port, current_count, last_updated, is_running) '
+                   'VALUES (?, ?, ?, ?, ?, 1)', ('R1', start, 'COM5', 7, start))
+    writer.execute('INSERT INTO cycle_data (timestamp, cycle_count, status, rig_id, session_start) '
+                   'VALUES (?, ?, ?, ?, ?)', (start, 7, 'Quick Save', 'R1', start))
+    assert writer.flush()
+
+    cycles = CycleCache(path).read()
+    assert [(rig['rig'], rig['count'], rig['running']) for rig in cycles['rigs']] == [('COM4', 120, True),
+                                                                                     ('R1', 7, True)]
+    # the page looks each rig's total up by the label it shows
+    assert {rig['rig']: cycles['today'].get(rig['rig']) for rig in cycles['rigs']} == {'COM4': 120, 'R1': 7}
+    assert cycles['today'] == {'COM4': 120, 'R1': 7}
+
+
+def test_rows_saved_before_rigs_were_recorded(counter_db):
+    path, writer = counter_db
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    writer.execute('INSERT INTO current_session (id, current_count, session_start, is_running) VALUES (1, 30, ?, 0)',
+                   (now,))
+    writer.execute('INSERT INTO cycle_data (timestamp, cycle_count, status) VALUES (?, ?, ?)', (now, 30, 'Completed'))
+    assert writer.flush()
+
+    cycles = CycleCache(path).read()
+    assert cycles['rigs'][0]['rig'] == ''
+    assert cycles['today'] == {'': 30}
+
+
+def snapshot(sequence, values, quality=QUALITY_GOOD, published=None):
+    values = np.array(values, dtype=float)
+    return Snapshot(sequence, time.time() if published is None else published, values,
+                    np.full(len(values), 100.0 + sequence), np.full(len(values), quality, dtype=np.uint8))
+
+
+def test_tag_cache_full_and_delta_bodies():
+    cache = TagCache()
+    assert cache.update(snapshot(1, [1.0, 2.0, np.nan]), TAGS)
+    full = json.loads(cache.full)
+    assert full['full'] and full['online']
+    assert full['tags'] == {'T001': [1.0, 101.0, 'good'], 'T002': [2.0, 101.0, 'good'], 'P001': [None, 101.0, 'good']}
+    first = full['version']
+
+    # the same scan again is not a new version
+    assert not cache.update(snapshot(1, [1.0, 2.0, np.nan]), TAGS)
+    assert json.loads(cache.full)['version'] == first
+
+    scan = snapshot(2, [1.0, 2.5, np.nan])
+    scan.timestamps[[0, 2]] = 101.0
+    assert cache.update(scan, TAGS)
+    delta = json.loads(cache.delta)
+    assert not delta['full']
+    assert delta['tags'] == {'T002': [2.5, 102.0, 'good']}
+    assert cache.since(first) == cache.delta
+
+    # a failed read: value kept, quality bad
+    scan = snapshot(3, [1.0, 2.5, np.nan], QUALITY_BAD)
+    scan.timestamps[:] = [101.0, 102.0, 101.0]
+    cache.update(scan, TAGS)
+    assert json.loads(cache.delta)['tags'] == {name: [value, ts, 'bad'] for name, value, ts in
+                                               [('T001', 1.0, 101.0), ('T002', 2.5, 102.0), ('P001', None, 101.0)]}
+
+
+def test_since_tokens():
+    cache = TagCache()
+    cache.update(snapshot(1, [1.0, 2.0, 3.0]), TAGS)
+    oldest = cache.token()
+    for sequence, changed in ((2, 0), (3, 1), (4, 1)):
+        values = [1.0, 2.0, 3.0]
+        values[changed] = 10.0 + sequence
+        scan = snapshot(sequence, values)
+        scan.timestamps[:] = 101.0
+        scan.timestamps[changed] = 100.0 + sequence
+        cache.update(scan, TAGS)
+
+    # a viewer several scans behind gets every tag changed since its version
+    stale = json.loads(cache.since(oldest))
+    assert not stale['full'] and set(stale['tags']) == {'T001', 'T002'}
+    assert stale['tags']['T002'] == [14.0, 104.0, 'good']
+    # the current version: nothing changed since
+    assert json.loads(cache.since(cache.token()))['tags'] == {}
+    # another run of the server, a version from the future or garbage: everything
+    for token in ('0.1', f"{cache.instance}.99", f"{cache.instance}.x", 'junk'):
+        assert cache.since(token) == cache.full
+
+
+def test_tag_cache_goes_offline_and_back():
+    cache = TagCache()
+    cache.update(snapshot(1, [1.0, 2.0, 3.0]), TAGS)
+    assert cache.update(snapshot(1, [1.0, 2.0, 3.0]), TAGS, live=False)
+    body = json.loads(cache.full)
+    assert not body['online'] and body['tags']['T001'] == [1.0, 101.0, 'good']
+    assert not cache.update(snapshot(1, [1.0, 2.0, 3.0]), TAGS, live=False)
+    assert cache.update(snapshot(2, [1.0, 2.0, 3.0]), TAGS)
+    assert json.loads(cache.full)['online']
+
+
+class FakeAcquisition:
+    """The groups and observer hooks SnapshotPublisher uses"""
+
+    def __init__(self):
+        self.groups = {'process': SimpleNamespace(codec=SimpleNamespace(tags=[SimpleNamespace(name=t) for t in TAGS]))}
+
+    def observe(self, callback):
+        pass
+
+    def unobserve(self, callback):
+        pass
+
+
+@pytest.fixture
+def publisher():
+    publisher = SnapshotPublisher(FakeAcquisition(), next(names))
+    yield publisher
+    publisher.close()
+
+
+def test_stale_or_closed_snapshot_marks_the_view_offline(publisher, tmp_path):
+    view = WebView(publisher.name, str(tmp_path / 'missing.db'))
+    assert view.route('GET', '/api/tags', {})[0] == 503
+    publisher.publish('process', np.array([1.0, 2.0, 3.0]), 100.0)
+    assert view.poll_snapshot()
+    assert json.loads(view.tags.full)['online']
+
+    # the HMI hung: its segment is still there but nothing new is published
+    publisher.layout.published[0] = time.time() - STALE_AFTER - 1
+    assert view.poll_snapshot()
+    assert not json.loads(view.tags.full)['online']
+    assert not view.poll_snapshot()
+
+    publisher.publish('process', np.array([1.0, 2.0, 4.0]), 101.0)
+    assert view.poll_snapshot()
+    assert json.loads(view.tags.full)['online']
+
+    publisher.close()
+    assert view.poll_snapshot()
+    assert not json.loads(view.tags.full)['online']
+    assert view.client is None
+
+
+async def get(port, target, headers=()):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    lines = [f"GET {target} HTTP/1.1", "Host: localhost", "Connection: close", *headers]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+    raw = await reader.read()
+    writer.close()
+    head, _, body = raw.partition(b'\r\n\r\n')
+    status_line, *header_lines = head.decode().split('\r\n')
+    headers = dict(line.split(': ', 1) for line in header_lines)
+    return int(status_line.split()[1]), {k.lower(): v for k, v in headers.items()}, body
+
+
+async def read_ws_frame(reader):
+    first, second = await reader.readexactly(2)
+    size = second & 0x7F
+    if size == 126:
+        size = int.from_bytes(await reader.readexactly(2), 'big')
+    elif size == 127:
+        size = int.from_bytes(await reader.readexactly(8), 'big')
+    return first & 0x0F, json.loads(await reader.readexactly(size))
+
+
+async def until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_http_etags_and_websocket_frames(publisher, tmp_path):
+    async def scenario():
+        view = WebView(publisher.name, str(tmp_path / 'missing.db'), interval=0.01)
+        server = await view.start('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            publisher.publish('process', np.array([1.0, 2.0, 3.0]), 100.0)
+            await until(lambda: view.tags.sequence == publisher.layout.sequence[0] // 2)
+            status, headers, body = await get(port, '/api/tags')
+            assert status == 200 and json.loads(body)['full']
+            etag = headers['etag']
+            status, headers, body = await get(port, '/api/tags', [f"If-None-Match: {etag}"])
+            assert (status, body, headers['etag']) == (304, b'', etag)
+            version = json.loads((await get(port, '/api/tags'))[2])['version']
+
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            key = base64.b64encode(os.urandom(16)).decode()
+            writer.write((f"GET /ws HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n"
+                          f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n\r\n").encode())
+            assert (await reader.readuntil(b'\r\n\r\n')).startswith(b'HTTP/1.1 101')
+            await until(lambda: view.viewers)
+
+            # full snapshot first, then the cycle counts
+            opcode, message = await read_ws_frame(reader)
+            assert (opcode, message['type'], message['full']) == (1, 'tags', True)
+            assert set(message['tags']) == set(TAGS)
+            opcode, message = await read_ws_frame(reader)
+            assert message['type'] == 'cycles'
+
+            # then one delta per scan with only the changed tags
+            publisher.publish('process', np.array([1.0, 2.5, 3.0]), 100.0)
+            opcode, message = await read_ws_frame(reader)
+            assert (message['type'], message['full']) == ('tags', False)
+            assert message['tags'] == {'T002': [2.5, 100.0, 'good']}
+
+            status, headers, body = await get(port, f"/api/tags?since={version}")
+            assert status == 200 and headers['etag'] == view.tags.etag() + '-d'
+            assert json.loads(body)['tags'] == {'T002': [2.5, 100.0, 'good']}
+            status, _, _ = await get(port, f"/api/tags?since={version}", [f"If-None-Match: {headers['etag']}"])
+            assert status == 304
+            writer.close()
+        finally:
+            await view.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,400 @@
+import math
+import time
+from datetime import datetime
+import numpy as np
+from PyQt5.QtWidgets import (QWidget, QDialog, QHBoxLayout, QVBoxLayout, QListWidget, QListWidgetItem, QComboBox,
+                             QLabel, QPushButton)
+from PyQt5.QtCore import Qt, QTimer, QRect, QPointF
+from PyQt5.QtGui import QPainter, QPixmap, QColor, QPen, QPolygonF, QFont
+import metrics
+
+TRACE_COLOURS = ['#e6194b', '#3cb44b', '#ffe119', '#4363d8', '#f58231', '#911eb4',
+                 '#42d4f4', '#f032e6', '#bfef45', '#fabed4', '#469990', '#dcbeff']
+
+# Time spans the trend window offers, in seconds
+SPANS = [60, 300, 600, 1800]
+
+LEGEND_WIDTH = 180
+AXIS_HEIGHT = 20
+
+FRAME_SECONDS = metrics.REGISTRY.histogram('trend_frame_seconds', 'Time to draw one trend frame onto the canvas')
+FULL_REDRAWS = metrics.REGISTRY.counter('trend_full_redraws_total', 'Trend frames that redrew every point')
+
+
+def polyline(x, y):
+    """QPolygonF filled straight from NumPy arrays instead of a QPointF per point"""
+    polygon = QPolygonF(len(x))
+    buffer = polygon.data()
+    buffer.setsize(len(x) * 16)
+    points = np.frombuffer(buffer, np.float64).reshape(-1, 2)
+    points[:, 0] = x
+    points[:, 1] = y
+    return polygon
+
+
+def decimate(x, y):
+    """Min and max of y per pixel column of x, so drawing cost follows the width, not the points"""
+    columns = np.floor(x).astype(np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], columns[1:] != columns[:-1])))
+    ys = np.empty(2 * len(starts))
+    with np.errstate(invalid='ignore'):
+        ys[0::2] = np.fmin.reduceat(y, starts)
+        ys[1::2] = np.fmax.reduceat(y, starts)
+    return np.repeat(x[starts], 2), ys
+
+
+def finite_runs(mask):
+    """(start, stop) of each run of True in mask; gaps (failed reads) break the line"""
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], mask, [False])).astype(np.int8)))
+    return zip(edges[::2], edges[1::2])
+
+
+class RingBuffer:
+    """The last `capacity` scans of a group, in preallocated arrays
+
+    total counts every row ever appended, so a reader remembers how far it
+    got and since() hands it only the rows added after that.
+    """
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.values = np.full((capacity, width), np.nan)
+        self.total = 0
+
+    def append(self, timestamp, row):
+        i = self.total % self.capacity
+        self.times[i] = timestamp
+        self.values[i] = row
+        self.total += 1
+
+    def clear(self):
+        self.total = 0
+
+    @property
+    def last_time(self):
+        return self.times[(self.total - 1) % self.capacity] if self.total else None
+
+    def since(self, total):
+        """(first row number, times, values) of the rows after the first `total`, oldest first"""
+        start = max(total, self.total - self.capacity)
+        index = np.arange(start, self.total) % self.capacity
+        return start, self.times[index], self.values[index]
+
+
+class Trace:
+    def __init__(self, tag, group, column, colour):
+        self.name = tag.name
+        self.unit = tag.unit
+        self.group = group
+        self.column = column
+        self.pen = QPen(QColor(colour), 1)
+        # Fixed to the alarm band when the tag has one, otherwise fitted to the data
+        self.low, self.high = (tag.low, tag.high) if tag.low is not None and tag.high is not None else (None, None)
+        self.last = None
+        self.value = None
+
+    def fit(self, values):
+        """Widen the y range to cover values; returns whether it changed"""
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return False
+        low, high = values.min(), values.max()
+        if self.low is not None and self.low <= low and high <= self.high:
+            return False
+        if self.low is not None:
+            low, high = min(low, self.low), max(high, self.high)
+        # Generous headroom so a drifting value doesn't force a full redraw every few scans
+        pad = (high - low) * 0.25 or max(abs(high) * 0.1, 1.0)
+        self.low, self.high = low - pad, high + pad
+        return True
+
+
+class TrendWidget(QWidget):
+    """Live trend of selected tags from acquisition scan groups
+
+    Scans go into a preallocated NumPy ring per group as they arrive; nothing
+    is drawn then. A frame timer capped at max_fps draws onto a canvas
+    pixmap: the canvas is scrolled left by the time elapsed and only the
+    segments from each trace's last drawn point to the new points are
+    painted, so a frame's cost depends on the points added since the last
+    frame rather than on the span shown. Everything is redrawn only when the
+    span, size, trace selection or a trace's y range changes.
+
+    Each trace is scaled to its own y range (the tag's alarm band, widened
+    to fit the data); the legend shows the ranges and latest values. The
+    time axis is scan time, so replayed history trends the same way.
+    """
+
+    def __init__(self, acquisition, groups, seconds=600, max_fps=10, capacity=18000, parent=None):
+        super().__init__(parent)
+        self.acquisition = acquisition
+        self.seconds = seconds
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.setMinimumSize(400, 200)
+
+        self.tags = {}
+        self.rings = {}
+        self.callbacks = {}
+        for name in groups:
+            group = acquisition.groups[name]
+            for column, tag in enumerate(group.codec.tags):
+                self.tags.setdefault(tag.name, (tag, name, column))
+            self.rings[name] = RingBuffer(capacity, len(group.codec.tags))
+            self.callbacks[name] = lambda values, name=name: self.add_scan(name, values)
+
+        self.traces = []
+        self.drawn = {}
+        self.canvas = None
+        self.canvas_time = None
+        self.latest = None
+        self.pending = False
+        self.full_redraw = True
+
+        self.background = QColor('#101418')
+        self.grid_pen = QPen(QColor('#37474f'), 1, Qt.DotLine)
+        self.text_colour = QColor('#cfd8dc')
+        self.legend_font = QFont()
+        self.legend_font.setPointSize(8)
+
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setInterval(int(1000 / max_fps))
+        self.frame_timer.timeout.connect(self.frame)
+
+    def set_traces(self, names):
+        self.traces = [Trace(*self.tags[name], TRACE_COLOURS[i % len(TRACE_COLOURS)])
+                       for i, name in enumerate(names) if name in self.tags]
+        self.redraw()
+
+    def set_span(self, seconds):
+        self.seconds = seconds
+        self.redraw()
+
+    def redraw(self):
+        self.full_redraw = True
+        self.pending = True
+
+    def attach(self):
+        for name, callback in self.callbacks.items():
+            self.acquisition.subscribe(name, callback)
+        self.frame_timer.start()
+
+    def detach(self):
+        self.frame_timer.stop()
+        for name, callback in self.callbacks.items():
+            self.acquisition.unsubscribe(name, callback)
+
+    def add_scan(self, name, values):
+        ring = self.rings[name]
+        timestamp = self.acquisition.groups[name].timestamp or time.time()
+        if values is None:
+            # A failed read leaves a gap in the traces
+            values = np.nan
+        elif ring.last_time is not None and timestamp < ring.last_time:
+            # Replay jumped back: the buffered future no longer follows on
+            for other in self.rings.values():
+                other.clear()
+            self.latest = None
+            self.redraw()
+        elif ring.last_time == timestamp:
+            return
+        ring.append(timestamp, values)
+        self.latest = timestamp if self.latest is None else max(self.latest, timestamp)
+        self.pending = True
+
+    # Drawing
+
+    @property
+    def plot_rect(self):
+        return QRect(0, 0, max(1, self.width() - LEGEND_WIDTH), max(1, self.height() - AXIS_HEIGHT))
+
+    def frame(self):
+        """Bring the canvas up to the newest scan; runs at most max_fps times a second"""
+        if not self.pending or self.latest is None:
+            return
+        self.pending = False
+        with FRAME_SECONDS.time():
+            if self.full_redraw or self.canvas is None or self.canvas.size() != self.plot_rect.size():
+                self.draw_all()
+            else:
+                self.draw_new()
+        self.update()
+
+    def x_of(self, times, width):
+        return width - (self.canvas_time - times) * (width / self.seconds)
+
+    def y_of(self, trace, values, height):
+        return height - (values - trace.low) / (trace.high - trace.low) * height
+
+    def draw_all(self):
+        FULL_REDRAWS.inc()
+        self.full_redraw = False
+        size = self.plot_rect.size()
+        if self.canvas is None or self.canvas.size() != size:
+            self.canvas = QPixmap(size)
+        self.canvas.fill(self.background)
+        self.canvas_time = self.latest
+        start = self.canvas_time - self.seconds
+
+        painter = QPainter(self.canvas)
+        painter.setRenderHint(QPainter.Antialiasing)
+        for name, ring in self.rings.items():
+            first, times, values = ring.since(0)
+            keep = times >= start
+            times, values = times[keep], values[keep]
+            self.drawn[name] = ring.total
+            for trace in (trace for trace in self.traces if trace.group == name):
+                column = values[:, trace.column]
+                trace.fit(column)
+                trace.last = None
+                trace.value = column[-1] if len(column) else None
+                if trace.low is None or not len(times):
+                    continue
+                self.draw_segments(painter, trace, times, column, size)
+        painter.end()
+
+    def draw_new(self):
+        size = self.plot_rect.size()
+        width = size.width()
+        shift = int((self.latest - self.canvas_time) * width / self.seconds)
+        if shift >= width:
+            return self.draw_all()
+        if shift > 0:
+            self.canvas.scroll(-shift, 0, self.canvas.rect())
+            painter = QPainter(self.canvas)
+            painter.fillRect(width - shift, 0, shift, size.height(), self.background)
+            painter.end()
+            self.canvas_time += shift * self.seconds / width
+
+        painter = QPainter(self.canvas)
+        painter.setRenderHint(QPainter.Antialiasing)
+        for name, ring in self.rings.items():
+            first, times, values = ring.since(self.drawn.get(name, 0))
+            # Points past the canvas's right edge wait for the next scroll, so nothing is drawn off-canvas
+            count = int(np.searchsorted(times, self.canvas_time, side='right'))
+            if not count:
+                continue
+            times, values = times[:count], values[:count]
+            self.drawn[name] = first + count
+            for trace in (trace for trace in self.traces if trace.group == name):
+                column = values[:, trace.column]
+                if trace.fit(column):
+                    painter.end()
+                    return self.draw_all()
+                trace.value = column[-1]
+                if trace.low is not None:
+                    self.draw_segments(painter, trace, times, column, size)
+        painter.end()
+
+    def draw_segments(self, painter, trace, times, values, size):
+        """Continue the trace from its last drawn point through the new points"""
+        if trace.last is not None:
+            times = np.concatenate(([trace.last[0]], times))
+            values = np.concatenate(([trace.last[1]], values))
+        x = self.x_of(times, size.width())
+        y = self.y_of(trace, values, size.height())
+        if len(x) > 2 * size.width():
+            x, y = decimate(x, y)
+        painter.setPen(trace.pen)
+        for start, stop in finite_runs(np.isfinite(y)):
+            if stop - start > 1:
+                painter.drawPolyline(polyline(x[start:stop], y[start:stop]))
+            else:
+                painter.drawPoint(QPointF(x[start], y[start]))
+        trace.last = (times[-1], values[-1]) if np.isfinite(values[-1]) else None
+
+    def resizeEvent(self, event):
+        self.redraw()
+        self.frame()
+        super().resizeEvent(event)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.background)
+        plot = self.plot_rect
+        if self.canvas is not None:
+            painter.drawPixmap(0, 0, self.canvas)
+
+        painter.setPen(self.grid_pen)
+        for i in range(1, 4):
+            y = plot.height() * i // 4
+            painter.drawLine(0, y, plot.width(), y)
+
+        painter.setFont(self.legend_font)
+        painter.setPen(self.text_colour)
+        if self.canvas_time is not None:
+            step = self.tick_step()
+            tick = math.floor(self.canvas_time / step) * step
+            while tick > self.canvas_time - self.seconds:
+                x = int(plot.width() - (self.canvas_time - tick) * plot.width() / self.seconds)
+                painter.drawLine(x, plot.height(), x, plot.height() + 4)
+                painter.drawText(QRect(x - 40, plot.height() + 4, 80, AXIS_HEIGHT - 4), Qt.AlignCenter,
+                                 datetime.fromtimestamp(tick).strftime('%H:%M:%S'))
+                tick -= step
+
+        y = 4
+        for trace in self.traces:
+            painter.fillRect(plot.width() + 8, y + 4, 10, 10, trace.pen.color())
+            painter.setPen(self.text_colour)
+            value = '--' if trace.value is None or not np.isfinite(trace.value) else f"{trace.value:.2f}"
+            painter.drawText(plot.width() + 24, y + 13, f"{trace.name}  {value} {trace.unit}")
+            if trace.low is not None:
+                painter.drawText(plot.width() + 24, y + 26, f"{trace.low:.1f} .. {trace.high:.1f}")
+            y += 32
+        painter.end()
+
+    def tick_step(self):
+        """A round number of seconds giving about six time labels"""
+        for step in (10, 15, 30, 60, 120, 300, 600, 900, 1800, 3600):
+            if self.seconds / step <= 6:
+                return step
+        return 3600
+
+
+class TrendWindow(QDialog):
+    def __init__(self, acquisition, groups, selected=10):
+        super().__init__()
+        self.setWindowTitle("Trends")
+        self.setGeometry(150, 150, 1100, 600)
+
+        self.trend = TrendWidget(acquisition, groups)
+
+        self.tag_list = QListWidget()
+        self.tag_list.setMaximumWidth(140)
+        for i, name in enumerate(self.trend.tags):
+            item = QListWidgetItem(name)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if i < selected else Qt.Unchecked)
+            self.tag_list.addItem(item)
+        self.tag_list.itemChanged.connect(self.selection_changed)
+
+        self.span = QComboBox()
+        for seconds in SPANS:
+            self.span.addItem(f"{seconds // 60} min", seconds)
+        self.span.setCurrentIndex(SPANS.index(self.trend.seconds))
+        self.span.currentIndexChanged.connect(lambda i: self.trend.set_span(self.span.itemData(i)))
+
+        side = QVBoxLayout()
+        side.addWidget(QLabel("Tags"))
+        side.addWidget(self.tag_list)
+        side.addWidget(QLabel("Span"))
+        side.addWidget(self.span)
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.close)
+        side.addWidget(close_btn)
+
+        layout = QHBoxLayout()
+        layout.addLayout(side)
+        layout.addWidget(self.trend, 1)
+        self.setLayout(layout)
+        self.selection_changed()
+
+    def selection_changed(self):
+        items = (self.tag_list.item(i) for i in range(self.tag_list.count()))
+        self.trend.set_traces([item.text() for item in items if item.checkState() == Qt.Checked])
+
+    def resume(self):
+        self.trend.attach()
+
+    def suspend(self):
+        self.trend.detach()
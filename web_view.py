@@ -0,0 +1,584 @@
+"""Read-only web view of the SFCT plant, for supervisors without the HMI
+
+    python web_view.py --port 8080                  this PC only
+    python web_view.py --host 0.0.0.0 --expose      every network the PC is on
+
+The server reads the HMI's shared tag snapshot (tag_snapshot.py) and
+cycle_counter.db, never the PLC. Responses are built once per scan, not
+once per viewer. Each new scan re-serialises the full snapshot and the
+delta from the previous scan. WebSocket viewers are all sent the same
+delta frame. Extra viewers only add socket writes.
+
+    /                   live page (WebSocket)
+    /api/tags           {"version", "online", "published", "full": true, "tags": {name: [value, time, quality]}}
+    /api/tags?since=V   the same with only the tags changed after version V ("full": false), or
+                        everything if V is from an earlier run of the server
+    /api/trend?tag=T    T's samples over the last TREND_ROWS scans, {"tag", "times", "values"}
+    /api/cycles         running sessions and today's totals per rig
+    /metrics            this process's metrics, Prometheus format
+    /ws                 {"type": "tags", ...} as /api/tags, full first and then one delta per scan;
+                        {"type": "cycles", ...} whenever the counts change
+
+/api responses carry an ETag and answer If-None-Match with 304.
+Quality is "good", "bad" (the last read failed, value kept) or null
+(never read). "online" turns false, with the last values kept, when the
+HMI's snapshot goes away or hasn't been published for STALE_AFTER seconds.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import ipaddress
+import sqlite3
+import argparse
+from datetime import datetime
+from urllib.parse import parse_qs, quote
+import numpy as np
+import metrics
+from tag_snapshot import SnapshotClient, SNAPSHOT_NAME, QUALITY_GOOD, QUALITY_BAD
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_INTERVAL = 0.2
+# A snapshot not published for this long (three of the slowest adaptive scans) is from a stopped or hung HMI
+STALE_AFTER = 15.0
+CYCLES_INTERVAL = 2.0
+RETRY_INTERVAL = 5.0
+TREND_ROWS = 3000
+KEEP_ALIVE = 60.0
+MAX_HEADERS = 64
+MAX_WS_PAYLOAD = 65536
+# A viewer with this much unsent is skipped until it catches up, then sent everything afresh
+MAX_BUFFERED = 256 * 1024
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+QUALITY_NAMES = {QUALITY_GOOD: 'good', QUALITY_BAD: 'bad'}
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           503: 'Service Unavailable'}
+
+
+def dumps(obj):
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def ws_frame(payload, opcode=0x1):
+    """A final, unmasked server-to-client WebSocket frame"""
+    size = len(payload)
+    if size < 126:
+        header = bytes([0x80 | opcode, size])
+    elif size < 65536:
+        header = bytes([0x80 | opcode, 126]) + size.to_bytes(2, 'big')
+    else:
+        header = bytes([0x80 | opcode, 127]) + size.to_bytes(8, 'big')
+    return header + payload
+
+
+class TagCache:
+    """The snapshot as pre-serialised responses, rebuilt when a new scan is seen
+
+    Versions count the scans this server has seen. Each tag remembers the
+    version it last changed in, so the tags changed since any version are
+    one comparison away. The per-version bodies are built once, however
+    many viewers ask for them.
+    """
+
+    def __init__(self, rows=TREND_ROWS):
+        self.instance = format(int(time.time()), 'x')
+        self.version = 0
+        self.sequence = None
+        self.online = False
+        self.published = None
+        self.tags = []
+        self.index = {}
+        self.values = self.times = self.quality = self.changed = None
+        self.rows = rows
+        self.trend_times = self.trend_values = None
+        self.trend_count = 0
+        self.full = None
+        self.delta = None
+        self.cached = {}
+
+    def token(self, version=None):
+        return f"{self.instance}.{self.version if version is None else version}"
+
+    def etag(self):
+        return f'"{self.token()}"'
+
+    def update(self, snapshot, tags, live=True):
+        """Take a snapshot from SnapshotClient.read(); whether it was a new scan or went stale (not live)"""
+        if snapshot.sequence == self.sequence and tags == self.tags:
+            if self.online == live:
+                return False
+            if not live:
+                return self.set_offline()
+        if tags != self.tags:
+            self.tags = list(tags)
+            self.index = {tag: i for i, tag in enumerate(self.tags)}
+            count = len(self.tags)
+            self.values = np.full(count, np.nan)
+            self.times = np.full(count, np.nan)
+            self.quality = np.zeros(count, dtype=np.uint8)
+            self.changed = np.zeros(count, dtype=np.int64)
+            self.trend_times = np.full((self.rows, count), np.nan)
+            self.trend_values = np.full((self.rows, count), np.nan)
+            self.trend_count = 0
+
+        changed = ((snapshot.quality != self.quality) | (snapshot.timestamps != self.times)
+                   | ~((snapshot.values == self.values) | (np.isnan(snapshot.values) & np.isnan(self.values))))
+        previous = self.version
+        self.version += 1
+        self.sequence = snapshot.sequence
+        self.online = live
+        self.published = snapshot.published
+        self.values, self.times, self.quality = snapshot.values, snapshot.timestamps, snapshot.quality
+        self.changed[changed] = self.version
+
+        row = self.trend_count % self.rows
+        self.trend_times[row] = self.times
+        self.trend_values[row] = self.values
+        self.trend_count += 1
+
+        self.rebuild(previous)
+        return True
+
+    def set_offline(self):
+        """The HMI has gone away or stopped publishing; the last values stay, marked as not live"""
+        if not self.online:
+            return False
+        self.online = False
+        previous = self.version
+        self.version += 1
+        self.rebuild(previous)
+        return True
+
+    def rebuild(self, previous):
+        self.cached = {}
+        self.full = self.body(None)
+        self.delta = self.body(previous)
+        self.cached[self.token(previous)] = self.delta
+
+    def body(self, since):
+        """JSON of every tag (since None) or of the tags changed after version since"""
+        if since is None:
+            indexes = range(len(self.tags))
+        else:
+            indexes = np.flatnonzero(self.changed > since).tolist()
+        tags = {}
+        values, times, quality = self.values.tolist(), self.times.tolist(), self.quality.tolist()
+        for i in indexes:
+            q = QUALITY_NAMES.get(quality[i])
+            if q is None:
+                tags[self.tags[i]] = [None, None, None]
+            else:
+                # A NaN off the PLC has no JSON spelling
+                tags[self.tags[i]] = [round(values[i], 6) if values[i] == values[i] else None, times[i], q]
+        return dumps({'version': self.token(), 'online': self.online, 'published': self.published,
+                      'full': since is None, 'tags': tags})
+
+    def since(self, token):
+        """Body for ?since=token, cached until the next scan"""
+        body = self.cached.get(token)
+        if body is None:
+            instance, _, version = token.partition('.')
+            if instance != self.instance or not version.isdigit() or int(version) > self.version:
+                return self.full
+            body = self.cached[token] = self.body(int(version))
+        return body
+
+    def trend(self, tag):
+        key = ('trend', tag)
+        body = self.cached.get(key)
+        if body is None:
+            column = self.index[tag]
+            count = min(self.trend_count, self.rows)
+            order = np.arange(self.trend_count - count, self.trend_count) % self.rows
+            times = self.trend_times[order, column]
+            values = self.trend_values[order, column]
+            # The same sample is seen on every scan until the tag's group is read again
+            keep = ~np.isnan(times) & ~np.isnan(values)
+            keep[1:] &= times[1:] != times[:-1]
+            body = self.cached[key] = dumps({'tag': tag, 'version': self.token(), 'times': times[keep].tolist(),
+                                             'values': np.round(values[keep], 6).tolist()})
+        return body
+
+
+class CycleCache:
+    """Cycle counts from cycle_counter.db, re-read every few seconds on a worker thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self.body = dumps({'rigs': [], 'today': {}})
+        self.etag = '"c0"'
+        self.counter = 0
+
+    def read(self):
+        uri = 'file:' + quote(os.path.abspath(self.path)) + '?mode=ro'
+        db = sqlite3.connect(uri, uri=True, timeout=1.0)
+        try:
+            tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            rigs = []
+            if 'current_session' in tables:
+                # The Counter tab's rig, under the rig_id its cycle_data rows are saved with
+                columns = {row[1] for row in db.execute('PRAGMA table_info(current_session)')}
+                rig_id = 'rig_id' if 'rig_id' in columns else 'NULL'
+                for rig, count, start, updated, running in db.execute(
+                        f"SELECT COALESCE({rig_id}, ''), current_count, session_start, last_updated, is_running "
+                        'FROM current_session'):
+                    rigs.append({'rig': rig, 'count': count, 'session_start': start, 'updated': updated,
+                                 'running': bool(running)})
+            if 'rig_sessions' in tables:
+                for rig, count, start, updated in db.execute(
+                        'SELECT rig_id, current_count, session_start, last_updated FROM rig_sessions '
+                        'WHERE is_running = 1 ORDER BY rig_id'):
+                    rigs.append({'rig': rig, 'count': count, 'session_start': start, 'updated': updated,
+                                 'running': True})
+            today = {}
+            if 'cycle_daily' in tables:
+                today = {rig: cycles for rig, cycles in db.execute(
+                    'SELECT rig_id, cycles FROM cycle_daily WHERE day = ?', (datetime.now().strftime('%Y-%m-%d'),))}
+            return {'rigs': rigs, 'today': today}
+        finally:
+            db.close()
+
+    def refresh(self):
+        """Re-read the counts; whether they changed"""
+        try:
+            body = dumps(self.read())
+        except sqlite3.Error as e:
+            log.debug("Cycle counts not read from %s: %s", self.path, e)
+            return False
+        if body == self.body:
+            return False
+        self.counter += 1
+        self.body = body
+        self.etag = f'"c{self.counter}"'
+        return True
+
+
+class Viewer:
+    """One WebSocket connection"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.behind = False
+
+    def send(self, frame):
+        self.writer.write(frame)
+
+    def buffered(self):
+        return self.writer.transport.get_write_buffer_size()
+
+
+class WebView:
+    """The asyncio server and the two loops that keep its caches current"""
+
+    def __init__(self, snapshot_name=SNAPSHOT_NAME, cycles_db='cycle_counter.db', interval=SNAPSHOT_INTERVAL,
+                 cycles_interval=CYCLES_INTERVAL):
+        self.snapshot_name = snapshot_name
+        self.interval = interval
+        self.cycles_interval = cycles_interval
+        self.tags = TagCache()
+        self.cycles = CycleCache(cycles_db)
+        self.viewers = set()
+        self.client = None
+        self.server = None
+        self.tag_frame = self.cycle_frame = None
+
+        self.requests = {}
+        self.viewer_gauge = metrics.REGISTRY.gauge('web_viewers', 'Connected WebSocket viewers')
+        self.skipped = metrics.REGISTRY.counter('web_frames_skipped_total', 'Deltas not sent to a slow viewer')
+        self.scan_seconds = metrics.REGISTRY.histogram('web_scan_seconds', 'Time to serialise and send one scan')
+
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self.connection, host, port)
+        self.tasks = [asyncio.create_task(self.watch_snapshot()), asyncio.create_task(self.watch_cycles())]
+        log.info("Web view on http://%s:%s/", host, port)
+        return self.server
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        self.server.close()
+        for viewer in list(self.viewers):
+            viewer.writer.close()
+        await self.server.wait_closed()
+        if self.client:
+            self.client.close()
+
+    # Caches
+
+    def poll_snapshot(self):
+        """Read the snapshot once; whether there was a new scan"""
+        try:
+            if self.client is None:
+                self.client = SnapshotClient(self.snapshot_name)
+                log.info("Reading the HMI's tag snapshot %s", self.snapshot_name)
+            snapshot = self.client.read()
+        except (FileNotFoundError, TimeoutError) as e:
+            if self.client is not None:
+                log.warning("Lost the HMI's tag snapshot: %s", e)
+                self.client.close()
+                self.client = None
+            return self.tags.set_offline()
+        # The HMI may have stopped scanning, or hung, without its snapshot going away
+        return self.tags.update(snapshot, self.client.tags, time.time() - snapshot.published <= STALE_AFTER)
+
+    async def watch_snapshot(self):
+        while True:
+            with self.scan_seconds.time():
+                if self.poll_snapshot():
+                    self.tag_frame = ws_frame(b'{"type":"tags",' + self.tags.full[1:])
+                    self.broadcast(ws_frame(b'{"type":"tags",' + self.tags.delta[1:]))
+            await asyncio.sleep(self.interval if self.client else RETRY_INTERVAL)
+
+    async def watch_cycles(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if await loop.run_in_executor(None, self.cycles.refresh) or self.cycle_frame is None:
+                self.cycle_frame = ws_frame(b'{"type":"cycles",' + self.cycles.body[1:])
+                self.broadcast(self.cycle_frame, resync=False)
+            await asyncio.sleep(self.cycles_interval)
+
+    def broadcast(self, frame, resync=True):
+        """Send frame to every viewer; a viewer too far behind gets the full snapshot once it drains"""
+        for viewer in list(self.viewers):
+            if viewer.buffered() > MAX_BUFFERED:
+                viewer.behind = viewer.behind or resync
+                self.skipped.inc()
+            elif viewer.behind:
+                viewer.behind = False
+                viewer.send(self.tag_frame)
+                viewer.send(self.cycle_frame)
+            else:
+                viewer.send(frame)
+
+    # HTTP
+
+    async def connection(self, reader, writer):
+        try:
+            while True:
+                request = await asyncio.wait_for(read_request(reader), KEEP_ALIVE)
+                if request is None:
+                    break
+                method, target, headers = request
+                path, _, query = target.partition('?')
+                self.count(path)
+                if path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                    await self.websocket(reader, writer, headers)
+                    break
+                status, content_type, body, etag = self.route(method, path, parse_qs(query))
+                if etag and etag == headers.get('if-none-match'):
+                    status, body = 304, b''
+                writer.write(response(status, content_type, body, etag))
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def count(self, path):
+        counter = self.requests.get(path)
+        if counter is None:
+            known = path if path in ('/', '/api/tags', '/api/trend', '/api/cycles', '/metrics', '/ws') else 'other'
+            counter = self.requests[path] = metrics.REGISTRY.counter(
+                'web_requests_total', 'HTTP requests to the web view', path=known)
+        counter.inc()
+
+    def route(self, method, path, query):
+        """(status, content type, body, etag) for a request"""
+        if method != 'GET':
+            return 405, 'text/plain', b'read-only\n', None
+        if path == '/':
+            return 200, 'text/html; charset=utf-8', PAGE, None
+        if path == '/metrics':
+            return 200, 'text/plain; version=0.0.4', metrics.REGISTRY.render_prometheus().encode(), None
+        if path == '/api/cycles':
+            return 200, 'application/json', self.cycles.body, self.cycles.etag
+        if path in ('/api/tags', '/api/trend') and self.tags.full is None:
+            return 503, 'application/json', dumps({'error': 'no snapshot yet; is the HMI running?'}), None
+        if path == '/api/tags':
+            since = query.get('since')
+            body = self.tags.since(since[0]) if since else self.tags.full
+            return 200, 'application/json', body, self.tags.etag() + ('-d' if since else '')
+        if path == '/api/trend':
+            tag = query.get('tag', [''])[0]
+            if tag not in self.tags.index:
+                return 404, 'application/json', dumps({'error': f'unknown tag {tag!r}'}), None
+            return 200, 'application/json', self.tags.trend(tag), self.tags.etag() + '-' + tag
+        return 404, 'text/plain', b'not found\n', None
+
+    # WebSocket
+
+    async def websocket(self, reader, writer, headers):
+        key = headers.get('sec-websocket-key')
+        if not key:
+            writer.write(response(400, 'text/plain', b'missing Sec-WebSocket-Key\n'))
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept.encode() + b'\r\n\r\n')
+        viewer = Viewer(writer)
+        for frame in (self.tag_frame, self.cycle_frame):
+            if frame:
+                viewer.send(frame)
+        self.viewers.add(viewer)
+        self.viewer_gauge.set(len(self.viewers))
+        try:
+            # Viewers only listen; their frames are read for pings and the close handshake
+            while True:
+                opcode, payload = await read_frame(reader)
+                if opcode == 0x8:
+                    writer.write(ws_frame(payload[:2], 0x8))
+                    break
+                if opcode == 0x9:
+                    writer.write(ws_frame(payload, 0xA))
+        finally:
+            self.viewers.discard(viewer)
+            self.viewer_gauge.set(len(self.viewers))
+
+
+async def read_request(reader):
+    """(method, target, lowercased headers) of the next request, None at end of stream"""
+    line = await reader.readline()
+    if not line:
+        return None
+    method, target, _ = line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise ValueError("too many headers")
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+async def read_frame(reader):
+    """(opcode, unmasked payload) of the next client frame"""
+    first, second = await reader.readexactly(2)
+    size = second & 0x7F
+    if size == 126:
+        size = int.from_bytes(await reader.readexactly(2), 'big')
+    elif size == 127:
+        size = int.from_bytes(await reader.readexactly(8), 'big')
+    if size > MAX_WS_PAYLOAD:
+        raise ValueError("WebSocket frame too large")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(size)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return first & 0x0F, payload
+
+
+def response(status, content_type, body, etag=None):
+    headers = [f"HTTP/1.1 {status} {REASONS[status]}", f"Content-Length: {len(body)}", "Cache-Control: no-cache"]
+    if status != 304:
+        headers.append(f"Content-Type: {content_type}")
+    if etag:
+        headers.append(f"ETag: {etag}")
+    return ('\r\n'.join(headers) + '\r\n\r\n').encode() + body
+
+
+PAGE = b"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>SFCT</title>
+<style>
+body { font-family: sans-serif; margin: 1em; background: #f4f6f7; }
+table { border-collapse: collapse; margin-bottom: 1em; }
+td, th { padding: 2px 10px; border-bottom: 1px solid #ddd; text-align: right; }
+.bad { color: #e74c3c; } .none { color: #999; } #status.offline { color: #e74c3c; }
+</style></head>
+<body>
+<h2>SFCT <small id="status">connecting</small></h2>
+<table id="cycles"><tr><th>Rig</th><th>Count</th><th>Session start</th><th>Today</th></tr></table>
+<table id="tags"><tr><th>Tag</th><th>Value</th><th>Scan</th></tr></table>
+<script>
+const rows = {};
+function tags(message) {
+  document.getElementById('status').textContent = message.online ? 'live' : 'HMI offline';
+  document.getElementById('status').className = message.online ? '' : 'offline';
+  for (const [tag, [value, time, quality]] of Object.entries(message.tags)) {
+    let row = rows[tag];
+    if (!row) {
+      row = rows[tag] = document.getElementById('tags').insertRow();
+      row.insertCell().textContent = tag; row.insertCell(); row.insertCell();
+    }
+    row.className = quality || 'none';
+    row.cells[1].textContent = value === null ? '' : value;
+    row.cells[2].textContent = time === null ? '' : new Date(time * 1000).toLocaleTimeString();
+  }
+}
+function cycles(message) {
+  const table = document.getElementById('cycles');
+  while (table.rows.length > 1) table.deleteRow(1);
+  for (const rig of message.rigs) {
+    const row = table.insertRow();
+    for (const text of [rig.rig, rig.count, rig.session_start, message.today[rig.rig] || 0])
+      row.insertCell().textContent = text;
+  }
+}
+function connect() {
+  const socket = new WebSocket(`ws://${location.host}/ws`);
+  socket.onmessage = event => {
+    const message = JSON.parse(event.data);
+    (message.type === 'tags' ? tags : cycles)(message);
+  };
+  socket.onclose = () => {
+    document.getElementById('status').textContent = 'reconnecting';
+    setTimeout(connect, 2000);
+  };
+}
+connect();
+</script>
+</body></html>
+"""
+
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def main():
+    from hmi_log import setup_logging
+    parser = argparse.ArgumentParser(description="Serve a read-only web view of the running SFCT HMI")
+    parser.add_argument("--host", default='127.0.0.1', help="address to listen on (default: this PC only)")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--expose", action="store_true",
+                        help="allow a --host other machines can reach; the view and /metrics have no authentication")
+    parser.add_argument("--cycles", metavar="CYCLE_DB", default='cycle_counter.db', help="cycle counter database")
+    parser.add_argument("--snapshot", default=SNAPSHOT_NAME, help="shared memory name of the HMI's tag snapshot")
+    args = parser.parse_args()
+    if not (args.expose or is_loopback(args.host)):
+        parser.error(f"--host {args.host} serves the plant view and /metrics to the network without "
+                     "authentication; add --expose to do that")
+    setup_logging('web_view')
+
+    async def serve():
+        view = WebView(args.snapshot, args.cycles)
+        server = await view.start(args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        sys.exit(f"Web view not started on {args.host}:{args.port}: {e}")
+
+
+if __name__ == '__main__':
+    main()
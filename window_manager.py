@@ -0,0 +1,53 @@
+from PyQt5.QtCore import QObject, QEvent
+
+
+class WindowRegistry(QObject):
+    """Keeps one instance per window type and tracks whether it is on screen
+
+    Windows are created on first use and reused afterwards; closing one only
+    hides it. Windows that define suspend()/resume() are suspended while
+    hidden or minimised and resumed when shown again, so they only poll
+    while an operator can actually see them.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.windows = {}
+        self.active = {}
+
+    def show(self, key, factory):
+        window = self.windows.get(key)
+        if window is None:
+            window = factory()
+            window.installEventFilter(self)
+            self.windows[key] = window
+            self.active[window] = False
+
+        if window.isMinimized():
+            window.showNormal()
+        else:
+            window.show()
+        window.raise_()
+        window.activateWindow()
+        return window
+
+    def get(self, key):
+        return self.windows.get(key)
+
+    def eventFilter(self, obj, event):
+        if obj in self.active and event.type() in (QEvent.Show, QEvent.Hide, QEvent.WindowStateChange):
+            self.set_active(obj, obj.isVisible() and not obj.isMinimized())
+        return False
+
+    def set_active(self, window, active):
+        if self.active[window] == active:
+            return
+        self.active[window] = active
+        if active and hasattr(window, 'resume'):
+            window.resume()
+        elif not active and hasattr(window, 'suspend'):
+            window.suspend()
+
+    def close_all(self):
+        for window in self.windows.values():
+            window.close()